@@ -12,9 +12,15 @@ import com.couchbase.lite.ReplicatorChangeListener;
 import com.couchbase.lite.ReplicatorConfiguration;
 
 import java.util.ArrayList;
+import java.util.HashMap;
 import java.util.List;
+import java.util.Map;
+import java.util.WeakHashMap;
 
 public class ReplicatorRequestHandler {
+    // The watchers do not reference their replicator, so an entry goes away with its replicator
+    private static final Map<Replicator, ReplicatorStatusWatcher> statusWatchers = new WeakHashMap<>();
+
     /* -------------- */
     /* - Replicator - */
     /* -------------- */
@@ -34,6 +40,34 @@ public class ReplicatorRequestHandler {
         return replicator.getStatus().toString();
     }
 
+    /* Status of the replicator in one call: activityLevel, completed, total, error and a version
+       that increases with every status change, see waitForStatusChange */
+    public Map<String, Object> statusSnapshot(Args args) {
+        Replicator replicator = args.get("replicator");
+        return getStatusWatcher(replicator).snapshot(replicator);
+    }
+
+    /* Blocks until the status version is greater than 'version' or 'timeout' (ms) expires,
+       then returns the status snapshot */
+    public Map<String, Object> waitForStatusChange(Args args) throws InterruptedException {
+        Replicator replicator = args.get("replicator");
+        long version = ((Number) args.get("version")).longValue();
+        int timeout = args.get("timeout");
+        return getStatusWatcher(replicator).waitForChange(replicator, version, timeout);
+    }
+
+    private static ReplicatorStatusWatcher getStatusWatcher(Replicator replicator) {
+        synchronized (statusWatchers) {
+            ReplicatorStatusWatcher watcher = statusWatchers.get(replicator);
+            if (watcher == null) {
+                watcher = new ReplicatorStatusWatcher();
+                replicator.addChangeListener(watcher);
+                statusWatchers.put(replicator, watcher);
+            }
+            return watcher;
+        }
+    }
+
     public String getActivityLevel(Args args) {
         Replicator replicator = args.get("replicator");
         return replicator.getStatus().getActivityLevel().toString().toLowerCase();
@@ -184,6 +218,39 @@ class MyReplicatorListener implements ReplicatorChangeListener{
     }
 }
 
+class ReplicatorStatusWatcher implements ReplicatorChangeListener {
+    private long version = 0;
+
+    public synchronized Map<String, Object> snapshot(Replicator replicator) {
+        Replicator.Status status = replicator.getStatus();
+        Map<String, Object> snapshot = new HashMap<>();
+        snapshot.put("activityLevel", status.getActivityLevel().toString().toLowerCase());
+        snapshot.put("completed", status.getProgress().getCompleted());
+        snapshot.put("total", status.getProgress().getTotal());
+        snapshot.put("version", version);
+        if (status.getError() != null) {
+            snapshot.put("error", status.getError().toString());
+        }
+        return snapshot;
+    }
+
+    public synchronized Map<String, Object> waitForChange(Replicator replicator, long sinceVersion, long timeout) throws InterruptedException {
+        long deadline = System.currentTimeMillis() + timeout;
+        long remaining = timeout;
+        while (version <= sinceVersion && remaining > 0) {
+            wait(remaining);
+            remaining = deadline - System.currentTimeMillis();
+        }
+        return snapshot(replicator);
+    }
+
+    @Override
+    public synchronized void changed(ReplicatorChange change) {
+        version++;
+        notifyAll();
+    }
+}
+
 class MyDocumentReplicatorListener implements DocumentReplicationListener{
     private List<DocumentReplication> changes = new ArrayList<>();
     private ListenerToken token;
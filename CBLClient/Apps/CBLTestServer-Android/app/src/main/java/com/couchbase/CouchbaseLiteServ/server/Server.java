@@ -40,6 +40,7 @@ import java.io.IOException;
 import java.io.PrintWriter;
 import java.io.StringWriter;
 import java.lang.reflect.Method;
+import java.util.ArrayList;
 import java.util.EnumSet;
 import java.util.HashMap;
 import java.util.List;
@@ -91,7 +92,16 @@ public class Server extends NanoHTTPD {
         } catch (ResponseException e) {
             e.printStackTrace();
         }
+        if ("valueEncodings".equals(method)) {
+            return Response.newFixedLengthResponse(Status.OK, "application/json", new Gson().toJson(ValueSerializer.ENCODINGS).getBytes());
+        }
+        // The client asks for the results in the encoding of its arguments
+        boolean treeEncoding = ValueSerializer.ENCODING_TREE.equals(session.getHeaders().get(ValueSerializer.ENCODING_HEADER));
         Map<String, Object> query = new Gson().fromJson(rawArgs.get("postData"), Map.class);
+        if ("batch".equals(method)) {
+            String body = handleBatch((String) query.get("calls"), treeEncoding);
+            return Response.newFixedLengthResponse(Status.OK, "application/json", body.getBytes());
+        }
         if (query !=null){
             for (String key : query.keySet()){
                 String value = (String) query.get(key);
@@ -107,101 +117,7 @@ public class Server extends NanoHTTPD {
             } else if ("flushMemory".equals(method)){
                 memory.flushMemory();
             } else {
-                Object requestHandler = null;
-                String handlerType = method.split("_")[0];
-                String method_to_call = method.split("_")[1];
-                Method target;
-                switch (handlerType){
-
-                    case "databaseConfiguration":
-                        target = DatabaseConfigurationRequestHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new DatabaseConfigurationRequestHandler();
-                        break;
-                    case "database":
-                        target = DatabaseRequestHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new DatabaseRequestHandler();
-                        break;
-                    case "document":
-                        target = DocumentRequestHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new DocumentRequestHandler();
-                        break;
-                    case "dictionary":
-                        target = DictionaryRequestHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new DictionaryRequestHandler();
-                        break;
-                    case "datatype":
-                        target = DataTypesInitiatorHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new DataTypesInitiatorHandler();
-                        break;
-                    case "replicator":
-                        target = ReplicatorRequestHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new ReplicatorRequestHandler();
-                        break;
-                    case "replicatorConfiguration":
-                        target = ReplicatorConfigurationRequestHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new ReplicatorConfigurationRequestHandler();
-                        break;
-                    case "query":
-                        target = QueryRequestHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new QueryRequestHandler();
-                        break;
-                    case "expression":
-                        target = ExpressionRequestHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new ExpressionRequestHandler();
-                        break;
-                    case "function":
-                        target = FunctionRequestHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new FunctionRequestHandler();
-                        break;
-                    case "dataSource":
-                        target = DataSourceRequestHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new DataSourceRequestHandler();
-                        break;
-                    case "selectResult":
-                        target = SelectResultRequestHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new SelectResultRequestHandler();
-                        break;
-                    case "collation":
-                        target = CollatorRequestHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new CollatorRequestHandler();
-                        break;
-                    case "result":
-                        target = ResultRequestHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new ResultRequestHandler();
-                        break;
-                    case "basicAuthenticator":
-                        target = BasicAuthenticatorRequestHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new BasicAuthenticatorRequestHandler();
-                        break;
-                    case "sessionAuthenticator":
-                        target = SessionAuthenticatorRequestHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new SessionAuthenticatorRequestHandler();
-                        break;
-                    case "array":
-                        target = ArrayRequestHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new ArrayRequestHandler();
-                        break;
-                    case "peerToPeer":
-                        target = PeerToPeerRequestHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new PeerToPeerRequestHandler();
-                        break;
-                    case "predictiveQuery":
-                        target = PredictiveQueriesRequestHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new PredictiveQueriesRequestHandler();
-                        break;
-                    case "logging":
-                        target = LoggingRequestHandler.class.getMethod(method_to_call, Args.class);
-                        requestHandler = new LoggingRequestHandler();
-                        break;
-                    default:
-                        throw new IllegalArgumentException("Handler not implemented for this call");
-                }
-                if (target.getReturnType().equals(Void.TYPE)) {
-                    target.invoke(requestHandler, args);
-                } else {
-                    Object result = target.invoke(requestHandler, args);
-                    body = ValueSerializer.serialize(result, memory);
-                }
+                body = invokeHandler(method, args, treeEncoding);
             }
             session.getHeaders();
             if (body != null) {
@@ -220,5 +136,172 @@ public class Server extends NanoHTTPD {
             return Response.newFixedLengthResponse(Status.BAD_REQUEST, "text/plain", sStackTrace);
         }
     }
-}
 
+    /**
+     * Invokes a single test server method and returns its serialized result, or null for void methods.
+     */
+    private String invokeHandler(String method, Args args, boolean treeEncoding) throws Exception {
+        Object result = invokeHandlerRaw(method, args);
+        return result == NO_RESULT ? null : ValueSerializer.serialize(result, memory, treeEncoding);
+    }
+
+    private static final Object NO_RESULT = new Object();
+
+    private Object invokeHandlerRaw(String method, Args args) throws Exception {
+        Object requestHandler = null;
+        String handlerType = method.split("_")[0];
+        String method_to_call = method.split("_")[1];
+        Method target;
+        switch (handlerType){
+
+            case "databaseConfiguration":
+                target = DatabaseConfigurationRequestHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new DatabaseConfigurationRequestHandler();
+                break;
+            case "database":
+                target = DatabaseRequestHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new DatabaseRequestHandler();
+                break;
+            case "document":
+                target = DocumentRequestHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new DocumentRequestHandler();
+                break;
+            case "dictionary":
+                target = DictionaryRequestHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new DictionaryRequestHandler();
+                break;
+            case "datatype":
+                target = DataTypesInitiatorHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new DataTypesInitiatorHandler();
+                break;
+            case "replicator":
+                target = ReplicatorRequestHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new ReplicatorRequestHandler();
+                break;
+            case "replicatorConfiguration":
+                target = ReplicatorConfigurationRequestHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new ReplicatorConfigurationRequestHandler();
+                break;
+            case "query":
+                target = QueryRequestHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new QueryRequestHandler();
+                break;
+            case "expression":
+                target = ExpressionRequestHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new ExpressionRequestHandler();
+                break;
+            case "function":
+                target = FunctionRequestHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new FunctionRequestHandler();
+                break;
+            case "dataSource":
+                target = DataSourceRequestHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new DataSourceRequestHandler();
+                break;
+            case "selectResult":
+                target = SelectResultRequestHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new SelectResultRequestHandler();
+                break;
+            case "collation":
+                target = CollatorRequestHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new CollatorRequestHandler();
+                break;
+            case "result":
+                target = ResultRequestHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new ResultRequestHandler();
+                break;
+            case "basicAuthenticator":
+                target = BasicAuthenticatorRequestHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new BasicAuthenticatorRequestHandler();
+                break;
+            case "sessionAuthenticator":
+                target = SessionAuthenticatorRequestHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new SessionAuthenticatorRequestHandler();
+                break;
+            case "array":
+                target = ArrayRequestHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new ArrayRequestHandler();
+                break;
+            case "peerToPeer":
+                target = PeerToPeerRequestHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new PeerToPeerRequestHandler();
+                break;
+            case "predictiveQuery":
+                target = PredictiveQueriesRequestHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new PredictiveQueriesRequestHandler();
+                break;
+            case "logging":
+                target = LoggingRequestHandler.class.getMethod(method_to_call, Args.class);
+                requestHandler = new LoggingRequestHandler();
+                break;
+            default:
+                throw new IllegalArgumentException("Handler not implemented for this call");
+        }
+
+        if (target.getReturnType().equals(Void.TYPE)) {
+            target.invoke(requestHandler, args);
+            return NO_RESULT;
+        }
+        return target.invoke(requestHandler, args);
+    }
+
+    /**
+     * Runs a batch of method invocations sent as a JSON list in the 'calls' argument:
+     * [{"method": "document_create", "args": {"id": "\"doc1\""}}, {"method": "document_setString", "args": {"document": "$0", ...}}]
+     * An argument value of "$<index>" refers to the result of an earlier call of the same batch.
+     * Returns a JSON list with one {"result": serialized result} or {"error": message} entry per call, in order.
+     */
+    private String handleBatch(String callsJson, boolean treeEncoding) {
+        List<Map<String, Object>> calls = new Gson().fromJson(callsJson, List.class);
+        List<Object> rawResults = new ArrayList<>();
+        List<Map<String, String>> results = new ArrayList<>();
+
+        for (Map<String, Object> call : calls) {
+            String callMethod = (String) call.get("method");
+            Map<String, Object> callArgs = (Map<String, Object>) call.get("args");
+            Map<String, String> callResult = new HashMap<>();
+            Object rawResult = NO_RESULT;
+
+            try {
+                Args args = new Args();
+                String releaseAddress = null;
+                if (callArgs != null) {
+                    for (String key : callArgs.keySet()) {
+                        String value = (String) callArgs.get(key);
+                        if (value != null && value.startsWith("$")) {
+                            int index = Integer.parseInt(value.substring(1));
+                            if (index >= results.size() || results.get(index).containsKey("error")) {
+                                throw new IllegalArgumentException("Call " + index + " referenced by " + callMethod + " failed or was not run");
+                            }
+                            Object referenced = rawResults.get(index);
+                            args.put(key, referenced == NO_RESULT ? null : referenced);
+                            releaseAddress = results.get(index).get("result");
+                        } else {
+                            args.put(key, ValueSerializer.deserialize(value, memory));
+                            releaseAddress = value;
+                        }
+                    }
+                }
+
+                if ("release".equals(callMethod)) {
+                    memory.remove(releaseAddress);
+                    callResult.put("result", null);
+                } else if ("flushMemory".equals(callMethod)) {
+                    memory.flushMemory();
+                    callResult.put("result", null);
+                } else {
+                    rawResult = invokeHandlerRaw(callMethod, args);
+                    callResult.put("result", rawResult == NO_RESULT ? null : ValueSerializer.serialize(rawResult, memory, treeEncoding));
+                }
+            } catch (Exception e) {
+                Throwable cause = e.getCause() != null ? e.getCause() : e;
+                callResult.put("error", cause.toString());
+            }
+
+            rawResults.add(rawResult);
+            results.add(callResult);
+        }
+
+        return new Gson().toJson(results);
+    }
+}
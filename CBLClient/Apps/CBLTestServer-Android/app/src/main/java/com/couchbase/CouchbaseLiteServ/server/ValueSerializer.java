@@ -1,14 +1,78 @@
 package com.couchbase.CouchbaseLiteServ.server;
 
 import com.google.gson.Gson;
+import com.google.gson.JsonArray;
+import com.google.gson.JsonElement;
+import com.google.gson.JsonObject;
+import com.google.gson.JsonParser;
+import com.google.gson.JsonPrimitive;
 
 import java.util.ArrayList;
+import java.util.Arrays;
 import java.util.HashMap;
 import java.util.List;
 import java.util.Map;
 
 public class ValueSerializer {
 
+    /**
+     * Encodings of maps and lists, listed by the 'valueEncodings' method:
+     * legacy - each container is a JSON string of serialized values
+     * tree   - one JSON tree prefixed with TREE_PREFIX, scalars keep their legacy tags
+     */
+    public static final String ENCODING_LEGACY = "legacy";
+    public static final String ENCODING_TREE = "tree";
+    public static final List<String> ENCODINGS = Arrays.asList(ENCODING_LEGACY, ENCODING_TREE);
+
+    // Request header asking for the results in the tree encoding, NanoHTTPD lower cases the header names
+    public static final String ENCODING_HEADER = "cbl-value-encoding";
+
+    private static final String TREE_PREFIX = "~";
+
+    public static String serialize(Object value, Memory memory, boolean tree) {
+        if (tree && ((value instanceof Map) || (value instanceof List))) {
+            return TREE_PREFIX + new Gson().toJson(toTree(value, memory));
+        }
+        return serialize(value, memory);
+    }
+
+    private static JsonElement toTree(Object value, Memory memory) {
+        if (value instanceof Map) {
+            JsonObject object = new JsonObject();
+            for (Map.Entry<String, Object> entry : ((Map<String, Object>) value).entrySet()) {
+                object.add(entry.getKey(), toTree(entry.getValue(), memory));
+            }
+            return object;
+        } else if (value instanceof List) {
+            JsonArray array = new JsonArray();
+            for (Object object : (List) value) {
+                array.add(toTree(object, memory));
+            }
+            return array;
+        }
+        String string = serialize(value, memory);
+        return new JsonPrimitive(string == null ? "null" : string);
+    }
+
+    private static Object fromTree(JsonElement element, Memory memory) {
+        if (element.isJsonObject()) {
+            Map<String, Object> map = new HashMap<>();
+            for (Map.Entry<String, JsonElement> entry : element.getAsJsonObject().entrySet()) {
+                map.put(entry.getKey(), fromTree(entry.getValue(), memory));
+            }
+            return map;
+        } else if (element.isJsonArray()) {
+            List<Object> list = new ArrayList<>();
+            for (JsonElement item : element.getAsJsonArray()) {
+                list.add(fromTree(item, memory));
+            }
+            return list;
+        } else if (element.isJsonNull()) {
+            return null;
+        }
+        return deserialize(element.getAsString(), memory);
+    }
+
     public static String serialize(Object value, Memory memory) {
         if (value == null)  {
             return null;
@@ -68,6 +132,8 @@ public class ValueSerializer {
             return (T)Boolean.TRUE;
         } else if (value.equals("false")) {
             return (T)Boolean.FALSE;
+        } else if (value.startsWith(TREE_PREFIX)) {
+            return (T)fromTree(new JsonParser().parse(value.substring(1)), memory);
         } else if (value.startsWith("{")) {
             Map<String, String> stringMap = new Gson().fromJson(value, Map.class);
             Map<String, Object> map = new HashMap<>();
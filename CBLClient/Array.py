@@ -1,4 +1,4 @@
-from CBLClient.Client import Client
+from CBLClient.Client import get_client
 from CBLClient.Args import Args
 
 
@@ -12,7 +12,7 @@ class Array(object):
         if not self.base_url:
             raise Exception("No base_url specified")
 
-        self._client = Client(base_url)
+        self._client = get_client(base_url)
 
     def create(self, array=None):
         args = Args()
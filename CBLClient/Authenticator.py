@@ -1,4 +1,4 @@
-from CBLClient.Client import Client
+from CBLClient.Client import get_client
 from CBLClient.Args import Args
 
 
@@ -13,7 +13,7 @@ class Authenticator(object):
         if self.base_url is None:
             raise Exception("No base_url specified")
 
-        self._client = Client(base_url)
+        self._client = get_client(base_url)
 
     def basicAuthenticator_create(self, username, password):
         args = Args()
@@ -0,0 +1,77 @@
+import copy
+
+from CBLClient.MemoryPointer import BatchReference
+from CBLClient.ValueSerializer import ValueSerializer
+
+
+class BatchCallError(Exception):
+    """ Error returned by the test server for a single call of a batch """
+
+    def __init__(self, index, method, message):
+        super(BatchCallError, self).__init__("Batch call {} ({}) failed: {}".format(index, method, message))
+        self.index = index
+        self.method = method
+        self.message = message
+
+
+class Batch(object):
+    """
+    Queues test server method invocations and sends them to the test server as one request.
+
+    invokeMethod() returns a BatchReference that can be used as an argument of
+    later calls of the same batch, ex. the memory pointer returned by document_create.
+    Any CBLClient wrapper can queue its calls in a batch through proxy():
+
+        batch = Batch(get_client(base_url))
+        doc_obj = batch.proxy(Document(base_url))
+        doc = doc_obj.create("doc_1")
+        doc_obj.setString(doc, "key", "value")
+        doc_obj.setInt(doc, "count", 1)
+        results = batch.execute()
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._calls = []
+
+    def __len__(self):
+        return len(self._calls)
+
+    def invokeMethod(self, method, args=None):
+        body = {}
+        if args:
+            for k, v in args:
+                body[k] = ValueSerializer.serialize(v, self._client.value_encoding)
+
+        self._calls.append({"method": method, "args": body})
+        return BatchReference(len(self._calls) - 1)
+
+    def release(self, obj):
+        self._calls.append({"method": "release", "args": {"object": ValueSerializer.serialize(obj, self._client.value_encoding)}})
+        return BatchReference(len(self._calls) - 1)
+
+    def proxy(self, wrapper):
+        """ Returns a copy of a CBLClient wrapper (Database, Document, ...) that queues its calls in this batch """
+        proxied = copy.copy(wrapper)
+        proxied._client = self
+        return proxied
+
+    def execute(self, raise_on_error=False):
+        """
+        Sends the queued calls and returns their results in order. A call that failed on the
+        test server has a BatchCallError in place of its result, unless 'raise_on_error' is set.
+        The batch is empty again after execute().
+        """
+
+        calls = self._calls
+        self._calls = []
+        if not calls:
+            return []
+
+        results = self._client.invokeBatch(calls)
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, BatchCallError):
+                    raise result
+
+        return results
@@ -1,17 +1,132 @@
 import json
+import threading
 
 from requests import Session
 from requests import Response
+from requests.adapters import HTTPAdapter
 from CBLClient.ValueSerializer import ValueSerializer
+from CBLClient.ValueSerializer import VALUE_ENCODING_HEADER, VALUE_ENCODING_LEGACY, VALUE_ENCODINGS
 from CBLClient.Args import Args
+from CBLClient.Batch import Batch, BatchCallError
+from CBLClient.MemoryPointerRegistry import MemoryPointerRegistry
+from keywords.constants import CBL_CLIENT_POOL_SIZE
 from keywords.utils import log_info
 
+# { (base_url, value_encoding): Client } shared by all the CBLClient wrappers
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+
+def get_client(base_url, value_encoding=VALUE_ENCODING_LEGACY):
+    """
+    Returns the Client shared by every CBLClient wrapper of the test server at 'base_url',
+    so they all use the same connection pool and memory pointer registry.
+    """
+
+    key = (base_url, value_encoding)
+    with _shared_clients_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            client = Client(base_url, value_encoding)
+            _shared_clients[key] = client
+        return client
+
+
+def get_shared_clients():
+    with _shared_clients_lock:
+        return list(_shared_clients.values())
+
+
+def close_shared_clients():
+    with _shared_clients_lock:
+        clients = list(_shared_clients.values())
+        _shared_clients.clear()
+    for client in clients:
+        client.session.close()
+
 
 class Client(object):
 
-    def __init__(self, base_url):
+    def __init__(self, base_url, value_encoding=VALUE_ENCODING_LEGACY):
+        """
+        'value_encoding' is the preferred encoding of dictionary and list arguments, one of VALUE_ENCODINGS.
+        Before the first call, the test server is asked for the encodings it supports ('valueEncodings'),
+        the legacy encoding is used if it does not support the preferred one or does not know the method.
+        Results are decoded based on their tags, so responses in any encoding are understood.
+
+        Use get_client() rather than creating a Client per wrapper.
+        """
+
+        if value_encoding not in VALUE_ENCODINGS:
+            raise ValueError("Unsupported value encoding: {}. Use one of {}".format(value_encoding, VALUE_ENCODINGS))
+
         self.base_url = base_url
+        self.requested_value_encoding = value_encoding
+        # Negotiated on first use, unless the legacy encoding was requested
+        self._value_encoding = VALUE_ENCODING_LEGACY if value_encoding == VALUE_ENCODING_LEGACY else None
+        self._value_encoding_lock = threading.Lock()
         self.session = Session()
+        # Keep-alive connections for the threads sharing this client (ex. DeviceFleet)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=CBL_CLIENT_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.pointers = MemoryPointerRegistry(self)
+        # { method: number of requests }
+        self.request_counts = {}
+        self._counts_lock = threading.Lock()
+        # Optional methods the test server failed to run, not tried again (ex. replicator_statusSnapshot on iOS / .NET)
+        self.unsupported_methods = set()
+
+    def _count_request(self, method):
+        with self._counts_lock:
+            self.request_counts[method] = self.request_counts.get(method, 0) + 1
+
+    def stats(self):
+        """ Returns the requests per method and the number of live memory pointers """
+        with self._counts_lock:
+            request_counts = dict(self.request_counts)
+        return {
+            "base_url": self.base_url,
+            "requests": request_counts,
+            "live_pointers": len(self.pointers),
+            "released_pointers": self.pointers.num_released
+        }
+
+    @property
+    def value_encoding(self):
+        """ The encoding of dictionary and list arguments agreed with the test server """
+        if self._value_encoding is None:
+            with self._value_encoding_lock:
+                if self._value_encoding is None:
+                    self._value_encoding = self._negotiate_value_encoding()
+        return self._value_encoding
+
+    def _negotiate_value_encoding(self):
+        resp = self.session.post(self.base_url + "/valueEncodings", data=json.dumps({}), headers={"Content-Type": "application/json"})
+        supported = []
+        if resp.status_code == 200:
+            try:
+                supported = resp.json()
+            except ValueError:
+                pass
+
+        if self.requested_value_encoding in supported:
+            log_info("Using the '{}' value encoding with {}".format(self.requested_value_encoding, self.base_url))
+            return self.requested_value_encoding
+        log_info("{} does not support the '{}' value encoding, falling back to '{}'".format(
+            self.base_url, self.requested_value_encoding, VALUE_ENCODING_LEGACY
+        ))
+        return VALUE_ENCODING_LEGACY
+
+    def _post(self, url, body):
+        headers = {"Content-Type": "application/json"}
+        if self.value_encoding != VALUE_ENCODING_LEGACY:
+            # Lets the test server reply with the same encoding
+            headers[VALUE_ENCODING_HEADER] = self.value_encoding
+
+        # Headers are per request, the session is shared by several threads
+        return self.session.post(url, data=json.dumps(body), headers=headers)
 
     def invokeMethod(self, method, args=None):
         resp = Response()
@@ -23,13 +138,12 @@ class Client(object):
 
             if args:
                 for k, v in args:
-                    val = ValueSerializer.serialize(v)
+                    val = ValueSerializer.serialize(v, self.value_encoding)
                     body[k] = val
 
             # Create connection to method endpoint.
-            headers = {"Content-Type": "application/json"}
-            self.session.headers = headers
-            resp = self.session.post(url, data=json.dumps(body))
+            self._count_request(method)
+            resp = self._post(url, body)
             resp.raise_for_status()
             responseCode = resp.status_code
 
@@ -38,18 +152,55 @@ class Client(object):
                 if len(result) < 25:
                     # Only print short messages
                     log_info("Got response: {}".format(result))
-                return ValueSerializer.deserialize(result)
+                result = ValueSerializer.deserialize(result)
+                self.pointers.register(result)
+                if method != "release":
+                    self.pointers.release_collected(min_count=self.pointers.batch_size)
+                return result
         except Exception as err:
             if resp.content:
                 raise Exception(str(err) + resp.content)
             else:
                 raise Exception(str(err))
 
+    def invokeBatch(self, calls):
+        """
+        Sends a list of {"method": method, "args": {name: serialized value}} calls as a single request.
+        Returns the deserialized results in order, failed calls are returned as a BatchCallError.
+        Use CBLClient.Batch to build the calls.
+        """
+
+        url = self.base_url + "/batch"
+        self._count_request("batch")
+        resp = self._post(url, {"calls": json.dumps(calls)})
+        resp.raise_for_status()
+        log_info("Batch of {} calls completed".format(len(calls)))
+
+        results = []
+        for index, (call, result) in enumerate(zip(calls, resp.json())):
+            if "error" in result:
+                results.append(BatchCallError(index, call["method"], result["error"]))
+            else:
+                results.append(ValueSerializer.deserialize(result.get("result")))
+        self.pointers.register(results)
+
+        return results
+
+    def batch(self):
+        """ Returns a Batch that queues calls for this client's test server """
+        return Batch(self)
+
     def release(self, obj):
+        """ Releases a memory pointer, or a list of them in batches """
+        if isinstance(obj, list):
+            self.pointers.release(obj)
+            return
+
         args = Args()
         args.setMemoryPointer("object", obj)
 
         self.invokeMethod("release", args)
+        self.pointers.forget([obj.getAddress()])
 
     class MethodInvocationException(RuntimeError):
         _responseCode = None
@@ -1,4 +1,4 @@
-from CBLClient.Client import Client
+from CBLClient.Client import get_client
 from CBLClient.Args import Args
 
 
@@ -12,7 +12,7 @@ class DataTypeInitiator(object):
         if not self.base_url:
             raise Exception("No base_url specified")
 
-        self._client = Client(self.base_url)
+        self._client = get_client(self.base_url)
 
     def setDate(self):
         args = Args()
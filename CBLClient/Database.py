@@ -1,6 +1,6 @@
 import uuid
 
-from CBLClient.Client import Client
+from CBLClient.Client import get_client
 from CBLClient.Args import Args
 from keywords.utils import log_info
 from keywords import types
@@ -20,7 +20,7 @@ class Database(object):
         if not self.base_url:
             raise Exception("No base_url specified")
 
-        self._client = Client(base_url)
+        self._client = get_client(base_url)
 
     def configure(self, directory=None, conflictResolver=None, password=None):
         args = Args()
@@ -209,12 +209,14 @@ class Database(object):
             args.setString("concurrencyControlType", concurrencyControlType)
         return self._client.invokeMethod("database_deleteWithConcurrency", args)
 
-    def create_bulk_docs(self, number, id_prefix, db, channels=None, generator=None, attachments_generator=None, id_start_num=0, attachment_file_list=None):
+    def create_bulk_docs(self, number, id_prefix, db, channels=None, generator=None, attachments_generator=None, id_start_num=0, attachment_file_list=None,
+                         seed_value=None):
         """
         if id_prefix == None, generate a uuid for each doc
 
         Add a 'number' of docs with a prefix 'id_prefix' using the provided generator from libraries.data.doc_generators.
         ex. id_prefix=testdoc with a number of 3 would create 'testdoc_0', 'testdoc_1', and 'testdoc_2'
+        Pass a 'seed_value' to generate the same doc bodies in every run.
         """
         added_docs = {}
         if channels is not None:
@@ -222,18 +224,7 @@ class Database(object):
 
         log_info("PUT {} docs to with prefix {}".format(number, id_prefix))
 
-        for i in xrange(id_start_num, id_start_num + number):
-
-            if generator == "four_k":
-                doc_body = doc_generators.four_k()
-            elif generator == "simple_user":
-                doc_body = doc_generators.simple_user()
-            elif generator == "complex_doc":
-                doc_body = doc_generators.complex_doc()
-            elif generator == "20mb":
-                doc_body = doc_generators.doc_20mb()
-            else:
-                doc_body = doc_generators.simple()
+        for i, doc_body in enumerate(doc_generators.generate_docs(generator, number, seed_value), id_start_num):
 
             if channels is not None:
                 doc_body["channels"] = channels
@@ -283,10 +274,20 @@ class Database(object):
                 updated_docs[doc] = doc_body
             self.updateDocuments(database, updated_docs)
 
-    def update_all_docs_individually(self, database, num_of_updates=1):
+    def update_all_docs_individually(self, database, num_of_updates=1, batch_size=None):
+        """
+        Increments the 'updates-cbl' property of every doc 'num_of_updates' times.
+        If 'batch_size' is set, the reads and the updates of 'batch_size' docs are
+        each sent as one batch request (test servers with batch support only)
+        """
         doc_ids = self.getDocIds(database)
-        doc_obj = Document(self._baseUrl)
+        doc_obj = Document(self.base_url)
         for i in xrange(num_of_updates):
+            if batch_size is not None:
+                for start in xrange(0, len(doc_ids), batch_size):
+                    self._update_docs_batch(database, doc_obj, doc_ids[start:start + batch_size])
+                continue
+
             for doc_id in doc_ids:
                 doc_mem = self.getDocument(database, doc_id)
                 doc_mut = doc_obj.toMutable(doc_mem)
@@ -299,6 +300,26 @@ class Database(object):
                 doc_body["updates-cbl"] = doc_body["updates-cbl"] + 1
                 self.updateDocument(database, doc_body, doc_id)
 
+    def _update_docs_batch(self, database, doc_obj, doc_ids):
+        batch = self._client.batch()
+        batch_db = batch.proxy(self)
+        batch_doc = batch.proxy(doc_obj)
+
+        # Read all the doc bodies in one round trip
+        for doc_id in doc_ids:
+            doc_mem = batch_db.getDocument(database, doc_id)
+            doc_mut = batch_doc.toMutable(doc_mem)
+            batch_doc.toMap(doc_mut)
+            batch.release(doc_mut)
+            batch.release(doc_mem)
+        results = batch.execute(raise_on_error=True)
+
+        # Results come back in order, 5 calls per doc and the doc body is the 3rd one
+        for doc_id, doc_body in zip(doc_ids, results[2::5]):
+            doc_body["updates-cbl"] = doc_body.get("updates-cbl", 0) + 1
+            batch_db.updateDocument(database, doc_body, doc_id)
+        batch.execute(raise_on_error=True)
+
     def deleteDBIfExists(self, db_name):
         if self.exists(db_name):
             self.deleteDBbyName(db_name)
@@ -0,0 +1,121 @@
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from keywords.exceptions import TimeoutError
+from keywords.utils import log_info
+
+# Replicator wait timeout (seconds) used when there is no deadline
+REPLICATOR_NO_DEADLINE = 365 * 24 * 60 * 60
+
+
+class Device(object):
+    """
+    The test server objects used to drive one CBL database on one device.
+    'repl' is set once the replicator of 'repl_obj' is created.
+    """
+
+    def __init__(self, name, db_obj, cbl_db, repl_obj=None, repl=None, query=None):
+        self.name = name
+        self.db_obj = db_obj
+        self.cbl_db = cbl_db
+        self.repl_obj = repl_obj
+        self.repl = repl
+        self.query = query
+
+
+class DeviceFleet(object):
+    """
+    Runs the same operation against several devices concurrently.
+
+    Each call to run() or wait_until_replicators_idle() returns once every device
+    is done, so a step takes as long as the slowest device instead of the sum of all
+    devices. The time spent by each device in the last step is kept in 'timings'.
+
+        fleet = DeviceFleet(devices)
+        fleet.run(lambda device: device.db_obj.update_bulk_docs(device.cbl_db))
+        fleet.wait_until_replicators_idle(timeout=600)
+    """
+
+    def __init__(self, devices):
+        if not devices:
+            raise ValueError("A device fleet needs at least one device")
+
+        self.devices = devices
+        self.timings = {}
+
+    def _run_timed(self, operation, device):
+        start = time.time()
+        try:
+            return operation(device)
+        finally:
+            self.timings[device.name] = time.time() - start
+
+    def run(self, operation, description=None):
+        """
+        Calls operation(device) for every device concurrently and returns the results in device order.
+        Raises the first error once all devices are done.
+        """
+
+        description = description or getattr(operation, "__name__", "operation")
+        self.timings = {}
+        start = time.time()
+
+        with ThreadPoolExecutor(max_workers=len(self.devices)) as executor:
+            futures = [executor.submit(self._run_timed, operation, device) for device in self.devices]
+
+        self.log_timings(description, time.time() - start)
+
+        errors = [(device, future.exception()) for device, future in zip(self.devices, futures) if future.exception() is not None]
+        for device, error in errors:
+            log_info("{} failed on {}: {}".format(description, device.name, error))
+        if errors:
+            raise errors[0][1]
+
+        return [future.result() for future in futures]
+
+    def log_timings(self, description, elapsed):
+        for device in self.devices:
+            if device.name in self.timings:
+                log_info("{} on {}: {:.2f}s".format(description, device.name, self.timings[device.name]))
+
+        if self.timings:
+            slowest = max(self.timings, key=self.timings.get)
+            log_info("{} completed on {} devices in {:.2f}s, slowest device: {}".format(description, len(self.timings), elapsed, slowest))
+
+    def wait_until_replicators_idle(self, timeout=None, sleep_time=2):
+        """
+        Waits for all replicators in parallel until each of them is idle with all changes completed.
+        All devices share the same deadline, 'timeout' seconds from now (no deadline if None).
+        """
+
+        deadline = None if timeout is None else time.time() + timeout
+
+        def wait_until_idle(device):
+            _wait_until_replicator_idle(device, deadline, sleep_time)
+
+        self.run(wait_until_idle, "Waiting for replicators to be idle")
+
+    def query_docs(self, limit, offset):
+        """ Runs the limit / offset docs query on all devices """
+
+        def query_docs(device):
+            return device.query.query_get_docs_limit_offset(device.cbl_db, limit=limit, offset=offset)
+
+        return self.run(query_docs, "Querying docs")
+
+    def get_doc_counts(self):
+        """ Returns the doc count of every device in device order """
+
+        def get_doc_count(device):
+            return device.db_obj.getCount(device.cbl_db)
+
+        return self.run(get_doc_count, "Getting doc counts")
+
+
+def _wait_until_replicator_idle(device, deadline, sleep_time):
+    timeout = REPLICATOR_NO_DEADLINE if deadline is None else max(deadline - time.time(), 0)
+    try:
+        device.repl_obj.wait_for_replicator_idle(device.repl, timeout, sleep_time=sleep_time)
+    except TimeoutError as e:
+        raise TimeoutError("{}: {}".format(device.name, e))
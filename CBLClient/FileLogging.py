@@ -1,4 +1,4 @@
-from CBLClient.Client import Client
+from CBLClient.Client import get_client
 from CBLClient.Args import Args
 
 
@@ -13,7 +13,7 @@ class FileLogging(object):
         if not self.base_url:
             raise Exception("No base_url specified")
 
-        self._client = Client(base_url)
+        self._client = get_client(base_url)
 
     def configure(self, log_level="debug", directory="", max_rotate_count=1, max_size=512000, plain_text=False):
         args = Args()
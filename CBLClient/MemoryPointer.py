@@ -7,3 +7,14 @@ class MemoryPointer(object):
 
     def getAddress(self):
         return self._address
+
+
+class BatchReference(MemoryPointer):
+    """
+    Result of a call queued in a Batch. It can be passed as an argument to
+    later calls of the same batch, the test server substitutes the result.
+    """
+
+    def __init__(self, index):
+        super(BatchReference, self).__init__("${}".format(index))
+        self.index = index
@@ -0,0 +1,202 @@
+import threading
+import weakref
+from collections import deque
+from contextlib import contextmanager
+
+from requests.exceptions import HTTPError
+
+from CBLClient.Args import Args
+from CBLClient.Batch import BatchCallError
+from CBLClient.MemoryPointer import MemoryPointer
+from CBLClient.MemoryPointer import BatchReference
+from keywords.constants import CBL_CLIENT_RELEASE_BATCH_SIZE
+from keywords.utils import log_info
+
+
+class MemoryPointerRegistry(object):
+    """
+    Tracks the memory pointers returned by a test server, so they can be released
+    without the test having to call Utils.release() on each of them.
+
+    Pointers can be released
+      - per scope: pointers returned while a scope is open are released when it ends
+
+            with client.pointers.scope():
+                doc = doc_obj.create("doc_1")
+                ...
+            # doc has been released on the test server
+
+        Use keep() for a pointer that has to outlive the scope.
+      - when garbage collected: if 'auto_release' is set, a pointer is released once
+        no MemoryPointer object refers to it anymore. The release is deferred to the next
+        call to the test server, garbage collection never sends requests.
+
+    Pointers returned with no scope open and without 'auto_release' are not tracked, only counted:
+    the test releases them itself (or they live until the test server memory is flushed).
+    len() is the number of live pointers, tracked or not.
+
+    Releases are sent in batches of 'batch_size' calls.
+    """
+
+    def __init__(self, client, batch_size=CBL_CLIENT_RELEASE_BATCH_SIZE, auto_release=False):
+        self._client = client
+        self.batch_size = batch_size
+        self.auto_release = auto_release
+        self._lock = threading.RLock()
+        # { address: number of MemoryPointer objects returned for it }
+        self._live = {}
+        # Live pointers returned with no scope open and without auto_release, only counted
+        self._num_untracked = 0
+        # Open scopes, innermost last. Shared by all threads, so pointers returned to
+        # worker threads (ex. DeviceFleet.run) belong to the scope of the main thread
+        self._scopes = []
+        self._weakrefs = set()
+        # Addresses of garbage collected pointers, appended by the weakref callbacks
+        self._collected = deque()
+        self._batch_supported = True
+        self.num_released = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._live) + self._num_untracked
+
+    def register(self, value):
+        """ Tracks the MemoryPointers in 'value' (a deserialized result) """
+
+        stack = [value]
+        while stack:
+            value = stack.pop()
+            if isinstance(value, dict):
+                stack.extend(value.values())
+            elif isinstance(value, list):
+                stack.extend(value)
+            elif isinstance(value, MemoryPointer) and not isinstance(value, BatchReference):
+                self._register_pointer(value)
+
+    def _register_pointer(self, pointer):
+        address = pointer.getAddress()
+        with self._lock:
+            if not self._scopes and not self.auto_release:
+                # Nothing will release it, counting it is enough
+                self._num_untracked += 1
+                return
+            self._live[address] = self._live.get(address, 0) + 1
+            if self._scopes:
+                self._scopes[-1].add(address)
+            if self.auto_release:
+                self._weakrefs.add(weakref.ref(pointer, self._make_collected_callback(address)))
+
+    def _make_collected_callback(self, address):
+        collected = self._collected
+        weakrefs = self._weakrefs
+
+        def on_collected(ref):
+            # Can run on any thread, in the middle of any call. deque.append and set.discard are atomic
+            weakrefs.discard(ref)
+            collected.append(address)
+
+        return on_collected
+
+    def keep(self, pointer):
+        """ Excludes 'pointer' from the release of the open scopes """
+        with self._lock:
+            for scope in self._scopes:
+                scope.discard(pointer.getAddress())
+
+    def begin_scope(self):
+        scope = set()
+        with self._lock:
+            self._scopes.append(scope)
+        return scope
+
+    def end_scope(self, scope):
+        """ Releases the pointers returned since begin_scope() returned 'scope' """
+        with self._lock:
+            if scope in self._scopes:
+                self._scopes.remove(scope)
+            addresses = [address for address in scope if address in self._live]
+        self.release_addresses(addresses)
+        self.release_collected()
+
+    @contextmanager
+    def scope(self):
+        scope = self.begin_scope()
+        try:
+            yield scope
+        finally:
+            self.end_scope(scope)
+
+    def release(self, pointers):
+        self.release_addresses([pointer.getAddress() for pointer in pointers])
+
+    def release_collected(self, min_count=1):
+        """ Releases the addresses of the garbage collected pointers, once at least 'min_count' have been collected """
+
+        if len(self._collected) < min_count:
+            return
+
+        addresses = []
+        with self._lock:
+            while self._collected:
+                address = self._collected.popleft()
+                count = self._live.get(address)
+                if count is None:
+                    # Already released
+                    continue
+                if count > 1:
+                    self._live[address] = count - 1
+                else:
+                    addresses.append(address)
+        self.release_addresses(addresses)
+
+    def forget(self, addresses):
+        """ Stops tracking 'addresses', they were released on the test server """
+        with self._lock:
+            for address in addresses:
+                if self._live.pop(address, None) is None:
+                    self._num_untracked = max(self._num_untracked - 1, 0)
+                for scope in self._scopes:
+                    scope.discard(address)
+            self.num_released += len(addresses)
+
+    def release_addresses(self, addresses):
+        if not addresses:
+            return
+        self.forget(addresses)
+
+        for start in range(0, len(addresses), self.batch_size):
+            chunk = addresses[start:start + self.batch_size]
+            if self._batch_supported:
+                try:
+                    self._release_batch(chunk)
+                    continue
+                except HTTPError as e:
+                    log_info("Test server does not support batches ({}), releasing one pointer at a time".format(e))
+                    self._batch_supported = False
+            for address in chunk:
+                self._release_one(address)
+
+    def _release_batch(self, addresses):
+        batch = self._client.batch()
+        for address in addresses:
+            batch.release(MemoryPointer(address))
+        for result in batch.execute():
+            if isinstance(result, BatchCallError):
+                log_info("Could not release {}: {}".format(addresses[result.index], result.message))
+
+    def _release_one(self, address):
+        args = Args()
+        args.setMemoryPointer("object", MemoryPointer(address))
+        try:
+            self._client.invokeMethod("release", args)
+        except Exception as e:
+            log_info("Could not release {}: {}".format(address, e))
+
+    def flushed(self):
+        """ Forgets every pointer, the test server memory was flushed """
+        with self._lock:
+            self._live = {}
+            self._num_untracked = 0
+            for scope in self._scopes:
+                scope.clear()
+            self._collected.clear()
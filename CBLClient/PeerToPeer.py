@@ -1,4 +1,4 @@
-from CBLClient.Client import Client
+from CBLClient.Client import get_client
 from CBLClient.Args import Args
 
 
@@ -15,7 +15,7 @@ class PeerToPeer(object):
         # If no base url was specified, raise an exception
         if not self.base_url:
             raise Exception("No base_url specified")
-        self._client = Client(base_url)
+        self._client = get_client(base_url)
         self.config = None
 
     def peer_intialize(self, database, continuous, host, port):
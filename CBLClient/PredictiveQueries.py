@@ -1,5 +1,5 @@
 from CBLClient.Args import Args
-from CBLClient.Client import Client
+from CBLClient.Client import get_client
 
 
 class PredictiveQueries(object):
@@ -13,7 +13,7 @@ class PredictiveQueries(object):
         if not self.base_url:
             raise Exception("No base_url specified")
 
-        self._client = Client(base_url)
+        self._client = get_client(base_url)
 
     def registerModel(self, modelName):
         args = Args()
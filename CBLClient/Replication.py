@@ -1,12 +1,19 @@
 import time
 import os
 
-from CBLClient.Client import Client
+from CBLClient.Client import get_client
 from CBLClient.Args import Args
 from CBLClient.Authenticator import Authenticator
+from keywords.exceptions import TimeoutError
 from keywords.utils import log_info
 from utilities.cluster_config_utils import sg_ssl_enabled
 
+# Longest wait (seconds) of a single waitForStatusChange call
+REPLICATOR_STATUS_CHANGE_TIMEOUT = 30
+
+# First delay (seconds) between status polls when the test server can not notify status changes
+REPLICATOR_STATUS_MIN_BACKOFF = 0.1
+
 
 class Replication(object):
     '''
@@ -21,7 +28,7 @@ class Replication(object):
         # If no base url was specified, raise an exception
         if not self.base_url:
             raise Exception("No base_url specified")
-        self._client = Client(base_url)
+        self._client = get_client(base_url)
         self.config = None
 
     def configure(self, source_db, target_url=None, target_db=None,
@@ -246,6 +253,27 @@ class Replication(object):
         args.setMemoryPointer("replicator", replicator)
         return self._client.invokeMethod("replicator_status", args)
 
+    def getStatusSnapshot(self, replicator):
+        """
+        Returns the replicator status in one call:
+        {"activityLevel": "idle", "completed": 10, "total": 10, "error": None, "version": 3}
+        'version' increases every time the status of the replicator changes
+        """
+        args = Args()
+        args.setMemoryPointer("replicator", replicator)
+        return self._client.invokeMethod("replicator_statusSnapshot", args)
+
+    def waitForStatusChange(self, replicator, version, timeout):
+        """
+        Returns the status snapshot as soon as its version is greater than 'version',
+        or after 'timeout' milliseconds if the status does not change
+        """
+        args = Args()
+        args.setMemoryPointer("replicator", replicator)
+        args.setLong("version", version)
+        args.setInt("timeout", timeout)
+        return self._client.invokeMethod("replicator_waitForStatusChange", args)
+
     def getCompleted(self, replicator):
         args = Args()
         args.setMemoryPointer("replicator", replicator)
@@ -290,35 +318,105 @@ class Replication(object):
         return repl
 
     def wait_until_replicator_idle(self, repl, err_check=True, max_times=150, sleep_time=2):
-        count = 0
-        # Sleep until replicator completely processed
-        activity_level = self.getActivitylevel(repl)
-        while count < max_times:
-            log_info("Activity level: {}".format(activity_level))
-            time.sleep(sleep_time)
-            if activity_level == "offline" or activity_level == "connecting" or activity_level == "busy":
-                count += 1
+        """
+        Waits until the replicator is idle with all changes completed or stopped, for at most
+        max_times * sleep_time seconds. Returns the last status snapshot
+        """
+        try:
+            return self.wait_for_replicator_idle(repl, max_times * sleep_time, err_check=err_check, sleep_time=sleep_time)
+        except TimeoutError as e:
+            log_info(str(e))
+            return None
+
+    def wait_for_replicator_idle(self, repl, timeout, err_check=True, sleep_time=2):
+        """
+        Waits until the replicator is idle with all changes completed or stopped and returns
+        the last status snapshot. Raises TimeoutError after 'timeout' seconds.
+
+        A replicator that looks done is only trusted once its status changed or it was seen busy
+        during the wait, or after 'sleep_time' seconds: right after start() or a local change,
+        the replicator can still report the status it had before picking up the work.
+
+        Test servers that support it notify status changes (waitForStatusChange), so this returns
+        as soon as the replicator is done. Other test servers are polled with a backoff growing up to 'sleep_time'.
+        """
+
+        start = time.time()
+        deadline = start + timeout
+        settle_deadline = start + sleep_time
+        first_status = status = self._get_status(repl)
+        seen_activity = False
+        backoff = REPLICATOR_STATUS_MIN_BACKOFF
+        while True:
+            if self._is_replicator_done(status, err_check):
+                if seen_activity or self._status_changed(first_status, status) or time.time() >= settle_deadline:
+                    return status
+                # Done so far, keep watching until the settle time
+                wait_until = min(settle_deadline, deadline)
             else:
-                if activity_level == "idle":
-                    if (self.getCompleted(repl) < self.getTotal(repl)) and self.getTotal(repl) != 0:
-                        count += 1
-                    else:
-                        time.sleep(sleep_time)
-                        break
-            if err_check:
-                err = self.getError(repl)
-                if err is not None and err != 'nil' and err != -1:
-                    raise Exception("Error while replicating", err)
-            activity_level = self.getActivitylevel(repl)
-            total = self.getTotal(repl)
-            completed = self.getCompleted(repl)
-            if activity_level == "stopped":
-                if completed < total:
-                    raise Exception("replication progress is not completed")
-                else:
-                    break
-            if total < completed and total <= 0:
-                raise Exception("total is less than completed")
+                seen_activity = True
+                wait_until = deadline
+
+            now = time.time()
+            if now >= deadline:
+                raise TimeoutError("Replicator is not idle after {}s, status: {}".format(timeout, status))
+
+            log_info("Activity level: {}".format(status["activityLevel"]))
+            if "version" in status and "replicator_waitForStatusChange" not in self._client.unsupported_methods:
+                wait_time = int(min(wait_until - now, REPLICATOR_STATUS_CHANGE_TIMEOUT) * 1000)
+                try:
+                    status = self.waitForStatusChange(repl, status["version"], wait_time)
+                    continue
+                except Exception as e:
+                    log_info("Waiting for a replicator status change failed, polling the status from now on: {}".format(e))
+                    self._client.unsupported_methods.add("replicator_waitForStatusChange")
+
+            time.sleep(min(backoff, max(wait_until - time.time(), 0)))
+            backoff = min(backoff * 2, sleep_time)
+            status = self._get_status(repl)
+
+    def _get_status(self, repl):
+        """
+        Returns the status snapshot, or the status read with one call per field if the test server
+        does not support snapshots. The snapshot is not tried again on the client once it failed.
+        """
+        if "replicator_statusSnapshot" not in self._client.unsupported_methods:
+            try:
+                return self.getStatusSnapshot(repl)
+            except Exception as e:
+                log_info("Replicator status snapshot failed, reading the status fields from now on: {}".format(e))
+                self._client.unsupported_methods.add("replicator_statusSnapshot")
+
+        return {
+            "activityLevel": self.getActivitylevel(repl),
+            "completed": self.getCompleted(repl),
+            "total": self.getTotal(repl),
+            "error": self.getError(repl)
+        }
+
+    def _status_changed(self, first_status, status):
+        if "version" in first_status and "version" in status:
+            return status["version"] != first_status["version"]
+        return any(status[key] != first_status[key] for key in ["activityLevel", "completed", "total"])
+
+    def _is_replicator_done(self, status, err_check):
+        if err_check:
+            err = status.get("error")
+            if err is not None and err != 'nil' and err != -1:
+                raise Exception("Error while replicating", err)
+
+        activity_level = status["activityLevel"]
+        total = status["total"]
+        completed = status["completed"]
+        if total < completed and total <= 0:
+            raise Exception("total is less than completed")
+
+        if activity_level == "stopped":
+            if completed < total:
+                raise Exception("replication progress is not completed")
+            return True
+
+        return activity_level == "idle" and (completed >= total or total == 0)
 
     def create_session_configure_replicate(self, baseUrl, sg_admin_url, sg_db, username, password,
                                            channels, sg_client, cbl_db, sg_blip_url, replication_type=None, continuous=True):
@@ -1,6 +1,6 @@
 import os
 
-from CBLClient.Client import Client
+from CBLClient.Client import get_client
 from CBLClient.Args import Args
 from utilities.cluster_config_utils import sg_ssl_enabled
 
@@ -16,7 +16,7 @@ class ReplicatorConfiguration(object):
         if not self.base_url:
             raise Exception("No base_url specified")
 
-        self._client = Client(base_url)
+        self._client = get_client(base_url)
 
     def configure(self, source_db, target_url=None, target_db=None, replication_type="push_pull", continuous=False,
                   channels=None, documentIDs=None, replicator_authenticator=None, headers=None):
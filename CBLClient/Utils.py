@@ -1,4 +1,5 @@
-from CBLClient.Client import Client
+from CBLClient.Client import get_client
+from CBLClient.Client import get_shared_clients
 
 
 class Utils:
@@ -11,15 +12,36 @@ class Utils:
         if not self.base_url:
             raise Exception("No base_url specified")
 
-        self._client = Client(base_url)
+        self._client = get_client(base_url)
 
     def release(self, obj):
-        # Release memory on the server
-        if isinstance(obj, list):
-            for i in obj:
-                self._client.release(i)
-        else:
-            self._client.release(obj)
+        # Release memory on the server, lists are released in batches
+        self._client.release(obj)
 
     def flushMemory(self):
-        return self._client.invokeMethod("flushMemory")
+        result = self._client.invokeMethod("flushMemory")
+        for client in get_shared_clients():
+            if client.base_url == self.base_url:
+                client.pointers.flushed()
+        return result
+
+    def pointer_scope(self):
+        """
+        Context manager that releases the memory pointers returned by the
+        test server (to any wrapper) while it is open. See MemoryPointerRegistry
+        """
+        return self._client.pointers.scope()
+
+    def begin_pointer_scope(self):
+        return self._client.pointers.begin_scope()
+
+    def end_pointer_scope(self, scope):
+        self._client.pointers.end_scope(scope)
+
+    def keep(self, obj):
+        """ Keeps a memory pointer alive after the open pointer scopes end """
+        self._client.pointers.keep(obj)
+
+    def get_stats(self):
+        """ Returns the requests per method and live memory pointers of this test server """
+        return self._client.stats()
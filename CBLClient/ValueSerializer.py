@@ -1,60 +1,139 @@
 import json
 from CBLClient.MemoryPointer import MemoryPointer
 
+# Wire encodings of dictionaries and lists
+#   legacy  - each container is a JSON string of serialized values, nested containers are
+#             JSON encoded once per nesting level (understood by every test server)
+#   tree    - one JSON tree prefixed with TREE_PREFIX, scalars keep their legacy tags.
+#             Only sent to the test servers listing it in their 'valueEncodings' reply (Android)
+VALUE_ENCODING_LEGACY = "legacy"
+VALUE_ENCODING_TREE = "tree"
+VALUE_ENCODINGS = [VALUE_ENCODING_LEGACY, VALUE_ENCODING_TREE]
+
+# Request header asking the test server to reply with the same encoding
+VALUE_ENCODING_HEADER = "CBL-Value-Encoding"
+
+TREE_PREFIX = "~"
+
 
 class ValueSerializer(object):
     @staticmethod
-    def serialize(value):
+    def serialize(value, encoding=VALUE_ENCODING_LEGACY):
+        if isinstance(value, (dict, list)):
+            if encoding == VALUE_ENCODING_LEGACY:
+                return ValueSerializer._serialize_legacy(value)
+            return TREE_PREFIX + json.dumps(ValueSerializer._to_tree(value), separators=(",", ":"))
+
+        return ValueSerializer._serialize_scalar(value)
+
+    @staticmethod
+    def _serialize_scalar(value):
         if value is None or value == "None":
             return "null"
         elif isinstance(value, MemoryPointer):
             return value.getAddress()
         elif isinstance(value, str):
-            string = str(value)
-            return "\"" + string + "\""
+            return "\"" + value + "\""
         elif isinstance(value, unicode):
             value = value.encode('utf-8')
             return "\"" + value + "\""
         elif isinstance(value, bool):
             # bool has to be before int,
             # Python's Bool gets caught by int
-            bool_val = bool(value)
-            return "true" if bool_val else "false"
+            return "true" if value else "false"
         elif isinstance(value, long):
-            number = long(value)
-            return "L" + str(number)
+            return "L" + str(value)
         elif isinstance(value, int):
             if value / 1000000000 < 2:
-                number = int(value)
-                return "I" + str(number)
+                return "I" + str(value)
             return "L" + str(value)
         elif isinstance(value, float):
-            number = float(value)
-            return "F" + str(number)
+            return "F" + str(value)
         # There is no double/number in python
-        elif isinstance(value, dict):
-            dict_map = value
-            string_map = {}
 
-            for map_param in dict_map:
-                val = ValueSerializer.serialize(dict_map[map_param])
-                string_map[map_param] = val
+        raise RuntimeError("Invalid value type: {}: {}".format(value, type(value)))
 
+    @staticmethod
+    def _serialize_legacy(value):
+        if isinstance(value, dict):
+            string_map = {}
+            for key, val in value.iteritems():
+                if isinstance(val, (dict, list)):
+                    string_map[key] = ValueSerializer._serialize_legacy(val)
+                else:
+                    string_map[key] = ValueSerializer._serialize_scalar(val)
             return json.dumps(string_map)
-        elif isinstance(value, list):
-            string_list = []
 
-            for obj in value:
-                string = ValueSerializer.serialize(obj)
-                string_list.append(string)
-            return json.dumps(string_list)
+        string_list = []
+        for val in value:
+            if isinstance(val, (dict, list)):
+                string_list.append(ValueSerializer._serialize_legacy(val))
+            else:
+                string_list.append(ValueSerializer._serialize_scalar(val))
+        return json.dumps(string_list)
 
-        raise RuntimeError("Invalid value type: {}: {}".format(value, type(value)))
+    @staticmethod
+    def _to_tree(value):
+        """
+        Converts a dictionary / list to a tree of the same shape with tagged scalars.
+        Walks the value iteratively, so the depth of the value is not limited by the recursion limit.
+        """
+
+        root = {} if isinstance(value, dict) else []
+        stack = [(value, root)]
+        while stack:
+            src, dst = stack.pop()
+            is_dict = isinstance(src, dict)
+            for key, val in (src.iteritems() if is_dict else enumerate(src)):
+                if isinstance(val, dict):
+                    node = {}
+                    stack.append((val, node))
+                elif isinstance(val, list):
+                    node = []
+                    stack.append((val, node))
+                else:
+                    node = ValueSerializer._serialize_scalar(val)
+
+                if is_dict:
+                    dst[key] = node
+                else:
+                    dst.append(node)
+
+        return root
 
     @staticmethod
     def deserialize(value):
         if not value or len(value) == 0 or value == "null":
             return None
+        elif value.startswith(TREE_PREFIX):
+            return ValueSerializer._from_tree(json.loads(value[1:]))
+        elif value.startswith("{"):
+            string_map = json.loads(value)
+            map = {}
+
+            for entry in string_map:
+                key = str(entry)
+                obj = ValueSerializer.deserialize(string_map[key])
+
+                map[key] = obj
+
+            return map
+        elif value.startswith("["):
+            string_list = json.loads(value)
+            res_list = []
+
+            for string in string_list:
+                obj = ValueSerializer.deserialize(string)
+                res_list.append(obj)
+
+            return res_list
+
+        return ValueSerializer._deserialize_scalar(value)
+
+    @staticmethod
+    def _deserialize_scalar(value):
+        if value == "null":
+            return None
         elif value.startswith("@"):
             return MemoryPointer(value)
         elif value.startswith("\"") and value.endswith("\""):
@@ -74,25 +153,34 @@ class ValueSerializer(object):
                 return float(value[1:])
             else:
                 return int(value[1:])
-        elif value.startswith("{"):
-            string_map = json.loads(value)
-            map = {}
 
-            for entry in string_map:
-                key = str(entry)
-                obj = ValueSerializer.deserialize(string_map[key])
+        raise RuntimeError("Invalid value type: {}: {}".format(value, type(value)))
 
-                map[key] = obj
+    @staticmethod
+    def _from_tree(tree):
+        """ Reverse of _to_tree(), also iterative """
 
-            return map
-        elif value.startswith("["):
-            string_list = json.loads(value)
-            res_list = []
+        if not isinstance(tree, (dict, list)):
+            return ValueSerializer._deserialize_scalar(tree)
 
-            for string in string_list:
-                obj = ValueSerializer.deserialize(string)
-                res_list.append(obj)
+        root = {} if isinstance(tree, dict) else []
+        stack = [(tree, root)]
+        while stack:
+            src, dst = stack.pop()
+            is_dict = isinstance(src, dict)
+            for key, val in (src.iteritems() if is_dict else enumerate(src)):
+                if isinstance(val, dict):
+                    node = {}
+                    stack.append((val, node))
+                elif isinstance(val, list):
+                    node = []
+                    stack.append((val, node))
+                else:
+                    node = ValueSerializer._deserialize_scalar(val)
 
-            return res_list
+                if is_dict:
+                    dst[str(key)] = node
+                else:
+                    dst.append(node)
 
-        raise RuntimeError("Invalid value type: {}: {}".format(value, type(value)))
+        return root
@@ -0,0 +1,98 @@
+import functools
+
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+
+from keywords.MobileRestClient import MobileRestClient
+from keywords.constants import ASYNC_CLIENT_MAX_CONCURRENCY
+from keywords.utils import log_info
+
+# MobileRestClient keywords exposed by AsyncMobileRestClient. Each one keeps the
+# MobileRestClient signature and returns a concurrent.futures.Future
+ASYNC_KEYWORDS = [
+    # Document CRUD
+    "get_doc",
+    "add_doc",
+    "put_doc",
+    "update_doc",
+    "delete_doc",
+    "get_attachment",
+    "purge_doc",
+    # Bulk
+    "add_bulk_docs",
+    "delete_bulk_docs",
+    "get_bulk_docs",
+    "get_all_docs",
+    # Changes
+    "get_changes",
+    # Sessions
+    "get_session",
+    "request_session",
+    "create_session",
+    "delete_session"
+]
+
+
+def _async_keyword(name):
+
+    @functools.wraps(getattr(MobileRestClient, name))
+    def submit(self, *args, **kwargs):
+        return self.submit(name, *args, **kwargs)
+
+    return submit
+
+
+class AsyncMobileRestClient:
+    """
+    Issues MobileRestClient keywords concurrently over a shared pool of keep-alive
+    connections. At most 'max_concurrency' requests are in flight at any time,
+    additional requests are queued until a slot frees up.
+
+    Keywords listed in ASYNC_KEYWORDS keep their MobileRestClient signature and
+    return a Future. Use map() to fan out a keyword over many argument sets.
+
+    with AsyncMobileRestClient(max_concurrency=200) as client:
+        futures = [client.update_doc(url, db, doc["id"]) for doc in docs]
+        updated_docs = client.wait(futures)
+    """
+
+    def __init__(self, max_concurrency=ASYNC_CLIENT_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.client = MobileRestClient(max_concurrency=max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """ Waits for in flight requests and releases the worker pool """
+        self._executor.shutdown(wait=True)
+
+    def submit(self, keyword, *args, **kwargs):
+        """ Schedules a MobileRestClient 'keyword' and returns a Future for its result """
+        return self._executor.submit(getattr(self.client, keyword), *args, **kwargs)
+
+    def wait(self, futures):
+        """
+        Waits for 'futures' and returns their results in the same order.
+        The first failed request raises its exception.
+        """
+        concurrent.futures.wait(futures)
+        return [future.result() for future in futures]
+
+    def map(self, keyword, kwargs_list):
+        """
+        Issues 'keyword' once per kwargs dictionary in 'kwargs_list' and returns the results in order
+
+        ex. client.map("get_doc", [{"url": sg_url, "db": sg_db, "doc_id": doc_id} for doc_id in doc_ids])
+        """
+        log_info("Issuing {} '{}' requests with a concurrency of {}".format(len(kwargs_list), keyword, self.max_concurrency))
+        futures = [self.submit(keyword, **kwargs) for kwargs in kwargs_list]
+        return self.wait(futures)
+
+
+for _keyword in ASYNC_KEYWORDS:
+    setattr(AsyncMobileRestClient, _keyword, _async_keyword(_keyword))
@@ -0,0 +1,559 @@
+import asyncore
+import base64
+import heapq
+import json
+import multiprocessing
+import socket
+import sys
+import time
+import urlparse
+
+from concurrent.futures import ProcessPoolExecutor
+
+from keywords.MobileRestClient import get_auth_type
+from keywords.constants import AuthType
+from keywords.exceptions import ChangesError
+from keywords.utils import log_info
+
+# Feeds the load engine can simulate
+CHANGES_LOAD_FEEDS = ["normal", "longpoll", "continuous"]
+
+# Timeout (ms) of the longpoll requests and heartbeat (ms) of the continuous feeds
+CHANGES_LOAD_LONGPOLL_TIMEOUT = 60000
+CHANGES_LOAD_HEARTBEAT = 30000
+
+# Consecutive failed requests after which a feed gives up
+CHANGES_LOAD_MAX_ERRORS = 10
+
+SOCKET_READ_SIZE = 64 * 1024
+
+
+def changes_feed_spec(user_name, auth, feed, filter_type=None, filter_channels=None, filter_doc_ids=None):
+    """
+    Describes one simulated changes feed. 'auth' is a session (from create_session) or a (name, password) tuple.
+    'filter_type' is None, 'sync_gateway/bychannel' (with 'filter_channels') or '_doc_ids' (with 'filter_doc_ids', normal feed only)
+    """
+
+    if feed not in CHANGES_LOAD_FEEDS:
+        raise ValueError("Unsupported changes feed: {}. Use one of {}".format(feed, CHANGES_LOAD_FEEDS))
+
+    if filter_type == "_doc_ids" and feed != "normal":
+        raise ValueError("'_doc_ids' filter only works with feed=normal")
+
+    return {
+        "user": user_name,
+        "auth": auth,
+        "feed": feed,
+        "filter_type": filter_type,
+        "filter_channels": filter_channels,
+        "filter_doc_ids": filter_doc_ids
+    }
+
+
+class _HttpResponseParser:
+    """
+    Incremental HTTP/1.1 response parser.
+    Body bytes (de-chunked) are passed to on_body(data) as they arrive, on_complete() is called at the end of the response.
+    """
+
+    def __init__(self, on_body, on_complete):
+        self.on_body = on_body
+        self.on_complete = on_complete
+        self.status = None
+        self.headers = {}
+        self.complete = False
+        self._buffer = b""
+        self._state = "status"
+        self._remaining = 0
+
+    def feed(self, data):
+        self._buffer += data
+        while not self.complete and self._step():
+            pass
+
+    def close(self):
+        """ Called when the server closes the connection """
+        if self._state == "until_close" and not self.complete:
+            self._finish()
+
+    def _read_line(self):
+        index = self._buffer.find(b"\r\n")
+        if index == -1:
+            return None
+        line = self._buffer[:index]
+        self._buffer = self._buffer[index + 2:]
+        return line
+
+    def _finish(self):
+        self.complete = True
+        self.on_complete()
+
+    def _step(self):
+        """ Parses what it can from the buffer, returns False when more data is needed """
+
+        if self._state in ("status", "headers", "trailer"):
+            line = self._read_line()
+            if line is None:
+                return False
+
+            if self._state == "status":
+                self.status = int(line.split(b" ")[1])
+                self._state = "headers"
+            elif self._state == "trailer":
+                if not line:
+                    self._finish()
+            elif line:
+                name, _, value = line.decode("latin-1").partition(":")
+                self.headers[name.strip().lower()] = value.strip()
+            elif self.headers.get("transfer-encoding", "").lower() == "chunked":
+                self._state = "chunk_size"
+            elif "content-length" in self.headers:
+                self._remaining = int(self.headers["content-length"])
+                self._state = "body"
+                if self._remaining == 0:
+                    self._finish()
+            else:
+                self._state = "until_close"
+            return True
+
+        if self._state == "chunk_size":
+            line = self._read_line()
+            if line is None:
+                return False
+            self._remaining = int(line.split(b";")[0], 16)
+            self._state = "chunk" if self._remaining > 0 else "trailer"
+            return True
+
+        if self._state == "chunk_end":
+            if len(self._buffer) < 2:
+                return False
+            self._buffer = self._buffer[2:]
+            self._state = "chunk_size"
+            return True
+
+        if not self._buffer:
+            return False
+
+        if self._state == "until_close":
+            data, self._buffer = self._buffer, b""
+            self.on_body(data)
+            return False
+
+        # "body" or "chunk"
+        data = self._buffer[:self._remaining]
+        self._buffer = self._buffer[len(data):]
+        self._remaining -= len(data)
+        self.on_body(data)
+        if self._remaining == 0:
+            if self._state == "chunk":
+                self._state = "chunk_end"
+            else:
+                self._finish()
+        return True
+
+
+class _EventLoop:
+    """ asyncore loop over a private socket map, with timers """
+
+    def __init__(self):
+        self.socket_map = {}
+        self._timers = []
+        self._timer_count = 0
+
+    def call_later(self, delay, callback):
+        # The counter keeps the heap from comparing callbacks
+        self._timer_count += 1
+        heapq.heappush(self._timers, (time.time() + delay, self._timer_count, callback))
+
+    def run(self, is_done, deadline=None):
+        while not is_done():
+            now = time.time()
+            if deadline is not None and now > deadline:
+                return False
+
+            while self._timers and self._timers[0][0] <= now:
+                _, _, callback = heapq.heappop(self._timers)
+                callback()
+
+            timeout = 1.0
+            if self._timers:
+                timeout = max(0.0, min(timeout, self._timers[0][0] - time.time()))
+
+            if self.socket_map:
+                # poll() does not have the FD_SETSIZE limit of select()
+                asyncore.loop(timeout=timeout, use_poll=True, map=self.socket_map, count=1)
+            else:
+                time.sleep(timeout)
+        return True
+
+
+class _ChangesFeed(asyncore.dispatcher):
+    """
+    One simulated changes feed. normal / longpoll feeds issue requests on a keep-alive connection,
+    'changes_delay' seconds apart. A continuous feed processes changes as they are streamed.
+    The feed stops once it has seen the terminator doc.
+    """
+
+    def __init__(self, loop, host, port, db, spec, terminator_doc_id, changes_delay, changes_limit):
+        asyncore.dispatcher.__init__(self, map=loop.socket_map)
+        self.loop = loop
+        self.address = (host, port)
+        self.host_header = "{}:{}".format(host, port)
+        self.db = db
+        self.spec = spec
+        self.terminator_doc_id = terminator_doc_id
+        self.changes_delay = changes_delay
+        self.changes_limit = changes_limit
+
+        self.since = 0
+        self.done = False
+        self.error = None
+        self.connected_socket = False
+
+        self.latest_changes = {}
+        self.seen_at = {}
+        self.num_requests = 0
+        self.num_changes = 0
+        self.num_errors = 0
+        self.consecutive_errors = 0
+        self.started_at = None
+        self.finished_at = None
+
+        self._out_buffer = b""
+        self._parser = None
+        self._body = []
+        self._line_buffer = b""
+
+    # Request building
+
+    def _request_body(self):
+        feed = self.spec["feed"]
+        body = {"feed": feed, "since": self.since}
+        if feed == "longpoll":
+            body["timeout"] = CHANGES_LOAD_LONGPOLL_TIMEOUT
+        if feed == "continuous":
+            body["heartbeat"] = CHANGES_LOAD_HEARTBEAT
+        elif self.changes_limit is not None:
+            body["limit"] = self.changes_limit
+
+        filter_type = self.spec["filter_type"]
+        if filter_type == "sync_gateway/bychannel":
+            body["filter"] = filter_type
+            body["channels"] = ",".join(self.spec["filter_channels"])
+        elif filter_type == "_doc_ids":
+            body["filter"] = filter_type
+            body["doc_ids"] = self.spec["filter_doc_ids"]
+        elif filter_type is not None:
+            raise ChangesError("Unsupported _changes filter_type: {}".format(filter_type))
+
+        return json.dumps(body).encode("utf-8")
+
+    def _auth_header(self):
+        auth = self.spec["auth"]
+        auth_type = get_auth_type(auth)
+        if auth_type == AuthType.session:
+            return "Cookie: SyncGatewaySession={}\r\n".format(auth[1])
+        elif auth_type == AuthType.http_basic:
+            credentials = base64.b64encode("{}:{}".format(auth[0], auth[1]).encode("utf-8")).decode("ascii")
+            return "Authorization: Basic {}\r\n".format(credentials)
+        return ""
+
+    def send_request(self):
+        if self.done:
+            return
+
+        if self.started_at is None:
+            self.started_at = time.time()
+
+        body = self._request_body()
+        headers = "POST /{}/_changes HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n{}\r\n".format(
+            self.db, self.host_header, len(body), self._auth_header()
+        )
+        self._out_buffer = headers.encode("utf-8") + body
+        self._parser = _HttpResponseParser(self._on_body, self._on_response_complete)
+        self._body = []
+        self._line_buffer = b""
+        self.num_requests += 1
+
+        if not self.connected_socket:
+            self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.connected_socket = True
+            self.connect(self.address)
+
+    # Response processing
+
+    def _process_change(self, change):
+        if self.spec["feed"] == "continuous":
+            # Resume from there if the server ends the feed
+            self.since = change.get("seq", change.get("last_seq", self.since))
+
+        doc_id = change.get("id")
+        if doc_id is None:
+            return
+
+        if doc_id == self.terminator_doc_id:
+            self._finish()
+            return
+
+        self.num_changes += 1
+        if change.get("changes"):
+            rev = change["changes"][0]["rev"]
+        else:
+            rev = ""
+
+        if self.latest_changes.get(doc_id) != rev:
+            self.latest_changes[doc_id] = rev
+            self.seen_at[doc_id] = time.time()
+
+    def _on_body(self, data):
+        if self._parser.status != 200:
+            self._body.append(data)
+            return
+
+        if self.spec["feed"] != "continuous":
+            self._body.append(data)
+            return
+
+        # Continuous feeds stream one change per line, empty lines are heartbeats
+        lines = (self._line_buffer + data).split(b"\n")
+        self._line_buffer = lines.pop()
+        for line in lines:
+            line = line.strip()
+            if line and not self.done:
+                self._process_change(json.loads(line))
+
+    def _on_response_complete(self):
+        if self._parser.status != 200:
+            self._on_error("status {}: {}".format(self._parser.status, b"".join(self._body)[:200]))
+            return
+
+        self.consecutive_errors = 0
+        if self.spec["feed"] == "continuous":
+            # The server ended the feed, resume from where it stopped
+            self._close_connection()
+            if not self.done:
+                self.loop.call_later(self.changes_delay, self.send_request)
+            return
+
+        changes = json.loads(b"".join(self._body))
+        for change in changes["results"]:
+            self._process_change(change)
+            if self.done:
+                return
+        self.since = changes["last_seq"]
+
+        if self._parser.headers.get("connection", "").lower() == "close":
+            self._close_connection()
+        self.loop.call_later(self.changes_delay, self.send_request)
+
+    def _on_error(self, message):
+        self.num_errors += 1
+        self.consecutive_errors += 1
+        self._close_connection()
+        if self.consecutive_errors >= CHANGES_LOAD_MAX_ERRORS:
+            self.error = message
+            log_info("Changes feed ({}, {}) failed: {}".format(self.spec["user"], self.spec["feed"], message))
+            self._finish()
+        else:
+            self.loop.call_later(max(self.changes_delay, 1), self.send_request)
+
+    def _finish(self):
+        if not self.done:
+            self.done = True
+            self.finished_at = time.time()
+            self._close_connection()
+
+    def _close_connection(self):
+        if self.connected_socket:
+            self.connected_socket = False
+            self.close()
+            self.connected = False
+
+    # asyncore callbacks
+
+    def handle_connect(self):
+        pass
+
+    def writable(self):
+        return len(self._out_buffer) > 0 or not self.connected
+
+    def handle_write(self):
+        sent = self.send(self._out_buffer)
+        self._out_buffer = self._out_buffer[sent:]
+
+    def handle_read(self):
+        data = self.recv(SOCKET_READ_SIZE)
+        if data and self._parser is not None and not self._parser.complete:
+            self._parser.feed(data)
+
+    def handle_close(self):
+        parser = self._parser
+        self._close_connection()
+        if parser is None or self.done:
+            return
+        parser.close()
+        if not parser.complete:
+            # The connection dropped before the response completed (ex. an idle keep-alive connection was closed)
+            self._on_error("connection closed")
+
+    def handle_error(self):
+        error = "{}: {}".format(sys.exc_info()[0].__name__, sys.exc_info()[1])
+        self._close_connection()
+        if not self.done:
+            self._on_error(error)
+
+    def result(self):
+        return {
+            "user": self.spec["user"],
+            "feed": self.spec["feed"],
+            "latest_changes": self.latest_changes,
+            "seen_at": self.seen_at,
+            "requests": self.num_requests,
+            "changes": self.num_changes,
+            "errors": self.num_errors,
+            "error": self.error,
+            "terminated": self.done and self.error is None,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+
+def run_changes_feeds(sg_url, sg_db, specs, terminator_doc_id, changes_delay=0, changes_limit=None, timeout=None):
+    """
+    Runs the changes feeds described by 'specs' (see changes_feed_spec) on one event loop, in this process,
+    until every feed has seen 'terminator_doc_id' (or 'timeout' seconds). Returns one result per spec:
+    {"user", "feed", "latest_changes": {doc_id: rev}, "seen_at": {doc_id: time the latest rev was seen},
+     "requests", "changes", "errors", "error", "terminated", "started_at", "finished_at"}
+    """
+
+    url = urlparse.urlparse(sg_url)
+    if url.scheme != "http":
+        raise ChangesError("The changes load engine only supports http urls: {}".format(sg_url))
+
+    loop = _EventLoop()
+    feeds = [
+        _ChangesFeed(loop, url.hostname, url.port or 80, sg_db, spec, terminator_doc_id, changes_delay, changes_limit)
+        for spec in specs
+    ]
+    for feed in feeds:
+        loop.call_later(0, feed.send_request)
+
+    deadline = time.time() + timeout if timeout is not None else None
+    if not loop.run(lambda: all(feed.done for feed in feeds), deadline):
+        log_info("Changes feeds timed out after {}s".format(timeout))
+
+    for feed in feeds:
+        feed._close_connection()
+    return [feed.result() for feed in feeds]
+
+
+def _run_changes_feeds_args(args):
+    return run_changes_feeds(*args)
+
+
+class ChangesLoadEngine:
+    """
+    Simulates the changes feeds of many users, multiplexed over one event loop per worker process,
+    instead of a process per feed.
+
+    engine = ChangesLoadEngine(sg_url, sg_db, "terminator", changes_delay=1)
+    engine.start([changes_feed_spec("user_0", session, "longpoll"), ...])
+    ... write docs, then the terminator doc ...
+    results = engine.results()
+
+    Each process holds one connection per feed, make sure the open files limit allows for it.
+    """
+
+    def __init__(self, sg_url, sg_db, terminator_doc_id, changes_delay=0, changes_limit=None, processes=None):
+        self.sg_url = sg_url
+        self.sg_db = sg_db
+        self.terminator_doc_id = terminator_doc_id
+        self.changes_delay = changes_delay
+        self.changes_limit = changes_limit
+        self.processes = processes or multiprocessing.cpu_count()
+        self._executor = None
+        self._futures = []
+
+    def start(self, specs, timeout=None):
+        """ Starts the feeds in the background, spread evenly over the worker processes """
+
+        num_processes = max(1, min(self.processes, len(specs)))
+        log_info("Starting {} changes feeds over {} processes".format(len(specs), num_processes))
+
+        self._executor = ProcessPoolExecutor(max_workers=num_processes)
+        self._futures = [
+            self._executor.submit(_run_changes_feeds_args, (
+                self.sg_url,
+                self.sg_db,
+                specs[i::num_processes],
+                self.terminator_doc_id,
+                self.changes_delay,
+                self.changes_limit,
+                timeout
+            ))
+            for i in range(num_processes)
+        ]
+
+    def results(self):
+        """ Blocks until all the feeds have terminated and returns their results """
+
+        try:
+            results = []
+            for future in self._futures:
+                results.extend(future.result())
+            return results
+        finally:
+            self._executor.shutdown()
+
+
+def _percentile(sorted_values, percentile):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(percentile / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def visibility_latencies(result, writes):
+    """
+    Returns the seconds between each write and the time the feed first saw the written revision.
+    'writes' is {doc_id: (rev, write time)}, only the writes the feed ended up seeing are included.
+    """
+
+    latencies = []
+    for doc_id, (rev, written_at) in writes.items():
+        if result["latest_changes"].get(doc_id) == rev:
+            latencies.append(max(0.0, result["seen_at"][doc_id] - written_at))
+    return latencies
+
+
+def summarize_changes_load(results, writes=None):
+    """
+    Summarizes the results of the feeds per user and feed:
+    { user: { feed: {"changes", "changes_per_sec", "requests", "errors", "terminated",
+                     "latency_p50_secs", "latency_p95_secs", "latency_max_secs"} } }
+    Latencies are only computed if 'writes' ({doc_id: (rev, write time)}) is provided.
+    """
+
+    summary = {}
+    for result in results:
+        elapsed = None
+        if result["started_at"] is not None and result["finished_at"] is not None:
+            elapsed = result["finished_at"] - result["started_at"]
+
+        feed_summary = {
+            "changes": result["changes"],
+            "changes_per_sec": result["changes"] / elapsed if elapsed else None,
+            "requests": result["requests"],
+            "errors": result["errors"],
+            "terminated": result["terminated"]
+        }
+
+        if writes is not None:
+            latencies = sorted(visibility_latencies(result, writes))
+            feed_summary["latency_p50_secs"] = _percentile(latencies, 50)
+            feed_summary["latency_p95_secs"] = _percentile(latencies, 95)
+            feed_summary["latency_max_secs"] = latencies[-1] if latencies else None
+
+        summary.setdefault(result["user"], {})[result["feed"]] = feed_summary
+
+    return summary
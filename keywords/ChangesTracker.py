@@ -1,8 +1,11 @@
+import base64
 import json
 import time
 import logging
+import threading
 
 import requests
+import websocket
 from requests.exceptions import Timeout
 
 from keywords.MobileRestClient import get_auth_type
@@ -11,47 +14,118 @@ from keywords.utils import log_r
 from keywords.utils import log_info
 import keywords.exceptions
 
+# Feeds supported by the ChangesTracker
+CHANGES_FEEDS = ["longpoll", "continuous", "websocket"]
+
+# Heartbeat (ms) used by the streaming feeds when none is provided, so that
+# the tracker can notice stop() while the feed is idle
+STREAMING_FEED_HEARTBEAT = 5000
+
+
+class ChangesWaiter:
+    """
+    Live set of the expected docs that have not been seen in the changes feed yet.
+    Docs are crossed out as changes are processed so checking for completion is O(1).
+    """
+
+    def __init__(self, expected_docs, rev_prefix_gen=False):
+        self.rev_prefix_gen = rev_prefix_gen
+
+        # { "doc_id": set(["rev1", "rev2"]) }
+        self.missing = {}
+        for doc in expected_docs:
+            self.missing.setdefault(doc["id"], set()).add(doc["rev"])
+
+    def num_missing(self):
+        return sum(len(revs) for revs in self.missing.values())
+
+    def cross_out(self, doc_id, rev):
+        """ Removes the expected revs of 'doc_id' matched by 'rev' """
+
+        expected_revs = self.missing.get(doc_id)
+        if expected_revs is None:
+            return
+
+        if self.rev_prefix_gen:
+            expected_revs.difference_update([expected_rev for expected_rev in expected_revs if rev.startswith(expected_rev)])
+        else:
+            expected_revs.discard(rev)
+
+        if not expected_revs:
+            del self.missing[doc_id]
+
 
 class ChangesTracker:
 
-    def __init__(self, url, db, auth=None):
+    def __init__(self, url, db, auth=None, feed="longpoll"):
+        """
+        'feed' is the _changes feed type used by start(), one of CHANGES_FEEDS.
+        The 'continuous' and 'websocket' feeds process changes as soon as they are streamed.
+        """
+
+        if feed not in CHANGES_FEEDS:
+            raise ValueError("Unsupported changes feed: {}. Use one of {}".format(feed, CHANGES_FEEDS))
+
         self.processed_changes = {}
         self.endpoint = "{}/{}".format(url, db)
         self.auth = auth
+        self.feed = feed
+
+        # Index of seen revisions, { "doc_id": set(["rev1", "rev2"]) }
+        self.processed_revs = {}
+
+        # Guards the processed changes and notifies the waiters when new changes land
+        self._changes_condition = threading.Condition()
+        self._waiters = []
 
         self.cancel = False
 
     def process_changes(self, results):
         """
-        Add each doc from longpoll changes results to the processed changes list in the following format:
+        Add each doc from changes results to the processed changes list in the following format:
         { "doc_id": [ {"rev": "rev1"}, {"rev", "rev2"}, ...] }
         """
 
-        for doc in results:
-            if len(doc["changes"]) > 0:
-                if doc["id"] in self.processed_changes:
-                    # doc has already been seen in the changes feed,
-                    # append new changes to revs accociated with that id
-                    revs_list = self.processed_changes[doc["id"]]
+        with self._changes_condition:
+            for doc in results:
+                if len(doc["changes"]) > 0:
+                    revs = self.processed_revs.setdefault(doc["id"], set())
 
                     # If the document is already in 'processed_changes', make sure
                     # that the revision doesn't already exist. If we see one, raise an exception
                     # because we are seeing the same revision being sent twice
                     # Checking against this scenario - https://github.com/couchbase/sync_gateway/issues/2186
-                    changes_revs = [change["rev"] for change in doc["changes"]]
-                    revs_list_revs = [rev["rev"] for rev in revs_list]
-                    for change in changes_revs:
-                        if change in revs_list_revs:
+                    for change in doc["changes"]:
+                        if change["rev"] in revs:
                             raise keywords.exceptions.ChangesError("Duplicates in changes feed!")
-                    revs_list.extend(doc["changes"])
-                    self.processed_changes[doc["id"]] = revs_list
-                else:
-                    # Stored the doc with the list of rev changes
-                    self.processed_changes[doc["id"]] = doc["changes"]
+                        revs.add(change["rev"])
+
+                        for waiter in self._waiters:
+                            waiter.cross_out(doc["id"], change["rev"])
+
+                    self.processed_changes.setdefault(doc["id"], []).extend(doc["changes"])
+
+            self._changes_condition.notify_all()
+
+    def _get_loop_timeout(self, timeout):
+        if timeout > 1000:
+            return (timeout // 1000) * 10
+        return 60
+
+    def _post_changes(self, data, request_timeout, stream=False):
+        auth_type = get_auth_type(self.auth)
+        if auth_type == AuthType.session:
+            return requests.post("{}/_changes".format(self.endpoint), data=json.dumps(
+                data), cookies=dict(SyncGatewaySession=self.auth[1]), timeout=request_timeout, stream=stream)
+        elif auth_type == AuthType.http_basic:
+            return requests.post("{}/_changes".format(self.endpoint), data=json.dumps(
+                data), auth=self.auth, timeout=request_timeout, stream=stream)
+        else:
+            return requests.post("{}/_changes".format(self.endpoint), data=json.dumps(data), timeout=request_timeout, stream=stream)
 
     def start(self, timeout=1000, heartbeat=None, request_timeout=None):
         """
-        Start a longpoll changes feed and and store the results in self.processed changes
+        Start a changes feed of type self.feed and store the results in self.processed changes
         """
 
         # convert to seconds for use with requests lib api
@@ -60,16 +134,20 @@ class ChangesTracker:
         else:
             request_timeout = 1000
 
-        auth_type = get_auth_type(self.auth)
-        current_seq_num = 0
+        loop_timeout = self._get_loop_timeout(timeout)
+        log_info("[Changes Tracker] Changes Tracker ({}) Starting for {} ...".format(self.feed, loop_timeout))
 
-        start = time.time()
-        if timeout > 1000:
-            loop_timeout = (timeout // 1000) * 10
+        if self.feed == "longpoll":
+            self._start_longpoll(timeout, heartbeat, request_timeout, loop_timeout)
+        elif self.feed == "continuous":
+            self._start_continuous(timeout, heartbeat, request_timeout, loop_timeout)
         else:
-            loop_timeout = 60
+            self._start_websocket(heartbeat, request_timeout, loop_timeout)
 
-        log_info("[Changes Tracker] Changes Tracker Starting for {} ...".format(loop_timeout))
+    def _start_longpoll(self, timeout, heartbeat, request_timeout, loop_timeout):
+
+        current_seq_num = 0
+        start = time.time()
 
         while not self.cancel:
             # This if condition will run this method until the timeout and break and come out of this method.
@@ -88,29 +166,12 @@ class ChangesTracker:
             if heartbeat is not None:
                 data["heartbeat"] = heartbeat
 
-            if auth_type == AuthType.session:
-                try:
-                    resp = requests.post("{}/_changes".format(self.endpoint), data=json.dumps(
-                        data), cookies=dict(SyncGatewaySession=self.auth[1]), timeout=request_timeout)
-                except Timeout as to:
-                    log_info("Request timed out. Exiting longpoll loop ...")
-                    logging.debug(to)
-                    break
-            elif auth_type == AuthType.http_basic:
-                try:
-                    resp = requests.post("{}/_changes".format(self.endpoint), data=json.dumps(
-                        data), auth=self.auth, timeout=request_timeout)
-                except Timeout as to:
-                    log_info("Request timed out. Exiting longpoll loop ...")
-                    logging.debug(to)
-                    break
-            else:
-                try:
-                    resp = requests.post("{}/_changes".format(self.endpoint), data=json.dumps(data), timeout=request_timeout)
-                except Timeout as to:
-                    log_info("Request timed out. Exiting longpoll loop ...")
-                    logging.debug(to)
-                    break
+            try:
+                resp = self._post_changes(data, request_timeout)
+            except Timeout as to:
+                log_info("Request timed out. Exiting longpoll loop ...")
+                logging.debug(to)
+                break
 
             log_r(resp)
             resp.raise_for_status()
@@ -118,21 +179,112 @@ class ChangesTracker:
 
             self.process_changes(resp_obj["results"])
             current_seq_num = resp_obj["last_seq"]
-            time.sleep(2)
+
+            # Only back off when the feed has nothing new, otherwise catch up right away
+            if len(resp_obj["results"]) == 0:
+                time.sleep(2)
 
         log_info("[Changes Tracker] End of longpoll changes loop")
 
+    def _start_continuous(self, timeout, heartbeat, request_timeout, loop_timeout):
+
+        if heartbeat is None:
+            heartbeat = STREAMING_FEED_HEARTBEAT
+
+        current_seq_num = 0
+        start = time.time()
+
+        # Reconnect from the last sequence if the feed ends (timeout) before the tracker is done
+        while not self.cancel and time.time() - start <= loop_timeout:
+            data = {
+                "feed": "continuous",
+                "style": "all_docs",
+                "since": current_seq_num,
+                "heartbeat": heartbeat
+            }
+
+            if timeout is not None:
+                data["timeout"] = timeout
+
+            try:
+                resp = self._post_changes(data, request_timeout, stream=True)
+                log_r(resp, body=False)
+                resp.raise_for_status()
+
+                # Heartbeats come through as empty lines
+                for line in resp.iter_lines():
+                    if self.cancel or time.time() - start > loop_timeout:
+                        break
+
+                    if not line:
+                        continue
+
+                    change = json.loads(line)
+                    if "last_seq" in change:
+                        current_seq_num = change["last_seq"]
+                    else:
+                        self.process_changes([change])
+                        current_seq_num = change["seq"]
+                resp.close()
+            except Timeout as to:
+                log_info("Request timed out. Exiting continuous loop ...")
+                logging.debug(to)
+                break
+
+        log_info("[Changes Tracker] End of continuous changes loop")
+
+    def _start_websocket(self, heartbeat, request_timeout, loop_timeout):
+
+        if heartbeat is None:
+            heartbeat = STREAMING_FEED_HEARTBEAT
+
+        auth_type = get_auth_type(self.auth)
+        headers = []
+        if auth_type == AuthType.session:
+            headers.append("Cookie: SyncGatewaySession={}".format(self.auth[1]))
+        elif auth_type == AuthType.http_basic:
+            credentials = base64.b64encode("{}:{}".format(self.auth[0], self.auth[1]).encode("utf-8"))
+            headers.append("Authorization: Basic {}".format(credentials.decode("utf-8")))
+
+        ws_url = "{}/_changes?feed=websocket".format(self.endpoint.replace("http", "ws", 1))
+        ws = websocket.create_connection(ws_url, header=headers, timeout=request_timeout)
+
+        # sync_gateway reads the feed options as the first message
+        ws.send(json.dumps({"since": 0, "style": "all_docs", "heartbeat": heartbeat}))
+
+        # Wake up at least once per heartbeat to check for stop()
+        ws.settimeout(heartbeat / 1000.0)
+
+        start = time.time()
+        try:
+            while not self.cancel and time.time() - start <= loop_timeout:
+                try:
+                    message = ws.recv()
+                except websocket.WebSocketTimeoutException:
+                    continue
+
+                if not message:
+                    continue
+
+                changes = json.loads(message)
+                if isinstance(changes, list):
+                    self.process_changes(changes)
+        finally:
+            ws.close()
+
+        log_info("[Changes Tracker] End of websocket changes loop")
+
     def stop(self):
         """
-        Stop the longpoll changes feed
+        Stop the changes feed
         """
         log_info("[Changes Tracker] Closing _changes feed ...")
         self.cancel = True
 
     def wait_until(self, expected_docs, timeout=30, rev_prefix_gen=False):
         """
-        Poll self.processed_changes to see if all expected docs have been recieved
-        via the changes feed. This will return false if the polling exceeds the timeout
+        Wait for all expected docs to be recieved via the changes feed. Returns True as soon as the last
+        expected revision is processed and False if it is not seen before the timeout
 
         expected docs format: [{"id": "doc_id1" "rev": "rev1", "ok", "true"}, ...]
 
@@ -140,38 +292,30 @@ class ChangesTracker:
             It is useful if you want to verify changes when updated by SDK as SDK does not know the actual
             revision, but with scenario it can know what prefix in the revision it is expecting
         """
+
         start = time.time()
-        while True:
-            if time.time() - start > timeout:
-                logging.error("[Changes Tracker] wait_until: TIMEOUT")
-                return False
-
-            # Check that the expected docs exist in the processed_changes
-            missing_docs = []
-            for doc in expected_docs:
-                if doc["id"] not in self.processed_changes:
-                    # doc_id not found in changes
-                    missing_docs.append(doc)
-                else:
-                    rev_found = False
-                    for rev in self.processed_changes[doc["id"]]:
-                        if rev_prefix_gen:
-                            if rev["rev"].startswith(doc["rev"]):
-                                # Found rev in changes feed, continue with the next doc
-                                rev_found = True
-                        else:
-                            if rev["rev"] == doc["rev"]:
-                                # Found rev in changes feed, continue with the next docs
-                                rev_found = True
-
-                    if not rev_found:
-                        missing_docs.append(doc)
-
-            if len(missing_docs) == 0:
-                log_info("[Changes Tracker] :) Saw all docs in the changes feed for ({})!".format(self.auth))
-
-                return True
-
-            log_info("[Changes Tracker] Docs missing from changes feed: {}".format(len(missing_docs)))
-
-            time.sleep(2)
+        waiter = ChangesWaiter(expected_docs, rev_prefix_gen=rev_prefix_gen)
+
+        with self._changes_condition:
+
+            # Cross out changes that were processed before waiting
+            for doc_id in list(waiter.missing.keys()):
+                for rev in self.processed_revs.get(doc_id, ()):
+                    waiter.cross_out(doc_id, rev)
+
+            self._waiters.append(waiter)
+            try:
+                while waiter.missing:
+                    remaining = timeout - (time.time() - start)
+                    if remaining <= 0:
+                        logging.error("[Changes Tracker] wait_until: TIMEOUT")
+                        log_info("[Changes Tracker] Docs missing from changes feed: {}".format(waiter.num_missing()))
+                        return False
+
+                    # Wakes up on every processed batch of changes
+                    self._changes_condition.wait(remaining)
+            finally:
+                self._waiters.remove(waiter)
+
+        log_info("[Changes Tracker] :) Saw all docs in the changes feed for ({})!".format(self.auth))
+        return True
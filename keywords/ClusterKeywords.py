@@ -15,6 +15,7 @@ from keywords.utils import (log_info, log_r, version_and_build,
                             version_is_binary, compare_versions)
 from libraries.testkit.cluster import Cluster
 from utilities.cluster_config_utils import is_load_balancer_enabled, get_load_balancer_ip, sg_ssl_enabled
+from utilities.cluster_config_utils import get_cluster_config, load_cluster_config_json
 
 
 class ClusterKeywords:
@@ -69,10 +70,18 @@ class ClusterKeywords:
           Setting lb_enable to True will return LB IPs instead of SG IPs
           Setting lb_enable to False will return SG IPs instead of LB IPs
           install_nginx sets it to False to get the SG_IPs for the nginx.conf
+
+        The topology is computed once per version of the cluster config
         """
 
-        with open("{}.json".format(cluster_config)) as f:
-            cluster = json.loads(f.read())
+        return get_cluster_config(cluster_config).memoize(
+            ("cluster_topology", lb_enable, self.sg_scheme),
+            lambda: self._compute_cluster_topology(cluster_config, lb_enable)
+        )
+
+    def _compute_cluster_topology(self, cluster_config, lb_enable):
+
+        cluster = load_cluster_config_json(cluster_config)
 
         sg_urls = []
         ac_urls = []
@@ -3,14 +3,17 @@ import json
 import time
 import uuid
 import re
+import threading
 
 from requests import Session
+from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE
 from requests.exceptions import HTTPError
 
 import concurrent.futures
 from concurrent.futures import ThreadPoolExecutor
 
 from keywords import attachment
+from keywords import multipart
 from libraries.data import doc_generators
 from libraries.provision.ansible_runner import AnsibleRunner
 
@@ -18,6 +21,8 @@ from keywords.constants import AuthType
 from keywords.constants import ServerType
 from keywords.constants import Platform
 from keywords.constants import CLIENT_REQUEST_TIMEOUT
+from keywords.constants import CLIENT_MAX_CONCURRENCY
+from keywords.constants import BULK_DOCS_RETRYABLE_STATUSES
 from keywords.constants import REGISTERED_CLIENT_DBS
 from keywords.utils import log_r
 from keywords.utils import log_info
@@ -37,30 +42,112 @@ def parse_multipart_response(response):
 
         {"_id":"test_ls_db2_0","_rev":"1-9a525c69cafb3d1cdf69545fa5ccfecc","date_time_added":"2016-04-29 13:34:26.346148"}
 
+    'response' can either be a requests response (preferably issued with stream=True)
+    or the text of the response. Use multipart.iter_multipart_response_docs()
+    to process the docs one at a time.
+
     Returns a a list of docs {"rows": [ {"_id":"test_ls_db2_0","_rev":"1-9a525c69cafb3d1cdf69545fa5ccfecc" ... } ] }
     """
-    rows = []
 
-    for part in response.split("--"):
+    if hasattr(response, "iter_content"):
+        return {"rows": list(multipart.iter_multipart_response_docs(response))}
+
+    if not isinstance(response, bytes):
+        response = response.encode("utf-8")
+
+    # The response text does not carry the Content-Type, the first delimiter gives the boundary
+    match = re.search(br"^--(\S+)", response.lstrip(), re.MULTILINE)
+    if match is None:
+        return {"rows": []}
+
+    boundary = match.group(1).decode("utf-8")
+    return {"rows": list(multipart.iter_multipart_docs([response], boundary))}
+
+
+def chunk_serialized_docs(docs, chunk_size, max_chunk_bytes):
+    """
+    Lazily slices an iterable of docs into chunks of at most 'chunk_size' docs and
+    (unless a single doc is bigger) 'max_chunk_bytes' serialized bytes.
+    Each doc is serialized once, yields lists of (doc, serialized_doc) tuples.
+    """
+
+    chunk = []
+    chunk_bytes = 0
+    for doc in docs:
+        serialized_doc = json.dumps(doc)
+        if chunk and (len(chunk) >= chunk_size or chunk_bytes + len(serialized_doc) > max_chunk_bytes):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append((doc, serialized_doc))
+        chunk_bytes += len(serialized_doc)
+
+    if chunk:
+        yield chunk
 
-        part_lines = part.splitlines()
-        # part_lines follow the format
-        # [
-        #   '5570ab847be212079e2b05bbbfa023da25b07712bda36aec6481bca024f3',
-        #   Content-Type: application/json,
-        #   { doc }
-        # ]
-        # Only include part that has doc property
-        if part_lines and len(part_lines) > 2:
-            doc = part_lines[-1]
-            try:
-                doc_obj = json.loads(doc)
-                rows.append(doc_obj)
-            except Exception as e:
-                # A few lines from the response can't be parsed as docs
-                logging.error("Could not parse docs as JSON: {} error: {}".format(doc, e))
 
-    return {"rows": rows}
+# Maps the vendor name returned by GET / to a (ServerType, Platform)
+VENDOR_SERVER_TYPES = {
+    "Couchbase Sync Gateway": (ServerType.syncgateway, Platform.centos),
+    "Couchbase Lite (Objective-C)": (ServerType.listener, Platform.macosx),
+    "Couchbase Lite (C#)": (ServerType.listener, Platform.net)
+}
+
+
+class ServerDescriptor:
+    """
+    Describes the service running behind a url as reported by GET /
+        - vendor: vendor name (None for Android LiteServ)
+        - version: version string reported by the service
+        - server_type: ServerType or None if unsupported
+        - platform: Platform or None if unsupported
+    """
+
+    def __init__(self, url, vendor, version, server_type, platform):
+        self.url = url
+        self.vendor = vendor
+        self.version = version
+        self.server_type = server_type
+        self.platform = platform
+
+    def __str__(self):
+        return "ServerDescriptor(url={}, vendor={}, version={}, server_type={}, platform={})".format(
+            self.url,
+            self.vendor,
+            self.version,
+            self.server_type,
+            self.platform
+        )
+
+    @classmethod
+    def from_response(cls, url, resp_obj):
+        """
+        Builds a ServerDescriptor from the GET / response of
+            - sync_gateway: {"couchdb": "Welcome", "vendor": {"name": "Couchbase Sync Gateway", "version": "2.1"}, "version": "..."}
+            - LiteServ: {"couchdb": "Welcome", "vendor": {"name": "Couchbase Lite (Objective-C)", "version": "..."}, "version": "..."}
+            - Android LiteServ: {"CBLite": "Welcome", "couchdb": "Welcome", "version": "..."}
+        """
+
+        server_type = None
+        platform = None
+
+        if "vendor" in resp_obj:
+            vendor = resp_obj["vendor"]["name"]
+            version = resp_obj["vendor"].get("version", resp_obj.get("version"))
+            if vendor in VENDOR_SERVER_TYPES:
+                server_type, platform = VENDOR_SERVER_TYPES[vendor]
+        else:
+            vendor = None
+            version = resp_obj.get("version")
+            if resp_obj.get("CBLite") == "Welcome":
+                # Android LiteServ
+                server_type, platform = ServerType.listener, Platform.android
+
+        return cls(url, vendor, version, server_type, platform)
+
+
+def _server_descriptor_key(url):
+    return url.rstrip("/")
 
 
 def get_auth_type(auth):
@@ -85,12 +172,32 @@ class MobileRestClient:
     via REST
     """
 
-    def __init__(self):
+    def __init__(self, max_concurrency=CLIENT_MAX_CONCURRENCY, pool_maxsize=None):
+        """
+        'max_concurrency' bounds the number of requests the fan out helpers (ex. update_docs)
+        issue at once. 'pool_maxsize' is the number of keep-alive connections kept per host,
+        it defaults to 'max_concurrency' so concurrent requests never wait on a connection.
+        """
         headers = {"Content-Type": "application/json"}
         self._session = Session()
         self._session.headers = headers
         self._session.verify = False
 
+        self.max_concurrency = max_concurrency
+        if pool_maxsize is None:
+            pool_maxsize = max_concurrency
+
+        if pool_maxsize > DEFAULT_POOLSIZE:
+            adapter = HTTPAdapter(pool_connections=DEFAULT_POOLSIZE, pool_maxsize=pool_maxsize)
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+
+        # Server descriptors keyed by url, see get_server_descriptor()
+        self._server_descriptors = {}
+        self._server_descriptors_lock = threading.Lock()
+        self.server_descriptor_hits = 0
+        self.server_descriptor_misses = 0
+
     def merge(self, *doc_lists):
         """
         Keyword to merge multiple lists of document dictionarys into one list
@@ -103,63 +210,93 @@ class MobileRestClient:
             merged_list.extend(doc_list)
         return merged_list
 
-    def get_server_type(self, url):
+    def get_server_descriptor(self, url):
         """
-        Issues a get to the service running at the specified url.
-        It will return a server type of 'listener' or 'syncgateway'
+        Returns the ServerDescriptor for the service running at the specified url.
+        The first call for a url issues a GET /, subsequent calls are served from the
+        per client cache until the url is invalidated or refreshed.
+        """
+
+        key = _server_descriptor_key(url)
+
+        with self._server_descriptors_lock:
+            descriptor = self._server_descriptors.get(key)
+            if descriptor is not None:
+                self.server_descriptor_hits += 1
+                log_debug("Server descriptor cache hit: {}".format(descriptor))
+                return descriptor
+            self.server_descriptor_misses += 1
+
+        return self.refresh_server_descriptor(url)
+
+    def refresh_server_descriptor(self, url):
+        """
+        Issues a GET / to the service running at the specified url, replaces
+        any cached ServerDescriptor for the url and returns the new one.
+        Use this after restarting or upgrading the service behind a url.
         """
 
         resp = self._session.get(url)
         log_r(resp)
         resp.raise_for_status()
-        resp_obj = resp.json()
 
-        try:
-            if resp_obj["vendor"]["name"] == "Couchbase Sync Gateway":
-                logging.info("ServerType={}".format(ServerType.syncgateway))
-                return ServerType.syncgateway
-            elif resp_obj["vendor"]["name"] == "Couchbase Lite (Objective-C)":
-                logging.info("ServerType={}".format(ServerType.listener))
-                return ServerType.listener
-            elif resp_obj["vendor"]["name"] == "Couchbase Lite (C#)":
-                logging.info("ServerType={}".format(ServerType.listener))
-                return ServerType.listener
-        except KeyError:
-            # Android LiteServ
-            if resp_obj["CBLite"] == "Welcome":
-                return ServerType.listener
-
-        raise ValueError("Unsupported couchbase lite server type")
+        descriptor = ServerDescriptor.from_response(url, resp.json())
+        logging.info("ServerType={} Platform={}".format(descriptor.server_type, descriptor.platform))
+
+        with self._server_descriptors_lock:
+            self._server_descriptors[_server_descriptor_key(url)] = descriptor
+
+        return descriptor
+
+    def invalidate_server_descriptors(self, url=None):
+        """
+        Drops the cached ServerDescriptor for 'url' so the next lookup issues a GET /.
+        If no url is provided, the whole cache is cleared.
+        """
+
+        with self._server_descriptors_lock:
+            if url is None:
+                self._server_descriptors.clear()
+            else:
+                self._server_descriptors.pop(_server_descriptor_key(url), None)
+
+    def get_server_descriptor_cache_stats(self):
+        """
+        Returns the server descriptor cache counters in the format:
+        {"hits": 10, "misses": 2, "size": 2}
+        """
+
+        with self._server_descriptors_lock:
+            return {
+                "hits": self.server_descriptor_hits,
+                "misses": self.server_descriptor_misses,
+                "size": len(self._server_descriptors)
+            }
+
+    def get_server_type(self, url):
+        """
+        Returns the server type of the service running at the specified url.
+        It will return a server type of 'listener' or 'syncgateway'
+        """
+
+        server_type = self.get_server_descriptor(url).server_type
+        if server_type is None:
+            raise ValueError("Unsupported couchbase lite server type")
+
+        return server_type
 
     def get_server_platform(self, url):
         """
-        Issues a get to the service running at the specified url.
+        Returns the platform of the service running at the specified url.
         It will return a server type of 'macosx', 'android', or 'net' for listener
         of centos for sync_gateway
         """
 
-        resp = self._session.get(url)
-        log_r(resp)
-        resp.raise_for_status()
-        resp_obj = resp.json()
+        platform = self.get_server_descriptor(url).platform
+        if platform is None:
+            raise ValueError("Unsupported platform type")
 
-        try:
-            if resp_obj["vendor"]["name"] == "Couchbase Sync Gateway":
-                logging.info("Platform={}".format(Platform.centos))
-                return Platform.centos
-            elif resp_obj["vendor"]["name"] == "Couchbase Lite (Objective-C)":
-                logging.info("Platform={}".format(Platform.macosx))
-                return Platform.macosx
-            elif resp_obj["vendor"]["name"] == "Couchbase Lite (C#)":
-                logging.info("Platform={}".format(Platform.net))
-                return Platform.net
-        except KeyError:
-            # Android LiteServ
-            if resp_obj["CBLite"] == "Welcome":
-                logging.info("Platform={}".format(Platform.android))
-                return Platform.android
-
-        raise ValueError("Unsupported platform type")
+        return platform
 
     def get_session(self, url, db=None, session_id=None):
 
@@ -1154,7 +1291,7 @@ class MobileRestClient:
 
         updated_docs = []
 
-        with ThreadPoolExecutor(max_workers=2) as executor:
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
 
             future_to_url = [
                 executor.submit(
@@ -1269,12 +1406,13 @@ class MobileRestClient:
 
         return resp_obj
 
-    def add_docs(self, url, db, number, id_prefix, auth=None, channels=None, generator=None, attachments_generator=None):
+    def add_docs(self, url, db, number, id_prefix, auth=None, channels=None, generator=None, attachments_generator=None, seed_value=None):
         """
         if id_prefix == None, generate a uuid for each doc
 
         Add a 'number' of docs with a prefix 'id_prefix' using the provided generator from libraries.data.doc_generators.
         ex. id_prefix=testdoc with a number of 3 would create 'testdoc_0', 'testdoc_1', and 'testdoc_2'
+        Pass a 'seed_value' to generate the same doc bodies in every run.
         """
         added_docs = []
 
@@ -1283,14 +1421,7 @@ class MobileRestClient:
 
         log_info("PUT {} docs to {}/{}/ with prefix {}".format(number, url, db, id_prefix))
 
-        for i in xrange(number):
-
-            if generator == "four_k":
-                doc_body = doc_generators.four_k()
-            elif generator == "simple_user":
-                doc_body = doc_generators.simple_user()
-            else:
-                doc_body = doc_generators.simple()
+        for i, doc_body in enumerate(doc_generators.generate_docs(generator, number, seed_value)):
 
             if channels is not None:
                 doc_body["channels"] = channels
@@ -1353,6 +1484,133 @@ class MobileRestClient:
 
         return resp_obj
 
+    def _post_bulk_docs_chunk(self, url, db, chunk, new_edits, auth, max_retries):
+        """
+        POSTs a chunk of pre serialized docs to _bulk_docs. Docs that fail with a retryable status
+        (and whole requests that fail with one) are retried up to 'max_retries' times with backoff.
+        Returns (doc responses, doc errors, number of attempts)
+        """
+
+        auth_type = get_auth_type(auth)
+        ok_docs = []
+        pending = chunk
+        attempt = 0
+
+        while True:
+            attempt += 1
+
+            body = '{{"docs": [{}]{}}}'.format(
+                ",".join(serialized_doc for _, serialized_doc in pending),
+                ', "new_edits": true' if new_edits else ""
+            )
+
+            if auth_type == AuthType.session:
+                resp = self._session.post("{}/{}/_bulk_docs".format(url, db), data=body, cookies=dict(SyncGatewaySession=auth[1]))
+            elif auth_type == AuthType.http_basic:
+                resp = self._session.post("{}/{}/_bulk_docs".format(url, db), data=body, auth=auth)
+            else:
+                resp = self._session.post("{}/{}/_bulk_docs".format(url, db), data=body)
+
+            log_r(resp, info=False, body=False)
+
+            if resp.status_code in BULK_DOCS_RETRYABLE_STATUSES and attempt <= max_retries:
+                log_info("_bulk_docs returned {}, retrying {} docs ...".format(resp.status_code, len(pending)))
+                time.sleep(attempt)
+                continue
+
+            resp.raise_for_status()
+
+            # _bulk_docs returns one entry per doc, in request order
+            doc_resps = resp.json()
+            if len(doc_resps) > len(pending):
+                raise RestError("_bulk_docs returned {} responses for {} docs".format(len(doc_resps), len(pending)))
+
+            retry = []
+            errors = []
+            for (doc, serialized_doc), doc_resp in zip(pending, doc_resps):
+                if "error" not in doc_resp:
+                    ok_docs.append(doc_resp)
+                elif doc_resp.get("status") in BULK_DOCS_RETRYABLE_STATUSES and attempt <= max_retries:
+                    retry.append((doc, serialized_doc))
+                else:
+                    errors.append(doc_resp)
+
+            # Docs missing from a truncated response may not have been written, they are resent
+            for doc, serialized_doc in pending[len(doc_resps):]:
+                if attempt <= max_retries:
+                    retry.append((doc, serialized_doc))
+                else:
+                    errors.append({"id": doc.get("_id"), "error": "No _bulk_docs response for the doc"})
+
+            if not retry:
+                return ok_docs, errors, attempt
+
+            log_info("Retrying {} docs with retryable _bulk_docs errors ...".format(len(retry)))
+            pending = retry
+            time.sleep(attempt)
+
+    def add_bulk_docs_chunked(self, url, db, docs, auth=None, chunk_size=1000, max_chunk_bytes=4 * 1024 * 1024, max_in_flight=4, max_retries=3):
+        """
+        Writes an iterable (list, generator) of docs through _bulk_docs in chunks of at most
+        'chunk_size' docs and 'max_chunk_bytes' bytes, keeping 'max_in_flight' chunk requests in flight.
+        The iterable is only consumed as request slots free up, so docs never need to be built up front.
+
+        Docs with retryable errors are resent up to 'max_retries' times.
+        This is a generator that yields a result per chunk as it completes:
+        {
+            "chunk": 3,             # index of the chunk in the doc iterable
+            "docs": [...],          # _bulk_docs responses of the written docs
+            "errors": [...],        # _bulk_docs responses of the docs that could not be written
+            "num_bytes": 4194000,   # serialized size of the chunk
+            "attempts": 1,          # number of requests issued for the chunk
+            "latency": 0.25         # seconds from first request to last response
+        }
+        """
+
+        new_edits = self.get_server_type(url) == ServerType.listener
+        chunks = enumerate(chunk_serialized_docs(docs, chunk_size, max_chunk_bytes))
+
+        def write_chunk(index, chunk):
+            start = time.time()
+            ok_docs, errors, attempts = self._post_bulk_docs_chunk(url, db, chunk, new_edits, auth, max_retries)
+            return {
+                "chunk": index,
+                "docs": ok_docs,
+                "errors": errors,
+                "num_bytes": sum(len(serialized_doc) for _, serialized_doc in chunk),
+                "attempts": attempts,
+                "latency": time.time() - start
+            }
+
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+
+            in_flight = set()
+            exhausted = False
+            while True:
+
+                # Backpressure: only pull the next chunk when a request slot is free
+                while not exhausted and len(in_flight) < max_in_flight:
+                    try:
+                        index, chunk = next(chunks)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    in_flight.add(executor.submit(write_chunk, index, chunk))
+
+                if not in_flight:
+                    break
+
+                done, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    log_info("Wrote chunk {}: {} docs, {} errors in {:.3f}s".format(
+                        result["chunk"],
+                        len(result["docs"]),
+                        len(result["errors"]),
+                        result["latency"]
+                    ))
+                    yield result
+
     def delete_bulk_docs(self, url, db, docs, auth=None):
         """
         Issues a bulk delete by setting the _deleted flag to true.
@@ -1431,21 +1689,18 @@ class MobileRestClient:
         auth_type = get_auth_type(auth)
 
         if auth_type == AuthType.session:
-            resp = self._session.post("{}/{}/_bulk_get?revs={}".format(url, db, rev_history), data=json.dumps(request_body), cookies=dict(SyncGatewaySession=auth[1]))
+            resp = self._session.post("{}/{}/_bulk_get?revs={}".format(url, db, rev_history), data=json.dumps(request_body), cookies=dict(SyncGatewaySession=auth[1]), stream=True)
         elif auth_type == AuthType.http_basic:
-            resp = self._session.post("{}/{}/_bulk_get?revs={}".format(url, db, rev_history), data=json.dumps(request_body), auth=auth)
+            resp = self._session.post("{}/{}/_bulk_get?revs={}".format(url, db, rev_history), data=json.dumps(request_body), auth=auth, stream=True)
         else:
-            resp = self._session.post("{}/{}/_bulk_get?revs={}".format(url, db, rev_history), data=json.dumps(request_body))
+            resp = self._session.post("{}/{}/_bulk_get?revs={}".format(url, db, rev_history), data=json.dumps(request_body), stream=True)
 
-        log_r(resp)
+        log_r(resp, body=False)
         resp.raise_for_status()
 
-        resp_obj = parse_multipart_response(resp.text)
-        logging.debug(resp_obj)
-
         docs = []
         errors = []
-        for row in resp_obj["rows"]:
+        for row in multipart.iter_multipart_response_docs(resp):
             if "error" in row:
                 errors.append(row)
             else:
@@ -1748,7 +2003,7 @@ class MobileRestClient:
                 resp = self._session.post("{}/{}/_all_docs".format(url, db), data=json.dumps(data))
                 log_r(resp)
                 resp.raise_for_status()
-                resp_obj = resp.json()
+                resp_rows = resp.json()["rows"]
 
             elif server_type == ServerType.syncgateway:
 
@@ -1759,16 +2014,17 @@ class MobileRestClient:
                 bulk_get_body = {"docs": bulk_get_body_id_list}
 
                 if auth_type == AuthType.session:
-                    resp = self._session.post("{}/{}/_bulk_get".format(url, db), data=json.dumps(bulk_get_body), cookies=dict(SyncGatewaySession=auth[1]))
+                    resp = self._session.post("{}/{}/_bulk_get".format(url, db), data=json.dumps(bulk_get_body), cookies=dict(SyncGatewaySession=auth[1]), stream=True)
                 elif auth_type == AuthType.http_basic:
-                    resp = self._session.post("{}/{}/_bulk_get".format(url, db), data=json.dumps(bulk_get_body), auth=auth)
+                    resp = self._session.post("{}/{}/_bulk_get".format(url, db), data=json.dumps(bulk_get_body), auth=auth, stream=True)
                 else:
-                    resp = self._session.post("{}/{}/_bulk_get".format(url, db), data=json.dumps(bulk_get_body))
+                    resp = self._session.post("{}/{}/_bulk_get".format(url, db), data=json.dumps(bulk_get_body), stream=True)
 
-                log_r(resp)
+                log_r(resp, body=False)
                 resp.raise_for_status()
 
-                resp_obj = parse_multipart_response(resp.text)
+                # Docs are verified as they are parsed from the stream
+                resp_rows = multipart.iter_multipart_response_docs(resp)
 
             # See any docs were not retured
             # Mac OSX - {"key":"test_ls_db2_5","error":"not_found"}
@@ -1778,7 +2034,10 @@ class MobileRestClient:
             all_attachments_returned = True
             missing_docs = []
             missing_attachment_docs = []
-            for resp_doc in resp_obj["rows"]:
+            resp_docs = {}
+            num_rows = 0
+            for resp_doc in resp_rows:
+                num_rows += 1
                 if "error" in resp_doc or ("value" in resp_doc and len(resp_doc["value"]) == 0):
                     # Doc not found
                     missing_docs.append(resp_doc)
@@ -1791,6 +2050,10 @@ class MobileRestClient:
                     # Found the doc but unexpected rev on LiteServ
                     missing_docs.append(resp_doc)
                     all_docs_returned = False
+                elif server_type == ServerType.listener:
+                    resp_docs[resp_doc["id"]] = resp_doc["value"]["rev"]
+                elif server_type == ServerType.syncgateway:
+                    resp_docs[resp_doc["_id"]] = resp_doc["_rev"]
 
                 if attachments and server_type == ServerType.listener:
                     # Check for an attachment
@@ -1803,7 +2066,7 @@ class MobileRestClient:
                         missing_attachment_docs.append(doc_id)
 
             logging.debug("Missing Docs = {}".format(missing_docs))
-            log_info("Num found docs: {}".format(len(resp_obj["rows"]) - len(missing_docs)))
+            log_info("Num found docs: {}".format(num_rows - len(missing_docs)))
             log_info("Num missing docs: {}".format(len(missing_docs)))
 
             # Issue the request again, docs my still be replicating
@@ -1820,13 +2083,6 @@ class MobileRestClient:
                     time.sleep(1)
                     continue
 
-            resp_docs = {}
-            for resp_doc in resp_obj["rows"]:
-                if server_type == ServerType.listener:
-                    resp_docs[resp_doc["id"]] = resp_doc["value"]["rev"]
-                elif server_type == ServerType.syncgateway:
-                    resp_docs[resp_doc["_id"]] = resp_doc["_rev"]
-
             logging.debug("Expected: {}".format(expected_doc_map))
             logging.debug("Actual: {}".format(resp_docs))
 
@@ -7,6 +7,7 @@ from requests import Session
 from jinja2 import Template
 
 from keywords.constants import SYNC_GATEWAY_CONFIGS, SYNC_GATEWAY_CERT
+from keywords.constants import CBS_HTTP_PORTS
 from keywords.utils import version_is_binary, add_cbs_to_sg_config_server_field
 from keywords.utils import log_r
 from keywords.utils import version_and_build
@@ -444,16 +445,12 @@ class SyncGateway(object):
         if is_cbs_ssl_enabled(cluster_config) and get_sg_version(cluster_config) >= "1.5.0":
             playbook_vars["server_scheme"] = "couchbases"
             playbook_vars["server_port"] = 11207
-            block_http_vars = {}
-            port_list = [8091, 8092, 8093, 8094, 8095, 8096, 11210, 11211]
-            for port in port_list:
-                block_http_vars["port"] = port
-                status = ansible_runner.run_ansible_playbook(
-                    "block-http-ports.yml",
-                    extra_vars=block_http_vars
-                )
-                if status != 0:
-                    raise ProvisioningError("Failed to block port on SGW")
+            status = ansible_runner.run_ansible_playbook(
+                "block-http-ports.yml",
+                extra_vars={"ports": CBS_HTTP_PORTS}
+            )
+            if status != 0:
+                raise ProvisioningError("Failed to block port on SGW")
 
         if is_delta_sync_enabled(cluster_config) and get_sg_version(cluster_config) >= "2.5.0":
             playbook_vars["delta_sync"] = '"delta_sync": { "enabled": true},'
@@ -1,10 +1,17 @@
 import base64
+import binascii
+import hashlib
+import io
 import random
+import threading
 import uuid
+from collections import OrderedDict
 
 from PIL import Image
 
 from keywords.constants import DATA_DIR
+from keywords.constants import ATTACHMENT_CACHE_MAX_BYTES
+from keywords.constants import GENERATED_ATTACHMENTS_MAX_ENTRIES
 from keywords.utils import log_info
 from keywords import types
 
@@ -36,49 +43,157 @@ def generate_2_png_100_100():
     return att_one_list + att_two_list
 
 
-def generate_png(width, height):
-    """ Generates a noise rgb images for attachment testing. """
+def attachment_digest(raw_data):
+    """ Returns the digest Sync Gateway / Couchbase Lite report for an attachment body ('sha1-<base64 sha1>') """
+    return "sha1-{}".format(base64.standard_b64encode(hashlib.sha1(raw_data).digest()).decode("ascii"))
+
+
+class AttachmentCache:
+    """
+    LRU of the base64 encoded attachment bodies, keyed by attachment name.
+    The cache holds at most 'max_bytes' of base64 data, the least recently used entries are dropped first.
+    """
+
+    def __init__(self, max_bytes=ATTACHMENT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            att = self._entries.pop(name, None)
+            if att is not None:
+                # Most recently used last
+                self._entries[name] = att
+            return att
+
+    def remove(self, name):
+        with self._lock:
+            att = self._entries.pop(name, None)
+            if att is not None:
+                self.size_bytes -= len(att.data)
+
+    def put(self, att):
+        with self._lock:
+            previous = self._entries.pop(att.name, None)
+            if previous is not None:
+                self.size_bytes -= len(previous.data)
 
-    img = Image.new("RGBA", (width, height), 255)
-    random_rgb_grid = map(lambda x: (
-        int(random.random() * 256),
-        int(random.random() * 256),
-        int(random.random() * 256)
-    ), [0] * width * height)
+            if len(att.data) > self.max_bytes:
+                return
 
-    img.putdata(random_rgb_grid)
+            self._entries[att.name] = att
+            self.size_bytes += len(att.data)
+            while self.size_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size_bytes -= len(evicted.data)
 
-    image_temp_name = "{}.png".format(str(uuid.uuid4()))
-    image_temp_path = "{}/{}".format(DATA_DIR, image_temp_name)
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+            self.size_bytes = 0
 
-    # Save temporary image
-    log_info("Saving temporary generated image: {}".format(image_temp_path))
-    img.save(image_temp_path)
 
-    # Load and store image data
-    att = load_from_data_dir([image_temp_name])
-    log_info("Creating Attachment: {}".format(image_temp_name))
+attachment_cache = AttachmentCache()
 
-    # Return attachment with generated name and loaded image data
+# { generated attachment name: (function building its raw body, args) }, oldest first
+# Generated bodies are not cached, they are rebuilt (identical, from their seed) if loaded by name
+_generated_attachments = OrderedDict()
+_generated_attachments_lock = threading.Lock()
+
+
+def _make_attachment(name, raw_data):
+    return Attachment(name, base64.standard_b64encode(raw_data), digest=attachment_digest(raw_data))
+
+
+def _cache_attachment(name, raw_data):
+    att = _make_attachment(name, raw_data)
+    attachment_cache.put(att)
     return att
 
 
+def _random_bytes(size, seed):
+    """ Returns 'size' pseudo random bytes, the same ones for the same 'seed' """
+    if size == 0:
+        return b""
+    return binascii.unhexlify("%0*x" % (size * 2, random.Random(seed).getrandbits(size * 8)))
+
+
+def _png_body(width, height, seed):
+    img = Image.frombytes("RGB", (width, height), _random_bytes(width * height * 3, seed))
+    image_buffer = io.BytesIO()
+    img.save(image_buffer, format="PNG")
+    return image_buffer.getvalue()
+
+
+def _generate(name, build, *args):
+    args = args + (uuid.uuid4().int,)
+    with _generated_attachments_lock:
+        _generated_attachments.pop(name, None)
+        _generated_attachments[name] = (build, args)
+        while len(_generated_attachments) > GENERATED_ATTACHMENTS_MAX_ENTRIES:
+            _generated_attachments.popitem(last=False)
+        # A previous body generated under this name must not be loaded anymore
+        attachment_cache.remove(name)
+    return [_make_attachment(name, build(*args))]
+
+
+def generate_png(width, height):
+    """ Generates a noise rgb images for attachment testing. The image is never written to disk """
+
+    image_name = "{}.png".format(str(uuid.uuid4()))
+    log_info("Creating Attachment: {}".format(image_name))
+
+    # Return attachment with generated name and image data
+    return _generate(image_name, _png_body, width, height)
+
+
+def generate_blob(size, name=None):
+    """ Returns a list with one attachment of 'size' random bytes """
+
+    if name is None:
+        name = "{}.bin".format(str(uuid.uuid4()))
+    log_info("Creating Attachment: {} ({} bytes)".format(name, size))
+    return _generate(name, _random_bytes, size)
+
+
 def load_from_data_dir(names):
+    """
+    Returns the attachments for 'names', generated attachments or files in the data directory.
+    Files are read (generated attachments rebuilt) and encoded once, subsequent loads come from attachment_cache.
+    """
 
     types.verify_is_list(names)
 
     atts = []
     for name in names:
-        file_path = "{}/{}".format(DATA_DIR, name)
-        log_info("Loading attachment from file: {}".format(file_path))
-        with open(file_path) as f:
-            data = base64.standard_b64encode(f.read())
-            atts.append(Attachment(name, data))
+        att = attachment_cache.get(name)
+        with _generated_attachments_lock:
+            generated = _generated_attachments.get(name)
+        if att is None and generated is not None:
+            build, args = generated
+            log_info("Rebuilding generated attachment: {}".format(name))
+            att = _cache_attachment(name, build(*args))
+        elif att is None:
+            file_path = "{}/{}".format(DATA_DIR, name)
+            log_info("Loading attachment from file: {}".format(file_path))
+            with open(file_path, "rb") as f:
+                att = _cache_attachment(name, f.read())
+        atts.append(att)
     return atts
 
 
 class Attachment:
 
-    def __init__(self, name, data):
+    def __init__(self, name, data, digest=None):
         self.name = name
         self.data = data
+        self._digest = digest
+
+    @property
+    def digest(self):
+        """ The 'sha1-...' digest of the attachment body, use it to verify attachments without fetching them """
+        if self._digest is None:
+            self._digest = attachment_digest(base64.standard_b64decode(self.data))
+        return self._digest
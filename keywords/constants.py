@@ -9,13 +9,46 @@ CLUSTER_CONFIGS_DIR = "resources/cluster_configs"
 SYNC_GATEWAY_CONFIGS = "resources/sync_gateway_configs"
 SYNC_GATEWAY_CERT = "resources/sync_gateway_cert"
 DATA_DIR = "resources/data"
+# Max base64 bytes of attachment bodies kept in memory by keywords.attachment
+ATTACHMENT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Max generated attachments keywords.attachment can rebuild by name, the oldest ones are forgotten first
+GENERATED_ATTACHMENTS_MAX_ENTRIES = 10000
 
 MAX_RETRIES = 10
 
 CLIENT_REQUEST_TIMEOUT = 120
+
+# Concurrency used by the MobileRestClient fan out helpers (ex. update_docs)
+CLIENT_MAX_CONCURRENCY = 2
+# Default concurrency limit / keep-alive connections per host for AsyncMobileRestClient
+ASYNC_CLIENT_MAX_CONCURRENCY = 100
+# _bulk_docs statuses (whole request or per doc) worth resending
+BULK_DOCS_RETRYABLE_STATUSES = [429, 500, 503]
 REBALANCE_TIMEOUT_SECS = 3600
+# Couchbase Server ports blocked on the Sync Gateway / sg_accel hosts when Couchbase Server SSL is enabled
+CBS_HTTP_PORTS = [8091, 8092, 8093, 8094, 8095, 8096, 11210, 11211]
+# Let Cluster.reset() flush the buckets instead of recreating them when the cluster config did not change
+CLUSTER_FAST_RESET_ENABLED = True
+# Independent playbooks run at once by AnsibleRunner.run_ansible_playbooks
+ANSIBLE_MAX_PARALLEL_PLAYBOOKS = 4
 REMOTE_EXECUTOR_TIMEOUT = 180
+# Seconds between keep-alive packets on pooled RemoteExecutor SSH connections
+REMOTE_EXECUTOR_KEEPALIVE = 30
+# Pooled RemoteExecutor SSH connections unused for that many seconds are closed
+REMOTE_EXECUTOR_IDLE_TIMEOUT = 300
+# Output lines of a remote command kept in memory by RemoteExecutor.execute (per stream, most recent)
+REMOTE_EXECUTOR_MAX_OUTPUT_LINES = 10000
 SDK_TIMEOUT = 3600
+# Seconds a pooled SDK bucket handle is trusted before CouchbaseServer.get_sdk_bucket checks it again
+SDK_BUCKET_HEALTH_CHECK_INTERVAL = 30
+# Results of the reference N1QL queries of the CBL query suite, kept between runs
+N1QL_REFERENCE_CACHE_DIR = "{}/n1ql_reference_cache".format(RESULTS_DIR)
+# Reference queries run at once when warming the cache at suite setup
+N1QL_REFERENCE_CACHE_WARM_CONCURRENCY = 8
+# Keep-alive connections per test server of the shared CBLClient Client
+CBL_CLIENT_POOL_SIZE = 20
+# Memory pointers released per request by the CBLClient MemoryPointerRegistry
+CBL_CLIENT_RELEASE_BATCH_SIZE = 100
 
 # Required to make sure that these are created with encryption
 # Use to build the command line flags for encryption
@@ -1,3 +1,4 @@
+import threading
 import time
 import json
 import requests
@@ -6,6 +7,7 @@ from requests import Session
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 from libraries.provision.ansible_runner import AnsibleRunner
 
+from couchbase import LOCKMODE_WAIT
 from couchbase.bucket import Bucket
 from couchbase.exceptions import CouchbaseError, NotFoundError
 
@@ -66,6 +68,109 @@ def verify_server_version(host, expected_server_version, cbs_ssl=False):
         raise ProvisioningError("Unsupported version format")
 
 
+def sdk_connection_string(host, bucket_name, ssl=False, ipv6=False):
+    if ssl and ipv6:
+        return "couchbases://{}/{}?ssl=no_verify&ipv6=allow".format(host, bucket_name)
+    elif ssl:
+        return "couchbases://{}/{}?ssl=no_verify".format(host, bucket_name)
+    elif ipv6:
+        return "couchbase://{}/{}?ipv6=allow".format(host, bucket_name)
+    return "couchbase://{}/{}".format(host, bucket_name)
+
+
+class _PooledBucket:
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.last_checked = time.time()
+        self.has_primary_index = False
+
+
+class SdkBucketPool:
+    """
+    Process wide pool of Couchbase SDK Bucket handles, one per (host, bucket, ssl, ipv6).
+
+    Opening a Bucket bootstraps the cluster map, so tests and keywords share one handle per bucket.
+    The handles are opened with LOCKMODE_WAIT, so several threads can use one.
+    A handle is checked again once it has not been checked for 'health_check_interval' seconds,
+    and reopened if the check fails. The handles of a bucket are dropped when it is deleted,
+    and all the handles are dropped when the cluster topology changes (rebalance, recovery).
+    """
+
+    def __init__(self, health_check_interval=keywords.constants.SDK_BUCKET_HEALTH_CHECK_INTERVAL):
+        self.health_check_interval = health_check_interval
+        self._buckets = {}
+        self._connect_locks = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, host, bucket_name, ssl, ipv6):
+        connection_str = sdk_connection_string(host, bucket_name, ssl, ipv6)
+        log_info("Connecting to {}".format(connection_str))
+        return Bucket(connection_str, password='password', lockmode=LOCKMODE_WAIT)
+
+    def _is_healthy(self, bucket):
+        try:
+            # quiet: a missing key is not an error
+            bucket.get("_sdk_bucket_pool_health_check", quiet=True)
+            return True
+        except CouchbaseError as e:
+            log_info("SDK bucket health check failed: {}".format(e))
+            return False
+
+    def _acquire(self, host, bucket_name, ssl=False, ipv6=False):
+        key = (host, bucket_name, ssl, ipv6)
+
+        with self._lock:
+            connect_lock = self._connect_locks.setdefault(key, threading.Lock())
+
+        # Connections to different buckets are established in parallel
+        with connect_lock:
+            with self._lock:
+                pooled = self._buckets.get(key)
+
+            if pooled is not None and time.time() - pooled.last_checked > self.health_check_interval:
+                if self._is_healthy(pooled.bucket):
+                    pooled.last_checked = time.time()
+                else:
+                    log_info("Reconnecting to bucket {} on {}".format(bucket_name, host))
+                    pooled = None
+
+            if pooled is None:
+                pooled = _PooledBucket(self._connect(host, bucket_name, ssl, ipv6))
+                with self._lock:
+                    self._buckets[key] = pooled
+
+        return pooled
+
+    def get(self, host, bucket_name, ssl=False, ipv6=False):
+        """ Returns the pooled Bucket of (host, bucket_name, ssl, ipv6), connecting if needed """
+        return self._acquire(host, bucket_name, ssl, ipv6).bucket
+
+    def get_with_primary_index(self, host, bucket_name, ssl=False, ipv6=False):
+        """ Same as get(), but creates the primary index of the bucket the first time """
+        pooled = self._acquire(host, bucket_name, ssl, ipv6)
+        if not pooled.has_primary_index:
+            pooled.bucket.bucket_manager().n1ql_index_create_primary(ignore_exists=True)
+            pooled.has_primary_index = True
+        return pooled.bucket
+
+    def invalidate(self, host=None, bucket_name=None):
+        """ Drops the handles matching 'host' and 'bucket_name' (all of them if both are None) """
+        with self._lock:
+            keys = [key for key in self._buckets
+                    if (host is None or key[0] == host) and (bucket_name is None or key[1] == bucket_name)]
+            for key in keys:
+                del self._buckets[key]
+        if keys:
+            log_debug("Dropped SDK bucket handles: {}".format(keys))
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+sdk_bucket_pool = SdkBucketPool()
+
+
 class CouchbaseServer:
     """ Installs Couchbase Server on machine host"""
 
@@ -129,6 +234,7 @@ class CouchbaseServer:
         if server_major_version >= 5:
             self._delete_internal_rbac_bucket_user(name)
 
+        sdk_bucket_pool.invalidate(bucket_name=name)
         resp = self._session.delete("{0}/pools/default/buckets/{1}".format(self.url, name))
         log_r(resp)
         resp.raise_for_status()
@@ -399,21 +505,25 @@ class CouchbaseServer:
             self._create_internal_rbac_bucket_user(name, cluster_config=cluster_config)
 
         # Create client an retry until KeyNotFound error is thrown
-        start = time.time()
+        # Handles opened on a deleted bucket with the same name are not usable anymore
+        sdk_bucket_pool.invalidate(bucket_name=name)
         time.sleep(5)
+        self._wait_for_bucket_ready(name, ipv6)
+        self.wait_for_ready_state()
+        return name
+
+    def _wait_for_bucket_ready(self, name, ipv6=False):
+        """ Polls bucket 'name' with an SDK client until a get returns a KeyNotFound error """
+
+        bucket = None
+        start = time.time()
         while True:
             if time.time() - start > keywords.constants.CLIENT_REQUEST_TIMEOUT:
                 raise Exception("TIMEOUT while trying to create server buckets.")
             try:
-                if self.cbs_ssl and ipv6:
-                    connection_url = "couchbases://{}/{}?ssl=no_verify&ipv6=allow".format(self.host, name)
-                elif self.cbs_ssl and not ipv6:
-                    connection_url = "couchbases://{}/{}?ssl=no_verify".format(self.host, name)
-                elif not self.cbs_ssl and ipv6:
-                    connection_url = "couchbase://{}/{}?ipv6=allow".format(self.host, name)
-                else:
-                    connection_url = "couchbase://{}/{}".format(self.host, name)
-                bucket = Bucket(connection_url, password='password')
+                # Keep polling with the same handle once connected
+                if bucket is None:
+                    bucket = self.get_sdk_bucket(name, ipv6=ipv6)
                 bucket.get('foo')
             except NotFoundError:
                 log_info("Key not found error: Bucket is ready!")
@@ -422,25 +532,39 @@ class CouchbaseServer:
                 log_info("Error from server: {}, Retrying ...". format(e))
                 time.sleep(1)
                 continue
+
+    def flush_buckets(self, bucket_names, ipv6=False):
+        """
+        Deletes all of the docs of 'bucket_names', much faster than deleting and recreating the buckets.
+        The buckets have to be created with flush enabled (see create_bucket).
+        Raises HTTPError if a bucket cannot be flushed.
+        """
+
+        for name in bucket_names:
+            log_info("Flushing bucket {}".format(name))
+            start = time.time()
+            while True:
+                if time.time() - start > keywords.constants.CLIENT_REQUEST_TIMEOUT:
+                    raise TimeoutError("Timed out trying to flush bucket {}".format(name))
+                resp = self._session.post("{}/pools/default/buckets/{}/controller/doFlush".format(self.url, name))
+                log_r(resp)
+                if resp.status_code == 503:
+                    # The bucket is still warming up or a previous flush is in progress
+                    time.sleep(1)
+                    continue
+                resp.raise_for_status()
+                break
+
+        for name in bucket_names:
+            self._wait_for_bucket_ready(name, ipv6)
         self.wait_for_ready_state()
-        return name
 
     def delete_couchbase_server_cached_rev_bodies(self, bucket, ipv6=False):
         """
         Deletes docs that follow the below format
         _sync:rev:att_doc:34:1-e7fa9a5e6bb25f7a40f36297247ca93e
         """
-        if self.cbs_ssl and ipv6:
-            connection_url = "couchbases://{}/{}?ssl=no_verify&ipv6=allow".format(self.host, bucket)
-        elif self.cbs_ssl and not ipv6:
-            connection_url = "couchbases://{}/{}?ssl=no_verify".format(self.host, bucket)
-        elif not self.cbs_ssl and ipv6:
-            connection_url = "couchbase://{}/{}?ipv6=allow".format(self.host, bucket)
-        else:
-            connection_url = "couchbase://{}/{}".format(self.host, bucket)
-        b = Bucket(connection_url, password='password')
-        b_manager = b.bucket_manager()
-        b_manager.n1ql_index_create_primary(ignore_exists=True)
+        b = self.get_sdk_bucket(bucket, ipv6=ipv6, primary_index=True)
         cached_rev_doc_ids = []
         for row in b.n1ql_query("SELECT meta(`{}`) FROM `{}`".format(bucket, bucket)):
             if row["$1"]["id"].startswith("_sync:rev"):
@@ -456,17 +580,7 @@ class CouchbaseServer:
         Returns server doc ids matching a prefix (ex. '_sync:rev:')
         """
 
-        if self.cbs_ssl and ipv6:
-            connection_url = "couchbases://{}/{}?ssl=no_verify&ipv6=allow".format(self.host, bucket)
-        elif self.cbs_ssl and not ipv6:
-            connection_url = "couchbases://{}/{}?ssl=no_verify".format(self.host, bucket)
-        elif not self.cbs_ssl and ipv6:
-            connection_url = "couchbase://{}/{}?ipv6=allow".format(self.host, bucket)
-        else:
-            connection_url = "couchbase://{}/{}".format(self.host, bucket)
-        b = Bucket(connection_url, password='password')
-        b_manager = b.bucket_manager()
-        b_manager.n1ql_index_create_primary(ignore_exists=True)
+        b = self.get_sdk_bucket(bucket, ipv6=ipv6, primary_index=True)
         found_ids = []
         for row in b.n1ql_query("SELECT meta(`{}`) FROM `{}`".format(bucket, bucket)):
             log_info(row)
@@ -617,6 +731,8 @@ class CouchbaseServer:
         resp.raise_for_status()
 
         self._wait_for_rebalance_complete()
+        # The pooled SDK handles were bootstrapped with the old cluster map
+        sdk_bucket_pool.invalidate()
 
         return True
 
@@ -660,6 +776,8 @@ class CouchbaseServer:
         resp.raise_for_status()
 
         self._wait_for_rebalance_complete()
+        # The pooled SDK handles were bootstrapped with the old cluster map
+        sdk_bucket_pool.invalidate()
 
         return True
 
@@ -717,6 +835,7 @@ class CouchbaseServer:
         command = "sudo service couchbase-server stop"
         self.remote_executor.must_execute(command)
         self._verify_stopped()
+        sdk_bucket_pool.invalidate(host=self.host)
 
     def delete_vbucket(self, vbucket_number, bucket_name):
         """ Deletes a vbucket file for a number and bucket"""
@@ -750,14 +869,16 @@ class CouchbaseServer:
     def restart(self):
         """ Restarts a couchbase server """
         self.remote_executor.must_execute("sudo systemctl restart couchbase-server")
+        sdk_bucket_pool.invalidate(host=self.host)
 
-    def get_sdk_bucket(self, bucket_name):
-        """ Gets an SDK bucket object """
-        if self.cbs_ssl:
-            connection_str = "couchbases://{}/{}?ssl=no_verify".format(self.host, bucket_name)
-        else:
-            connection_str = "couchbase://{}/{}".format(self.host, bucket_name)
-        return Bucket(connection_str, password='password')
+    def get_sdk_bucket(self, bucket_name, ipv6=False, primary_index=False):
+        """
+        Gets an SDK bucket object, shared through sdk_bucket_pool.
+        If 'primary_index' is True, the primary index of the bucket is created the first time.
+        """
+        if primary_index:
+            return sdk_bucket_pool.get_with_primary_index(self.host, bucket_name, self.cbs_ssl, ipv6)
+        return sdk_bucket_pool.get(self.host, bucket_name, self.cbs_ssl, ipv6)
 
     def get_package_name(self, version, build_number, cbs_platform="centos7"):
         """
@@ -52,29 +52,118 @@ def get_vbucket_number(key):
     return (((zlib.crc32(key)) >> 16) & 0x7fff) & (NUM_VBUCKETS - 1)
 
 
-def generate_doc_id_for_vbucket(vbucket_number):
-    """ Returns a random doc id that will hash to a given vbucket. """
-    if vbucket_number < 0 or vbucket_number > 1023:
+# Doc ids targeting a vBucket are '<base><suffix>', where the suffix is 4 hex digits.
+# The CRC32 of equal length keys is affine, so flipping suffix bits changes the vBucket of any
+# key by the same XOR mask: vbucket(base + suffix) == vbucket(base + "0000") ^ delta(suffix).
+# With one suffix per possible delta, every base yields one doc id per vBucket.
+VBUCKET_SUFFIX_REF = "0000"
+_vbucket_suffixes = None
+
+
+def _get_vbucket_suffixes():
+    """ Returns the suffix to append for each of the NUM_VBUCKETS vBucket deltas (built once) """
+    global _vbucket_suffixes
+    if _vbucket_suffixes is None:
+        ref = get_vbucket_number(VBUCKET_SUFFIX_REF)
+        suffixes = [None] * NUM_VBUCKETS
+        found = 0
+        for i in range(16 ** len(VBUCKET_SUFFIX_REF)):
+            suffix = "{:04x}".format(i)
+            delta = get_vbucket_number(suffix) ^ ref
+            if suffixes[delta] is None:
+                suffixes[delta] = suffix
+                found += 1
+                if found == NUM_VBUCKETS:
+                    break
+        _vbucket_suffixes = suffixes
+    return _vbucket_suffixes
+
+
+def _validate_vbucket_number(vbucket_number):
+    if vbucket_number < 0 or vbucket_number > NUM_VBUCKETS - 1:
         raise keywords.exceptions.DocumentError("'vbucket_number' must be between 0-1023")
 
-    # loop over random generated doc ids until the desired vbucket is returned
-    while True:
-        doc_id = str(uuid.uuid4())
-        if get_vbucket_number(doc_id) == vbucket_number:
-            utils.log_info("doc_id: {} -> vBucket: {}".format(doc_id, vbucket_number))
-            return doc_id
+
+def doc_id_for_vbucket(base, vbucket_number):
+    """ Returns the doc id starting with 'base' that will hash to a given vbucket """
+    _validate_vbucket_number(vbucket_number)
+    suffixes = _get_vbucket_suffixes()
+    base_vbucket = get_vbucket_number(base + VBUCKET_SUFFIX_REF)
+    return base + suffixes[base_vbucket ^ vbucket_number]
+
+
+class VBucketDocIdGenerator:
+    """
+    Deterministically generates doc ids for any set of vBuckets.
+
+    Ids are '<prefix>_<seed>_<counter>_<suffix>', one hash per counter value gives an id
+    for every vBucket. The same (prefix, seed) always generates the same ids, in the same order,
+    and a generator never returns the same id twice.
+    """
+
+    def __init__(self, prefix="doc", seed=0):
+        self.prefix = prefix
+        self.seed = seed
+        self._counter = 0
+
+    def _next_base(self):
+        base = "{}_{}_{:08x}_".format(self.prefix, self.seed, self._counter)
+        self._counter += 1
+        return base
+
+    def doc_ids_for_vbuckets(self, vbucket_numbers, number_doc_ids):
+        """ Returns { vbucket_number: [doc_id, ...] } with 'number_doc_ids' doc ids per vBucket """
+
+        for vbucket_number in vbucket_numbers:
+            _validate_vbucket_number(vbucket_number)
+
+        suffixes = _get_vbucket_suffixes()
+        doc_ids = {vbucket_number: [] for vbucket_number in vbucket_numbers}
+        for _ in range(number_doc_ids):
+            base = self._next_base()
+            base_vbucket = get_vbucket_number(base + VBUCKET_SUFFIX_REF)
+            for vbucket_number in doc_ids:
+                doc_ids[vbucket_number].append(base + suffixes[base_vbucket ^ vbucket_number])
+
+        return doc_ids
+
+    def doc_ids_for_vbucket(self, vbucket_number, number_doc_ids):
+        """ Returns a list of 'number_doc_ids' doc ids that will hash to a given vBucket number """
+        return self.doc_ids_for_vbuckets([vbucket_number], number_doc_ids)[vbucket_number]
+
+    def doc_ids_for_all_vbuckets(self, number_doc_ids_per_vbucket):
+        """
+        Returns 'number_doc_ids_per_vbucket' doc ids for each of the NUM_VBUCKETS vBuckets,
+        interleaved so that any slice of the list is spread evenly across the vBuckets.
+        """
+
+        doc_ids = []
+        by_vbucket = self.doc_ids_for_vbuckets(range(NUM_VBUCKETS), number_doc_ids_per_vbucket)
+        for i in range(number_doc_ids_per_vbucket):
+            doc_ids.extend(by_vbucket[vbucket_number][i] for vbucket_number in range(NUM_VBUCKETS))
+        return doc_ids
+
+
+def generate_doc_id_for_vbucket(vbucket_number):
+    """ Returns a random doc id that will hash to a given vbucket. """
+    doc_id = doc_id_for_vbucket(str(uuid.uuid4()) + "_", vbucket_number)
+    utils.log_info("doc_id: {} -> vBucket: {}".format(doc_id, vbucket_number))
+    return doc_id
 
 
 def generate_doc_ids_for_vbucket(vbucket_number, number_doc_ids):
     """ Returns a list of generated doc ids that will hash to a given vBucket number """
 
-    doc_ids = []
-    for _ in range(number_doc_ids):
-        doc_ids.append(generate_doc_id_for_vbucket(vbucket_number))
-
+    doc_ids = VBucketDocIdGenerator(prefix=str(uuid.uuid4())).doc_ids_for_vbucket(vbucket_number, number_doc_ids)
+    utils.log_info("Generated {} doc_ids -> vBucket: {}".format(len(doc_ids), vbucket_number))
     return doc_ids
 
 
+def generate_doc_ids_for_all_vbuckets(number_doc_ids_per_vbucket):
+    """ Returns random doc ids spread evenly across all vBuckets, 'number_doc_ids_per_vbucket' for each """
+    return VBucketDocIdGenerator(prefix=str(uuid.uuid4())).doc_ids_for_all_vbuckets(number_doc_ids_per_vbucket)
+
+
 def update_prop_generator():
     return {"updates": 0}
 
@@ -0,0 +1,187 @@
+import base64
+import json
+import logging
+import re
+import zlib
+
+from keywords.exceptions import RestError
+
+# Size of the chunks read from a streamed response
+MULTIPART_CHUNK_SIZE = 64 * 1024
+
+BOUNDARY_RE = re.compile(r'boundary="?([^";]+)"?', re.IGNORECASE)
+FILENAME_RE = re.compile(r'filename="?([^";]+)"?', re.IGNORECASE)
+
+
+def get_boundary(content_type):
+    """
+    Returns the boundary from a multipart Content-Type header
+    ex. 'multipart/mixed; boundary="5570ab847be2"' -> '5570ab847be2'
+    """
+
+    if content_type is None or not content_type.lower().startswith("multipart/"):
+        raise RestError("Expected a multipart Content-Type, got: {}".format(content_type))
+
+    match = BOUNDARY_RE.search(content_type)
+    if match is None:
+        raise RestError("Could not find a boundary in Content-Type: {}".format(content_type))
+
+    return match.group(1)
+
+
+def _parse_headers(header_lines):
+    headers = {}
+    for line in header_lines:
+        line = line.decode("utf-8").strip()
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+def iter_multipart_parts(chunks, boundary):
+    """
+    Incrementally parses a multipart body provided as an iterable of byte chunks
+    and yields a (headers, body) tuple per part. Header names are lower cased.
+
+    Only the current part and a small look ahead are buffered, so the memory used
+    is bounded by the size of the largest part rather than the size of the body.
+    Both CRLF and LF line endings are accepted.
+    """
+
+    # Prepending a newline makes the first delimiter look like every other one
+    delimiter = b"\n--" + boundary.encode("utf-8")
+    buf = b"\n"
+
+    # States: 'preamble' -> ('delimiter' -> 'headers' -> 'body')* -> 'delimiter'
+    state = "preamble"
+    header_lines = []
+    body_chunks = []
+    chunks = iter(chunks)
+    exhausted = False
+
+    while True:
+
+        if state == "preamble":
+            idx = buf.find(delimiter)
+            if idx != -1:
+                buf = buf[idx + len(delimiter):]
+                state = "delimiter"
+            else:
+                # Keep enough of the tail to match a delimiter split across chunks
+                buf = buf[-len(delimiter):]
+
+        if state == "delimiter":
+            # Rest of the delimiter line, either '--' (close delimiter) or padding
+            idx = buf.find(b"\n")
+            if buf.startswith(b"--"):
+                return
+            elif idx != -1:
+                buf = buf[idx + 1:]
+                header_lines = []
+                state = "headers"
+
+        if state == "headers":
+            idx = buf.find(b"\n")
+            while idx != -1:
+                line = buf[:idx]
+                buf = buf[idx + 1:]
+                if line.strip() == b"":
+                    body_chunks = []
+                    state = "body"
+                    break
+                header_lines.append(line)
+                idx = buf.find(b"\n")
+
+        if state == "body":
+            idx = buf.find(delimiter)
+            if idx != -1:
+                body_chunks.append(buf[:idx])
+                buf = buf[idx + len(delimiter):]
+                body = b"".join(body_chunks)
+                if body.endswith(b"\r"):
+                    body = body[:-1]
+                body_chunks = []
+                state = "delimiter"
+                yield _parse_headers(header_lines), body
+                continue
+            elif len(buf) > len(delimiter):
+                # Everything but the tail can not be part of a delimiter
+                split = len(buf) - len(delimiter)
+                body_chunks.append(buf[:split])
+                buf = buf[split:]
+
+        if exhausted:
+            if state in ("headers", "body"):
+                raise RestError("Multipart body ended before the closing boundary")
+            return
+
+        try:
+            buf += next(chunks)
+        except StopIteration:
+            exhausted = True
+
+
+def _decode_part_body(headers, body):
+    if headers.get("content-encoding", "").lower() == "gzip":
+        # X-Accept-Part-Encoding: gzip
+        body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    return body
+
+
+def _doc_from_part(headers, body):
+    """
+    Returns the doc contained in a part or None if the part could not be parsed.
+    Parts can either be a json doc or a multipart/related doc with attachments
+    """
+
+    content_type = headers.get("content-type", "application/json")
+    body = _decode_part_body(headers, body)
+
+    if content_type.lower().startswith("multipart/"):
+        doc = None
+        attachments = {}
+        for sub_headers, sub_body in iter_multipart_parts([body], get_boundary(content_type)):
+            sub_content_type = sub_headers.get("content-type", "application/json")
+            if doc is None and sub_content_type.lower().startswith("application/json"):
+                doc = _doc_from_part(sub_headers, sub_body)
+            else:
+                match = FILENAME_RE.search(sub_headers.get("content-disposition", ""))
+                if match is not None:
+                    attachments[match.group(1)] = _decode_part_body(sub_headers, sub_body)
+
+        if doc is not None:
+            for name, data in attachments.items():
+                att_meta = doc.setdefault("_attachments", {}).setdefault(name, {})
+                att_meta.pop("follows", None)
+                att_meta["data"] = base64.b64encode(data).decode("ascii")
+
+        return doc
+
+    try:
+        return json.loads(body.decode("utf-8"))
+    except ValueError as e:
+        logging.error("Could not parse docs as JSON: {} error: {}".format(body, e))
+        return None
+
+
+def iter_multipart_docs(chunks, boundary):
+    """
+    Yields the docs of a multipart (_bulk_get) body one at a time.
+    Attachment parts are inlined into the doc '_attachments' as base64 'data'
+    """
+
+    for headers, body in iter_multipart_parts(chunks, boundary):
+        doc = _doc_from_part(headers, body)
+        if doc is not None:
+            yield doc
+
+
+def iter_multipart_response_docs(resp, chunk_size=MULTIPART_CHUNK_SIZE):
+    """
+    Yields the docs of a multipart requests response one at a time.
+    The request should be issued with 'stream=True' to avoid loading the whole body in memory.
+    """
+
+    boundary = get_boundary(resp.headers.get("Content-Type"))
+    return iter_multipart_docs(resp.iter_content(chunk_size=chunk_size), boundary)
@@ -0,0 +1,273 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from requests import Session
+
+from keywords.constants import CLIENT_REQUEST_TIMEOUT
+from keywords.constants import N1QL_REFERENCE_CACHE_DIR
+from keywords.constants import N1QL_REFERENCE_CACHE_WARM_CONCURRENCY
+from keywords.couchbaseserver import CouchbaseServer
+from keywords.couchbaseserver import get_server_version
+from keywords.exceptions import CBServerError
+from keywords.utils import log_info
+from keywords.utils import log_r
+
+# File of the cache directory listing every statement ever cached for a bucket, warmed at suite setup
+MANIFEST_FILENAME = "statements-{}.json"
+
+# Rows hashed into the fingerprint of a bucket: the id and body of each doc, without the Sync Gateway metadata
+BUCKET_FINGERPRINT_QUERY = 'select raw [meta().id, object_remove(b, "_sync")] from `{0}` b where meta().id not like "_sync%"'
+
+# Quoted strings / identifiers, or runs of whitespace
+_N1QL_TOKEN_RE = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|`[^`]*`)|\s+')
+
+
+def normalize_n1ql(statement):
+    """ Collapses the whitespace outside of quotes and drops the trailing ';', so formatting does not change the cache key """
+
+    def replace(match):
+        return match.group(1) if match.group(1) is not None else " "
+
+    return _N1QL_TOKEN_RE.sub(replace, statement).strip().rstrip(";").strip()
+
+
+def _canonical_value(value):
+    # N1QL and CBL may return 10 and 10.0 for the same number
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return dict((key, _canonical_value(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [_canonical_value(item) for item in value]
+    return value
+
+
+def canonical_rows(rows):
+    """ Returns 'rows' as a sorted list of canonical JSON strings, comparing them ignores row and key order """
+    return sorted(json.dumps(_canonical_value(row), sort_keys=True) for row in rows)
+
+
+def digest_rows(sorted_rows):
+    digest = hashlib.sha1()
+    for row in sorted_rows:
+        digest.update(row.encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+class ReferenceResult:
+    """
+    The rows of a reference N1QL query, pre-sorted and hashed.
+    matches() compares a result set with a hash instead of sorting lists of dicts each time.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self._sorted_rows = canonical_rows(rows)
+        self.digest = digest_rows(self._sorted_rows)
+        self._row_set = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, row):
+        if self._row_set is None:
+            self._row_set = set(self._sorted_rows)
+        return json.dumps(_canonical_value(row), sort_keys=True) in self._row_set
+
+    def column(self, name):
+        """ Returns the ReferenceResult of the 'name' value of each row (ex. 'id' for 'select meta().id ...') """
+        return ReferenceResult([row[name] for row in self.rows])
+
+    def matches(self, rows):
+        """ True if 'rows' are the reference rows, in any order """
+        if len(rows) != len(self.rows):
+            return False
+        return digest_rows(canonical_rows(rows)) == self.digest
+
+    def describe_mismatch(self, rows):
+        other = canonical_rows(rows)
+        missing = sorted(set(self._sorted_rows) - set(other))
+        unexpected = sorted(set(other) - set(self._sorted_rows))
+        return "expected {} rows, got {}. Missing: {} Unexpected: {}".format(len(self.rows), len(rows), missing[:10], unexpected[:10])
+
+
+class N1QLReferenceCache:
+    """
+    Results of N1QL queries against a static bucket (ex. travel-sample), persisted in 'cache_dir'.
+
+    Entries are stored per bucket state (server version and bucket fingerprint, see get_reference_cache)
+    and keyed by the normalized statement, so a different server or bucket content never hits a stale result.
+    Every statement is also recorded in a manifest, warm() runs the statements of the manifest missing for
+    the current bucket state. prune() deletes the entries of the other states of the bucket, clear() deletes
+    everything (--clear-n1ql-reference-cache in the CBL functional suite).
+    """
+
+    def __init__(self, query_url, server_version, bucket_name, bucket_fingerprint, cache_dir=N1QL_REFERENCE_CACHE_DIR, session=None):
+        self.query_url = query_url
+        self.server_version = server_version
+        self.bucket_name = bucket_name
+        self.bucket_fingerprint = bucket_fingerprint
+        self.cache_dir = cache_dir
+        self.num_hits = 0
+        self.num_misses = 0
+
+        if session is None:
+            session = Session()
+            session.auth = ("Administrator", "password")
+            session.verify = False
+        self._session = session
+        self._results = {}
+        self._lock = threading.Lock()
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        self._statements = set(self._load_manifest())
+
+    def _manifest_path(self):
+        return os.path.join(self.cache_dir, MANIFEST_FILENAME.format(self.bucket_name))
+
+    def _load_manifest(self):
+        try:
+            with open(self._manifest_path()) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return []
+
+    def _state_dir(self):
+        """ Directory of the results for the current server version and bucket fingerprint """
+        state = json.dumps([self.server_version, self.bucket_fingerprint])
+        return os.path.join(self.cache_dir, self.bucket_name, hashlib.sha1(state.encode("utf-8")).hexdigest())
+
+    def _write_json(self, path, obj):
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            # Already created, possibly by another thread
+            pass
+
+        # Write then rename, a concurrent reader never sees a partial file
+        tmp_path = "{}.{}.tmp".format(path, threading.current_thread().ident)
+        with open(tmp_path, "w") as f:
+            json.dump(obj, f)
+        os.rename(tmp_path, path)
+
+    def key(self, statement):
+        return hashlib.sha1(normalize_n1ql(statement).encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self._state_dir(), "{}.json".format(key))
+
+    def _load_entry(self, key):
+        try:
+            with open(self._entry_path(key)) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def run_query(self, statement):
+        """ Runs 'statement' on the query service, returns the result rows """
+        resp = self._session.post(self.query_url, data={"statement": statement}, timeout=CLIENT_REQUEST_TIMEOUT)
+        # The results of a reference query can be large
+        log_r(resp, body=False)
+        resp_obj = resp.json()
+        if resp.status_code != 200 or resp_obj.get("status") != "success":
+            raise CBServerError("N1QL query failed: {} {}".format(statement, resp_obj.get("errors")))
+        return resp_obj["results"]
+
+    def get_reference_result(self, statement):
+        """ Returns the ReferenceResult of 'statement', running it only if it has never been cached """
+
+        key = self.key(statement)
+        with self._lock:
+            result = self._results.get(key)
+        if result is not None:
+            self.num_hits += 1
+            return result
+
+        rows = self._load_entry(key)
+        if rows is not None:
+            self.num_hits += 1
+        else:
+            self.num_misses += 1
+            log_info("N1QL reference cache miss: {}".format(statement))
+            rows = self.run_query(statement)
+            self._write_json(self._entry_path(key), rows)
+
+        result = ReferenceResult(rows)
+        normalized = normalize_n1ql(statement)
+        with self._lock:
+            self._results[key] = result
+            if normalized not in self._statements:
+                self._statements.add(normalized)
+                self._write_json(self._manifest_path(), sorted(self._statements))
+        return result
+
+    def warm(self, statements=None, max_workers=N1QL_REFERENCE_CACHE_WARM_CONCURRENCY):
+        """
+        Runs the 'statements' (the manifest statements by default) missing from the cache, 'max_workers' at a time.
+        Returns the number of statements that had to be run.
+        """
+
+        if statements is None:
+            statements = sorted(self._statements)
+        missing = [statement for statement in statements if not os.path.isfile(self._entry_path(self.key(statement)))]
+        log_info("Warming the N1QL reference cache: {} of {} statements to run".format(len(missing), len(statements)))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(self.get_reference_result, missing))
+        return len(missing)
+
+    def prune(self):
+        """ Deletes the cached results of the other server versions / contents of the bucket, returns their number """
+        state_dir = self._state_dir()
+        bucket_dir = os.path.dirname(state_dir)
+        if not os.path.isdir(bucket_dir):
+            return 0
+
+        stale_dirs = [os.path.join(bucket_dir, name) for name in os.listdir(bucket_dir) if os.path.join(bucket_dir, name) != state_dir]
+        for stale_dir in stale_dirs:
+            shutil.rmtree(stale_dir, ignore_errors=True)
+        if stale_dirs:
+            log_info("Deleted {} stale states of {} from the N1QL reference cache".format(len(stale_dirs), self.bucket_name))
+        return len(stale_dirs)
+
+    def clear(self):
+        """ Deletes every cached result and manifest of the cache directory """
+        with self._lock:
+            self._results = {}
+            self._statements = set()
+        for filename in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, filename)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif filename.endswith(".json"):
+                os.remove(path)
+        log_info("Cleared the N1QL reference cache in {}".format(self.cache_dir))
+
+
+def get_reference_cache(cbs_url, bucket_name, cache_dir=N1QL_REFERENCE_CACHE_DIR):
+    """
+    Returns the N1QLReferenceCache of 'bucket_name' on the Couchbase Server at 'cbs_url'.
+    The bucket fingerprint is a hash of the id and body of every doc (besides the Sync Gateway metadata).
+    Reloading the same sample bucket at each suite setup keeps the fingerprint, so the results are reused
+    across runs, while any change of the content gives another fingerprint and the older states are pruned.
+    """
+
+    server = CouchbaseServer(cbs_url)
+    if server.cbs_ssl:
+        query_url = "https://{}:18093/query/service".format(server.host)
+    else:
+        query_url = "http://{}:8093/query/service".format(server.host)
+    server_version = get_server_version(server.host, server.cbs_ssl)
+
+    cache = N1QLReferenceCache(query_url, server_version, bucket_name, None, cache_dir=cache_dir)
+    rows = cache.run_query(BUCKET_FINGERPRINT_QUERY.format(bucket_name))
+    cache.bucket_fingerprint = digest_rows(canonical_rows(rows))
+    cache.prune()
+    return cache
@@ -1,17 +1,204 @@
+import atexit
+import select
+import threading
+import time
+from collections import deque
+
 import paramiko
 import ansible.constants
+from concurrent.futures import ThreadPoolExecutor
 
 from keywords.exceptions import RemoteCommandError
 from keywords.utils import log_info
 from keywords.constants import REMOTE_EXECUTOR_TIMEOUT
+from keywords.constants import REMOTE_EXECUTOR_KEEPALIVE
+from keywords.constants import REMOTE_EXECUTOR_IDLE_TIMEOUT
+from keywords.constants import REMOTE_EXECUTOR_MAX_OUTPUT_LINES
+
+# Size of the reads from a command channel
+CHANNEL_READ_SIZE = 32 * 1024
+
+
+class _PooledConnection:
+
+    def __init__(self, key, client):
+        self.key = key
+        self.client = client
+        self.in_use = 0
+        self.last_used = time.time()
+        # Set once the connection left the pool, it is closed when its last command is done
+        self.retired = False
+
+    def is_active(self):
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+
+class SSHConnectionPool:
+    """
+    Process wide pool of SSH connections, one per (host, username).
+
+    Commands to the same host run on their own channel over the same connection,
+    so only the first command to a host pays for the key exchange and authentication.
+    Connections are kept alive and closed once unused for 'idle_timeout' seconds.
+    A connection is never closed while commands are still running on it.
+    """
+
+    def __init__(self, keepalive=REMOTE_EXECUTOR_KEEPALIVE, idle_timeout=REMOTE_EXECUTOR_IDLE_TIMEOUT):
+        self.keepalive = keepalive
+        self.idle_timeout = idle_timeout
+        self._connections = {}
+        self._connect_locks = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, host, username, password, connect_kwargs):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        log_info("Connecting to {}".format(host))
+        client.connect(host, username=username, password=password, banner_timeout=REMOTE_EXECUTOR_TIMEOUT, **connect_kwargs)
+        client.get_transport().set_keepalive(self.keepalive)
+        return client
+
+    def _retire(self, connection):
+        """ Removes 'connection' from the pool, returns True if it can be closed now. Call with self._lock held """
+        if self._connections.get(connection.key) is connection:
+            del self._connections[connection.key]
+        connection.retired = True
+        return connection.in_use == 0
+
+    def acquire(self, host, username, password=None, **connect_kwargs):
+        """
+        Returns the _PooledConnection for (host, username), its 'client' is a connected paramiko.SSHClient.
+        Give it back with release()
+        """
+
+        key = (host, username)
+        self.evict_idle()
+
+        with self._lock:
+            connect_lock = self._connect_locks.setdefault(key, threading.Lock())
+
+        # Connections to different hosts are established in parallel
+        with connect_lock:
+            with self._lock:
+                connection = self._connections.get(key)
+                if connection is not None:
+                    # In use from now on, so it is not evicted while being checked
+                    connection.in_use += 1
+                    connection.last_used = time.time()
+
+            if connection is not None and not connection.is_active():
+                log_info("Connection to {} was lost, reconnecting".format(host))
+                self.discard(connection)
+                self.release(connection)
+                connection = None
+
+            if connection is None:
+                connection = _PooledConnection(key, self._connect(host, username, password, connect_kwargs))
+                with self._lock:
+                    self._connections[key] = connection
+                    connection.in_use += 1
+
+        return connection
+
+    def release(self, connection):
+        """ Gives back a connection returned by acquire(), closes it if it was discarded meanwhile and is now unused """
+        with self._lock:
+            connection.in_use -= 1
+            connection.last_used = time.time()
+            close = connection.retired and connection.in_use == 0
+        if close:
+            connection.client.close()
+
+    def discard(self, connection):
+        """
+        Removes 'connection' from the pool (ex. after the host was restarted), the next acquire() reconnects.
+        It is closed once the commands still running on it are done
+        """
+        with self._lock:
+            close = self._retire(connection)
+        if close:
+            connection.client.close()
+
+    def evict_idle(self):
+        """ Closes the connections that have not been used for idle_timeout seconds """
+
+        now = time.time()
+        with self._lock:
+            idle_connections = [connection for connection in self._connections.values()
+                                if connection.in_use == 0 and now - connection.last_used > self.idle_timeout]
+            for connection in idle_connections:
+                self._retire(connection)
+
+        for connection in idle_connections:
+            log_info("Closing idle connection to {}".format(connection.key[0]))
+            connection.client.close()
 
+    def close_all(self):
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections = {}
 
-def stream_output(stdio_file_stream):
-    lines = []
-    for line in stdio_file_stream:
-        print(line)
-        lines.append(line)
-    return lines
+        for connection in connections:
+            connection.client.close()
+
+
+ssh_connection_pool = SSHConnectionPool()
+atexit.register(ssh_connection_pool.close_all)
+
+
+class RemoteCommand:
+    """
+    A command running on a channel of a pooled connection.
+    Iterate over it to get the ('stdout' | 'stderr', line) output as it is produced,
+    'exit_status' is set once the output has been consumed.
+    """
+
+    def __init__(self, pool, connection, channel):
+        self._pool = pool
+        self._connection = connection
+        self._channel = channel
+        self.exit_status = None
+
+    def __iter__(self):
+        channel = self._channel
+        partial = {"stdout": b"", "stderr": b""}
+        try:
+            while True:
+                read = False
+                if channel.recv_ready():
+                    data = channel.recv(CHANNEL_READ_SIZE)
+                    read = True
+                    for line in self._split_lines(partial, "stdout", data):
+                        yield "stdout", line
+                if channel.recv_stderr_ready():
+                    data = channel.recv_stderr(CHANNEL_READ_SIZE)
+                    read = True
+                    for line in self._split_lines(partial, "stderr", data):
+                        yield "stderr", line
+
+                if not read:
+                    if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                        break
+                    # Wait for more output (or for the channel to close)
+                    select.select([channel], [], [], 1)
+
+            for stream_name in ["stdout", "stderr"]:
+                if partial[stream_name]:
+                    yield stream_name, partial[stream_name].decode("utf-8", "replace")
+
+            # this will block until the command has completed and will return the error code from
+            # the command. If the command does not return an exit status, then -1 is returned
+            self.exit_status = channel.recv_exit_status()
+        finally:
+            channel.close()
+            self._pool.release(self._connection)
+
+    @staticmethod
+    def _split_lines(partial, stream_name, data):
+        lines = (partial[stream_name] + data).split(b"\n")
+        partial[stream_name] = lines.pop()
+        return [line.decode("utf-8", "replace") + "\n" for line in lines]
 
 
 class RemoteExecutor:
@@ -20,55 +207,79 @@ class RemoteExecutor:
     has passwordless ssh access to the host you are communicating with.
     This username is set as the 'remote_user' in your ansible.cfg file,
     located in the root of the repository
+
+    Connections are shared through ssh_connection_pool, so many RemoteExecutors
+    (and commands) for the same host reuse one SSH connection.
     """
 
-    def __init__(self, host, sg_platform="centos", username=None, password=None):
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        self.client = client
+    def __init__(self, host, sg_platform="centos", username=None, password=None, pool=None):
+        self.pool = pool or ssh_connection_pool
         self.host = host
         self.sg_platform = sg_platform
         if "[" in self.host:
             self.host = self.host.replace("[", "")
             self.host = self.host.replace("]", "")
         self.username = ansible.constants.DEFAULT_REMOTE_USER
+        self.password = None
         if username is not None:
             self.username = username
             self.password = password
 
-    def execute(self, command):
-        """Executes a shell command on a remote host.
-        It will stream the stdout and stderr and return an error code
-        """
+    def start(self, command):
+        """ Starts 'command' and returns a RemoteCommand to stream its output """
 
-        log_info("Connecting to {}".format(self.host))
         log_info("Running '{}' on host {}".format(command, self.host))
 
         if self.sg_platform == "windows":
-            self.client.connect(self.host, username=self.username, password=self.password, banner_timeout=REMOTE_EXECUTOR_TIMEOUT)
             command = "cmd /c " + command
-            stdin, stdout, stderr = self.client.exec_command(command, timeout=60)
-        else:
-            self.client.connect(self.host, username=self.username, banner_timeout=REMOTE_EXECUTOR_TIMEOUT)
-            # get_pty=True is required for sudo commands
-            stdin, stdout, stderr = self.client.exec_command(command, get_pty=True)
+
+        # A pooled connection can look active but be stale (ex. the host was restarted),
+        # so a command that can not be started is retried once on a new connection
+        for attempt in range(2):
+            connection = self.pool.acquire(self.host, self.username, self.password)
+            try:
+                if self.sg_platform == "windows":
+                    stdin, stdout, stderr = connection.client.exec_command(command, timeout=60)
+                else:
+                    # get_pty=True is required for sudo commands
+                    stdin, stdout, stderr = connection.client.exec_command(command, get_pty=True)
+                break
+            except Exception as e:
+                self.pool.discard(connection)
+                self.pool.release(connection)
+                if attempt > 0:
+                    raise
+                log_info("Could not start the command on {}, retrying on a new connection: {}".format(self.host, e))
 
         # We should not be sending / recieving data on the stdin channel so close it
         stdin.close()
 
-        # Stream output to console, and capture all of the output.
-        # TODO: this is not memory efficient and if there is a ton of output, this will blow up
-        stdout_p = stream_output(stdout)
-        stderr_p = stream_output(stderr)
+        return RemoteCommand(self.pool, connection, stdout.channel)
+
+    def execute(self, command, on_line=None, max_output_lines=REMOTE_EXECUTOR_MAX_OUTPUT_LINES):
+        """Executes a shell command on a remote host.
+        It will stream the stdout and stderr and return an error code.
+
+        Each line is printed, or passed to on_line(stream_name, line) if provided.
+        Only the last 'max_output_lines' lines of each stream are returned.
+        """
+
+        stdout_p = deque(maxlen=max_output_lines)
+        stderr_p = deque(maxlen=max_output_lines)
 
-        # this will block until the command has completed and will return the error code from
-        # the command. If the command does not return an exit status, then -1 is returned
-        status = stdout.channel.recv_exit_status()
+        remote_command = self.start(command)
+        for stream_name, line in remote_command:
+            if on_line is not None:
+                on_line(stream_name, line)
+            else:
+                print(line)
 
-        log_info("Closing connection to {}".format(self.host))
-        self.client.close()
+            if stream_name == "stdout":
+                stdout_p.append(line)
+            else:
+                stderr_p.append(line)
 
-        return status, stdout_p, stderr_p
+        return remote_command.exit_status, list(stdout_p), list(stderr_p)
 
     def must_execute(self, command):
         """This wraps self.execute(command) and throws
@@ -80,3 +291,24 @@ class RemoteExecutor:
             log_info("{}: {}".format(stdout_p, stderr_p))
             raise RemoteCommandError("command: {} failed on host: {}".format(command, self.host))
         return stdout_p, stderr_p
+
+
+def execute_on_hosts(hosts, command, sg_platform="centos", username=None, password=None, must_succeed=False):
+    """
+    Runs 'command' on all 'hosts' in parallel.
+    Returns { host: (status, stdout lines, stderr lines) }.
+    If 'must_succeed' is set, raises RemoteCommandError if the command failed on any host.
+    """
+
+    def execute(host):
+        return RemoteExecutor(host, sg_platform=sg_platform, username=username, password=password).execute(command)
+
+    with ThreadPoolExecutor(max_workers=max(1, len(hosts))) as executor:
+        results = dict(zip(hosts, executor.map(execute, hosts)))
+
+    if must_succeed:
+        failed_hosts = [host for host, result in results.items() if result[0] != 0]
+        if failed_hosts:
+            raise RemoteCommandError("command: {} failed on hosts: {}".format(command, failed_hosts))
+
+    return results
@@ -46,7 +46,10 @@ def log_warn(message):
     logging.warn(message)
 
 
-def log_r(request, info=True):
+def log_r(request, info=True, body=True):
+    """ Logs a requests response. Use body=False for streamed (stream=True) responses
+    to avoid reading the whole body in memory just to log it.
+    """
     request_summary = "{0} {1} {2}".format(
         request.request.method,
         request.request.url,
@@ -62,7 +65,8 @@ def log_r(request, info=True):
         request.request.headers,
         request.request.body))
 
-    logging.debug("{}".format(request.text))
+    if body:
+        logging.debug("{}".format(request.text))
 
 
 def version_is_binary(version):
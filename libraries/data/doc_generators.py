@@ -4,33 +4,73 @@ import random
 import uuid
 import datetime
 import json
+import threading
+
+DOC_20MB_FILE = "resources/data/20mb_doc.json"
+
+# Size of the pool random strings are sliced from
+STRING_POOL_SIZE = 64 * 1024
+
+# All the random values come from this generator, call seed() for a reproducible corpus
+_random = random.Random()
+_string_pool = None
+_doc_20mb_json = None
+_doc_20mb_lock = threading.Lock()
+
+
+def seed(value=None):
+    """
+    Seeds the generators so the same sequence of calls returns the same docs.
+    Only 'date_time_added' (the time the doc was generated) differs between runs.
+    """
+    global _string_pool
+    _random.seed(value)
+    _string_pool = "".join(_random.choice(string.ascii_letters) for _ in xrange(STRING_POOL_SIZE))
 
 
 def random_bool():
-    return random.choice([True, False])
+    return _random.random() < 0.5
 
 
 def random_long():
-    return long(random.choice(range(0, 10000000)))
+    return long(_random.randint(0, 9999999))
 
 
 def random_int():
-    return random.randint(0, sys.maxint)
+    return _random.randint(0, sys.maxint)
 
 
 def random_float():
     # Arbirary range, maybe we could have something better?
-    return random.uniform(-100000000000000.0, 100000000000000.0)
+    return _random.uniform(-100000000000000.0, 100000000000000.0)
 
 
 def random_string(length):
-    return "".join(random.choice(string.ascii_letters) for _ in xrange(length))
+    """ Returns 'length' random ascii letters, sliced from a pre-generated pool """
+    if length > STRING_POOL_SIZE:
+        return "".join(_random.choice(string.ascii_letters) for _ in xrange(length))
+    start = _random.randint(0, STRING_POOL_SIZE - length)
+    return _string_pool[start:start + length]
+
+
+def random_uuid():
+    return str(uuid.UUID(int=_random.getrandbits(128), version=4))
+
+
+def _load_doc_20mb_json():
+    """ Returns the serialized 20mb doc, the file is read once """
+    global _doc_20mb_json
+    with _doc_20mb_lock:
+        if _doc_20mb_json is None:
+            with open(DOC_20MB_FILE) as fh:
+                # Round trip to validate and normalize the template
+                _doc_20mb_json = json.dumps(json.load(fh))
+    return _doc_20mb_json
 
 
 def doc_20mb():
-    with open("resources/data/20mb_doc.json") as fh:
-        json_data = json.load(fh)
-        return json_data
+    # Parsing the cached text returns a new doc, that callers can modify
+    return json.loads(_load_doc_20mb_json())
 
 
 def simple():
@@ -67,7 +107,7 @@ def simple_user():
         "updates": 0,
         "index": 0,
         "date_time_added": str(datetime.datetime.now()),
-        "guid": str(uuid.uuid4()),
+        "guid": random_uuid(),
         "isActive": True,
         "balance": "$3,175.30",
         "picture": random_string(10),
@@ -604,7 +644,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -636,7 +676,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -677,7 +717,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -753,7 +793,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -785,7 +825,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -826,7 +866,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -902,7 +942,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -934,7 +974,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -975,7 +1015,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -1051,7 +1091,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -1083,7 +1123,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -1124,7 +1164,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -1200,7 +1240,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -1232,7 +1272,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -1273,7 +1313,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -1349,7 +1389,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -1381,7 +1421,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -1422,7 +1462,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -1498,7 +1538,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -1530,7 +1570,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -1571,7 +1611,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -1647,7 +1687,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -1679,7 +1719,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -1720,7 +1760,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -1796,7 +1836,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -1828,7 +1868,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -1869,7 +1909,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -1945,7 +1985,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -1977,7 +2017,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -2018,7 +2058,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -2094,7 +2134,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -2126,7 +2166,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -2167,7 +2207,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -2243,7 +2283,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -2275,7 +2315,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -2316,7 +2356,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -2392,7 +2432,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -2424,7 +2464,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -2465,7 +2505,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -2541,7 +2581,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -2573,7 +2613,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -2614,7 +2654,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -2690,7 +2730,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -2722,7 +2762,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -2763,7 +2803,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -2839,7 +2879,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -2871,7 +2911,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -2912,7 +2952,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -2988,7 +3028,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -3020,7 +3060,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -3061,7 +3101,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -3137,7 +3177,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -3169,7 +3209,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -3210,7 +3250,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -3286,7 +3326,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -3318,7 +3358,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -3359,7 +3399,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -3435,7 +3475,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -3467,7 +3507,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -3508,7 +3548,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -3584,7 +3624,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -3616,7 +3656,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -3657,7 +3697,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -3733,7 +3773,7 @@ def complex_doc():
                         "name": "DISTRILOGISTIQUE",
                         "origin": "Server",
                         "representatives": None,
-                        "supbackorder": bool(random.getrandbits(1)),
+                        "supbackorder": random_bool(),
                         "tel": None,
                         "town": None,
                         "vat": None,
@@ -3765,7 +3805,7 @@ def complex_doc():
                     ],
                     "sellingunit": "ST",
                     "statistics": None,
-                    "status": bool(random.getrandbits(1)),
+                    "status": random_bool(),
                     "stock": [
                         {
                             "artId": None,
@@ -3806,7 +3846,7 @@ def complex_doc():
                             "name": "DISTRILOGISTIQUE",
                             "origin": "Server",
                             "representatives": None,
-                            "supbackorder": bool(random.getrandbits(1)),
+                            "supbackorder": random_bool(),
                             "tel": None,
                             "town": None,
                             "vat": None,
@@ -3871,7 +3911,7 @@ def complex_doc():
                     "tel": None
                 }
             ],
-            "supbackorder": bool(random.getrandbits(1)),
+            "supbackorder": random_bool(),
             "tel": "056/31 39 55",
             "town": "ZWEVEGEM",
             "vat": None,
@@ -3881,3 +3921,54 @@ def complex_doc():
         "trackingnumber": None,
         "type": "CentralDepot"
     }
+
+
+seed()
+
+# Generator names accepted by the add docs keywords
+GENERATORS = {
+    "simple": simple,
+    "simple_user": simple_user,
+    "four_k": four_k,
+    "complex_doc": complex_doc,
+    "20mb": doc_20mb
+}
+
+
+def get_generator(name):
+    """ Returns the generator for 'name', 'simple' if the name is None or unknown """
+    return GENERATORS.get(name, simple)
+
+
+def generate_docs(generator, number, seed_value=None):
+    """
+    Yields 'number' docs from 'generator' (a name from GENERATORS or a function).
+    If 'seed_value' is provided the generators are reseeded first, so the corpus is reproducible.
+    """
+
+    if not callable(generator):
+        generator = get_generator(generator)
+    if seed_value is not None:
+        seed(seed_value)
+
+    for _ in xrange(number):
+        yield generator()
+
+
+def generate_serialized_docs(generator, number, seed_value=None):
+    """
+    Yields 'number' docs from 'generator' already serialized as JSON.
+    The 20mb doc is not parsed at all, its cached serialized form is returned.
+    """
+
+    if not callable(generator):
+        generator = get_generator(generator)
+
+    if generator is doc_20mb:
+        serialized = _load_doc_20mb_json()
+        for _ in xrange(number):
+            yield serialized
+        return
+
+    for doc in generate_docs(generator, number, seed_value):
+        yield json.dumps(doc, separators=(",", ":"))
@@ -1,4 +1,7 @@
 import os
+import threading
+import time
+from contextlib import contextmanager
 
 from keywords.utils import log_info
 
@@ -66,9 +69,132 @@ class Options(object):
         self.module_path = module_path
 
 
+class PatternCacheInventory(Inventory):
+    """
+    Inventory with its own host pattern cache.
+    Ansible caches the hosts matching a pattern in a module global, so with several Inventory instances
+    alive (pooled contexts, see inventory_context) one inventory would get the Host objects of another and host
+    comparisons would fail (see http://bit.ly/1qKmV3x)
+    """
+
+    _global_cache_lock = threading.RLock()
+
+    def __init__(self, *args, **kwargs):
+        self._hosts_patterns_cache = {}
+        Inventory.__init__(self, *args, **kwargs)
+
+    def get_hosts(self, *args, **kwargs):
+        with PatternCacheInventory._global_cache_lock:
+            global_cache = ansible.inventory.HOSTS_PATTERNS_CACHE
+            ansible.inventory.HOSTS_PATTERNS_CACHE = self._hosts_patterns_cache
+            try:
+                return Inventory.get_hosts(self, *args, **kwargs)
+            finally:
+                ansible.inventory.HOSTS_PATTERNS_CACHE = global_cache
+
+    def clear_pattern_cache(self):
+        Inventory.clear_pattern_cache(self)
+        self._hosts_patterns_cache.clear()
+
+
+class InventoryContext(object):
+    """
+    Parsed inventory, variable manager and data loader (which caches the parsed playbooks) of an inventory file.
+    A context is reused by the playbook runs of the inventory, but only used by one run at a time.
+    """
+
+    def __init__(self, inventory_filename):
+        # Gets data from YAML/JSON files
+        self.loader = DataLoader()
+
+        # All the variables from all the various places
+        self.variable_manager = VariableManager()
+
+        # Set inventory, using most of above objects
+        self.inventory = PatternCacheInventory(loader=self.loader, variable_manager=self.variable_manager, host_list=inventory_filename)
+        self.variable_manager.set_inventory(self.inventory)
+
+    def prepare(self, extra_vars, subset):
+        """ Sets the extra vars and host subset of the next playbook run """
+        # Forget the facts gathered (and set_fact) by the previous runs, the hosts may have changed since
+        self.variable_manager._fact_cache.clear()
+        self.variable_manager._nonpersistent_fact_cache.clear()
+        self.variable_manager.extra_vars = extra_vars
+        self.inventory.remove_restriction()
+        self.inventory.subset(subset)
+
+
+# { (inventory file, modification time): [idle InventoryContext, ...] }
+_idle_contexts = {}
+_idle_contexts_lock = threading.Lock()
+
+
+@contextmanager
+def inventory_context(inventory_filename):
+    """ Checks out an idle InventoryContext of 'inventory_filename', parsing the inventory if none is idle """
+
+    key = (os.path.abspath(inventory_filename), os.path.getmtime(inventory_filename))
+    with _idle_contexts_lock:
+        idle = _idle_contexts.setdefault(key, [])
+        context = idle.pop() if idle else None
+
+    if context is None:
+        log_info("Parsing inventory: {}".format(inventory_filename))
+        context = InventoryContext(inventory_filename)
+
+    try:
+        yield context
+    finally:
+        with _idle_contexts_lock:
+            _idle_contexts[key].append(context)
+
+
+def clear_inventory_contexts():
+    with _idle_contexts_lock:
+        _idle_contexts.clear()
+
+
+class TaskTimer(object):
+    """
+    Callback recording how long each task took on each host.
+    The linear strategy starts a task on all the hosts at once, so the time of a host is
+    measured from the start of the task to the result of the host.
+    """
+
+    def __init__(self):
+        self.timings = []
+        self._task_name = None
+        self._task_start = None
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self._task_name = task.get_name()
+        self._task_start = time.time()
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self.v2_playbook_on_task_start(task, False)
+
+    def _record(self, result, status):
+        if self._task_start is None:
+            return
+        elapsed = time.time() - self._task_start
+        self.timings.append((result._host.get_name(), self._task_name, elapsed, status))
+
+    def v2_runner_on_ok(self, result):
+        self._record(result, "ok")
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._record(result, "ignored" if ignore_errors else "failed")
+
+    def v2_runner_on_skipped(self, result):
+        self._record(result, "skipped")
+
+    def v2_runner_on_unreachable(self, result):
+        self._record(result, "unreachable")
+
+
 class Runner(object):
 
-    def __init__(self, inventory_filename, playbook, extra_vars, verbosity=0, subset=constants.DEFAULT_SUBSET):
+    def __init__(self, inventory_filename, playbook, extra_vars, verbosity=0, subset=constants.DEFAULT_SUBSET, context=None, forks=None):
 
         if not os.path.exists(inventory_filename):
             raise Exception("Cannot find inventory_filename: {}.  Current dir: {}".format(inventory_filename, os.getcwd()))
@@ -83,7 +209,7 @@ class Runner(object):
 
         # Propagate defaults from ANSIBLE_CONFIG into options
         self.options.module_path = constants.DEFAULT_MODULE_PATH
-        self.options.forks = constants.DEFAULT_FORKS
+        self.options.forks = forks or constants.DEFAULT_FORKS
         self.options.ask_vault_pass = constants.DEFAULT_ASK_VAULT_PASS
         self.options.vault_password_files = [constants.DEFAULT_VAULT_PASSWORD_FILE]
         self.options.sudo = constants.DEFAULT_SUDO
@@ -109,23 +235,13 @@ class Runner(object):
         # Become Pass Needed if not logging in as user root
         passwords = {}
 
-        # Gets data from YAML/JSON files
-        self.loader = DataLoader()
-
-        # All the variables from all the various places
-        self.variable_manager = VariableManager()
-        self.variable_manager.extra_vars = extra_vars
-
-        # WARNING: this is a dirty hack to avoid a situation where creating multiple
-        # instance of this Runner each with it's own Inventory instance was creating
-        # a situation where we ended up with different UUID's for hosts and comparisons
-        # were failing (see http://bit.ly/1qKmV3x)
-        ansible.inventory.HOSTS_PATTERNS_CACHE = {}
-
-        # Set inventory, using most of above objects
-        self.inventory = Inventory(loader=self.loader, variable_manager=self.variable_manager, host_list=inventory_filename)
-        self.inventory.subset(self.options.subset)
-        self.variable_manager.set_inventory(self.inventory)
+        # Inventory, variable manager and loader, reused if the caller checked out a context
+        if context is None:
+            context = InventoryContext(inventory_filename)
+        context.prepare(extra_vars, self.options.subset)
+        self.loader = context.loader
+        self.variable_manager = context.variable_manager
+        self.inventory = context.inventory
 
         # Setup playbook executor, but don't run until run() called
         log_info("Running playbook: {}".format(playbook))
@@ -137,6 +253,10 @@ class Runner(object):
             options=self.options,
             passwords=passwords)
 
+        # Loaded callbacks are appended to this list when the playbook runs
+        self.task_timer = TaskTimer()
+        self.pbex._tqm._callback_plugins.append(self.task_timer)
+
     def run(self):
         # Results of PlaybookExecutor
         self.pbex.run()
@@ -1,30 +1,185 @@
+import multiprocessing
+import os
+import time
+import traceback
+
 from ansible_python_runner import Runner
+from ansible_python_runner import inventory_context
 from ansible import constants
 import logging
 
+from keywords.constants import ANSIBLE_MAX_PARALLEL_PLAYBOOKS
+from keywords.exceptions import ProvisioningError
+from keywords.utils import log_info
+
 PLAYBOOKS_HOME = "libraries/provision/ansible/playbooks"
 
+# Playbooks that do not change Couchbase Server, Sync Gateway or sg_accel (ex. log collection)
+READ_ONLY_PLAYBOOK_PREFIXES = ("fetch-", "check-", "collect-", "pull-", "sgcollect-", "start-ngrep", "stop-ngrep", "start-profile-collection")
+# Playbooks that only manage the test clients
+CLIENT_PLAYBOOK_KEYWORDS = ("liteserv", "testserver")
+
+# How often (seconds) run_ansible_playbooks checks whether a playbook process has finished
+PLAYBOOK_PROCESS_POLL_SECS = 0.1
+
+# { inventory: number of playbook runs that may have changed the cluster }
+_cluster_change_counts = {}
+
+
+def is_read_only_playbook(script_name):
+    return script_name.startswith(READ_ONLY_PLAYBOOK_PREFIXES) or any(keyword in script_name for keyword in CLIENT_PLAYBOOK_KEYWORDS)
+
+
+def get_cluster_change_count(inventory_filename):
+    """
+    Returns the number of playbook runs that may have changed the cluster of 'inventory_filename'.
+    Cluster.reset() uses it to detect that the cluster was changed since its last reset.
+    """
+    return _cluster_change_counts.get(os.path.abspath(inventory_filename), 0)
+
+
+class PlaybookResult:
+    """ Outcome of a playbook run: 'status' (number of failed / unreachable hosts), duration and per host, per task timings """
+
+    def __init__(self, script_name, subset, status, elapsed, task_timings):
+        self.script_name = script_name
+        self.subset = subset
+        self.status = status
+        self.elapsed = elapsed
+        # [(host, task, secs, 'ok' | 'failed' | 'ignored' | 'skipped' | 'unreachable'), ...]
+        self.task_timings = task_timings
+
+    def host_timings(self):
+        """ Returns { host: total secs spent in tasks } """
+        totals = {}
+        for host, _, elapsed, _ in self.task_timings:
+            totals[host] = totals.get(host, 0) + elapsed
+        return totals
+
+    def slowest_tasks(self, count=5):
+        return sorted(self.task_timings, key=lambda timing: timing[2], reverse=True)[:count]
+
+    def __repr__(self):
+        return "PlaybookResult({}, subset={}, status={}, {:.1f}s)".format(self.script_name, self.subset, self.status, self.elapsed)
+
+
+def log_playbook_timings(results, count=5):
+    """ Logs the duration of each playbook run and its slowest host tasks """
+    for result in results:
+        log_info(">>> {} (subset: {}) took {:.1f}s, status: {}".format(result.script_name, result.subset, result.elapsed, result.status))
+        for host, task, elapsed, status in result.slowest_tasks(count):
+            log_info(">>>   {} {}: {:.1f}s ({})".format(host, task, elapsed, status))
+
 
 class AnsibleRunner:
 
     def __init__(self, config):
         self.provisiong_config = config
 
-    def run_ansible_playbook(self, script_name, extra_vars={}, subset=constants.DEFAULT_SUBSET):
+    def _count_change(self, script_name):
+        if not is_read_only_playbook(script_name):
+            key = os.path.abspath(self.provisiong_config)
+            _cluster_change_counts[key] = _cluster_change_counts.get(key, 0) + 1
+
+    def _run_step(self, script_name, extra_vars, subset, forks):
 
         inventory_filename = self.provisiong_config
 
         playbook_filename = "{}/{}".format(PLAYBOOKS_HOME, script_name)
 
-        runner = Runner(
-            inventory_filename=inventory_filename,
-            playbook=playbook_filename,
-            extra_vars=extra_vars,
-            verbosity=0,  # change this to a higher number for -vvv debugging (try 10),
-            subset=subset
-        )
+        start = time.time()
+        with inventory_context(inventory_filename) as context:
+            runner = Runner(
+                inventory_filename=inventory_filename,
+                playbook=playbook_filename,
+                extra_vars=extra_vars,
+                verbosity=0,  # change this to a higher number for -vvv debugging (try 10),
+                subset=subset,
+                context=context,
+                forks=forks
+            )
 
-        stats = runner.run()
+            stats = runner.run()
         logging.info(stats)
 
-        return len(stats.failures) + len(stats.dark)
+        status = len(stats.failures) + len(stats.dark)
+        return PlaybookResult(script_name, subset, status, time.time() - start, runner.task_timer.timings)
+
+    def run_ansible_playbook(self, script_name, extra_vars={}, subset=constants.DEFAULT_SUBSET, forks=None):
+        self._count_change(script_name)
+        return self._run_step(script_name, extra_vars, subset, forks).status
+
+    def run_ansible_playbooks(self, steps, max_parallel=ANSIBLE_MAX_PARALLEL_PLAYBOOKS, forks=None):
+        """
+        Runs 'steps', a list of (script_name, extra_vars, subset), 'max_parallel' at a time.
+        The steps must be independent (ex. stopping sync_gateway and sg_accel, or one step per host),
+        run the steps that depend on each other with separate calls.
+        'forks' is the number of hosts each playbook runs a task on at once (ANSIBLE_CONFIG default if None)
+
+        Returns the PlaybookResult of each step, in the order of 'steps'
+        """
+
+        for script_name, _, _ in steps:
+            self._count_change(script_name)
+
+        if len(steps) <= 1 or max_parallel == 1:
+            results = [self._run_step(script_name, extra_vars, subset, forks) for script_name, extra_vars, subset in steps]
+        else:
+            results = self._run_steps_in_processes(steps, max_parallel, forks)
+
+        log_playbook_timings(results)
+        return results
+
+    def _run_steps_in_processes(self, steps, max_parallel, forks):
+        """
+        Runs each step in its own process, Ansible's PlaybookExecutor keeps global state
+        (display, plugin loaders, connection caches) and can not run on several threads of one process.
+        """
+
+        results = [None] * len(steps)
+        errors = []
+        pending = list(enumerate(steps))
+        # { step index: (process, receiving end of its pipe) }
+        running = {}
+        while pending or running:
+            while pending and len(running) < max_parallel:
+                index, step = pending.pop(0)
+                running[index] = self._start_step_process(step, forks)
+
+            for index, (process, receiver) in list(running.items()):
+                if not receiver.poll(PLAYBOOK_PROCESS_POLL_SECS):
+                    continue
+
+                try:
+                    results[index], error = receiver.recv()
+                except EOFError:
+                    error = "The playbook process exited without a result"
+                receiver.close()
+                process.join()
+                del running[index]
+
+                if error is not None:
+                    script_name, _, subset = steps[index]
+                    errors.append("{} (subset: {}): {}".format(script_name, subset, error))
+
+        if errors:
+            raise ProvisioningError("Failed to run playbooks: {}".format("\n".join(errors)))
+        return results
+
+    def _start_step_process(self, step, forks):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        # Not a daemon process, Ansible starts its own worker processes
+        process = multiprocessing.Process(target=self._run_step_in_process, args=(sender, step, forks))
+        process.start()
+        # Only the child writes to the pipe
+        sender.close()
+        return process, receiver
+
+    def _run_step_in_process(self, sender, step, forks):
+        script_name, extra_vars, subset = step
+        try:
+            sender.send((self._run_step(script_name, extra_vars, subset, forks), None))
+        except Exception:
+            sender.send((None, traceback.format_exc()))
+        finally:
+            sender.close()
@@ -11,6 +11,7 @@ from libraries.provision.ansible_runner import AnsibleRunner
 from libraries.testkit.config import Config
 from libraries.testkit.cluster import Cluster
 from keywords.constants import SYNC_GATEWAY_CERT
+from keywords.constants import CBS_HTTP_PORTS
 from utilities.cluster_config_utils import is_cbs_ssl_enabled, is_xattrs_enabled, no_conflicts_enabled, get_revs_limit, sg_ssl_enabled
 from utilities.cluster_config_utils import get_sg_version, get_sg_replicas, get_sg_use_views, get_redact_level, is_ipv6, is_x509_auth, generate_x509_certs, is_delta_sync_enabled
 
@@ -220,16 +221,12 @@ def install_sync_gateway(cluster_config, sync_gateway_config, sg_ce=False,
     if is_cbs_ssl_enabled(cluster_config) and get_sg_version(cluster_config) >= "1.5.0":
         playbook_vars["server_scheme"] = "couchbases"
         playbook_vars["server_port"] = 11207
-        block_http_vars = {}
-        port_list = [8091, 8092, 8093, 8094, 8095, 8096, 11210, 11211]
-        for port in port_list:
-            block_http_vars["port"] = port
-            status = ansible_runner.run_ansible_playbook(
-                "block-http-ports.yml",
-                extra_vars=block_http_vars
-            )
-            if status != 0:
-                raise ProvisioningError("Failed to block port on SGW")
+        status = ansible_runner.run_ansible_playbook(
+            "block-http-ports.yml",
+            extra_vars={"ports": CBS_HTTP_PORTS}
+        )
+        if status != 0:
+            raise ProvisioningError("Failed to block port on SGW")
 
     if is_xattrs_enabled(cluster_config):
         playbook_vars["autoimport"] = '"import_docs": "continuous",'
@@ -1,6 +1,8 @@
+import hashlib
 import json
 import os
 import time
+from contextlib import contextmanager
 
 from requests.exceptions import ConnectionError
 
@@ -9,6 +11,7 @@ from keywords.couchbaseserver import CouchbaseServer
 from keywords.exceptions import ProvisioningError
 from keywords.utils import log_info, add_cbs_to_sg_config_server_field
 from libraries.provision.ansible_runner import AnsibleRunner
+from libraries.provision.ansible_runner import get_cluster_change_count
 from libraries.testkit.admin import Admin
 from libraries.testkit.config import Config
 from libraries.testkit.sgaccel import SgAccel
@@ -18,7 +21,16 @@ from utilities.cluster_config_utils import is_load_balancer_enabled, get_revs_li
 from utilities.cluster_config_utils import get_load_balancer_ip, no_conflicts_enabled, is_delta_sync_enabled
 from utilities.cluster_config_utils import generate_x509_certs, is_x509_auth
 from keywords.constants import SYNC_GATEWAY_CERT
-from utilities.cluster_config_utils import get_sg_replicas, get_sg_use_views, get_sg_version
+from keywords.constants import CBS_HTTP_PORTS
+from keywords.constants import CLIENT_REQUEST_TIMEOUT
+from keywords.constants import CLUSTER_FAST_RESET_ENABLED
+from utilities.cluster_config_utils import get_sg_replicas, get_sg_use_views, get_sg_version, load_cluster_config_json
+
+RESET_PLAN_FAST = "fast"
+RESET_PLAN_FULL = "full"
+
+# State left by the last full reset of each cluster config (absolute path), see plan_reset
+_reset_states = {}
 
 
 class Cluster:
@@ -43,8 +55,7 @@ class Cluster:
         log_info(self._cluster_config)
 
         # Load resources/cluster_configs/<cluster_config>.json
-        with open("{}.json".format(config)) as f:
-            cluster = json.loads(f.read())
+        cluster = load_cluster_config_json(config)
 
         # Get load balancer IP
         lb_ip = None
@@ -94,46 +105,31 @@ class Cluster:
         self.sg_accels = [SgAccel(cluster_config=self._cluster_config, target=ac) for ac in acs]
         self.servers = [CouchbaseServer(url=cb_url) for cb_url in cbs_urls]
         self.sync_gateway_config = None  # will be set to Config object when reset() called
+        self.last_reset_plan = None
+        self.last_reset_timings = None
 
-    def reset(self, sg_config_path):
+    def reset(self, sg_config_path, full_reset=False):
+        """
+        Resets the cluster to run 'sg_config_path'. Returns the Sync Gateway mode ('cc' or 'di').
 
-        ansible_runner = AnsibleRunner(self._cluster_config)
+        When the cluster is still in the state left by the previous reset with the same
+        Sync Gateway config and buckets (see plan_reset), only the data is reset: the databases
+        are taken offline, the buckets are flushed and the databases are brought back online.
+        Otherwise (or with 'full_reset') Sync Gateway is stopped, the buckets are deleted and recreated
+        and Sync Gateway is restarted. The time spent in each step is kept in 'last_reset_timings'.
+        """
 
         log_info(">>> Reseting cluster ...")
         log_info(">>> CBS SSL enabled: {}".format(self.cbs_ssl))
         log_info(">>> Using xattrs: {}".format(self.xattrs))
 
-        # Stop sync_gateways
-        log_info(">>> Stopping sync_gateway")
-        status = ansible_runner.run_ansible_playbook("stop-sync-gateway.yml")
-        assert status == 0, "Failed to stop sync gateway"
-
-        # Stop sync_gateway accels
-        log_info(">>> Stopping sg_accel")
-        status = ansible_runner.run_ansible_playbook("stop-sg-accel.yml")
-        assert status == 0, "Failed to stop sg_accel"
-
-        # Deleting sync_gateway artifacts
-        log_info(">>> Deleting sync_gateway artifacts")
-        status = ansible_runner.run_ansible_playbook("delete-sync-gateway-artifacts.yml")
-        assert status == 0, "Failed to delete sync_gateway artifacts"
-
-        # Deleting sg_accel artifacts
-        log_info(">>> Deleting sg_accel artifacts")
-        status = ansible_runner.run_ansible_playbook("delete-sg-accel-artifacts.yml")
-        assert status == 0, "Failed to delete sg_accel artifacts"
-
-        # Delete buckets
-        log_info(">>> Deleting buckets on: {}".format(self.servers[0].url))
-        self.servers[0].delete_buckets()
+        timings = ResetTimings()
+        self.last_reset_timings = timings
 
         # Parse config and grab bucket names
         config_path_full = os.path.abspath(sg_config_path)
         config = Config(config_path_full)
         mode = config.get_mode()
-        bucket_name_set = config.get_bucket_name_set()
-        sg_cert_path = os.path.abspath(SYNC_GATEWAY_CERT)
-        cbs_cert_path = os.path.join(os.getcwd(), "certs")
         bucket_names = get_buckets_from_sync_gateway_config(sg_config_path)
 
         self.sync_gateway_config = config
@@ -142,19 +138,160 @@ class Cluster:
         if not is_valid:
             raise ProvisioningError(reason)
 
-        log_info(">>> Creating buckets on: {}".format(self.servers[0].url))
-        log_info(">>> Creating buckets {}".format(bucket_name_set))
-        self.servers[0].create_buckets(bucket_names=bucket_name_set,
-                                       cluster_config=self._cluster_config,
-                                       ipv6=self.ipv6)
+        playbook_vars = self._get_sync_gateway_playbook_vars(config_path_full, bucket_names)
+        fingerprint = get_reset_fingerprint(config_path_full, playbook_vars, config)
+        state_key = os.path.abspath(self._cluster_config)
+
+        plan, reason = plan_reset(
+            _reset_states.get(state_key),
+            fingerprint,
+            get_cluster_change_count(self._cluster_config),
+            mode,
+            full_reset or not CLUSTER_FAST_RESET_ENABLED
+        )
+        log_info(">>> Reset plan: {} ({})".format(plan, reason))
+
+        if plan == RESET_PLAN_FAST:
+            try:
+                self._fast_reset(config, timings)
+            except Exception as e:
+                log_info(">>> Fast reset failed: {}, falling back to a full reset".format(e))
+                plan = RESET_PLAN_FULL
+
+        if plan == RESET_PLAN_FULL:
+            # The state is unknown until the full reset succeeds
+            _reset_states.pop(state_key, None)
+            self._full_reset(config, config_path_full, bucket_names, playbook_vars, timings)
+            _reset_states[state_key] = ResetState(fingerprint, get_cluster_change_count(self._cluster_config))
+
+        self.last_reset_plan = plan
+        timings.log(plan)
+        return mode
+
+    def _fast_reset(self, config, timings):
+        """ Deletes the data of the running databases without restarting Sync Gateway or recreating the buckets """
+
+        bucket_names = config.get_bucket_name_set()
+        databases = config.get_databases()
+        admins = [Admin(sg) for sg in self.sync_gateways]
+
+        with timings.step("verify cluster state"):
+            server_bucket_names = self.servers[0].get_bucket_names()
+            if sorted(server_bucket_names) != sorted(bucket_names):
+                raise ProvisioningError("Expected buckets {}, found {}".format(bucket_names, server_bucket_names))
+            for admin in admins:
+                sg_dbs = admin.get_dbs()
+                if sorted(sg_dbs) != sorted(databases):
+                    raise ProvisioningError("Expected databases {} on {}, found {}".format(sorted(databases), admin.admin_url, sg_dbs))
 
-        # Wait for server to be in a warmup state to work around
-        # https://github.com/couchbase/sync_gateway/issues/1745
-        log_info(">>> Waiting for Server: {} to be in a healthy state".format(self.servers[0].url))
-        self.servers[0].wait_for_ready_state()
+        with timings.step("take databases offline"):
+            for admin in admins:
+                for db in databases:
+                    admin.take_db_offline(db)
+
+        with timings.step("flush buckets"):
+            self.servers[0].flush_buckets(bucket_names, ipv6=self.ipv6)
+
+        with timings.step("bring databases online"):
+            for admin in admins:
+                for db in databases:
+                    admin.bring_db_online(db)
+            for admin in admins:
+                for db in databases:
+                    wait_for_db_online(admin, db)
+
+    def _full_reset(self, config, config_path_full, bucket_names, playbook_vars, timings):
+
+        ansible_runner = AnsibleRunner(self._cluster_config)
+        mode = config.get_mode()
+
+        with timings.step("stop sync_gateway and sg_accel"):
+            log_info(">>> Stopping sync_gateway and sg_accel")
+            stop_results = ansible_runner.run_ansible_playbooks([
+                ("stop-sync-gateway.yml", {}, None),
+                ("stop-sg-accel.yml", {}, None)
+            ])
+            assert stop_results[0].status == 0, "Failed to stop sync gateway"
+            assert stop_results[1].status == 0, "Failed to stop sg_accel"
+
+        with timings.step("delete sync_gateway and sg_accel artifacts"):
+            log_info(">>> Deleting sync_gateway and sg_accel artifacts")
+            delete_results = ansible_runner.run_ansible_playbooks([
+                ("delete-sync-gateway-artifacts.yml", {}, None),
+                ("delete-sg-accel-artifacts.yml", {}, None)
+            ])
+            assert delete_results[0].status == 0, "Failed to delete sync_gateway artifacts"
+            assert delete_results[1].status == 0, "Failed to delete sg_accel artifacts"
+
+        with timings.step("delete buckets"):
+            log_info(">>> Deleting buckets on: {}".format(self.servers[0].url))
+            self.servers[0].delete_buckets()
+
+        bucket_name_set = config.get_bucket_name_set()
+        with timings.step("create buckets"):
+            log_info(">>> Creating buckets on: {}".format(self.servers[0].url))
+            log_info(">>> Creating buckets {}".format(bucket_name_set))
+            self.servers[0].create_buckets(bucket_names=bucket_name_set,
+                                           cluster_config=self._cluster_config,
+                                           ipv6=self.ipv6)
+
+            # Wait for server to be in a warmup state to work around
+            # https://github.com/couchbase/sync_gateway/issues/1745
+            log_info(">>> Waiting for Server: {} to be in a healthy state".format(self.servers[0].url))
+            self.servers[0].wait_for_ready_state()
 
         log_info(">>> Starting sync_gateway with configuration: {}".format(config_path_full))
 
+        if get_sg_version(self._cluster_config) >= "2.1.0" and is_x509_auth(self._cluster_config):
+            generate_x509_certs(self._cluster_config, bucket_names)
+
+        if self.cbs_ssl and get_sg_version(self._cluster_config) >= "1.5.0":
+            with timings.step("block http ports"):
+                status = ansible_runner.run_ansible_playbook(
+                    "block-http-ports.yml",
+                    extra_vars={"ports": CBS_HTTP_PORTS}
+                )
+                if status != 0:
+                    raise ProvisioningError("Failed to block port on SGW")
+
+        with timings.step("wait for index teardown"):
+            # Sleep for a few seconds for the indexes to teardown
+            time.sleep(5)
+
+        with timings.step("start sync_gateway"):
+            status = ansible_runner.run_ansible_playbook(
+                "start-sync-gateway.yml",
+                extra_vars=playbook_vars
+            )
+            assert status == 0, "Failed to start to Sync Gateway"
+
+        # HACK - only enable sg_accel for distributed index tests
+        # revise this with https://github.com/couchbaselabs/sync-gateway-testcluster/issues/222
+        if mode == "di":
+            with timings.step("start sg_accel"):
+                # Start sg-accel
+                status = ansible_runner.run_ansible_playbook(
+                    "start-sg-accel.yml",
+                    extra_vars=playbook_vars
+                )
+                assert status == 0, "Failed to start sg_accel"
+
+        # Validate CBGT
+        if mode == "di":
+            with timings.step("validate CBGT"):
+                if not self.validate_cbgt_pindex_distribution_retry(len(self.sg_accels)):
+                    self.save_cbgt_diagnostics()
+                    raise Exception("Failed to validate CBGT Pindex distribution")
+                log_info(">>> Detected valid CBGT Pindex distribution")
+        else:
+            log_info(">>> Running in channel cache")
+
+    def _get_sync_gateway_playbook_vars(self, config_path_full, bucket_names):
+        """ Returns the start-sync-gateway.yml / start-sg-accel.yml variables for the cluster """
+
+        sg_cert_path = os.path.abspath(SYNC_GATEWAY_CERT)
+        cbs_cert_path = os.path.join(os.getcwd(), "certs")
+
         server_port = 8091
         server_scheme = "http"
         couchbase_server_primary_node = add_cbs_to_sg_config_server_field(self._cluster_config)
@@ -166,6 +303,7 @@ class Cluster:
 
         # Start sync-gateway
         playbook_vars = {
+
             "sync_gateway_config_filepath": config_path_full,
             "username": "",
             "password": "",
@@ -213,7 +351,6 @@ class Cluster:
                 playbook_vars["server_scheme"] = "couchbases"
                 playbook_vars["server_port"] = ""
                 playbook_vars["x509_auth"] = True
-                generate_x509_certs(self._cluster_config, bucket_names)
             else:
                 playbook_vars["username"] = '"username": "{}",'.format(
                     bucket_names[0])
@@ -227,16 +364,7 @@ class Cluster:
         if self.cbs_ssl and get_sg_version(self._cluster_config) >= "1.5.0":
             playbook_vars["server_scheme"] = "couchbases"
             playbook_vars["server_port"] = 11207
-            block_http_vars = {}
-            port_list = [8091, 8092, 8093, 8094, 8095, 8096, 11210, 11211]
-            for port in port_list:
-                block_http_vars["port"] = port
-                status = ansible_runner.run_ansible_playbook(
-                    "block-http-ports.yml",
-                    extra_vars=block_http_vars
-                )
-                if status != 0:
-                    raise ProvisioningError("Failed to block port on SGW")
+
         # Add configuration to run with xattrs
         if self.xattrs:
             playbook_vars["autoimport"] = '"import_docs": "continuous",'
@@ -258,35 +386,7 @@ class Cluster:
         if is_delta_sync_enabled(self._cluster_config) and get_sg_version(self._cluster_config) >= "2.5.0":
             playbook_vars["delta_sync"] = '"delta_sync": { "enabled": true},'
 
-        # Sleep for a few seconds for the indexes to teardown
-        time.sleep(5)
-
-        status = ansible_runner.run_ansible_playbook(
-            "start-sync-gateway.yml",
-            extra_vars=playbook_vars
-        )
-        assert status == 0, "Failed to start to Sync Gateway"
-
-        # HACK - only enable sg_accel for distributed index tests
-        # revise this with https://github.com/couchbaselabs/sync-gateway-testcluster/issues/222
-        if mode == "di":
-            # Start sg-accel
-            status = ansible_runner.run_ansible_playbook(
-                "start-sg-accel.yml",
-                extra_vars=playbook_vars
-            )
-            assert status == 0, "Failed to start sg_accel"
-
-        # Validate CBGT
-        if mode == "di":
-            if not self.validate_cbgt_pindex_distribution_retry(len(self.sg_accels)):
-                self.save_cbgt_diagnostics()
-                raise Exception("Failed to validate CBGT Pindex distribution")
-            log_info(">>> Detected valid CBGT Pindex distribution")
-        else:
-            log_info(">>> Running in channel cache")
-
-        return mode
+        return playbook_vars
 
     def restart_services(self):
         ansible_runner = AnsibleRunner(self._cluster_config)
@@ -416,17 +516,14 @@ class Cluster:
 
     def stop_sg_and_accel(self):
 
-        # Stop sync_gateways
-        log_info(">>> Stopping sync_gateway")
-        for sg in self.sync_gateways:
-            status = sg.stop()
-            assert status == 0, "Failed to stop sync gateway for host {}".format(sg.hostname)
+        # Stop sync_gateways and sync_gateway accels, one playbook run per host
+        log_info(">>> Stopping sync_gateway and sg_accel")
+        steps = [("stop-sync-gateway.yml", {}, sg.hostname) for sg in self.sync_gateways]
+        steps += [("stop-sg-accel.yml", {}, sgaccel.hostname) for sgaccel in self.sg_accels]
+        results = AnsibleRunner(self._cluster_config).run_ansible_playbooks(steps)
 
-        # Stop sync_gateway accels
-        log_info(">>> Stopping sg_accel")
-        for sgaccel in self.sg_accels:
-            status = sgaccel.stop()
-            assert status == 0, "Failed to stop sync gateway for host {}".format(sgaccel.hostname)
+        for result in results:
+            assert result.status == 0, "Failed to stop {} for host {}".format(result.script_name, result.subset)
 
     def __repr__(self):
         s = "\n\n"
@@ -454,3 +551,76 @@ def validate_cluster(sync_gateways, sg_accels, config):
         return False, "INVALID CONFIG: Running in Distributed Index mode but no sg_accels are defined."
 
     return True, ""
+
+
+class ResetState:
+    """ 'fingerprint' of the Sync Gateway config / buckets set up by a full reset and the cluster change count after it """
+
+    def __init__(self, fingerprint, change_count):
+        self.fingerprint = fingerprint
+        self.change_count = change_count
+
+
+class ResetTimings:
+    """ Time spent in each step of a Cluster.reset() """
+
+    def __init__(self):
+        self.steps = []
+
+    @contextmanager
+    def step(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.time() - start))
+
+    def total(self):
+        return sum(elapsed for _, elapsed in self.steps)
+
+    def log(self, plan):
+        log_info(">>> {} reset took {:.1f}s".format(plan.capitalize(), self.total()))
+        for name, elapsed in self.steps:
+            log_info(">>>   {}: {:.1f}s".format(name, elapsed))
+
+
+def get_reset_fingerprint(config_path_full, playbook_vars, config):
+    """ Hash of everything a full reset sets up: the Sync Gateway config, how it is started and the buckets """
+
+    with open(config_path_full, "rb") as f:
+        sg_config = f.read()
+
+    fingerprint = hashlib.sha1(sg_config)
+    fingerprint.update(json.dumps([playbook_vars, sorted(config.get_bucket_name_set()), config.get_databases()], sort_keys=True).encode("utf-8"))
+    return fingerprint.hexdigest()
+
+
+def plan_reset(state, fingerprint, change_count, mode, full_reset):
+    """
+    Returns (RESET_PLAN_FAST | RESET_PLAN_FULL, reason).
+    A fast reset is only possible if the last full reset set up the same config / buckets ('fingerprint')
+    and no playbook changed the cluster since then ('change_count').
+    """
+
+    if full_reset:
+        return RESET_PLAN_FULL, "full reset requested"
+    if mode == "di":
+        return RESET_PLAN_FULL, "sg_accel has to be restarted in distributed index mode"
+    if state is None:
+        return RESET_PLAN_FULL, "no previous reset of this cluster"
+    if state.fingerprint != fingerprint:
+        return RESET_PLAN_FULL, "the Sync Gateway config or buckets changed"
+    if state.change_count != change_count:
+        return RESET_PLAN_FULL, "the cluster was changed since the last reset"
+    return RESET_PLAN_FAST, "the cluster matches the last reset"
+
+
+def wait_for_db_online(admin, db, timeout=CLIENT_REQUEST_TIMEOUT):
+    start = time.time()
+    while True:
+        state = admin.get_db_info(db)["state"]
+        if state == "Online":
+            return
+        if time.time() - start > timeout:
+            raise keywords.exceptions.TimeoutError("Database {} is still {} after {}s".format(db, state, timeout))
+        time.sleep(0.5)
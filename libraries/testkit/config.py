@@ -16,6 +16,7 @@ class Config:
         self.conf_path = conf_path
         self.mode = None
         self.bucket_name_set = []
+        self.databases = {}
 
         with open(conf_path, "r") as config:
 
@@ -76,6 +77,8 @@ class Config:
 
             self.discover_bucket_name_set(conf_obj)
 
+            self.discover_databases(conf_obj)
+
     def get_mode(self):
 
         return self.mode
@@ -84,6 +87,11 @@ class Config:
 
         return self.bucket_name_set
 
+    def get_databases(self):
+        """ Returns { database name: data bucket name } """
+
+        return self.databases
+
     def discover_mode(self, conf_obj):
 
         if "cluster_config" in conf_obj.keys():
@@ -119,6 +127,11 @@ class Config:
         # Buckets may be shared for different functionality
         self.bucket_name_set = list(set(bucket_names_from_config))
 
+    def discover_databases(self, conf_obj):
+
+        for name, val in conf_obj["databases"].iteritems():
+            self.databases[name] = val.get("bucket")
+
 
 def convert_to_valid_json(invalid_json):
 
@@ -9,6 +9,7 @@ from utilities.cluster_config_utils import is_cbs_ssl_enabled, is_xattrs_enabled
 from utilities.cluster_config_utils import get_sg_replicas, get_sg_use_views, get_sg_version, get_redact_level, is_delta_sync_enabled
 from keywords.utils import add_cbs_to_sg_config_server_field, log_info
 from keywords.constants import SYNC_GATEWAY_CERT
+from keywords.constants import CBS_HTTP_PORTS
 from utilities.cluster_config_utils import sg_ssl_enabled
 from keywords.exceptions import ProvisioningError
 
@@ -107,16 +108,12 @@ class SgAccel:
         if is_cbs_ssl_enabled(self.cluster_config) and get_sg_version(self.cluster_config) >= "1.5.0":
             playbook_vars["server_scheme"] = "couchbases"
             playbook_vars["server_port"] = 11207
-            block_http_vars = {}
-            port_list = [8091, 8092, 8093, 8094, 8095, 8096, 11210, 11211]
-            for port in port_list:
-                block_http_vars["port"] = port
-                status = self.ansible_runner.run_ansible_playbook(
-                    "block-http-ports.yml",
-                    extra_vars=block_http_vars
-                )
-                if status != 0:
-                    raise ProvisioningError("Failed to block port on SGW")
+            status = self.ansible_runner.run_ansible_playbook(
+                "block-http-ports.yml",
+                extra_vars={"ports": CBS_HTTP_PORTS}
+            )
+            if status != 0:
+                raise ProvisioningError("Failed to block port on SGW")
         status = self.ansible_runner.run_ansible_playbook(
             "start-sg-accel.yml",
             extra_vars=playbook_vars,
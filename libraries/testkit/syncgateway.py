@@ -17,6 +17,7 @@ from utilities.cluster_config_utils import get_revs_limit, get_redact_level, is_
 from utilities.cluster_config_utils import get_sg_replicas, get_sg_use_views, get_sg_version, is_x509_auth, generate_x509_certs
 from keywords.utils import add_cbs_to_sg_config_server_field, log_info
 from keywords.constants import SYNC_GATEWAY_CERT
+from keywords.constants import CBS_HTTP_PORTS
 from keywords.exceptions import ProvisioningError
 
 log = logging.getLogger(libraries.testkit.settings.LOGGER)
@@ -156,16 +157,12 @@ class SyncGateway:
         if is_cbs_ssl_enabled(self.cluster_config) and get_sg_version(self.cluster_config) >= "1.5.0":
             playbook_vars["server_scheme"] = "couchbases"
             playbook_vars["server_port"] = 11207
-            block_http_vars = {}
-            port_list = [8091, 8092, 8093, 8094, 8095, 8096, 11210, 11211]
-            for port in port_list:
-                block_http_vars["port"] = port
-                status = self.ansible_runner.run_ansible_playbook(
-                    "block-http-ports.yml",
-                    extra_vars=block_http_vars
-                )
-                if status != 0:
-                    raise ProvisioningError("Failed to block port on SGW")
+            status = self.ansible_runner.run_ansible_playbook(
+                "block-http-ports.yml",
+                extra_vars={"ports": CBS_HTTP_PORTS}
+            )
+            if status != 0:
+                raise ProvisioningError("Failed to block port on SGW")
 
         status = self.ansible_runner.run_ansible_playbook(
             "start-sync-gateway.yml",
@@ -267,16 +264,12 @@ class SyncGateway:
         if is_cbs_ssl_enabled(self.cluster_config) and get_sg_version(self.cluster_config) >= "1.5.0":
             playbook_vars["server_scheme"] = "couchbases"
             playbook_vars["server_port"] = 11207
-            block_http_vars = {}
-            port_list = [8091, 8092, 8093, 8094, 8095, 8096, 11210, 11211]
-            for port in port_list:
-                block_http_vars["port"] = port
-                status = self.ansible_runner.run_ansible_playbook(
-                    "block-http-ports.yml",
-                    extra_vars=block_http_vars
-                )
-                if status != 0:
-                    raise ProvisioningError("Failed to block port on SGW")
+            status = self.ansible_runner.run_ansible_playbook(
+                "block-http-ports.yml",
+                extra_vars={"ports": CBS_HTTP_PORTS}
+            )
+            if status != 0:
+                raise ProvisioningError("Failed to block port on SGW")
 
         status = self.ansible_runner.run_ansible_playbook(
             "reset-sync-gateway.yml",
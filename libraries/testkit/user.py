@@ -8,9 +8,11 @@ import time
 
 from requests.exceptions import HTTPError
 
+from keywords import multipart
 from libraries.testkit.debug import log_request
 from libraries.testkit.debug import log_response
 from libraries.testkit import settings
+from libraries.testkit.verify import diff_changes
 import logging
 log = logging.getLogger(settings.LOGGER)
 
@@ -52,18 +54,12 @@ class User:
         docs_array = [{"id": doc_id} for doc_id in doc_ids]
         body = {"docs": docs_array}
 
-        resp = self._session.post("{0}/{1}/_bulk_get".format(self.target.url, self.db), data=json.dumps(body))
+        resp = self._session.post("{0}/{1}/_bulk_get".format(self.target.url, self.db), data=json.dumps(body), stream=True)
         log.debug("POST {}".format(resp.url))
         resp.raise_for_status()
 
-        # Parse Mime and build python obj of docs returned
-        # May need to fix this if we start including attachments
-        docs = []
-        for part in resp.text.splitlines():
-            if part.startswith("{"):
-                docs.append(json.loads(part))
-
-        return docs
+        # Parse Mime parts as they are streamed and build python obj of docs returned
+        return list(multipart.iter_multipart_response_docs(resp))
 
     # GET /{db}/_all_docs
     def get_all_docs(self):
@@ -353,22 +349,16 @@ class User:
 
     # Check if the user created doc-ids are part of changes feed
     def check_doc_ids_in_changes_feed(self):
-        superset = []
-        errors = 0
-        for obj in self.changes_data['results']:
-            if obj["id"] in superset:
-                log.error("doc id {} already exists".format(obj["id"]))
-                raise KeyError("Doc id already exists")
-            else:
-                superset.append(obj["id"])
+        diff = diff_changes(self.cache, self.changes_data['results'], name=self.name, ignore_rev_ids=True)
 
-        for doc_id in self.cache.keys():
-            if doc_id not in superset:
-                log.error("doc-id {} missing from superset for User {}".format(doc_id, self.name))
-                errors += 1
-            else:
-                log.debug('Found doc-id {} for user {} in changes feed'.format(doc_id, self.name))
-        return errors == 0
+        for doc_id in diff.duplicate_doc_ids:
+            log.error("doc id {} already exists".format(doc_id))
+            raise KeyError("Doc id already exists")
+
+        for doc_id in diff.missing:
+            log.error("doc-id {} missing from superset for User {}".format(doc_id, self.name))
+
+        return len(diff.missing) == 0
 
     # POST /{db}/_changes
     def get_changes(self, feed=None, limit=None, heartbeat=None, style=None,
@@ -1,3 +1,6 @@
+import concurrent.futures
+
+from libraries.testkit import settings
 from keywords.utils import log_info
 from keywords.utils import log_error
 from keywords.utils import log_warn
@@ -23,103 +26,187 @@ def verify_same_docs(expected_num_docs, doc_dict_one, doc_dict_two):
     log_info(" -> doc_dict_one == doc_dict_two expected (num_docs: {})".format(expected_num_docs))
 
 
+class ChangesDiff:
+    """
+    Structured difference between the expected docs and a _changes feed
+        - missing: expected doc ids not in the feed
+        - unexpected: doc ids in the feed that were not expected
+        - wrong_revision: {doc_id: (expected_rev, changes_rev)}
+        - duplicate_doc_ids: {doc_id: number of times seen}
+        - duplicate_sequences: {seq: [doc_ids]}
+        - check_failures: {check_name: [doc_ids]} for the failed per result checks
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.num_changes = 0
+        self.missing = []
+        self.unexpected = []
+        self.wrong_revision = {}
+        self.duplicate_doc_ids = {}
+        self.duplicate_sequences = {}
+        self.check_failures = {}
+
+    def is_empty(self):
+        return not any([self.missing, self.unexpected, self.wrong_revision, self.duplicate_doc_ids, self.duplicate_sequences, self.check_failures])
+
+    def __str__(self):
+        return "ChangesDiff({}: num_changes={}, missing={}, unexpected={}, wrong_revision={}, duplicate_doc_ids={}, duplicate_sequences={}, check_failures={})".format(
+            self.name,
+            self.num_changes,
+            len(self.missing),
+            len(self.unexpected),
+            len(self.wrong_revision),
+            len(self.duplicate_doc_ids),
+            len(self.duplicate_sequences),
+            {check_name: len(doc_ids) for check_name, doc_ids in self.check_failures.items()}
+        )
+
+
+def diff_changes(expected_docs, changes_results, name=None, ignore_rev_ids=False, checks=None):
+    """
+    Compares the results of a _changes feed to 'expected_docs' ({doc_id: rev}) in a single pass
+    and returns a ChangesDiff. '_user/' docs are skipped.
+
+    If the results include docs (include_docs=true), the doc '_rev' is compared, otherwise the first change rev.
+    'checks' is an optional {check_name: function(result)} where the function returns False if
+    the _changes result fails the check. Failures are recorded in ChangesDiff.check_failures
+    """
+
+    diff = ChangesDiff(name)
+    seen_doc_ids = {}
+    seen_sequences = {}
+
+    for result in changes_results:
+        doc_id = result["id"]
+        if doc_id.startswith("_user"):
+            continue
+
+        diff.num_changes += 1
+
+        if doc_id in seen_doc_ids:
+            seen_doc_ids[doc_id] += 1
+            diff.duplicate_doc_ids[doc_id] = seen_doc_ids[doc_id]
+        else:
+            seen_doc_ids[doc_id] = 1
+
+        seq = result.get("seq")
+        if seq is not None:
+            # Sequences can be compound strings or lists (di mode), hash their string form
+            seq_key = str(seq)
+            if seq_key in seen_sequences:
+                diff.duplicate_sequences.setdefault(seq_key, [seen_sequences[seq_key]]).append(doc_id)
+            else:
+                seen_sequences[seq_key] = doc_id
+
+        if doc_id not in expected_docs:
+            diff.unexpected.append(doc_id)
+        elif not ignore_rev_ids:
+            if result.get("doc") is not None:
+                rev = result["doc"]["_rev"]
+            else:
+                rev = result["changes"][0]["rev"]
+
+            if expected_docs[doc_id] != rev:
+                diff.wrong_revision[doc_id] = (expected_docs[doc_id], rev)
+
+        if checks is not None:
+            for check_name, check in checks.items():
+                if not check(result):
+                    diff.check_failures.setdefault(check_name, []).append(doc_id)
+
+    diff.missing = [expected_id for expected_id in expected_docs if expected_id not in seen_doc_ids]
+
+    return diff
+
+
+def diff_users_changes(users, expected_docs, ignore_rev_ids=False, checks=None, include_docs=True):
+    """
+    Fetches the _changes feed of every user in parallel and diffs each one against the shared
+    'expected_docs' index with diff_changes(). Returns {user: ChangesDiff}
+    """
+
+    def diff_user_changes(user):
+        changes = user.get_changes(include_docs=include_docs)
+        return diff_changes(expected_docs, changes["results"], name=user.name, ignore_rev_ids=ignore_rev_ids, checks=checks)
+
+    diffs = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=settings.MAX_REQUEST_WORKERS) as executor:
+        futures = {executor.submit(diff_user_changes, user): user for user in users}
+        for future in concurrent.futures.as_completed(futures):
+            diffs[futures[future]] = future.result()
+
+    return diffs
+
+
+def _log_changes_diff(diff):
+    if diff.missing:
+        log_error("{0} -> changes feed is missing expected doc ids: {1}".format(diff.name, diff.missing))
+    if diff.unexpected:
+        log_error("{0} -> changes feed has unexpected doc ids: {1}".format(diff.name, diff.unexpected))
+    if diff.wrong_revision:
+        log_error("{0} -> changes feed has unexpected revisions (expected, actual): {1}".format(diff.name, diff.wrong_revision))
+    for doc_id in diff.duplicate_doc_ids:
+        log_info("Duplicate id {}".format(doc_id))
+    if diff.duplicate_sequences:
+        log_error("{0} -> changes feed has duplicate sequences: {1}".format(diff.name, diff.duplicate_sequences))
+    for check_name, doc_ids in diff.check_failures.items():
+        log_error("{0} -> {1} failed for: {2}".format(diff.name, check_name, doc_ids))
+
+
+def _to_user_list(users):
+    if type(users) is list:
+        return users
+
+    # Allow a single user to be passed
+    return [users]
+
+
 def verify_docs_removed(users, expected_num_docs, expected_docs):
 
     # Verifies that the expected_docs have all been flagged with _removed = true
     # Also verifies no duplication of changes results and set equality of the expected doc_ids
     # and the ids returned from the _changes feed
 
-    errors = {
-        "unexpected_changes_length": 0,
-        "invalid_expected_docs_length": 0,
-        "duplicate_expected_ids": 0,
-        "duplicate_changes_doc_ids": 0,
-        "expected_doc_ids_differ_from_changes_doc_ids": 0,
-        "doc_not_removed": 0,
-        "invalid_rev_id": 0
-    }
-
-    if type(users) is list:
-        user_list = users
-    else:
-        # Allow a single user to be passed
-        user_list = list()
-        user_list.append(users)
+    user_list = _to_user_list(users)
 
     if type(expected_docs) is not dict:
         raise Exception("Make sure 'expected_docs' is a dictionary")
 
-    for user in user_list:
-
-        # get changes feed
-        changes = user.get_changes(include_docs=True)
-        results = changes["results"]
-
-        changes_results = list()
-        for result in results:
-            changes_result = dict()
-            if not result["id"].startswith("_user"):
-                changes_result["id"] = result["doc"]["_id"]
-                changes_result["rev"] = result["doc"]["_rev"]
-                changes_result["removed"] = result["doc"]["_removed"]
-                changes_results.append(changes_result)
-
-        # Check expected_num_docs matches number of changes results
-        if expected_num_docs != len(changes_results):
-            errors["unexpected_changes_length"] += 1
-
-        # Check number of expected num docs matched number of expected doc ids
-        if expected_num_docs != len(expected_docs):
-            errors["invalid_expected_docs_length"] += 1
-
-        # Get ids from expected docs
-        expected_doc_ids = expected_docs.keys()
-
-        # Assert there are no duplicates in expected doc ids
-        if len(expected_doc_ids) != len(set(expected_doc_ids)):
-            errors["duplicate_expected_ids"] += 1
-
-        # Get ids from all changes results
-        changes_doc_ids = [result["id"] for result in changes_results]
-
-        # Assert there are no duplicates in changes doc ids
-        if len(changes_doc_ids) != len(set(changes_doc_ids)):
-            errors["duplicate_changes_doc_ids"] += 1
-
-        # Assert the expected doc ids and changes doc ids are the same
-        if set(expected_doc_ids) != set(changes_doc_ids):
-            errors["expected_doc_ids_differ_from_changes_doc_ids"] += 1
-
-        num_doc_removed = 0
-        for result in changes_results:
-
-            # Check removed is set to true
-            if result["removed"] is not True:
-                errors["doc_not_removed"] += 1
-            elif result["removed"] is True:
-                num_doc_removed += 1
-
-            # Compare revision number for id
-            if expected_docs[result["id"]] != result["rev"]:
-                errors["invalid_rev_id"] += 1
+    checks = {
+        "doc_not_removed": lambda result: result["doc"].get("_removed") is True
+    }
+    diffs = diff_users_changes(user_list, expected_docs, checks=checks)
 
-            # TODO - maybe try to ping doc endpoint and asser 4XX response?
+    error_count = 0
+    for user in user_list:
+        diff = diffs[user]
+
+        errors = {
+            "unexpected_changes_length": int(expected_num_docs != diff.num_changes),
+            "invalid_expected_docs_length": int(expected_num_docs != len(expected_docs)),
+            "duplicate_changes_doc_ids": len(diff.duplicate_doc_ids),
+            "duplicate_changes_sequences": len(diff.duplicate_sequences),
+            "expected_doc_ids_differ_from_changes_doc_ids": int(bool(diff.missing or diff.unexpected)),
+            "doc_not_removed": len(diff.check_failures.get("doc_not_removed", [])),
+            "invalid_rev_id": len(diff.wrong_revision)
+        }
 
         log_info(" -> REMOVED |{0}| expected (num_docs: {1}) _changes (num_docs: {2}, num_removed: {3})".format(
             user.name,
             expected_num_docs,
-            len(changes_doc_ids),
-            num_doc_removed
+            diff.num_changes,
+            diff.num_changes - errors["doc_not_removed"]
         ))
 
         # Print any error that may have occured
-        error_count = 0
+        _log_changes_diff(diff)
         for key, val in errors.items():
             if val != 0:
                 log_error("<!> VERIFY ERROR - name: {}: occurences: {}".format(key, val))
                 error_count += 1
 
-        assert error_count == 0
+    assert error_count == 0
 
 
 def verify_changes(users, expected_num_docs, expected_num_revisions, expected_docs, ignore_rev_ids=False):
@@ -129,144 +216,58 @@ def verify_changes(users, expected_num_docs, expected_num_revisions, expected_do
     # from the combination of these user caches. This is used to create expected results
     # when comparing against the changes feed for each user.
 
-    errors = {
-        "unexpected_changes_length": 0,
-        "invalid_expected_docs_length": 0,
-        "duplicate_expected_ids": 0,
-        "duplicate_changes_doc_ids": 0,
-        "expected_doc_ids_differ_from_changes_doc_ids": 0,
-        "invalid_rev_id": 0,
-        "unexpected_rev_id_prefix": 0,
-        "unexpected_num_updates": 0
-    }
-
-    if type(users) is list:
-        user_list = users
-    else:
-        # Allow a single user to be passed
-        user_list = list()
-        user_list.append(users)
+    user_list = _to_user_list(users)
 
     if type(expected_docs) is not dict:
         log_error("expected_docs is not a dictionary")
         raise Exception("Make sure 'expected_docs' is a dictionary")
 
-    for user in user_list:
+    if ignore_rev_ids:
+        log_warn("WARNING: Ignoring rev id verification!!")
 
-        changes = user.get_changes(include_docs=True)
-        results = changes["results"]
-
-        changes_results = list()
-        for result in results:
-            changes_result = dict()
-            if not result["id"].startswith("_user"):
-                changes_result["id"] = result["doc"]["_id"]
-                changes_result["rev"] = result["doc"]["_rev"]
-                changes_result["updates"] = result["doc"]["updates"]
-                changes_results.append(changes_result)
-
-        # Check expected_num_docs matches number of changes results
-        if expected_num_docs != len(changes_results):
-            log_error("{0} -> {1} expected_num_docs != {2} len(changes_results)".format(user.name, expected_num_docs, len(changes_results)))
-            changes_results_ids = []
-            for i in changes_results:
-                changes_results_ids.append(i["id"])
-
-            changes_results_ids_tracker = {}
-            for i in changes_results_ids:
-                if i in changes_results_ids_tracker:
-                    changes_results_ids_tracker[i] += 1
-                else:
-                    changes_results_ids_tracker[i] = 1
-
-            for i in changes_results_ids_tracker:
-                if changes_results_ids_tracker[i] > 1:
-                    log_info("Duplicate id {}".format(i))
-
-            errors["unexpected_changes_length"] += 1
-
-        # Check number of expected num docs matched number of expected doc ids
-        if expected_num_docs != len(expected_docs):
+    # IMPORTANT - This assumes that no conflicts are created via new_edits in the doc PUT
+    # rev-id prefix will be 1 when document is created
+    # For any non-conflicting update, it will be incremented by one
+    checks = {
+        "unexpected_rev_id_prefix": lambda result: expected_num_revisions == int(result["doc"]["_rev"].split("-")[0]) - 1,
+        "unexpected_num_updates": lambda result: expected_num_revisions == result["doc"]["updates"]
+    }
+    diffs = diff_users_changes(user_list, expected_docs, ignore_rev_ids=ignore_rev_ids, checks=checks)
+
+    error_count = 0
+    for user in user_list:
+        diff = diffs[user]
+
+        errors = {
+            "unexpected_changes_length": int(expected_num_docs != diff.num_changes),
+            "invalid_expected_docs_length": int(expected_num_docs != len(expected_docs)),
+            "duplicate_changes_doc_ids": len(diff.duplicate_doc_ids),
+            "duplicate_changes_sequences": len(diff.duplicate_sequences),
+            "expected_doc_ids_differ_from_changes_doc_ids": int(bool(diff.missing or diff.unexpected)),
+            "invalid_rev_id": len(diff.wrong_revision),
+            "unexpected_rev_id_prefix": len(diff.check_failures.get("unexpected_rev_id_prefix", [])),
+            "unexpected_num_updates": len(diff.check_failures.get("unexpected_num_updates", []))
+        }
+
+        if errors["unexpected_changes_length"]:
+            log_error("{0} -> {1} expected_num_docs != {2} len(changes_results)".format(user.name, expected_num_docs, diff.num_changes))
+
+        if errors["invalid_expected_docs_length"]:
             log_error("{0} -> {1} expected_num_docs != {2} len(expected_docs)".format(user.name, expected_num_docs, len(expected_docs)))
-            errors["invalid_expected_docs_length"] += 1
-
-        # Get ids from expected docs
-        expected_doc_ids = expected_docs.keys()
-
-        # Assert there are no duplicates in expected doc ids
-        if len(expected_doc_ids) != len(set(expected_doc_ids)):
-            log_error("{0} -> Duplicates found in expected_doc_ids".format(user.name))
-            errors["duplicate_expected_ids"] += 1
-
-        # Get ids from all changes results
-        changes_doc_ids = [result["id"] for result in changes_results]
-
-        # Assert there are no duplicates in changes doc ids
-        if len(changes_doc_ids) != len(set(changes_doc_ids)):
-            log_error("{0} -> Duplicates found in changes doc ids".format(user.name))
-            changes_doc_ids_tracker = {}
-            for i in set(changes_doc_ids):
-                if i in changes_doc_ids_tracker:
-                    changes_doc_ids_tracker[i] += 1
-                else:
-                    changes_doc_ids_tracker[i] = 1
-
-            for i in changes_doc_ids_tracker:
-                if changes_doc_ids_tracker[i] > 1:
-                    log_info("Duplicate id {}".format(i))
-
-            errors["duplicate_changes_doc_ids"] += 1
-
-        # Assert the expected doc ids and changes doc ids are the same
-        if set(expected_doc_ids) != set(changes_doc_ids):
-            log_error("{0} -> changes feed doc ids differ from expected doc ids".format(user.name))
-            different_docs = set(expected_doc_ids) - set(changes_doc_ids)
-            log_error("{0} -> Set difference {1}".format(user.name, different_docs))
-            errors["expected_doc_ids_differ_from_changes_doc_ids"] += 1
-
-        if ignore_rev_ids:
-            log_warn("WARNING: Ignoring rev id verification!!")
-
-        for result in changes_results:
-            if not ignore_rev_ids:
-                # Compare revision number for id
-                if expected_docs[result["id"]] != result["rev"]:
-                    errors["invalid_rev_id"] += 1
-
-            # IMPORTANT - This assumes that no conflicts are created via new_edits in the doc PUT
-            # Assert that the revision id prefix matches the number of expected revisions
-            rev_id_prefix = result["rev"].split("-")[0]
-
-            # rev-id prefix will be 1 when document is created
-            # For any non-conflicting update, it will be incremented by one
-            if expected_num_revisions != int(rev_id_prefix) - 1:
-                log_error("{0} -> expected_num_revisions {1} does not match stored rev_id_prefix: {2}".format(user.name, expected_num_revisions, rev_id_prefix))
-                errors["unexpected_rev_id_prefix"] += 1
-
-            # Check number of expected updates matched the updates on the _changes doc
-            if expected_num_revisions != result["updates"]:
-                log_error("{0} -> expected_num_revisions {1} does not match number of updates {2}".format(user.name, expected_num_revisions, result["updates"]))
-                errors["unexpected_num_updates"] += 1
-
-        # Allow printing updates even if changes feed length is 0
-        if len(changes_results) == 0:
-            updates = 0
-        else:
-            updates = changes_results[0]["updates"]
 
-        log_info(" -> |{0}| expected (num_docs: {1} num_revisions: {2}) _changes (num_docs: {3} updates: {4})".format(
+        log_info(" -> |{0}| expected (num_docs: {1} num_revisions: {2}) _changes (num_docs: {3} updates_mismatches: {4})".format(
             user.name,
             expected_num_docs,
             expected_num_revisions,
-            len(changes_doc_ids),
-            updates
+            diff.num_changes,
+            errors["unexpected_num_updates"]
         ))
 
         # Print any error that may have occured
-        error_count = 0
+        _log_changes_diff(diff)
         for key, val in errors.items():
             if val != 0:
                 log_error("<!> VERIFY ERROR - name: {}: occurences: {}".format(key, val))
                 error_count += 1
 
-        assert error_count == 0
+    assert error_count == 0
@@ -2,45 +2,181 @@ import json
 import threading
 import time
 from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
 
+from keywords.exceptions import TimeoutError
+from keywords.utils import log_debug
 from keywords.utils import log_info
 
 
+class WebhookStore:
+    """
+    Payloads received by the WebServer, in arrival order, indexed by doc id and by (doc id, rev).
+    Every payload has a receive timestamp, so delivery latencies can be computed.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.clear()
+
+    def clear(self):
+        with self._condition:
+            self.payloads = []
+            self.received_at = []
+            # { doc_id: [payload index, ...] }
+            self._by_doc_id = {}
+            # { (doc_id, rev): payload index }
+            self._by_doc_rev = {}
+
+    def add(self, payload):
+        with self._condition:
+            index = len(self.payloads)
+            self.payloads.append(payload)
+            self.received_at.append(time.time())
+            if isinstance(payload, dict) and "_id" in payload:
+                self._by_doc_id.setdefault(payload["_id"], []).append(index)
+                if "_rev" in payload:
+                    self._by_doc_rev[(payload["_id"], payload["_rev"])] = index
+            self._condition.notify_all()
+
+    def get_data(self):
+        with self._condition:
+            return list(self.payloads)
+
+    def get_doc_payloads(self, doc_id):
+        """ Returns the payloads received for 'doc_id', in arrival order """
+        with self._condition:
+            return [self.payloads[index] for index in self._by_doc_id.get(doc_id, [])]
+
+    def get_latest_doc_payloads(self):
+        """ Returns { doc_id: latest payload received for the doc } """
+        with self._condition:
+            return dict((doc_id, self.payloads[indexes[-1]]) for doc_id, indexes in self._by_doc_id.items())
+
+    def get_received_at(self, doc_id, rev):
+        """ Returns the time the payload for (doc_id, rev) was received, None if it has not been received """
+        with self._condition:
+            index = self._by_doc_rev.get((doc_id, rev))
+            return self.received_at[index] if index is not None else None
+
+    def _wait(self, is_done, timeout, description):
+        deadline = time.time() + timeout
+        with self._condition:
+            while not is_done():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError("Timed out waiting for webhook events: {}".format(description()))
+                self._condition.wait(remaining)
+
+    def wait_for_count(self, count, timeout):
+        """ Blocks until at least 'count' payloads have been received, returns them """
+        self._wait(
+            lambda: len(self.payloads) >= count,
+            timeout,
+            lambda: "expected {} payloads, received {}".format(count, len(self.payloads))
+        )
+        return self.get_data()
+
+    def _missing_doc_ids(self, doc_ids, rev_prefix):
+        missing = []
+        for doc_id in doc_ids:
+            indexes = self._by_doc_id.get(doc_id)
+            if not indexes:
+                missing.append(doc_id)
+            elif rev_prefix is not None and not any(self.payloads[index].get("_rev", "").startswith(rev_prefix) for index in indexes):
+                missing.append(doc_id)
+        return missing
+
+    def wait_for_doc_ids(self, doc_ids, timeout, rev_prefix=None):
+        """
+        Blocks until a payload has been received for each of 'doc_ids' (with a rev starting with 'rev_prefix', ex. '2-', if provided).
+        Returns { doc_id: latest payload }
+        """
+        doc_ids = list(doc_ids)
+        self._wait(
+            lambda: not self._missing_doc_ids(doc_ids, rev_prefix),
+            timeout,
+            lambda: "missing doc ids {}".format(self._missing_doc_ids(doc_ids, rev_prefix))
+        )
+        return self.get_latest_doc_payloads()
+
+    def delivery_latencies(self, write_times):
+        """
+        Returns the seconds between each write and the receipt of its webhook.
+        'write_times' is { (doc_id, rev): time written }, writes without a webhook are skipped.
+        """
+        latencies = []
+        for (doc_id, rev), written_at in write_times.items():
+            received_at = self.get_received_at(doc_id, rev)
+            if received_at is not None:
+                latencies.append(received_at - written_at)
+        return latencies
+
+
+def latency_histogram(latencies, bucket_ms=100):
+    """ Returns { bucket start (ms): count } for 'latencies' (secs) """
+    histogram = {}
+    for latency in latencies:
+        bucket = int(round(latency * 1000)) // bucket_ms * bucket_ms
+        histogram[bucket] = histogram.get(bucket, 0) + 1
+    return histogram
+
+
 class HttpHandler(BaseHTTPRequestHandler):
 
-    server_recieved_data = []
+    def log_message(self, format, *args):
+        # BaseHTTPRequestHandler logs every request to stderr
+        pass
 
     def do_GET(self):
-        log_info('Received GET request')
+        log_debug('Received GET request')
+        body = 'Response body\n'
         self.send_response(200)
         self.send_header('Last-Modified', self.date_time_string(time.time()))
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write('Response body\n')
+        self.wfile.write(body)
         return
 
     def do_POST(self):
-        content_len = int(self.headers.getheader('content-length', 0))
+        content_len = int(self.headers.get('content-length', 0))
         post_body = self.rfile.read(content_len)
         data = json.loads(post_body)
 
         if "_id" in data:
-            log_info("Webhook doc received: {}".format(data["_id"]))
+            log_debug("Webhook doc received: {}".format(data["_id"]))
         else:
             log_info("Webhook data received: {}".format(data))
-        HttpHandler.server_recieved_data.append(data)
+        self.server.store.add(data)
         self.send_response(200)
         self.send_header("Content-type", "text/html")
+        self.send_header("Content-Length", "0")
         self.end_headers()
         return
 
 
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """ Handles each connection on its own thread, so concurrent webhook deliveries do not queue """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
 class WebServer(object):
+    """
+    Receives the Sync Gateway webhooks on 'port'. The received payloads are kept in a WebhookStore,
+    tests can block on them with wait_for_count / wait_for_doc_ids.
+    """
+
     def __init__(self, port=8080):
         self.port = port
-        self.server = HTTPServer(('', port), HttpHandler)
+        self.store = WebhookStore()
+        self.server = ThreadingHTTPServer(('', port), HttpHandler)
+        self.server.store = self.store
 
     def start(self):
-        log_info('Starting webserver on port :8080 ...')
+        log_info('Starting webserver on port :{} ...'.format(self.port))
         thread = threading.Thread(target=self.server.serve_forever)
         thread.daemon = True
         try:
@@ -51,9 +187,16 @@ class WebServer(object):
     def stop(self):
         self.clear_data()
         self.server.shutdown()
+        self.server.server_close()
 
     def clear_data(self):
-        HttpHandler.server_recieved_data = []
+        self.store.clear()
 
     def get_data(self):
-        return HttpHandler.server_recieved_data
+        return self.store.get_data()
+
+    def wait_for_count(self, count, timeout):
+        return self.store.wait_for_count(count, timeout)
+
+    def wait_for_doc_ids(self, doc_ids, timeout, rev_prefix=None):
+        return self.store.wait_for_doc_ids(doc_ids, timeout, rev_prefix)
@@ -6,8 +6,9 @@ import matplotlib
 import matplotlib.pyplot as plt
 
 from optparse import OptionParser
-from collections import OrderedDict
 from libraries.utilities.provisioning_config_parser import hosts_for_tag
+from libraries.utilities.log_expvars import iter_expvar_samples
+from libraries.utilities.perf_analysis import compare_to_baseline, summarize_run, write_report
 
 matplotlib.rcParams.update({'font.size': 6})
 
@@ -20,13 +21,19 @@ def keys_present(keys, dictionary):
     return True
 
 
+def get_expvars_file(test_id, name):
+    """ Returns the expvars results file of a test, JSON lines or the single JSON object written by older versions """
+
+    file_path = "testsuites/syncgateway/performance/results/{}/{}.jsonl".format(test_id, name)
+    if os.path.isfile(file_path):
+        return file_path
+    return "testsuites/syncgateway/performance/results/{}/{}.json".format(test_id, name)
+
+
 def plot_gateload_expvars(figure, json_file_name):
 
     print("Plotting gateload expvars ...")
 
-    with open(json_file_name, "r") as f:
-        obj = json.loads(f.read(), object_pairs_hook=OrderedDict)
-
     datetimes = []
     p95s = []
     p99s = []
@@ -37,28 +44,28 @@ def plot_gateload_expvars(figure, json_file_name):
 
     number_ns_per_sec = 1000000000.0
 
-    for timestamp in obj:
+    for timestamp, endpoint, expvars in iter_expvar_samples(json_file_name):
 
         # only plot if p95 and p99 exist in expvars
-        if "PushToSubscriberInteractive" in obj[timestamp]["expvars"]["gateload"]["ops"]:
+        if "PushToSubscriberInteractive" in expvars["gateload"]["ops"]:
             datetimes.append(datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S.%f"))
 
-            p95 = obj[timestamp]["expvars"]["gateload"]["ops"]["PushToSubscriberInteractive"]["p95"] / number_ns_per_sec
+            p95 = expvars["gateload"]["ops"]["PushToSubscriberInteractive"]["p95"] / number_ns_per_sec
             p95s.append(p95)
 
-            p99 = obj[timestamp]["expvars"]["gateload"]["ops"]["PushToSubscriberInteractive"]["p99"] / number_ns_per_sec
+            p99 = expvars["gateload"]["ops"]["PushToSubscriberInteractive"]["p99"] / number_ns_per_sec
             p99s.append(p99)
 
-            docs_pushed.append(obj[timestamp]["expvars"]["gateload"]["total_doc_pushed"])
-            docs_pulled.append(obj[timestamp]["expvars"]["gateload"]["total_doc_pulled"])
+            docs_pushed.append(expvars["gateload"]["total_doc_pushed"])
+            docs_pulled.append(expvars["gateload"]["total_doc_pulled"])
 
-            if "total_doc_failed_to_push" in obj[timestamp]["expvars"]["gateload"]:
-                docs_failed = obj[timestamp]["expvars"]["gateload"]["total_doc_failed_to_push"]
+            if "total_doc_failed_to_push" in expvars["gateload"]:
+                docs_failed = expvars["gateload"]["total_doc_failed_to_push"]
                 docs_failed_to_push.append(docs_failed)
                 print("!!! ERROR: docs failed to push: {} !!!".format(docs_failed_to_push))
 
-            if "total_doc_failed_to_pull" in obj[timestamp]["expvars"]["gateload"]:
-                docs_failed = obj[timestamp]["expvars"]["gateload"]["total_doc_failed_to_pull"]
+            if "total_doc_failed_to_pull" in expvars["gateload"]:
+                docs_failed = expvars["gateload"]["total_doc_failed_to_pull"]
                 docs_failed_to_pull.append(docs_failed)
                 print("!!! ERROR: docs failed to pull: {} !!!".format(docs_failed_to_pull))
 
@@ -112,9 +119,6 @@ def plot_sync_gateway_expvars(cluster_config, figure, json_file_name):
     sg_writers = hosts_for_tag(cluster_config, "sg_accels")
     sg_writer_hostnames = [sg_writer["ansible_host"] for sg_writer in sg_writers]
 
-    with open(json_file_name, "r") as f:
-        obj = json.loads(f.read(), object_pairs_hook=OrderedDict)
-
     datetimes = []
     memstats_alloc = []
     memstats_sys = []
@@ -123,19 +127,18 @@ def plot_sync_gateway_expvars(cluster_config, figure, json_file_name):
     writer_memstats_alloc = []
     writer_memstats_sys = []
 
-    for timestamp in obj:
+    for timestamp, endpoint, expvars in iter_expvar_samples(json_file_name):
 
-        endpoint = obj[timestamp]["endpoint"]
         hostname = endpoint.split(":")[0]
 
         if hostname in sg_writer_hostnames:
             writer_datetimes.append(datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S.%f"))
-            writer_memstats_alloc.append(obj[timestamp]["expvars"]["memstats"]["Alloc"])
-            writer_memstats_sys.append(obj[timestamp]["expvars"]["memstats"]["Sys"])
+            writer_memstats_alloc.append(expvars["memstats"]["Alloc"])
+            writer_memstats_sys.append(expvars["memstats"]["Sys"])
         else:
             datetimes.append(datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S.%f"))
-            memstats_alloc.append(obj[timestamp]["expvars"]["memstats"]["Alloc"])
-            memstats_sys.append(obj[timestamp]["expvars"]["memstats"]["Sys"])
+            memstats_alloc.append(expvars["memstats"]["Alloc"])
+            memstats_sys.append(expvars["memstats"]["Sys"])
 
     # Plot Alloc / Sys
     ax1 = figure.add_subplot(111)
@@ -192,14 +195,44 @@ def plot_machine_stats(cluster_config, figure, folder_path):
     figure.autofmt_xdate()
 
 
-def analze_perf_results(cluster_config, test_id):
+def analze_perf_results(cluster_config, test_id, baseline_file=None, thresholds_file=None):
+    """
+    Plots the results of a perf run and writes a perf_summary.json report next to them.
+    If a 'baseline_file' (the perf_summary.json of an earlier run) is provided, exits with 1
+    when a metric regressed more than its threshold, see perf_analysis.DEFAULT_REGRESSION_THRESHOLDS.
+    """
+
+    results_dir = "testsuites/syncgateway/performance/results/{}".format(test_id)
+
+    print("Summarizing results for {}".format(test_id))
+    summary = summarize_run(
+        gateload_file=get_expvars_file(test_id, "gateload_expvars"),
+        sync_gateway_file=get_expvars_file(test_id, "sync_gateway_expvars"),
+        machine_stats_folder="{}/perf_logs/".format(results_dir)
+    )
+
+    regressions = None
+    if baseline_file is not None:
+        with open(baseline_file) as f:
+            baseline = json.load(f)["summary"]
+
+        thresholds = None
+        if thresholds_file is not None:
+            with open(thresholds_file) as f:
+                thresholds = json.load(f)
+
+        regressions = compare_to_baseline(summary, baseline, thresholds)
+        for regression in regressions:
+            print("REGRESSION: {section} {node} {metric}: {value} (baseline: {baseline} on {baseline_node}, change: {change:.1%})".format(**regression))
+
+    write_report("{}/perf_summary.json".format(results_dir), summary, regressions)
 
     print("Generating graphs for {}".format(test_id))
 
     # Generate plot of gateload expvars
     fig1 = plt.figure()
     fig1.text(0.5, 0.04, 'Gateload Expvars', ha='center', va='center')
-    valid_results = plot_gateload_expvars(fig1, "testsuites/syncgateway/performance/results/{}/gateload_expvars.json".format(test_id))
+    valid_results = plot_gateload_expvars(fig1, get_expvars_file(test_id, "gateload_expvars"))
     plt.savefig("testsuites/syncgateway/performance/results/{}/gateload_expvars.png".format(test_id), dpi=300)
     if not valid_results:
         print("FAILURE STATE. Some docs failed to push and/or pull. Exiting...")
@@ -208,7 +241,7 @@ def analze_perf_results(cluster_config, test_id):
     # Generate plot of sync_gateway expvars
     fig2 = plt.figure()
     fig2.text(0.5, 0.04, 'sync_gateway expvars', ha='center', va='center')
-    plot_sync_gateway_expvars(cluster_config, fig2, "testsuites/syncgateway/performance/results/{}/sync_gateway_expvars.json".format(test_id))
+    plot_sync_gateway_expvars(cluster_config, fig2, get_expvars_file(test_id, "sync_gateway_expvars"))
     plt.savefig("testsuites/syncgateway/performance/results/{}/sync_gateway_expvars.png".format(test_id), dpi=300)
 
     # Generate plot of machine stats
@@ -217,6 +250,10 @@ def analze_perf_results(cluster_config, test_id):
     plot_machine_stats(cluster_config, fig3, "testsuites/syncgateway/performance/results/{}/perf_logs/".format(test_id))
     plt.savefig("testsuites/syncgateway/performance/results/{}/sync_gateway_machine_stats.png".format(test_id), dpi=300)
 
+    if regressions:
+        print("FAILURE STATE. Performance regressed compared to {}. Exiting...".format(baseline_file))
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     usage = """usage: analyze_perf_results.py
@@ -229,6 +266,14 @@ if __name__ == "__main__":
                       action="store", type="string", dest="test_id", default=None,
                       help="Test id to generate graphs for")
 
+    parser.add_option("", "--baseline",
+                      action="store", type="string", dest="baseline", default=None,
+                      help="perf_summary.json of a baseline run to compare the results with")
+
+    parser.add_option("", "--thresholds",
+                      action="store", type="string", dest="thresholds", default=None,
+                      help="JSON file with the regression thresholds, defaults to perf_analysis.DEFAULT_REGRESSION_THRESHOLDS")
+
     arg_parameters = sys.argv[1:]
 
     (opts, args) = parser.parse_args(arg_parameters)
@@ -243,4 +288,4 @@ if __name__ == "__main__":
         print("You must provide a test identifier to run the test")
         sys.exit(1)
 
-    analze_perf_results(cluster_conf, opts.test_id)
+    analze_perf_results(cluster_conf, opts.test_id, baseline_file=opts.baseline, thresholds_file=opts.thresholds)
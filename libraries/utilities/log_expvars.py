@@ -4,39 +4,143 @@ import requests
 import json
 import os
 import sys
+import threading
 from keywords.utils import log_info
 from libraries.testkit import settings
 
-from collections import OrderedDict
+from collections import OrderedDict, deque
 
+from concurrent.futures import ThreadPoolExecutor
 from requests.exceptions import RequestException
 
 from provisioning_config_parser import hosts_for_tag
 
 
-def dump_results(test_folder, gateload_results, sync_gateway_results):
-    filename = "testsuites/syncgateway/performance/results/{}/gateload_expvars.json".format(test_folder)
-    log_info("Writing gateload_expvars to: {}".format(filename))
-    with open(filename, "w") as f:
-        f.write(json.dumps(gateload_results))
+# Samples kept in memory by an ExpvarCollector for live queries
+EXPVAR_RING_SIZE = 1000
 
-    filename = "testsuites/syncgateway/performance/results/{}/sync_gateway_expvars.json".format(test_folder)
-    log_info("Writing sync_gateway_expvars to: {}".format(filename))
-    with open(filename, "w") as f:
-        f.write(json.dumps(sync_gateway_results))
+EXPVAR_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
 
 
-def write_expvars(results_obj, endpoint):
+def get_expvars(endpoint):
+    resp = requests.get("http://{}".format(endpoint), timeout=settings.HTTP_REQ_TIMEOUT)
+    resp.raise_for_status()
+    return resp.json()
 
-        resp = requests.get("http://{}".format(endpoint), timeout=settings.HTTP_REQ_TIMEOUT)
-        resp.raise_for_status()
-        expvars = resp.json()
 
-        now = "{}".format(datetime.datetime.utcnow())
-        results_obj[now] = {
-            "endpoint": endpoint,
-            "expvars": expvars
-        }
+def iter_expvar_samples(file_path):
+    """
+    Yields the (timestamp, endpoint, expvars) samples of an expvar results file one at a time.
+    Reads the JSON lines files (.jsonl) written by ExpvarCollector lazily,
+    and also the single JSON object files ({timestamp: {"endpoint": ..., "expvars": ...}}) written by older versions.
+    """
+
+    if file_path.endswith(".jsonl"):
+        with open(file_path) as f:
+            for line in f:
+                if line.strip():
+                    sample = json.loads(line)
+                    yield sample["timestamp"], sample["endpoint"], sample["expvars"]
+    else:
+        with open(file_path) as f:
+            obj = json.loads(f.read(), object_pairs_hook=OrderedDict)
+        for timestamp, sample in obj.items():
+            yield timestamp, sample["endpoint"], sample["expvars"]
+
+
+class ExpvarCollector:
+    """
+    Scrapes all gateload and sync_gateway expvar endpoints concurrently every 'interval' seconds.
+
+    Each sample is appended as one JSON line to <results_dir>/gateload_expvars.jsonl or
+    <results_dir>/sync_gateway_expvars.jsonl, so the cost of a tick does not grow with the length of the run.
+    All samples of a tick share the tick timestamp and ticks are scheduled from the start time,
+    so request latencies do not make the sampling drift.
+    The last 'ring_size' samples are kept in memory, see recent_samples().
+    """
+
+    def __init__(self, results_dir, gateload_endpoints, sync_gateway_endpoints, interval=30, ring_size=EXPVAR_RING_SIZE):
+        self.results_dir = results_dir
+        self.gateload_endpoints = gateload_endpoints
+        self.sync_gateway_endpoints = sync_gateway_endpoints
+        self.interval = interval
+
+        self.gateload_file_path = os.path.join(results_dir, "gateload_expvars.jsonl")
+        self.sync_gateway_file_path = os.path.join(results_dir, "sync_gateway_expvars.jsonl")
+
+        self._samples = deque(maxlen=ring_size)
+        self._samples_lock = threading.Lock()
+
+    def recent_samples(self, endpoint=None):
+        """ Returns the samples in memory, oldest first, as {"timestamp": ..., "endpoint": ..., "expvars": ...} """
+        with self._samples_lock:
+            return [sample for sample in self._samples if endpoint is None or sample["endpoint"] == endpoint]
+
+    def collect(self, executor, timestamp, gateload_file, sync_gateway_file):
+        """
+        Scrapes every endpoint once and appends the samples.
+        Returns the endpoints that could not be reached as (gateload endpoints, sync_gateway endpoints)
+        """
+
+        futures = [
+            (endpoint, gateload_file, executor.submit(get_expvars, endpoint)) for endpoint in self.gateload_endpoints
+        ] + [
+            (endpoint, sync_gateway_file, executor.submit(get_expvars, endpoint)) for endpoint in self.sync_gateway_endpoints
+        ]
+
+        unreachable = set()
+        for endpoint, results_file, future in futures:
+            try:
+                expvars = future.result()
+            except RequestException as re:
+                log_info("Error: {}. {} no longer reachable".format(re, endpoint))
+                unreachable.add(endpoint)
+                continue
+
+            sample = {"timestamp": timestamp, "endpoint": endpoint, "expvars": expvars}
+            results_file.write(json.dumps(sample) + "\n")
+            with self._samples_lock:
+                self._samples.append(sample)
+
+        gateload_file.flush()
+        sync_gateway_file.flush()
+
+        return ([endpoint for endpoint in self.gateload_endpoints if endpoint in unreachable],
+                [endpoint for endpoint in self.sync_gateway_endpoints if endpoint in unreachable])
+
+    def run(self):
+        """
+        Collects expvars until a gateload or a sync_gateway is no longer reachable.
+        Returns False if a sync_gateway stopped responding.
+        """
+
+        log_info("Writing expvars to: {} and {}".format(self.gateload_file_path, self.sync_gateway_file_path))
+
+        start_time = time.time()
+        num_ticks = 0
+        max_workers = max(1, min(len(self.gateload_endpoints) + len(self.sync_gateway_endpoints), settings.MAX_REQUEST_WORKERS))
+
+        with open(self.gateload_file_path, "a") as gateload_file, open(self.sync_gateway_file_path, "a") as sync_gateway_file:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                while True:
+                    tick_time = start_time + num_ticks * self.interval
+                    timestamp = datetime.datetime.utcfromtimestamp(tick_time).strftime(EXPVAR_TIMESTAMP_FORMAT)
+
+                    gateloads_down, sgs_down = self.collect(executor, timestamp, gateload_file, sync_gateway_file)
+                    if sgs_down:
+                        # Should not happen unless sg crashes
+                        log_info("ERROR: sync_gateway not reachable: {}".format(sgs_down))
+                        return False
+                    if gateloads_down:
+                        # connection to gateload expvars has been closed
+                        log_info("Gateload no longer reachable: {}".format(gateloads_down))
+                        return True
+
+                    log_info("Elapsed: {} minutes".format((time.time() - start_time) / 60.0))
+
+                    # Skip the ticks that were missed if a scrape took longer than the interval
+                    num_ticks = max(num_ticks + 1, int((time.time() - start_time) // self.interval) + 1)
+                    time.sleep(max(0, start_time + num_ticks * self.interval - time.time()))
 
 
 def log_expvars(cluster_config, folder_name, sleep_time=30):
@@ -66,44 +170,9 @@ def log_expvars(cluster_config, folder_name, sleep_time=30):
         # Wait until the gateload expvar endpoints are up, or raise an exception and abort
         wait_for_endpoints_alive_or_raise(lgs_expvar_endpoints)
 
-        start_time = time.time()
-        gateload_results = OrderedDict()
-        sync_gateway_results = OrderedDict()
-
-        gateload_is_running = True
-        sg_is_running = True
-        while gateload_is_running and sg_is_running:
-
-            # Capture expvars for gateloads
-            for endpoint in lgs_expvar_endpoints:
-                try:
-                    log_info("Collecting gateload expvars {}".format(endpoint))
-                    write_expvars(gateload_results, endpoint)
-                    dump_results(folder_name, gateload_results, sync_gateway_results)
-                except RequestException as re:
-                    # connection to gateload expvars has been closed
-                    log_info(re)
-                    log_info("Error: {}.  Gateload {} no longer reachable. Writing expvars to {}".format(re, endpoint, folder_name))
-                    dump_results(folder_name, gateload_results, sync_gateway_results)
-                    gateload_is_running = False
-
-            # Capture expvars for sync_gateways
-            for endpoint in sgs_expvar_endpoints:
-                try:
-                    log_info("Collecting sg expvars {}".format(endpoint))
-                    write_expvars(sync_gateway_results, endpoint)
-                    dump_results(folder_name, gateload_results, sync_gateway_results)
-                except RequestException as re:
-                    # Should not happen unless sg crashes
-                    finished_successfully = False
-                    log_info(re)
-                    log_info("ERROR {}: sync_gateway not reachable. Dumping results to {}".format(re, folder_name))
-                    dump_results(folder_name, gateload_results, sync_gateway_results)
-                    sg_is_running = False
-
-            dump_results(folder_name, gateload_results, sync_gateway_results)
-            log_info("Elapsed: {} minutes".format((time.time() - start_time) / 60.0))
-            time.sleep(sleep_time)
+        results_dir = "testsuites/syncgateway/performance/results/{}".format(folder_name)
+        collector = ExpvarCollector(results_dir, lgs_expvar_endpoints, sgs_expvar_endpoints, interval=sleep_time)
+        finished_successfully = collector.run()
 
     except RuntimeError as e:
         log_info("Exception trying to log expvars: {}".format(e))
@@ -0,0 +1,297 @@
+import json
+import os
+
+import numpy as np
+
+from keywords.utils import log_warn
+from libraries.utilities.log_expvars import iter_expvar_samples
+
+NS_PER_SEC = 1000000000.0
+SECS_PER_HOUR = 3600.0
+
+# Default length (seconds) of the windows used for the per window summaries
+PERF_WINDOW_SECS = 300
+
+# Gateload expvars loaded as columns, as column name -> path in the expvars
+GATELOAD_COLUMNS = {
+    "total_doc_pushed": ("gateload", "total_doc_pushed"),
+    "total_doc_pulled": ("gateload", "total_doc_pulled"),
+    "total_doc_failed_to_push": ("gateload", "total_doc_failed_to_push"),
+    "total_doc_failed_to_pull": ("gateload", "total_doc_failed_to_pull"),
+    "p50": ("gateload", "ops", "PushToSubscriberInteractive", "p50"),
+    "p95": ("gateload", "ops", "PushToSubscriberInteractive", "p95"),
+    "p99": ("gateload", "ops", "PushToSubscriberInteractive", "p99"),
+}
+
+# sync_gateway expvars loaded as columns
+SYNC_GATEWAY_COLUMNS = {
+    "alloc": ("memstats", "Alloc"),
+    "sys": ("memstats", "Sys"),
+    "pause_total_ns": ("memstats", "PauseTotalNs"),
+    "num_gc": ("memstats", "NumGC"),
+}
+
+# How much worse than the baseline a metric can get before it is reported as a regression.
+# 'max_regression' is relative to the baseline value, ex. 0.1 for a 10% drop of a 'higher_is_better' metric
+DEFAULT_REGRESSION_THRESHOLDS = {
+    "docs_pushed_per_sec": {"higher_is_better": True, "max_regression": 0.10},
+    "docs_pulled_per_sec": {"higher_is_better": True, "max_regression": 0.10},
+    "latency_p50_secs": {"higher_is_better": False, "max_regression": 0.20},
+    "latency_p95_secs": {"higher_is_better": False, "max_regression": 0.20},
+    "latency_p99_secs": {"higher_is_better": False, "max_regression": 0.25},
+    "gc_pause_fraction": {"higher_is_better": False, "max_regression": 0.25},
+    "alloc_growth_bytes_per_hour": {"higher_is_better": False, "max_regression": 0.50},
+    "cpu_percent_mean": {"higher_is_better": False, "max_regression": 0.15},
+}
+
+
+def _get_path(obj, path):
+    for key in path:
+        if not isinstance(obj, dict) or key not in obj:
+            return np.nan
+        obj = obj[key]
+    return obj
+
+
+def _to_seconds(timestamps):
+    """ Converts '%Y-%m-%d %H:%M:%S.%f' timestamps to epoch seconds in one pass """
+    return np.array(timestamps, dtype="datetime64[us]").astype(np.int64) / 1000000.0
+
+
+def load_expvar_frames(file_path, columns):
+    """
+    Loads the samples of an expvar results file as one frame per endpoint:
+    { endpoint: {"time": array of epoch seconds, <column>: array, ...} }
+    Values missing from a sample are NaN. Samples are read lazily, only the selected columns are kept.
+    """
+
+    raw = {}
+    for timestamp, endpoint, expvars in iter_expvar_samples(file_path):
+        frame = raw.setdefault(endpoint, dict((name, []) for name in ["time"] + list(columns)))
+        frame["time"].append(timestamp)
+        for name, path in columns.items():
+            frame[name].append(_get_path(expvars, path))
+
+    frames = {}
+    for endpoint, frame in raw.items():
+        times = _to_seconds(frame.pop("time"))
+        order = np.argsort(times, kind="mergesort")
+        frames[endpoint] = dict((name, np.array(values, dtype=np.float64)[order]) for name, values in frame.items())
+        frames[endpoint]["time"] = times[order]
+
+    return frames
+
+
+def load_machine_stats_frames(folder_path):
+    """
+    Loads the cpu_stats.json files written by log_machine_stats.py (one sub folder per node)
+    { node: {"time": array of epoch seconds, "cpu_percent": array, "memory_used": array} }
+    """
+
+    frames = {}
+    if not os.path.isdir(folder_path):
+        return frames
+
+    for node in sorted(os.listdir(folder_path)):
+        stats_file = os.path.join(folder_path, node, "cpu_stats.json")
+        if not os.path.isfile(stats_file):
+            continue
+
+        with open(stats_file) as f:
+            obj = json.load(f)
+
+        timestamps = sorted(obj)
+        frames[node] = {
+            "time": _to_seconds(timestamps),
+            "cpu_percent": np.array([obj[timestamp].get("cpu_percent", np.nan) for timestamp in timestamps], dtype=np.float64),
+            "memory_used": np.array([obj[timestamp].get("virtual_memory", {}).get("used", np.nan) for timestamp in timestamps], dtype=np.float64),
+        }
+
+    return frames
+
+
+def _rate(times, counters):
+    """ Average increase per second of a counter, ignoring missing values """
+    valid = ~np.isnan(counters)
+    if valid.sum() < 2:
+        return None
+    times = times[valid]
+    counters = counters[valid]
+    elapsed = times[-1] - times[0]
+    if elapsed <= 0:
+        return None
+    return float((counters[-1] - counters[0]) / elapsed)
+
+
+def _slope_per_hour(times, values):
+    """ Least squares slope of 'values' per hour """
+    valid = ~np.isnan(values)
+    if valid.sum() < 2 or np.ptp(times[valid]) == 0:
+        return None
+    return float(np.polyfit(times[valid], values[valid], 1)[0] * SECS_PER_HOUR)
+
+
+def _stat(func, values):
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return None
+    return float(func(values))
+
+
+def _windows(frame, window_secs):
+    """ Yields (window start offset in seconds, frame restricted to the window) """
+    times = frame["time"]
+    if len(times) == 0:
+        return
+    window_ids = np.floor((times - times[0]) / window_secs).astype(np.int64)
+    boundaries = np.flatnonzero(np.diff(window_ids)) + 1
+    for indexes in np.split(np.arange(len(times)), boundaries):
+        yield int(window_ids[indexes[0]] * window_secs), dict((name, values[indexes]) for name, values in frame.items())
+
+
+def summarize_gateload(frame):
+    latencies = {}
+    for percentile in ["p50", "p95", "p99"]:
+        # Gateload reports latency percentiles over its own window, keep the median of the reported values
+        latencies["latency_{}_secs".format(percentile)] = _stat(np.median, frame[percentile] / NS_PER_SEC)
+
+    summary = {
+        "docs_pushed_per_sec": _rate(frame["time"], frame["total_doc_pushed"]),
+        "docs_pulled_per_sec": _rate(frame["time"], frame["total_doc_pulled"]),
+        "docs_failed_to_push": _stat(np.max, frame["total_doc_failed_to_push"]) or 0,
+        "docs_failed_to_pull": _stat(np.max, frame["total_doc_failed_to_pull"]) or 0,
+        "latency_p95_max_secs": _stat(np.max, frame["p95"] / NS_PER_SEC),
+        "latency_p99_max_secs": _stat(np.max, frame["p99"] / NS_PER_SEC),
+    }
+    summary.update(latencies)
+    return summary
+
+
+def summarize_sync_gateway(frame):
+    times = frame["time"]
+    elapsed = float(times[-1] - times[0]) if len(times) > 1 else 0.0
+
+    pause_total = frame["pause_total_ns"][~np.isnan(frame["pause_total_ns"])]
+    num_gc = frame["num_gc"][~np.isnan(frame["num_gc"])]
+    gc_pause_secs = float(pause_total[-1] - pause_total[0]) / NS_PER_SEC if len(pause_total) > 1 else None
+    num_gcs = int(num_gc[-1] - num_gc[0]) if len(num_gc) > 1 else None
+
+    return {
+        "alloc_start_bytes": _stat(lambda values: values[0], frame["alloc"]),
+        "alloc_end_bytes": _stat(lambda values: values[-1], frame["alloc"]),
+        "alloc_max_bytes": _stat(np.max, frame["alloc"]),
+        "sys_max_bytes": _stat(np.max, frame["sys"]),
+        "alloc_growth_bytes_per_hour": _slope_per_hour(times, frame["alloc"]),
+        "gc_pause_secs": gc_pause_secs,
+        "gc_count": num_gcs,
+        "gc_pause_mean_secs": gc_pause_secs / num_gcs if num_gcs else None,
+        "gc_pause_fraction": gc_pause_secs / elapsed if gc_pause_secs is not None and elapsed > 0 else None,
+    }
+
+
+def summarize_machine_stats(frame):
+    return {
+        "cpu_percent_mean": _stat(np.mean, frame["cpu_percent"]),
+        "cpu_percent_p95": _stat(lambda values: np.percentile(values, 95), frame["cpu_percent"]),
+        "cpu_percent_max": _stat(np.max, frame["cpu_percent"]),
+        "memory_used_growth_bytes_per_hour": _slope_per_hour(frame["time"], frame["memory_used"]),
+    }
+
+
+def _summarize_nodes(frames, summarize, window_secs):
+    nodes = {}
+    for node, frame in frames.items():
+        if len(frame["time"]) == 0:
+            continue
+        nodes[node] = summarize(frame)
+        nodes[node]["windows"] = [
+            dict(summarize(window_frame), start_offset_secs=start)
+            for start, window_frame in _windows(frame, window_secs)
+        ]
+    return nodes
+
+
+def summarize_run(gateload_file=None, sync_gateway_file=None, machine_stats_folder=None, window_secs=PERF_WINDOW_SECS):
+    """
+    Returns the JSON serializable summary of a perf run, per node and per window:
+    { "gateload": { endpoint: {...} }, "sync_gateway": { endpoint: {...} }, "machine_stats": { node: {...} } }
+    """
+
+    summary = {"window_secs": window_secs}
+    if gateload_file is not None:
+        summary["gateload"] = _summarize_nodes(load_expvar_frames(gateload_file, GATELOAD_COLUMNS), summarize_gateload, window_secs)
+    if sync_gateway_file is not None:
+        summary["sync_gateway"] = _summarize_nodes(load_expvar_frames(sync_gateway_file, SYNC_GATEWAY_COLUMNS), summarize_sync_gateway, window_secs)
+    if machine_stats_folder is not None:
+        summary["machine_stats"] = _summarize_nodes(load_machine_stats_frames(machine_stats_folder), summarize_machine_stats, window_secs)
+    return summary
+
+
+def _pair_nodes(nodes, baseline_nodes):
+    """
+    Pairs the nodes of a role with the baseline nodes of the same role by their index in sorted order.
+    The hosts of a run and of its baseline usually differ (ex. another cluster), so the names cannot be matched.
+    """
+    return list(zip(sorted(nodes), sorted(baseline_nodes)))
+
+
+def compare_to_baseline(summary, baseline, thresholds=None):
+    """
+    Compares the run level metrics of every node with the baseline node of the same role
+    (gateload, sync_gateway, machine_stats) and index, see _pair_nodes.
+    Returns a list of regressions, one per metric worse than its threshold allows:
+    {"section": ..., "node": ..., "baseline_node": ..., "metric": ..., "baseline": ..., "value": ..., "change": ..., "max_regression": ...}
+    Raises a ValueError if no metric could be compared, a gate comparing nothing would always pass.
+    """
+
+    thresholds = thresholds or DEFAULT_REGRESSION_THRESHOLDS
+    regressions = []
+    num_compared = 0
+    for section in ["gateload", "sync_gateway", "machine_stats"]:
+        nodes = summary.get(section, {})
+        baseline_nodes = baseline.get(section, {})
+        if len(nodes) != len(baseline_nodes):
+            log_warn("{} has {} nodes, the baseline has {}. Only the first {} are compared".format(
+                section, len(nodes), len(baseline_nodes), min(len(nodes), len(baseline_nodes))
+            ))
+
+        for node, baseline_node in _pair_nodes(nodes, baseline_nodes):
+            metrics = nodes[node]
+            baseline_metrics = baseline_nodes[baseline_node]
+            for metric, threshold in thresholds.items():
+                value = metrics.get(metric)
+                baseline_value = baseline_metrics.get(metric)
+                if value is None or baseline_value is None or baseline_value == 0:
+                    continue
+                num_compared += 1
+
+                # Positive change means worse
+                change = (value - baseline_value) / abs(baseline_value)
+                if threshold["higher_is_better"]:
+                    change = -change
+
+                if change > threshold["max_regression"]:
+                    regressions.append({
+                        "section": section,
+                        "node": node,
+                        "baseline_node": baseline_node,
+                        "metric": metric,
+                        "baseline": baseline_value,
+                        "value": value,
+                        "change": change,
+                        "max_regression": threshold["max_regression"]
+                    })
+
+    if num_compared == 0:
+        raise ValueError("No metric of the run could be compared with the baseline, check that both summaries have the same roles and metrics")
+
+    return regressions
+
+
+def write_report(report_file, summary, regressions=None):
+    report = {"summary": summary}
+    if regressions is not None:
+        report["regressions"] = regressions
+        report["passed"] = len(regressions) == 0
+    with open(report_file, "w") as f:
+        json.dump(report, f, indent=4, sort_keys=True)
@@ -5,12 +5,11 @@ import ansible.inventory
 from ansible.parsing.dataloader import DataLoader
 from ansible.vars import VariableManager
 
+from utilities.cluster_config_utils import get_cluster_config
 
-def hosts_for_tag(cluster_config, tag):
 
-    if not os.path.isfile(cluster_config):
-        print("Hostfile does not exist {}".format(cluster_config))
-        sys.exit(1)
+def load_inventory_hosts(cluster_config):
+    """ Parses the ansible inventory and returns the host vars of every group: { group name: [host vars, ...] } """
 
     variable_manager = VariableManager()
     loader = DataLoader()
@@ -18,8 +17,14 @@ def hosts_for_tag(cluster_config, tag):
     i = ansible.inventory.Inventory(loader=loader, variable_manager=variable_manager, host_list=cluster_config)
     variable_manager.set_inventory(i)
 
-    group = i.get_group(tag)
-    if group is None:
-        return []
-    hosts = group.get_hosts()
-    return [host.get_vars() for host in hosts]
+    return dict((name, [host.get_vars() for host in group.get_hosts()]) for name, group in i.get_groups().items())
+
+
+def hosts_for_tag(cluster_config, tag):
+
+    if not os.path.isfile(cluster_config):
+        print("Hostfile does not exist {}".format(cluster_config))
+        sys.exit(1)
+
+    # The inventory is only parsed again when the cluster config changes
+    return get_cluster_config(cluster_config).hosts_for_tag(tag)
@@ -0,0 +1,200 @@
+import multiprocessing
+import time
+from contextlib import contextmanager
+
+import pytest
+
+import libraries.provision.ansible_python_runner
+import libraries.provision.ansible_runner
+from libraries.provision.ansible_python_runner import InventoryContext
+from libraries.provision.ansible_python_runner import TaskTimer
+from libraries.provision.ansible_python_runner import clear_inventory_contexts
+from libraries.provision.ansible_python_runner import inventory_context
+from libraries.provision.ansible_runner import AnsibleRunner
+from libraries.provision.ansible_runner import PlaybookResult
+from libraries.provision.ansible_runner import get_cluster_change_count
+from keywords.exceptions import ProvisioningError
+
+
+class MockStats:
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.dark = {}
+
+
+class MockRunner:
+    """
+    Sleeps instead of running the playbook, the playbooks named 'fail-*' fail on the subset host
+    and the playbooks named 'raise-*' raise. The counters are shared with the playbook processes
+    """
+
+    running = multiprocessing.Value("i", 0)
+    max_running = multiprocessing.Value("i", 0)
+
+    def __init__(self, inventory_filename, playbook, extra_vars, verbosity, subset, context, forks):
+        self.playbook = playbook
+        self.subset = subset
+        self.context = context
+        self.task_timer = TaskTimer()
+
+    def run(self):
+        with MockRunner.running.get_lock():
+            MockRunner.running.value += 1
+            MockRunner.max_running.value = max(MockRunner.max_running.value, MockRunner.running.value)
+        time.sleep(0.2)
+        with MockRunner.running.get_lock():
+            MockRunner.running.value -= 1
+        self.task_timer.timings.append((self.subset, "PLAYBOOK | task", 0.2, "ok"))
+        if "/raise-" in self.playbook:
+            raise RuntimeError("Unable to parse the playbook")
+        if "/fail-" in self.playbook:
+            return MockStats({self.subset: 1})
+        return MockStats({})
+
+
+@contextmanager
+def mock_inventory_context(inventory_filename):
+    yield None
+
+
+def test_run_ansible_playbooks(monkeypatch, tmpdir):
+    monkeypatch.setattr(libraries.provision.ansible_runner, "Runner", MockRunner)
+    monkeypatch.setattr(libraries.provision.ansible_runner, "inventory_context", mock_inventory_context)
+    inventory = tmpdir.join("cluster")
+    inventory.write("[sync_gateways]\nsg1\nsg2\nsg3\n")
+    ansible_runner = AnsibleRunner(str(inventory))
+    MockRunner.max_running.value = 0
+
+    # Each step runs in its own process
+    steps = [("stop-sync-gateway.yml", {}, "sg1"), ("fail-stop.yml", {}, "sg2"), ("stop-sync-gateway.yml", {}, "sg3")]
+    start = time.time()
+    results = ansible_runner.run_ansible_playbooks(steps, max_parallel=3)
+
+    assert time.time() - start < 0.5
+    assert MockRunner.max_running.value == 3
+    assert [(result.script_name, result.subset, result.status) for result in results] == [
+        ("stop-sync-gateway.yml", "sg1", 0),
+        ("fail-stop.yml", "sg2", 1),
+        ("stop-sync-gateway.yml", "sg3", 0)
+    ]
+    assert results[2].host_timings() == {"sg3": 0.2}
+    assert get_cluster_change_count(str(inventory)) == 3
+
+    MockRunner.max_running.value = 0
+    results = ansible_runner.run_ansible_playbooks(steps, max_parallel=1)
+    assert MockRunner.max_running.value == 1
+    assert [result.status for result in results] == [0, 1, 0]
+    assert ansible_runner.run_ansible_playbook("fetch-sync-gateway-logs.yml", subset="sg1") == 0
+    assert get_cluster_change_count(str(inventory)) == 6
+
+    # At most 'max_parallel' processes at once, an error of one playbook is raised once all are done
+    MockRunner.max_running.value = 0
+    steps = [("stop-sync-gateway.yml", {}, "sg1"), ("raise-stop.yml", {}, "sg2"), ("stop-sync-gateway.yml", {}, "sg3")]
+    with pytest.raises(ProvisioningError) as e:
+        ansible_runner.run_ansible_playbooks(steps, max_parallel=2)
+    assert MockRunner.max_running.value == 2
+    assert "raise-stop.yml (subset: sg2)" in str(e.value)
+    assert "Unable to parse the playbook" in str(e.value)
+
+
+class MockInventoryContext:
+
+    def __init__(self, inventory_filename):
+        self.inventory_filename = inventory_filename
+
+
+def test_inventory_contexts_are_reused(monkeypatch, tmpdir):
+    monkeypatch.setattr(libraries.provision.ansible_python_runner, "InventoryContext", MockInventoryContext)
+    clear_inventory_contexts()
+    inventory = tmpdir.join("cluster")
+    inventory.write("[sync_gateways]\nsg1\n")
+
+    with inventory_context(str(inventory)) as first:
+        # A context is only used by one playbook run at a time
+        with inventory_context(str(inventory)) as second:
+            assert second is not first
+    with inventory_context(str(inventory)) as context:
+        assert context in (first, second)
+
+    other_inventory = tmpdir.join("other_cluster")
+    other_inventory.write("[sync_gateways]\nsg2\n")
+    with inventory_context(str(other_inventory)) as context:
+        assert context.inventory_filename == str(other_inventory)
+    clear_inventory_contexts()
+
+
+class MockTask:
+
+    def __init__(self, name):
+        self.name = name
+
+    def get_name(self):
+        return self.name
+
+
+class MockHost(MockTask):
+    pass
+
+
+class MockResult:
+
+    def __init__(self, host):
+        self._host = MockHost(host)
+
+
+def test_task_timer(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(libraries.provision.ansible_python_runner.time, "time", lambda: now[0])
+    timer = TaskTimer()
+
+    timer.v2_playbook_on_task_start(MockTask("SYNC GATEWAY | stop"), False)
+    now[0] += 2
+    timer.v2_runner_on_ok(MockResult("sg1"))
+    now[0] += 3
+    timer.v2_runner_on_unreachable(MockResult("sg2"))
+    timer.v2_playbook_on_task_start(MockTask("SYNC GATEWAY | delete logs"), False)
+    now[0] += 1
+    timer.v2_runner_on_failed(MockResult("sg1"), ignore_errors=True)
+
+    assert timer.timings == [
+        ("sg1", "SYNC GATEWAY | stop", 2, "ok"),
+        ("sg2", "SYNC GATEWAY | stop", 5, "unreachable"),
+        ("sg1", "SYNC GATEWAY | delete logs", 1, "ignored")
+    ]
+
+    result = PlaybookResult("stop-sync-gateway.yml", None, 1, 6, timer.timings)
+    assert result.host_timings() == {"sg1": 3, "sg2": 5}
+    assert result.slowest_tasks(1) == [("sg2", "SYNC GATEWAY | stop", 5, "unreachable")]
+
+
+class MockVariableManager:
+
+    def __init__(self):
+        self._fact_cache = {"sg1": {"ansible_distribution": "CentOS"}}
+        self._nonpersistent_fact_cache = {"sg1": {"sync_gateway_version": "2.1.0"}}
+        self.extra_vars = {}
+
+
+class MockInventory:
+
+    def __init__(self):
+        self.restriction = None
+
+    def remove_restriction(self):
+        self.restriction = None
+
+    def subset(self, subset):
+        self.restriction = subset
+
+
+def test_prepare_forgets_facts():
+    context = InventoryContext.__new__(InventoryContext)
+    context.variable_manager = MockVariableManager()
+    context.inventory = MockInventory()
+
+    context.prepare({"sync_gateway_version": "2.5.0"}, "sg1")
+    assert context.variable_manager._fact_cache == {}
+    assert context.variable_manager._nonpersistent_fact_cache == {}
+    assert context.variable_manager.extra_vars == {"sync_gateway_version": "2.5.0"}
+    assert context.inventory.restriction == "sg1"
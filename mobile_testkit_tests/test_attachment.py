@@ -1,3 +1,6 @@
+import base64
+import hashlib
+
 import pytest
 from keywords import attachment
 
@@ -10,3 +13,72 @@ def test_load_from_data_dir_requires_list():
 def test_load_from_data_dir():
     atts = attachment.load_from_data_dir(["sample_text.txt", "golden_gate_large.jpg"])
     assert len(atts) == 2 and atts[0].name == "sample_text.txt" and atts[1].name == "golden_gate_large.jpg"
+
+
+def test_load_from_data_dir_cached(monkeypatch):
+    attachment.attachment_cache.clear()
+    atts = attachment.load_from_data_dir(["sample_text.txt"])
+
+    def fail_open(*args, **kwargs):
+        raise AssertionError("attachment should be served from the cache")
+
+    monkeypatch.setattr("keywords.attachment.open", fail_open, raising=False)
+    assert attachment.load_from_data_dir(["sample_text.txt"])[0].data == atts[0].data
+
+
+def test_generate_png_in_memory(tmpdir, monkeypatch):
+    monkeypatch.setattr("keywords.attachment.DATA_DIR", str(tmpdir))
+    atts = attachment.generate_2_png_10_10()
+
+    assert len(atts) == 2 and atts[0].name != atts[1].name
+    assert tmpdir.listdir() == []
+    assert base64.standard_b64decode(atts[0].data).startswith(b"\x89PNG")
+
+    # Generated attachments are not cached, but can be loaded by name
+    assert attachment.attachment_cache.get(atts[0].name) is None
+    assert attachment.load_from_data_dir([atts[0].name])[0].data == atts[0].data
+
+
+def test_generated_attachment_is_rebuilt():
+    att = attachment.generate_blob(1024)[0]
+    assert attachment.load_from_data_dir([att.name])[0].digest == att.digest
+
+    # Evicted from the cache
+    attachment.attachment_cache.clear()
+    assert attachment.load_from_data_dir([att.name])[0].data == att.data
+    assert attachment.generate_blob(1024)[0].data != att.data
+
+
+def test_generate_again_under_the_same_name(monkeypatch):
+    first = attachment.generate_blob(16, name="x.bin")[0]
+    assert attachment.load_from_data_dir(["x.bin"])[0].data == first.data
+
+    second = attachment.generate_blob(16, name="x.bin")[0]
+    assert second.data != first.data
+    assert attachment.load_from_data_dir(["x.bin"])[0].data == second.data
+
+    # Only the most recent generated attachments can be rebuilt
+    monkeypatch.setattr(attachment, "GENERATED_ATTACHMENTS_MAX_ENTRIES", 2)
+    names = [attachment.generate_blob(16)[0].name for _ in range(3)]
+    assert list(attachment._generated_attachments) == names[1:]
+
+
+def test_generate_blob_digest():
+    att = attachment.generate_blob(1024)[0]
+    raw_data = base64.standard_b64decode(att.data)
+    assert len(raw_data) == 1024
+    assert att.digest == "sha1-" + base64.standard_b64encode(hashlib.sha1(raw_data).digest()).decode()
+    assert attachment.Attachment(att.name, att.data).digest == att.digest
+
+
+def test_attachment_cache_is_bounded():
+    cache = attachment.AttachmentCache(max_bytes=100)
+    for i in range(5):
+        cache.put(attachment.Attachment("att_{}".format(i), "x" * 30))
+    assert cache.size_bytes == 90
+    assert cache.get("att_0") is None and cache.get("att_1") is None
+
+    # A get makes att_2 the most recently used
+    cache.get("att_2")
+    cache.put(attachment.Attachment("att_5", "x" * 30))
+    assert cache.get("att_2") is not None and cache.get("att_3") is None
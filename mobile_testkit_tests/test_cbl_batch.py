@@ -0,0 +1,128 @@
+import json
+
+import pytest
+
+from CBLClient.Batch import BatchCallError
+from CBLClient.Client import Client
+from CBLClient.Document import Document
+from CBLClient.MemoryPointer import BatchReference
+
+
+class MockBatchResponse:
+
+    def __init__(self, resp_obj):
+        self.resp_obj = resp_obj
+        self.status_code = 200
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.resp_obj
+
+
+class MockBatchSession:
+    """ Handles /batch the way the test server does, for a couple of document methods """
+
+    def __init__(self):
+        self.headers = {}
+        self.num_posts = 0
+        self.memory = {}
+
+    def _arg(self, results, value):
+        # '$<index>' arguments refer to the raw result of an earlier call
+        if value.startswith("$"):
+            return results[int(value[1:])]
+        return value
+
+    def post(self, url, data=None, headers=None):
+        assert url.endswith("/batch")
+        self.num_posts += 1
+
+        results = []
+        resp_obj = []
+        for call in json.loads(json.loads(data)["calls"]):
+            args = dict((k, self._arg(results, v)) for k, v in call["args"].items())
+            result = None
+            try:
+                if call["method"] == "document_create":
+                    result = "@{}".format(len(self.memory))
+                    self.memory[result] = {"id": json.loads(args["id"]), "props": {}}
+                elif call["method"] == "document_setString":
+                    self.memory[args["document"]]["props"][json.loads(args["key"])] = json.loads(args["value"])
+                elif call["method"] == "document_getString":
+                    result = json.dumps(self.memory[args["document"]]["props"][json.loads(args["key"])])
+                elif call["method"] == "release":
+                    del self.memory[args["object"]]
+                else:
+                    raise KeyError("Unknown method: {}".format(call["method"]))
+                resp_obj.append({"result": result})
+            except KeyError as e:
+                resp_obj.append({"error": str(e)})
+            results.append(result)
+
+        return MockBatchResponse(resp_obj)
+
+
+@pytest.fixture
+def client():
+    client = Client("http://localhost:8080")
+    client.session = MockBatchSession()
+    return client
+
+
+def test_batch_results_in_order(client):
+    batch = client.batch()
+    doc_obj = batch.proxy(Document(client.base_url))
+
+    doc = doc_obj.create("doc_1")
+    assert isinstance(doc, BatchReference)
+    assert doc.getAddress() == "$0"
+
+    doc_obj.setString(doc, "color", "blue")
+    doc_obj.setString(doc, "shape", "round")
+    doc_obj.getString(doc, "shape")
+    doc_obj.getString(doc, "color")
+    assert len(batch) == 5
+
+    results = batch.execute()
+    assert client.session.num_posts == 1
+    assert len(batch) == 0
+    assert results[0].getAddress() == "@0"
+    assert results[3:] == ["round", "blue"]
+
+
+def test_batch_release(client):
+    batch = client.batch()
+    doc_obj = batch.proxy(Document(client.base_url))
+
+    doc = doc_obj.create("doc_1")
+    batch.release(doc)
+    batch.execute()
+    assert client.session.memory == {}
+
+
+def test_batch_call_errors(client):
+    batch = client.batch()
+    doc_obj = batch.proxy(Document(client.base_url))
+
+    doc = doc_obj.create("doc_1")
+    doc_obj.getString(doc, "missing")
+    doc_obj.setString(doc, "color", "blue")
+    results = batch.execute()
+
+    # A failed call does not stop the rest of the batch
+    assert isinstance(results[1], BatchCallError)
+    assert results[1].index == 1
+    assert results[1].method == "document_getString"
+    assert client.session.memory["@0"]["props"] == {"color": "blue"}
+
+    doc = doc_obj.create("doc_2")
+    doc_obj.getString(doc, "missing")
+    with pytest.raises(BatchCallError):
+        batch.execute(raise_on_error=True)
+
+
+def test_empty_batch(client):
+    assert client.batch().execute() == []
+    assert client.session.num_posts == 0
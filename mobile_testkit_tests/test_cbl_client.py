@@ -0,0 +1,210 @@
+import gc
+import json
+
+import pytest
+from requests.exceptions import HTTPError
+
+from CBLClient.Args import Args
+from CBLClient.Client import get_client
+from CBLClient.Client import close_shared_clients
+from CBLClient.Database import Database
+from CBLClient.Document import Document
+from CBLClient.Query import Query
+from CBLClient.Utils import Utils
+from CBLClient.ValueSerializer import VALUE_ENCODING_HEADER, VALUE_ENCODING_LEGACY, VALUE_ENCODING_TREE
+
+
+class MockResponse:
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    def raise_for_status(self):
+        if self.status_code != 200:
+            raise HTTPError("{} Error".format(self.status_code))
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class MockTestServerSession:
+    """ Keeps the objects created by document_create in 'memory' until they are released """
+
+    def __init__(self, batch_supported=True, value_encodings=None):
+        self.batch_supported = batch_supported
+        # None for the test servers without the 'valueEncodings' method
+        self.value_encodings = value_encodings
+        self.memory = {}
+        self.next_address = 0
+        self.methods = []
+        self.headers = []
+
+    def _call(self, method, args):
+        self.methods.append(method)
+        if method == "document_create":
+            address = "@{}".format(self.next_address)
+            self.next_address += 1
+            self.memory[address] = json.loads(args["id"])
+            return address
+        elif method == "release":
+            del self.memory[args["object"]]
+        elif method == "flushMemory":
+            self.memory = {}
+        return None
+
+    def post(self, url, data=None, headers=None):
+        method = url.rsplit("/", 1)[-1]
+        body = json.loads(data)
+        if method == "valueEncodings":
+            if self.value_encodings is None:
+                return MockResponse(400, "java.lang.ArrayIndexOutOfBoundsException")
+            return MockResponse(200, json.dumps(self.value_encodings))
+
+        self.headers.append(headers)
+        if method != "batch":
+            result = self._call(method, body)
+            return MockResponse(200, result or "")
+
+        if not self.batch_supported:
+            return MockResponse(404, "")
+        results = [{"result": self._call(call["method"], call["args"])} for call in json.loads(body["calls"])]
+        return MockResponse(200, json.dumps(results))
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def session():
+    close_shared_clients()
+    session = MockTestServerSession()
+    get_client("http://localhost:8080").session = session
+    yield session
+    close_shared_clients()
+
+
+def test_wrappers_share_client():
+    close_shared_clients()
+    base_url = "http://localhost:8080"
+    assert Database(base_url)._client is Document(base_url)._client is Query(base_url)._client
+    assert Document("http://localhost:8081")._client is not Document(base_url)._client
+    assert get_client(base_url, "tree") is not get_client(base_url)
+    close_shared_clients()
+
+
+@pytest.mark.parametrize("value_encodings, expected_encoding", [
+    (["legacy", "tree"], VALUE_ENCODING_TREE),
+    (["legacy"], VALUE_ENCODING_LEGACY),
+    # iOS / .NET test servers do not know the method
+    (None, VALUE_ENCODING_LEGACY),
+])
+def test_value_encoding_negotiation(value_encodings, expected_encoding):
+    close_shared_clients()
+    session = MockTestServerSession(value_encodings=value_encodings)
+    client = get_client("http://localhost:8080", VALUE_ENCODING_TREE)
+    client.session = session
+
+    for doc_id in ["doc_1", "doc_2"]:
+        args = Args()
+        args.setString("id", doc_id)
+        client.invokeMethod("document_create", args)
+    assert client.value_encoding == expected_encoding
+    assert [headers.get(VALUE_ENCODING_HEADER) for headers in session.headers] == [
+        expected_encoding if expected_encoding != VALUE_ENCODING_LEGACY else None
+    ] * 2
+    close_shared_clients()
+
+
+def test_request_counts(session):
+    doc_obj = Document("http://localhost:8080")
+    for i in range(3):
+        doc_obj.create("doc_{}".format(i))
+
+    stats = Utils("http://localhost:8080").get_stats()
+    assert stats["requests"] == {"document_create": 3}
+    # No scope open and no auto release, counted but not tracked
+    assert stats["live_pointers"] == 3
+    assert len(get_client("http://localhost:8080").pointers._live) == 0
+
+
+def test_pointer_scope(session):
+    doc_obj = Document("http://localhost:8080")
+    utils = Utils("http://localhost:8080")
+    outside = doc_obj.create("outside")
+
+    with utils.pointer_scope():
+        for i in range(5):
+            doc_obj.create("doc_{}".format(i))
+        kept = doc_obj.create("kept")
+        utils.keep(kept)
+
+        with utils.pointer_scope():
+            doc_obj.create("inner")
+        assert "inner" not in session.memory.values()
+
+    assert sorted(session.memory.values()) == ["kept", "outside"]
+    # The 5 docs and 'inner' were released with 2 batch requests, one per scope
+    assert session.methods.count("release") == 6
+    assert utils.get_stats()["requests"]["batch"] == 2
+    assert utils.get_stats()["live_pointers"] == 2
+
+    utils.release([outside, kept])
+    assert session.memory == {}
+    assert utils.get_stats()["live_pointers"] == 0
+
+
+def test_releases_are_batched(session):
+    client = get_client("http://localhost:8080")
+    client.pointers.batch_size = 4
+    doc_obj = Document("http://localhost:8080")
+
+    with client.pointers.scope():
+        for i in range(10):
+            doc_obj.create("doc_{}".format(i))
+
+    assert session.memory == {}
+    assert client.request_counts["batch"] == 3
+
+
+def test_release_without_batch_support(session):
+    session.batch_supported = False
+    doc_obj = Document("http://localhost:8080")
+    utils = Utils("http://localhost:8080")
+
+    with utils.pointer_scope():
+        for i in range(3):
+            doc_obj.create("doc_{}".format(i))
+
+    assert session.memory == {}
+    assert utils.get_stats()["requests"]["release"] == 3
+
+
+def test_auto_release(session):
+    client = get_client("http://localhost:8080")
+    client.pointers.auto_release = True
+    client.pointers.batch_size = 5
+    doc_obj = Document("http://localhost:8080")
+
+    kept = [doc_obj.create("kept_{}".format(i)) for i in range(2)]
+    for i in range(10):
+        doc_obj.create("doc_{}".format(i))
+    gc.collect()
+
+    # The collected pointers are released once 5 of them are waiting, with the next call
+    assert len(session.memory) == 7
+    last = doc_obj.create("last")
+    assert sorted(session.memory.values()) == ["kept_0", "kept_1", "last"]
+    assert len(kept) == 2 and last is not None
+
+
+def test_flush_memory_forgets_pointers(session):
+    doc_obj = Document("http://localhost:8080")
+    utils = Utils("http://localhost:8080")
+
+    with utils.pointer_scope():
+        doc_obj.create("doc_0")
+        utils.flushMemory()
+        assert utils.get_stats()["live_pointers"] == 0
+
+    assert session.methods.count("release") == 0
@@ -0,0 +1,194 @@
+import json
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+import pytest
+
+import keywords.ChangesLoad
+from keywords.ChangesLoad import ChangesLoadEngine
+from keywords.ChangesLoad import changes_feed_spec
+from keywords.ChangesLoad import run_changes_feeds
+from keywords.ChangesLoad import summarize_changes_load
+from keywords.ChangesLoad import _HttpResponseParser
+
+
+class MockSyncGateway(ThreadingMixIn, HTTPServer):
+    """ Serves the normal, longpoll and continuous _changes feeds of 'changes' """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), MockChangesHandler)
+        self.changes = []
+        self.requests = []
+        self.status = 200
+        self.condition = threading.Condition()
+
+    def add_change(self, doc_id, rev):
+        with self.condition:
+            self.changes.append({"seq": len(self.changes) + 1, "id": doc_id, "changes": [{"rev": rev}]})
+            self.condition.notify_all()
+
+    def changes_since(self, since, wait):
+        with self.condition:
+            if wait and len(self.changes) <= since:
+                self.condition.wait(wait)
+            return list(self.changes[since:])
+
+
+class MockChangesHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, body):
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_chunk(self, data):
+        self.wfile.write("{:x}\r\n".format(len(data)).encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.headers.get("Cookie"), body))
+
+        if self.server.status != 200:
+            self.send_response(self.server.status)
+            self.send_body(b"{\"error\": \"Unauthorized\"}")
+            return
+
+        self.send_response(200)
+        since = body["since"]
+        if body["feed"] != "continuous":
+            results = self.server.changes_since(since, 0.2 if body["feed"] == "longpoll" else 0)
+            results = results[:body.get("limit", len(results))]
+            last_seq = results[-1]["seq"] if results else since
+            self.send_body(json.dumps({"results": results, "last_seq": last_seq}).encode("utf-8"))
+            return
+
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        while True:
+            results = self.server.changes_since(since, 0.1)
+            for change in results:
+                self.send_chunk(json.dumps(change).encode("utf-8") + b"\n")
+                since = change["seq"]
+                if change["id"] == "terminator":
+                    self.send_chunk(b"")
+                    return
+            if not results:
+                # heartbeat
+                self.send_chunk(b"\n")
+
+
+@pytest.fixture
+def sync_gateway():
+    server = MockSyncGateway()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def add_docs_then_terminate(sync_gateway, num_docs, delay=0.3):
+
+    def add_docs():
+        time.sleep(delay)
+        for i in range(num_docs):
+            sync_gateway.add_change("doc_{}".format(i), "1-a")
+        sync_gateway.add_change("doc_0", "2-b")
+        sync_gateway.add_change("terminator", "1-t")
+
+    thread = threading.Thread(target=add_docs)
+    thread.start()
+    return thread
+
+
+def sg_url(sync_gateway):
+    return "http://127.0.0.1:{}".format(sync_gateway.server_address[1])
+
+
+def test_http_response_parser():
+    body = []
+    completed = []
+
+    parser = _HttpResponseParser(body.append, lambda: completed.append(True))
+    response = b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n7\r\n, world\r\n0\r\n\r\n"
+    for i in range(len(response)):
+        parser.feed(response[i:i + 1])
+    assert parser.status == 200
+    assert b"".join(body) == b"hello, world"
+    assert completed == [True]
+
+    body = []
+    parser = _HttpResponseParser(body.append, lambda: completed.append(True))
+    parser.feed(b"HTTP/1.1 401 Unauthorized\r\nContent-Length: 4\r\n\r\nnope")
+    assert parser.status == 401 and body == [b"nope"] and len(completed) == 2
+
+
+def test_run_changes_feeds(sync_gateway):
+    specs = []
+    for i in range(20):
+        session = ("SyncGatewaySession", "session_{}".format(i))
+        specs.append(changes_feed_spec("user_{}".format(i), session, "normal", filter_type="_doc_ids", filter_doc_ids=["terminator"]))
+        specs.append(changes_feed_spec("user_{}".format(i), session, "longpoll", filter_type="sync_gateway/bychannel", filter_channels=["even"]))
+        specs.append(changes_feed_spec("user_{}".format(i), session, "continuous"))
+
+    writer = add_docs_then_terminate(sync_gateway, 10)
+    results = run_changes_feeds(sg_url(sync_gateway), "db", specs, "terminator", changes_delay=0.05, changes_limit=3, timeout=30)
+    writer.join()
+
+    assert len(results) == 60
+    for result in results:
+        assert result["terminated"], result
+        assert result["errors"] == 0
+        assert len(result["latest_changes"]) == 10
+        assert result["latest_changes"]["doc_0"] == "2-b"
+
+    # 11 changes + terminator with a limit of 3 per request
+    assert min(result["requests"] for result in results if result["feed"] == "normal") >= 4
+
+    cookie, body = sync_gateway.requests[0]
+    assert cookie == "SyncGatewaySession=session_0"
+    bodies = [request_body for _, request_body in sync_gateway.requests]
+    assert {"feed": "normal", "since": 0, "limit": 3, "filter": "_doc_ids", "doc_ids": ["terminator"]} in bodies
+    assert {"feed": "longpoll", "since": 0, "limit": 3, "timeout": 60000, "filter": "sync_gateway/bychannel", "channels": "even"} in bodies
+
+
+def test_changes_feed_gives_up(sync_gateway, monkeypatch):
+    monkeypatch.setattr(keywords.ChangesLoad, "CHANGES_LOAD_MAX_ERRORS", 2)
+    sync_gateway.status = 401
+
+    results = run_changes_feeds(sg_url(sync_gateway), "db", [changes_feed_spec("user_0", ("user_0", "pass"), "longpoll")], "terminator", timeout=30)
+    assert results[0]["errors"] == 2
+    assert not results[0]["terminated"]
+    assert results[0]["error"].startswith("status 401")
+
+
+def test_changes_load_engine(sync_gateway):
+    specs = [changes_feed_spec("user_{}".format(i), None, feed) for i in range(10) for feed in ["normal", "longpoll", "continuous"]]
+
+    engine = ChangesLoadEngine(sg_url(sync_gateway), "db", "terminator", changes_delay=0.05, processes=2)
+    engine.start(specs, timeout=30)
+    writer = add_docs_then_terminate(sync_gateway, 5, delay=1)
+    results = engine.results()
+    writer.join()
+
+    assert sorted((result["user"], result["feed"]) for result in results) == sorted((spec["user"], spec["feed"]) for spec in specs)
+    assert all(result["terminated"] for result in results)
+
+    # doc_0 was updated to 2-b when the terminator was written
+    writes = {"doc_0": ("2-b", time.time() - 1)}
+    summary = summarize_changes_load(results, writes)
+    assert sorted(summary["user_0"]) == ["continuous", "longpoll", "normal"]
+    assert summary["user_0"]["continuous"]["changes"] == 6
+    assert summary["user_0"]["continuous"]["latency_max_secs"] > 0
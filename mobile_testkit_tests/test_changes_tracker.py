@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+
+from keywords.ChangesTracker import ChangesTracker
+from keywords.exceptions import ChangesError
+
+
+def changes(doc_id, *revs):
+    return {"id": doc_id, "seq": 1, "changes": [{"rev": rev} for rev in revs]}
+
+
+def test_process_changes():
+    ct = ChangesTracker("http://localhost:4984", "db")
+    ct.process_changes([changes("doc_0", "1-a"), changes("doc_1", "1-b"), changes("_user/foo")])
+    ct.process_changes([changes("doc_0", "2-a")])
+
+    assert ct.processed_changes == {
+        "doc_0": [{"rev": "1-a"}, {"rev": "2-a"}],
+        "doc_1": [{"rev": "1-b"}]
+    }
+
+
+def test_process_changes_duplicate_rev():
+    ct = ChangesTracker("http://localhost:4984", "db")
+    ct.process_changes([changes("doc_0", "1-a")])
+
+    with pytest.raises(ChangesError):
+        ct.process_changes([changes("doc_0", "1-a")])
+
+
+def test_unsupported_feed():
+    with pytest.raises(ValueError):
+        ChangesTracker("http://localhost:4984", "db", feed="normal")
+
+
+@pytest.mark.parametrize("expected_revs, rev_prefix_gen", [
+    (["2-a", "1-b"], False),
+    (["2-", "1-"], True)
+])
+def test_wait_until(expected_revs, rev_prefix_gen):
+    ct = ChangesTracker("http://localhost:4984", "db")
+    ct.process_changes([changes("doc_0", "1-a")])
+
+    expected_docs = [{"id": "doc_0", "rev": expected_revs[0]}, {"id": "doc_1", "rev": expected_revs[1]}]
+    timer = threading.Timer(0.2, ct.process_changes, [[changes("doc_0", "2-a"), changes("doc_1", "1-b")]])
+    timer.start()
+
+    assert ct.wait_until(expected_docs, timeout=10, rev_prefix_gen=rev_prefix_gen)
+    timer.join()
+
+
+def test_wait_until_timeout():
+    ct = ChangesTracker("http://localhost:4984", "db")
+    ct.process_changes([changes("doc_0", "1-a")])
+    assert not ct.wait_until([{"id": "doc_0", "rev": "1-a"}, {"id": "doc_1", "rev": "1-b"}], timeout=0.2)
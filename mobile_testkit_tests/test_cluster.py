@@ -1,3 +1,16 @@
+import pytest
+
+import libraries.testkit.cluster
+from keywords.exceptions import ProvisioningError
+from libraries.provision.ansible_runner import get_cluster_change_count
+from libraries.provision.ansible_runner import is_read_only_playbook
+from libraries.testkit.cluster import Cluster
+from libraries.testkit.cluster import RESET_PLAN_FAST
+from libraries.testkit.cluster import RESET_PLAN_FULL
+from libraries.testkit.cluster import ResetState
+from libraries.testkit.cluster import ResetTimings
+from libraries.testkit.cluster import get_reset_fingerprint
+from libraries.testkit.cluster import plan_reset
 from libraries.testkit.cluster import validate_cluster
 
 
@@ -20,3 +33,119 @@ def test_validate_cluster():
     sg_accels.append("sga1")
     is_valid, _ = validate_cluster(sync_gateways, sg_accels, config)
     assert is_valid is True
+
+
+class MockResetConfig:
+
+    def __init__(self, databases):
+        self.databases = databases
+
+    def get_bucket_name_set(self):
+        return sorted(set(self.databases.values()))
+
+    def get_databases(self):
+        return self.databases
+
+
+def test_plan_reset():
+    state = ResetState("abc", 3)
+    assert plan_reset(state, "abc", 3, "cc", False)[0] == RESET_PLAN_FAST
+    assert plan_reset(state, "abc", 3, "cc", True)[0] == RESET_PLAN_FULL
+    assert plan_reset(state, "abc", 3, "di", False)[0] == RESET_PLAN_FULL
+    assert plan_reset(None, "abc", 3, "cc", False)[0] == RESET_PLAN_FULL
+    assert plan_reset(state, "def", 3, "cc", False)[0] == RESET_PLAN_FULL
+    # A playbook (ex. a Sync Gateway restart) ran since the last reset
+    assert plan_reset(state, "abc", 4, "cc", False)[0] == RESET_PLAN_FULL
+
+
+def test_reset_fingerprint(tmpdir):
+    sg_config = tmpdir.join("sg_config.json")
+    sg_config.write('{"databases": {"db": {"bucket": "data-bucket"}}}')
+    config = MockResetConfig({"db": "data-bucket"})
+    playbook_vars = {"xattrs": "", "revs_limit": ""}
+
+    fingerprint = get_reset_fingerprint(str(sg_config), playbook_vars, config)
+    assert fingerprint == get_reset_fingerprint(str(sg_config), dict(playbook_vars), config)
+
+    assert fingerprint != get_reset_fingerprint(str(sg_config), {"xattrs": '"enable_shared_bucket_access": true,', "revs_limit": ""}, config)
+    assert fingerprint != get_reset_fingerprint(str(sg_config), playbook_vars, MockResetConfig({"db": "data-bucket", "db2": "data-bucket2"}))
+    sg_config.write('{"databases": {"db": {"bucket": "data-bucket", "allow_conflicts": false}}}')
+    assert fingerprint != get_reset_fingerprint(str(sg_config), playbook_vars, config)
+
+
+def test_cluster_change_count():
+    assert is_read_only_playbook("fetch-sync-gateway-logs.yml")
+    assert is_read_only_playbook("start-testserver-msft.yml")
+    assert not is_read_only_playbook("start-sync-gateway.yml")
+    assert not is_read_only_playbook("sync-gateway-db-offline.yml")
+    assert get_cluster_change_count("resources/cluster_configs/unknown") == 0
+
+
+def test_reset_timings(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(libraries.testkit.cluster.time, "time", lambda: now[0])
+
+    timings = ResetTimings()
+    with timings.step("flush buckets"):
+        now[0] += 2
+    with pytest.raises(ValueError):
+        with timings.step("bring databases online"):
+            now[0] += 0.5
+            raise ValueError()
+
+    assert timings.steps == [("flush buckets", 2), ("bring databases online", 0.5)]
+    assert timings.total() == 2.5
+
+
+class MockResetAdmin:
+
+    def __init__(self, sync_gateway):
+        self.admin_url = "http://{}:4985".format(sync_gateway)
+        self.dbs = {"db": "Online", "db2": "Online"}
+
+    def get_dbs(self):
+        return sorted(self.dbs)
+
+    def take_db_offline(self, db):
+        self.dbs[db] = "Offline"
+
+    def bring_db_online(self, db):
+        self.dbs[db] = "Online"
+
+    def get_db_info(self, db):
+        return {"state": self.dbs[db]}
+
+
+class MockResetServer:
+
+    def __init__(self, bucket_names):
+        self.bucket_names = bucket_names
+        self.flushed = []
+
+    def get_bucket_names(self):
+        return self.bucket_names
+
+    def flush_buckets(self, bucket_names, ipv6=False):
+        self.flushed.extend(bucket_names)
+
+
+def test_fast_reset(monkeypatch):
+    monkeypatch.setattr(libraries.testkit.cluster, "Admin", MockResetAdmin)
+    # Skip loading a cluster config
+    monkeypatch.setattr(Cluster, "__init__", lambda self: None)
+    cluster = Cluster()
+    cluster.sync_gateways = ["sg1", "sg2"]
+    cluster.ipv6 = False
+    config = MockResetConfig({"db": "data-bucket", "db2": "data-bucket2"})
+
+    cluster.servers = [MockResetServer(["data-bucket2", "data-bucket"])]
+    timings = ResetTimings()
+    cluster._fast_reset(config, timings)
+    assert cluster.servers[0].flushed == ["data-bucket", "data-bucket2"]
+    assert [name for name, _ in timings.steps] == ["verify cluster state", "take databases offline", "flush buckets", "bring databases online"]
+
+    # A bucket is missing, the full path has to recreate it
+    cluster.servers = [MockResetServer(["data-bucket"])]
+    with pytest.raises(ProvisioningError):
+        cluster._fast_reset(config, ResetTimings())
+    assert cluster.servers[0].flushed == []
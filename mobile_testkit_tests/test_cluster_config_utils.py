@@ -0,0 +1,112 @@
+""" tests for the cached cluster config """
+
+import json
+import os
+import shutil
+
+import pytest
+
+import libraries.utilities.provisioning_config_parser as provisioning_config_parser
+from keywords.ClusterKeywords import ClusterKeywords
+from utilities.cluster_config_utils import (get_cluster_config,
+                                            get_sg_version,
+                                            is_xattrs_enabled,
+                                            load_cluster_config_json,
+                                            persist_cluster_config_environment_prop)
+
+MOCK_CLUSTER_CONFIG = os.getcwd() + "/mobile_testkit_tests/test_data/mock_base_di"
+
+
+@pytest.fixture
+def cluster_config(tmpdir):
+    path = str(tmpdir.join("mock_base_di"))
+    shutil.copyfile(MOCK_CLUSTER_CONFIG, path)
+    shutil.copyfile(MOCK_CLUSTER_CONFIG + ".json", path + ".json")
+    return path
+
+
+@pytest.fixture
+def num_json_reads(monkeypatch):
+    """ Counts how many times the cluster config json is parsed """
+
+    reads = []
+    loads = json.loads
+
+    def counting_loads(*args, **kwargs):
+        reads.append(1)
+        return loads(*args, **kwargs)
+
+    monkeypatch.setattr("utilities.cluster_config_utils.json.loads", counting_loads)
+    return lambda: len(reads)
+
+
+def test_json_parsed_once(cluster_config, num_json_reads):
+    for _ in range(10):
+        assert get_sg_version(cluster_config) == "1.5.0-571"
+        assert not is_xattrs_enabled(cluster_config)
+        assert load_cluster_config_json(cluster_config + ".json")["environment"]["server_version"] == "5.0.0-3519"
+
+    assert num_json_reads() == 1
+
+
+def test_load_cluster_config_json_returns_a_copy(cluster_config):
+    cluster = load_cluster_config_json(cluster_config)
+    cluster["environment"]["sync_gateway_version"] = "2.0.0"
+    assert get_sg_version(cluster_config) == "1.5.0-571"
+
+
+def test_persist_invalidates(cluster_config):
+    assert not is_xattrs_enabled(cluster_config)
+    persist_cluster_config_environment_prop(cluster_config, "xattrs_enabled", True)
+    assert is_xattrs_enabled(cluster_config)
+    persist_cluster_config_environment_prop(cluster_config, "xattrs_enabled", False)
+    assert not is_xattrs_enabled(cluster_config)
+
+
+def test_external_write_invalidates(cluster_config):
+    assert get_sg_version(cluster_config) == "1.5.0-571"
+
+    cluster = load_cluster_config_json(cluster_config)
+    cluster["environment"]["sync_gateway_version"] = "2.1.0-121"
+    with open(cluster_config + ".json", "w") as f:
+        json.dump(cluster, f)
+
+    assert get_sg_version(cluster_config) == "2.1.0-121"
+
+
+def test_hosts_for_tag_parses_inventory_once(cluster_config, monkeypatch):
+    parsed = []
+
+    def load_inventory_hosts(path):
+        parsed.append(path)
+        return {"sync_gateways": [{"ansible_host": "192.168.33.21"}]}
+
+    monkeypatch.setattr(provisioning_config_parser, "load_inventory_hosts", load_inventory_hosts)
+
+    for _ in range(5):
+        assert provisioning_config_parser.hosts_for_tag(cluster_config, "sync_gateways") == [{"ansible_host": "192.168.33.21"}]
+        assert provisioning_config_parser.hosts_for_tag(cluster_config, "load_generators") == []
+    assert parsed == [cluster_config]
+
+    # Callers can not modify the cached hosts
+    provisioning_config_parser.hosts_for_tag(cluster_config, "sync_gateways")[0]["ansible_host"] = "changed"
+    assert provisioning_config_parser.hosts_for_tag(cluster_config, "sync_gateways") == [{"ansible_host": "192.168.33.21"}]
+
+    get_cluster_config(cluster_config).invalidate()
+    provisioning_config_parser.hosts_for_tag(cluster_config, "sync_gateways")
+    assert len(parsed) == 2
+
+
+def test_cluster_topology_memoized(cluster_config, num_json_reads):
+    cluster_keywords = ClusterKeywords(cluster_config)
+    topology = cluster_keywords.get_cluster_topology(cluster_config)
+    assert topology["couchbase_servers"] == ["http://192.168.33.20:8091"]
+    assert topology["sync_gateways"] == [{"public": "http://192.168.33.21:4984", "admin": "http://192.168.33.21:4985"}]
+
+    topology["couchbase_servers"].append("http://192.168.33.30:8091")
+    for _ in range(5):
+        assert cluster_keywords.get_cluster_topology(cluster_config)["couchbase_servers"] == ["http://192.168.33.20:8091"]
+    assert num_json_reads() == 1
+
+    persist_cluster_config_environment_prop(cluster_config, "cbs_ssl_enabled", True)
+    assert cluster_keywords.get_cluster_topology(cluster_config)["couchbase_servers"] == ["https://192.168.33.20:18091"]
@@ -0,0 +1,77 @@
+import time
+
+import pytest
+
+from CBLClient.DeviceFleet import Device, DeviceFleet
+from keywords.exceptions import TimeoutError
+
+
+class MockReplication:
+    """ Replicator that goes idle after 'busy_polls' status checks """
+
+    def __init__(self, busy_polls):
+        self.busy_polls = busy_polls
+        self.polls = 0
+
+    def wait_for_replicator_idle(self, repl, timeout, err_check=True, sleep_time=2):
+        deadline = time.time() + timeout
+        while True:
+            self.polls += 1
+            if self.polls > self.busy_polls:
+                return
+            if time.time() + sleep_time > deadline:
+                raise TimeoutError("Replicator is not idle")
+            time.sleep(sleep_time)
+
+
+def make_fleet(busy_polls_per_device):
+    devices = [Device("db{}".format(i), None, None, repl_obj=MockReplication(busy_polls), repl="repl")
+               for i, busy_polls in enumerate(busy_polls_per_device)]
+    return DeviceFleet(devices)
+
+
+def test_run_is_concurrent():
+    fleet = make_fleet([0, 0, 0, 0])
+
+    start = time.time()
+    results = fleet.run(lambda device: time.sleep(0.2) or device.name)
+
+    # 4 devices in about the time of one
+    assert time.time() - start < 0.6
+    assert results == ["db0", "db1", "db2", "db3"]
+    assert sorted(fleet.timings) == ["db0", "db1", "db2", "db3"]
+
+
+def test_run_raises_after_all_devices_are_done():
+    fleet = make_fleet([0, 0, 0])
+    done = []
+
+    def operation(device):
+        if device.name == "db0":
+            raise ValueError("failed on db0")
+        time.sleep(0.1)
+        done.append(device.name)
+
+    with pytest.raises(ValueError):
+        fleet.run(operation)
+    assert sorted(done) == ["db1", "db2"]
+
+
+def test_wait_until_replicators_idle():
+    fleet = make_fleet([0, 2, 4])
+    fleet.wait_until_replicators_idle(timeout=5, sleep_time=0.01)
+    assert [device.repl_obj.polls for device in fleet.devices] == [1, 3, 5]
+
+
+def test_wait_until_replicators_idle_shared_deadline():
+    fleet = make_fleet([0, 1000])
+
+    start = time.time()
+    with pytest.raises(TimeoutError):
+        fleet.wait_until_replicators_idle(timeout=0.3, sleep_time=0.05)
+    assert time.time() - start < 1
+
+
+def test_empty_fleet():
+    with pytest.raises(ValueError):
+        DeviceFleet([])
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from CBLClient.Database import Database
+from libraries.data import doc_generators
+
+
+@pytest.mark.parametrize("name", ["simple", "simple_user", "four_k", "complex_doc"])
+def test_generate_docs_is_reproducible(name):
+    docs = list(doc_generators.generate_docs(name, 10, seed_value=42))
+    same_docs = list(doc_generators.generate_docs(name, 10, seed_value=42))
+    other_docs = list(doc_generators.generate_docs(name, 10, seed_value=43))
+
+    for doc in docs + same_docs + other_docs:
+        doc.pop("date_time_added", None)
+
+    assert len(docs) == 10
+    assert docs == same_docs
+    if name != "four_k":
+        assert docs != other_docs
+
+
+def test_random_string():
+    doc_generators.seed(1)
+    strings = [doc_generators.random_string(10) for _ in range(100)]
+    assert all(len(value) == 10 and value.isalpha() for value in strings)
+    assert len(set(strings)) > 90
+
+    assert len(doc_generators.random_string(doc_generators.STRING_POOL_SIZE + 1)) == doc_generators.STRING_POOL_SIZE + 1
+
+
+def test_generate_serialized_docs():
+    docs = list(doc_generators.generate_docs("simple_user", 5, seed_value=7))
+    serialized = list(doc_generators.generate_serialized_docs("simple_user", 5, seed_value=7))
+
+    for doc, serialized_doc in zip(docs, serialized):
+        doc.pop("date_time_added")
+        parsed = json.loads(serialized_doc)
+        parsed.pop("date_time_added")
+        assert parsed == doc
+
+
+def test_doc_20mb_read_once(tmpdir, monkeypatch):
+    doc_file = tmpdir.join("20mb_doc.json")
+    doc_file.write(json.dumps({"values": list(range(10))}))
+    monkeypatch.setattr(doc_generators, "DOC_20MB_FILE", str(doc_file))
+    monkeypatch.setattr(doc_generators, "_doc_20mb_json", None)
+
+    doc = doc_generators.doc_20mb()
+    doc["values"].append(10)
+
+    doc_file.remove()
+    assert doc_generators.doc_20mb() == {"values": list(range(10))}
+    assert [json.loads(serialized) for serialized in doc_generators.generate_serialized_docs("20mb", 2)] == [{"values": list(range(10))}] * 2
+
+
+def test_get_generator():
+    assert doc_generators.get_generator("four_k") is doc_generators.four_k
+    assert doc_generators.get_generator(None) is doc_generators.simple
+
+
+def test_create_bulk_docs_is_reproducible(monkeypatch):
+    saved = []
+    monkeypatch.setattr(Database, "saveDocuments", lambda self, db, docs: saved.append(docs))
+    db = Database("http://localhost:8080")
+
+    for _ in range(2):
+        db.create_bulk_docs(3, "doc", "@1", channels=["ABC"], generator="simple_user", id_start_num=5, seed_value=42)
+    for docs in saved:
+        for doc in docs.values():
+            doc.pop("date_time_added")
+
+    assert sorted(saved[0]) == ["doc_5", "doc_6", "doc_7"]
+    assert saved[0]["doc_5"]["channels"] == ["ABC"]
+    assert saved[0] == saved[1]
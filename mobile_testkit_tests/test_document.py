@@ -1,6 +1,7 @@
 import pytest
 from keywords import document
 from keywords import attachment
+from keywords.exceptions import DocumentError
 
 ATTACHMENT_ONE = attachment.generate_png_100_100()
 ATTACHMENT_TWO = attachment.generate_png_100_100()
@@ -51,3 +52,36 @@ def test_document_attachment_not_list():
 def test_document_channels_not_list():
     with pytest.raises(TypeError):
         document.create_doc(None, None, None, None, "B")
+
+
+@pytest.mark.parametrize("vbucket_number", [0, 66, 1023])
+def test_generate_doc_ids_for_vbucket(vbucket_number):
+    doc_ids = document.generate_doc_ids_for_vbucket(vbucket_number, 100)
+    assert len(set(doc_ids)) == 100
+    assert all(document.get_vbucket_number(doc_id) == vbucket_number for doc_id in doc_ids)
+    assert document.get_vbucket_number(document.generate_doc_id_for_vbucket(vbucket_number)) == vbucket_number
+
+
+def test_generate_doc_id_for_invalid_vbucket():
+    with pytest.raises(DocumentError):
+        document.generate_doc_id_for_vbucket(1024)
+
+
+def test_vbucket_doc_id_generator_is_deterministic():
+    doc_ids = document.VBucketDocIdGenerator(seed=1).doc_ids_for_vbuckets([1, 2], 10)
+    assert doc_ids == document.VBucketDocIdGenerator(seed=1).doc_ids_for_vbuckets([1, 2], 10)
+    assert doc_ids != document.VBucketDocIdGenerator(seed=2).doc_ids_for_vbuckets([1, 2], 10)
+
+    # Never repeats ids
+    generator = document.VBucketDocIdGenerator(seed=1)
+    assert set(generator.doc_ids_for_vbucket(1, 10)).isdisjoint(generator.doc_ids_for_vbucket(1, 10))
+
+
+def test_generate_doc_ids_for_all_vbuckets():
+    doc_ids = document.generate_doc_ids_for_all_vbuckets(3)
+    assert len(set(doc_ids)) == 3 * document.NUM_VBUCKETS
+
+    # Every slice of NUM_VBUCKETS ids covers each vBucket once
+    for i in range(3):
+        vbuckets = [document.get_vbucket_number(doc_id) for doc_id in doc_ids[i * document.NUM_VBUCKETS:(i + 1) * document.NUM_VBUCKETS]]
+        assert sorted(vbuckets) == list(range(document.NUM_VBUCKETS))
@@ -0,0 +1,87 @@
+import json
+import time
+
+import pytest
+from requests.exceptions import ConnectionError
+
+import libraries.utilities.log_expvars as log_expvars
+from libraries.utilities.log_expvars import ExpvarCollector
+from libraries.utilities.log_expvars import iter_expvar_samples
+
+
+@pytest.fixture
+def endpoints(monkeypatch):
+    """ Fake expvar endpoints that answer 'num_samples' times (None for forever) and then go away """
+
+    endpoints = {}
+
+    def get_expvars(endpoint):
+        num_samples = endpoints[endpoint]
+        if num_samples == 0:
+            raise ConnectionError("{} is down".format(endpoint))
+        if num_samples is not None:
+            endpoints[endpoint] = num_samples - 1
+        time.sleep(0.05)
+        return {"memstats": {"Alloc": 1, "Sys": 2}}
+
+    monkeypatch.setattr(log_expvars, "get_expvars", get_expvars)
+    return endpoints
+
+
+def test_collect_until_gateload_finishes(tmpdir, endpoints):
+    endpoints.update({"lg1:9876": 3, "sg1:4985": None, "sg2:4985": None})
+    collector = ExpvarCollector(str(tmpdir), ["lg1:9876"], ["sg1:4985", "sg2:4985"], interval=0.1)
+
+    assert collector.run() is True
+
+    gateload_samples = list(iter_expvar_samples(collector.gateload_file_path))
+    sg_samples = list(iter_expvar_samples(collector.sync_gateway_file_path))
+    assert len(gateload_samples) == 3
+    assert len(sg_samples) == 8
+
+    # Samples of a tick share the tick timestamp
+    timestamps = [timestamp for timestamp, _, _ in sg_samples]
+    assert timestamps[0] == timestamps[1]
+    assert timestamps[0] == gateload_samples[0][0]
+    assert sorted(set(endpoint for _, endpoint, _ in sg_samples)) == ["sg1:4985", "sg2:4985"]
+
+    # One JSON object per line
+    with open(collector.sync_gateway_file_path) as f:
+        assert len([json.loads(line) for line in f]) == 8
+
+
+def test_collect_sync_gateway_down(tmpdir, endpoints):
+    endpoints.update({"lg1:9876": None, "sg1:4985": 2})
+    collector = ExpvarCollector(str(tmpdir), ["lg1:9876"], ["sg1:4985"], interval=0.1)
+    assert collector.run() is False
+
+
+def test_scrapes_are_concurrent(tmpdir, endpoints):
+    sgs = ["sg{}:4985".format(i) for i in range(10)]
+    endpoints.update(dict((sg, 1) for sg in sgs))
+    endpoints["lg1:9876"] = None
+    collector = ExpvarCollector(str(tmpdir), ["lg1:9876"], sgs, interval=0.1)
+
+    start = time.time()
+    collector.run()
+
+    # 2 ticks of 11 endpoints, that each take 50ms
+    assert time.time() - start < 0.5
+
+
+def test_recent_samples_ring(tmpdir, endpoints):
+    endpoints.update({"lg1:9876": 5, "sg1:4985": None})
+    collector = ExpvarCollector(str(tmpdir), ["lg1:9876"], ["sg1:4985"], interval=0.01, ring_size=4)
+    collector.run()
+
+    assert len(collector.recent_samples()) == 4
+    assert [sample["endpoint"] for sample in collector.recent_samples("sg1:4985")] == ["sg1:4985"] * 3
+
+
+def test_iter_expvar_samples_legacy_file(tmpdir):
+    legacy_file = tmpdir.join("sync_gateway_expvars.json")
+    legacy_file.write(json.dumps({
+        "2017-01-01 00:00:00.000001": {"endpoint": "sg1:4985", "expvars": {"a": 1}},
+    }))
+
+    assert list(iter_expvar_samples(str(legacy_file))) == [("2017-01-01 00:00:00.000001", "sg1:4985", {"a": 1})]
@@ -0,0 +1,231 @@
+import json
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+from requests.exceptions import HTTPError
+
+import keywords.MobileRestClient
+from keywords.constants import Platform
+from keywords.constants import ServerType
+from keywords.MobileRestClient import MobileRestClient
+from keywords.MobileRestClient import ServerDescriptor
+from keywords.MobileRestClient import chunk_serialized_docs
+from keywords.AsyncMobileRestClient import AsyncMobileRestClient
+
+
+class MockResponse:
+
+    def __init__(self, url, resp_obj, status_code=200):
+        self.url = url
+        self.resp_obj = resp_obj
+        self.status_code = status_code
+        self.headers = {}
+        self.text = ""
+        self.request = self
+
+    @property
+    def method(self):
+        return "GET"
+
+    @property
+    def body(self):
+        return None
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError(self.status_code)
+
+    def json(self):
+        return self.resp_obj
+
+
+class MockSession:
+
+    def __init__(self, resp_obj):
+        self.resp_obj = resp_obj
+        self.num_gets = 0
+
+    def get(self, url, **kwargs):
+        self.num_gets += 1
+        return MockResponse(url, self.resp_obj)
+
+
+@pytest.mark.parametrize("resp_obj, expected_server_type, expected_platform, expected_version", [
+    ({"couchdb": "Welcome", "vendor": {"name": "Couchbase Sync Gateway", "version": "2.1"}, "version": "Couchbase Sync Gateway/2.1.0(121;5d31e1f)"},
+     ServerType.syncgateway, Platform.centos, "2.1"),
+    ({"couchdb": "Welcome", "vendor": {"name": "Couchbase Lite (Objective-C)", "version": "1.4.0"}, "version": "1.4.0"},
+     ServerType.listener, Platform.macosx, "1.4.0"),
+    ({"couchdb": "Welcome", "vendor": {"name": "Couchbase Lite (C#)", "version": "1.4.0"}, "version": "1.4.0"},
+     ServerType.listener, Platform.net, "1.4.0"),
+    ({"CBLite": "Welcome", "couchdb": "Welcome", "version": "1.4.0-1"},
+     ServerType.listener, Platform.android, "1.4.0-1"),
+    ({"couchdb": "Welcome", "vendor": {"name": "Unknown"}, "version": "1.0"},
+     None, None, "1.0")
+])
+def test_server_descriptor_from_response(resp_obj, expected_server_type, expected_platform, expected_version):
+    descriptor = ServerDescriptor.from_response("http://localhost:4984", resp_obj)
+    assert descriptor.server_type == expected_server_type
+    assert descriptor.platform == expected_platform
+    assert descriptor.version == expected_version
+
+
+def test_server_descriptor_cache():
+    client = MobileRestClient()
+    client._session = MockSession({"couchdb": "Welcome", "vendor": {"name": "Couchbase Sync Gateway", "version": "2.1"}})
+
+    assert client.get_server_type("http://localhost:4984") == ServerType.syncgateway
+    assert client.get_server_platform("http://localhost:4984/") == Platform.centos
+    assert client._session.num_gets == 1
+    assert client.get_server_descriptor_cache_stats() == {"hits": 1, "misses": 1, "size": 1}
+
+    client.invalidate_server_descriptors("http://localhost:4984")
+    assert client.get_server_type("http://localhost:4984") == ServerType.syncgateway
+    assert client._session.num_gets == 2
+
+    client.refresh_server_descriptor("http://localhost:4984")
+    assert client._session.num_gets == 3
+    assert client.get_server_descriptor_cache_stats()["size"] == 1
+
+
+def test_server_descriptor_unsupported():
+    client = MobileRestClient()
+    client._session = MockSession({"couchdb": "Welcome", "vendor": {"name": "Unknown"}})
+
+    with pytest.raises(ValueError):
+        client.get_server_type("http://localhost:4984")
+
+    with pytest.raises(ValueError):
+        client.get_server_platform("http://localhost:4984")
+
+
+def test_async_client_map():
+    with AsyncMobileRestClient(max_concurrency=4) as client:
+        client.client._session = MockSession({"couchdb": "Welcome", "vendor": {"name": "Couchbase Sync Gateway", "version": "2.1"}})
+        results = client.map("get_server_descriptor", [{"url": "http://localhost:{}".format(port)} for port in range(4984, 4994)])
+
+    assert [result.url for result in results] == ["http://localhost:{}".format(port) for port in range(4984, 4994)]
+    assert client.client.get_server_descriptor_cache_stats()["misses"] == 10
+
+
+class MockDocSession:
+    """ Returns the docs in 'doc_ids' (404 for other ids), the first docs take the longest to be returned """
+
+    def __init__(self, doc_ids):
+        self.doc_ids = doc_ids
+        self.completed = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        doc_id = url.split("/")[-1]
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        if doc_id in self.doc_ids:
+            time.sleep(0.01 * (len(self.doc_ids) - self.doc_ids.index(doc_id)))
+        with self.lock:
+            self.in_flight -= 1
+            self.completed.append(doc_id)
+
+        if doc_id not in self.doc_ids:
+            return MockResponse(url, {"error": "not_found"}, status_code=404)
+        return MockResponse(url, {"_id": doc_id, "_rev": "1-abc"})
+
+
+def test_async_client_keyword():
+    doc_ids = ["doc_{}".format(i) for i in range(8)]
+
+    with AsyncMobileRestClient(max_concurrency=4) as client:
+        client.client._session = MockDocSession(doc_ids)
+        futures = [client.get_doc("http://localhost:4984", "db", doc_id) for doc_id in doc_ids]
+        assert all(isinstance(future, Future) for future in futures)
+        docs = client.wait(futures)
+
+        # Completed out of order, returned in request order
+        assert client.client._session.completed != doc_ids
+        assert [doc["_id"] for doc in docs] == doc_ids
+        assert client.client._session.max_in_flight == 4
+
+        docs = client.map("get_doc", [{"url": "http://localhost:4984", "db": "db", "doc_id": doc_id} for doc_id in reversed(doc_ids)])
+        assert [doc["_id"] for doc in docs] == list(reversed(doc_ids))
+
+        with pytest.raises(HTTPError):
+            client.wait([client.get_doc("http://localhost:4984", "db", "doc_0"), client.get_doc("http://localhost:4984", "db", "missing")])
+
+
+class MockBulkDocsSession(MockSession):
+    """ Fails the first write of every doc with a 503 """
+
+    def __init__(self):
+        MockSession.__init__(self, {"couchdb": "Welcome", "vendor": {"name": "Couchbase Sync Gateway", "version": "2.1"}})
+        self.attempted = set()
+        self.num_posts = 0
+
+    def post(self, url, data=None, **kwargs):
+        self.num_posts += 1
+        doc_resps = []
+        for doc in json.loads(data)["docs"]:
+            if doc["_id"] in self.attempted:
+                doc_resps.append({"id": doc["_id"], "rev": "1-abc"})
+            else:
+                self.attempted.add(doc["_id"])
+                doc_resps.append({"id": doc["_id"], "error": "Service Unavailable", "status": 503})
+        return MockResponse(url, doc_resps)
+
+
+def test_chunk_serialized_docs():
+    docs = ({"_id": "doc_{}".format(i), "content": "x" * 10} for i in range(10))
+    chunks = list(chunk_serialized_docs(docs, chunk_size=4, max_chunk_bytes=100))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 2, 2, 2]
+    assert all(json.loads(serialized_doc) == doc for chunk in chunks for doc, serialized_doc in chunk)
+
+    chunks = list(chunk_serialized_docs(({"_id": str(i)} for i in range(10)), chunk_size=4, max_chunk_bytes=1000))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+
+
+def test_add_bulk_docs_chunked():
+    client = MobileRestClient()
+    client._session = MockBulkDocsSession()
+
+    docs = ({"_id": "doc_{}".format(i)} for i in range(25))
+    results = list(client.add_bulk_docs_chunked("http://localhost:4984", "db", docs, chunk_size=10, max_in_flight=2))
+
+    assert sorted(result["chunk"] for result in results) == [0, 1, 2]
+    assert sum(len(result["docs"]) for result in results) == 25
+    assert all(not result["errors"] and result["attempts"] == 2 for result in results)
+    assert client._session.num_posts == 6
+
+
+class MockTruncatedBulkDocsSession(MockSession):
+    """ Only answers for the first 'max_resps' docs of every request """
+
+    def __init__(self, max_resps):
+        MockSession.__init__(self, {"couchdb": "Welcome", "vendor": {"name": "Couchbase Sync Gateway", "version": "2.1"}})
+        self.max_resps = max_resps
+        self.num_posts = 0
+
+    def post(self, url, data=None, **kwargs):
+        self.num_posts += 1
+        docs = json.loads(data)["docs"][:self.max_resps]
+        return MockResponse(url, [{"id": doc["_id"], "rev": "1-abc"} for doc in docs])
+
+
+def test_add_bulk_docs_chunked_truncated_response(monkeypatch):
+    monkeypatch.setattr(keywords.MobileRestClient.time, "sleep", lambda seconds: None)
+    client = MobileRestClient()
+    client._session = MockTruncatedBulkDocsSession(max_resps=4)
+
+    docs = ({"_id": "doc_{}".format(i)} for i in range(10))
+    result = list(client.add_bulk_docs_chunked("http://localhost:4984", "db", docs, chunk_size=10))[0]
+
+    # The docs without a response are resent
+    assert len(result["docs"]) == 10 and result["attempts"] == 3
+
+    client._session = MockTruncatedBulkDocsSession(max_resps=1)
+    docs = ({"_id": "doc_{}".format(i)} for i in range(10))
+    result = list(client.add_bulk_docs_chunked("http://localhost:4984", "db", docs, chunk_size=10, max_retries=2))[0]
+    assert len(result["docs"]) == 3
+    assert [error["id"] for error in result["errors"]] == ["doc_{}".format(i) for i in range(3, 10)]
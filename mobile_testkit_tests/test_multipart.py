@@ -0,0 +1,107 @@
+import base64
+import gzip
+import io
+import json
+
+import pytest
+
+from keywords import multipart
+from keywords.exceptions import RestError
+from keywords.MobileRestClient import parse_multipart_response
+
+BOUNDARY = "5570ab847be212079e2b05bbbfa023da25b07712bda36aec6481bca024f3"
+
+
+def gzip_bytes(data):
+    out = io.BytesIO()
+    with gzip.GzipFile(fileobj=out, mode="wb") as f:
+        f.write(data)
+    return out.getvalue()
+
+
+def build_body(parts, boundary=BOUNDARY, newline=b"\r\n"):
+    body = b""
+    for headers, part_body in parts:
+        body += b"--" + boundary.encode("utf-8") + newline
+        for header in headers:
+            body += header.encode("utf-8") + newline
+        body += newline + part_body + newline
+    body += b"--" + boundary.encode("utf-8") + b"--" + newline
+    return body
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+DOC_ONE = {"_id": "doc_0", "_rev": "1-abc", "content": "--not-a-boundary--"}
+DOC_TWO = {"_id": "doc_1", "_rev": "1-def"}
+ERROR = {"id": "doc_2", "error": "not_found", "reason": "missing", "status": 404}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 100000])
+@pytest.mark.parametrize("newline", [b"\r\n", b"\n"])
+def test_iter_multipart_docs(chunk_size, newline):
+    body = build_body([
+        (["Content-Type: application/json"], json.dumps(DOC_ONE).encode("utf-8")),
+        (["Content-Type: application/json"], json.dumps(DOC_TWO).encode("utf-8")),
+        (["Content-Type: application/json"], json.dumps(ERROR).encode("utf-8"))
+    ], newline=newline)
+
+    docs = list(multipart.iter_multipart_docs(chunked(body, chunk_size), BOUNDARY))
+    assert docs == [DOC_ONE, DOC_TWO, ERROR]
+
+
+def test_iter_multipart_docs_gzip_part():
+    body = build_body([
+        (["Content-Type: application/json", "Content-Encoding: gzip"], gzip_bytes(json.dumps(DOC_ONE).encode("utf-8"))),
+    ])
+
+    docs = list(multipart.iter_multipart_docs(chunked(body, 16), BOUNDARY))
+    assert docs == [DOC_ONE]
+
+
+def test_iter_multipart_docs_attachments():
+    att_data = b"\x89PNG--\r\n" + b"\x00" * 100
+    doc = {"_id": "att_doc", "_rev": "1-abc", "_attachments": {"att.png": {"follows": True, "length": len(att_data)}}}
+    related_body = build_body([
+        (["Content-Type: application/json"], json.dumps(doc).encode("utf-8")),
+        (["Content-Type: image/png", 'Content-Disposition: attachment; filename="att.png"'], att_data)
+    ], boundary="related_boundary")
+    body = build_body([
+        (['Content-Type: multipart/related; boundary="related_boundary"'], related_body),
+        (["Content-Type: application/json"], json.dumps(DOC_TWO).encode("utf-8"))
+    ])
+
+    docs = list(multipart.iter_multipart_docs(chunked(body, 13), BOUNDARY))
+    assert len(docs) == 2
+    assert docs[0]["_attachments"]["att.png"]["data"] == base64.b64encode(att_data).decode("ascii")
+    assert "follows" not in docs[0]["_attachments"]["att.png"]
+    assert docs[1] == DOC_TWO
+
+
+def test_iter_multipart_docs_truncated():
+    body = build_body([(["Content-Type: application/json"], json.dumps(DOC_ONE).encode("utf-8"))])
+    with pytest.raises(RestError):
+        list(multipart.iter_multipart_docs([body[:-len(BOUNDARY) - 10]], BOUNDARY))
+
+
+@pytest.mark.parametrize("content_type, expected_boundary", [
+    ('multipart/mixed; boundary="{}"'.format(BOUNDARY), BOUNDARY),
+    ("multipart/related; boundary={}".format(BOUNDARY), BOUNDARY)
+])
+def test_get_boundary(content_type, expected_boundary):
+    assert multipart.get_boundary(content_type) == expected_boundary
+
+
+def test_get_boundary_not_multipart():
+    with pytest.raises(RestError):
+        multipart.get_boundary("application/json")
+
+
+def test_parse_multipart_response_text():
+    body = build_body([
+        (["Content-Type: application/json"], json.dumps(DOC_ONE).encode("utf-8")),
+        (["Content-Type: application/json"], json.dumps(DOC_TWO).encode("utf-8"))
+    ])
+    assert parse_multipart_response(body.decode("utf-8")) == {"rows": [DOC_ONE, DOC_TWO]}
@@ -0,0 +1,173 @@
+import json
+import threading
+
+import pytest
+
+import keywords.n1qlcache
+from keywords.exceptions import CBServerError
+from keywords.n1qlcache import BUCKET_FINGERPRINT_QUERY
+from keywords.n1qlcache import N1QLReferenceCache
+from keywords.n1qlcache import ReferenceResult
+from keywords.n1qlcache import normalize_n1ql
+
+
+class MockRequest:
+
+    def __init__(self, statement):
+        self.method = "POST"
+        self.url = "http://192.168.33.10:8093/query/service"
+        self.headers = {}
+        self.body = "statement={}".format(statement)
+
+
+class MockResponse:
+
+    def __init__(self, statement, status_code, content):
+        self.request = MockRequest(statement)
+        self.status_code = status_code
+        self.content = content
+        self.text = json.dumps(content)
+
+    def json(self):
+        return self.content
+
+
+class MockQuerySession:
+    """ Returns the rows of 'results' for the known statements """
+
+    def __init__(self, results=None):
+        self.results = results if results is not None else RESULTS
+        self.statements = []
+        self.lock = threading.Lock()
+
+    def post(self, url, data=None, timeout=None):
+        statement = data["statement"]
+        with self.lock:
+            self.statements.append(statement)
+        if statement not in self.results:
+            return MockResponse(statement, 400, {"status": "errors", "errors": [{"msg": "syntax error"}]})
+        return MockResponse(statement, 200, {"status": "success", "results": self.results[statement]})
+
+
+AIRLINES = 'select meta().id, name from `travel-sample` where type="airline" limit 2'
+HOTELS = 'select meta().id from `travel-sample` where type="hotel" limit 2'
+RESULTS = {
+    AIRLINES: [{"id": "airline_10", "name": "40-Mile Air"}, {"id": "airline_1191", "name": "Air Austral"}],
+    HOTELS: [{"id": "hotel_10025"}, {"id": "hotel_10026"}]
+}
+
+
+@pytest.fixture
+def cache_dir(tmpdir):
+    return str(tmpdir.join("n1ql_reference_cache"))
+
+
+def create_cache(cache_dir, session, server_version="6.0.0-1693", fingerprint=31591):
+    return N1QLReferenceCache("http://192.168.33.10:8093/query/service", server_version, "travel-sample", fingerprint,
+                              cache_dir=cache_dir, session=session)
+
+
+def test_normalize_n1ql():
+    assert normalize_n1ql('select  meta().id\n  from `travel-sample`   where name = "a  b" ;') == 'select meta().id from `travel-sample` where name = "a  b"'
+    assert normalize_n1ql("select `my  bucket`.* from `my  bucket` where x='  '") == "select `my  bucket`.* from `my  bucket` where x='  '"
+
+
+def test_reference_result():
+    result = ReferenceResult([{"id": "a", "geo": {"lat": 10.0, "lon": 2.5}}, {"id": "b"}, {"id": "b"}])
+
+    assert result.matches([{"id": "b"}, {"id": "a", "geo": {"lon": 2.5, "lat": 10}}, {"id": "b"}])
+    assert not result.matches([{"id": "b"}, {"id": "a", "geo": {"lon": 2.5, "lat": 10}}, {"id": "c"}])
+    assert not result.matches([{"id": "a", "geo": {"lon": 2.5, "lat": 10}}, {"id": "b"}])
+    assert {"id": "b"} in result
+    assert {"id": "c"} not in result
+    assert "Missing: " in result.describe_mismatch([{"id": "a"}])
+
+    ids = ReferenceResult([{"id": "a"}, {"id": "b"}]).column("id")
+    assert ids.matches(["b", "a"])
+    assert len(ids) == 2
+
+
+def test_results_are_persisted(cache_dir):
+    session = MockQuerySession(RESULTS)
+    cache = create_cache(cache_dir, session)
+
+    result = cache.get_reference_result(AIRLINES)
+    assert result.matches(RESULTS[AIRLINES])
+    # Same statement, formatted differently
+    assert cache.get_reference_result(AIRLINES.replace(" from", "\n    from")) is result
+    assert session.statements == [AIRLINES]
+
+    # Another run
+    session = MockQuerySession(RESULTS)
+    cache = create_cache(cache_dir, session)
+    assert cache.get_reference_result(AIRLINES).matches(RESULTS[AIRLINES])
+    assert session.statements == []
+    assert cache.num_hits == 1
+
+    # Another server version or bucket content
+    create_cache(cache_dir, session, server_version="6.5.0-4960").get_reference_result(AIRLINES)
+    create_cache(cache_dir, session, fingerprint=31592).get_reference_result(AIRLINES)
+    assert session.statements == [AIRLINES, AIRLINES]
+
+    with pytest.raises(CBServerError):
+        cache.get_reference_result("select from")
+
+
+def test_warm_and_clear(cache_dir):
+    session = MockQuerySession(RESULTS)
+    cache = create_cache(cache_dir, session)
+    cache.get_reference_result(AIRLINES)
+    cache.get_reference_result(HOTELS)
+
+    # The manifest statements are run again for a new server version
+    session = MockQuerySession(RESULTS)
+    cache = create_cache(cache_dir, session, server_version="6.5.0-4960")
+    assert cache.warm(max_workers=2) == 2
+    assert sorted(session.statements) == sorted([AIRLINES, HOTELS])
+    assert cache.warm() == 0
+
+    cache.get_reference_result(HOTELS)
+    assert len(session.statements) == 2
+
+    cache.clear()
+    assert cache.warm() == 0
+    cache.get_reference_result(HOTELS)
+    assert len(session.statements) == 3
+
+
+def test_prune(cache_dir):
+    session = MockQuerySession(RESULTS)
+    create_cache(cache_dir, session).get_reference_result(AIRLINES)
+    create_cache(cache_dir, session, fingerprint=31592).get_reference_result(AIRLINES)
+
+    cache = create_cache(cache_dir, session, fingerprint=31593)
+    assert cache.prune() == 2
+    assert cache.warm() == 1
+    assert create_cache(cache_dir, session, fingerprint=31593).prune() == 0
+
+
+class MockCouchbaseServer:
+
+    def __init__(self, url):
+        self.host = "192.168.33.10"
+        self.cbs_ssl = False
+
+
+def test_bucket_fingerprint(cache_dir, monkeypatch):
+    monkeypatch.setattr(keywords.n1qlcache, "CouchbaseServer", MockCouchbaseServer)
+    monkeypatch.setattr(keywords.n1qlcache, "get_server_version", lambda host, cbs_ssl: "6.0.0-1693")
+    monkeypatch.setattr(keywords.n1qlcache, "Session", MockQuerySession)
+    fingerprint_query = BUCKET_FINGERPRINT_QUERY.format("travel-sample")
+
+    def fingerprint(docs):
+        RESULTS[fingerprint_query] = docs
+        try:
+            return keywords.n1qlcache.get_reference_cache("http://192.168.33.10:8091", "travel-sample", cache_dir=cache_dir).bucket_fingerprint
+        finally:
+            del RESULTS[fingerprint_query]
+
+    docs = [["airline_10", {"name": "40-Mile Air", "id": 10}], ["airline_1191", {"name": "Air Austral", "id": 1191}]]
+    # A reloaded bucket returns the same docs, in any order and with any key order
+    assert fingerprint(docs) == fingerprint([["airline_1191", {"id": 1191.0, "name": "Air Austral"}], docs[0]])
+    # Same number of docs, one of them was updated
+    assert fingerprint(docs) != fingerprint([docs[0], ["airline_1191", {"name": "Air Austral", "id": 1192}]])
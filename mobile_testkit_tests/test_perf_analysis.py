@@ -0,0 +1,123 @@
+import datetime
+import json
+
+import pytest
+
+from libraries.utilities.perf_analysis import compare_to_baseline
+from libraries.utilities.perf_analysis import load_expvar_frames
+from libraries.utilities.perf_analysis import summarize_run
+from libraries.utilities.perf_analysis import write_report
+from libraries.utilities.perf_analysis import SYNC_GATEWAY_COLUMNS
+
+START = datetime.datetime(2017, 1, 1)
+
+
+def timestamp(secs):
+    return (START + datetime.timedelta(seconds=secs)).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def write_samples(file_path, samples):
+    with open(file_path, "w") as f:
+        for secs, endpoint, expvars in samples:
+            f.write(json.dumps({"timestamp": timestamp(secs), "endpoint": endpoint, "expvars": expvars}) + "\n")
+
+
+@pytest.fixture
+def run(tmpdir):
+    gateload_file = str(tmpdir.join("gateload_expvars.jsonl"))
+    sync_gateway_file = str(tmpdir.join("sync_gateway_expvars.jsonl"))
+
+    # 100 docs/s pushed, 50 docs/s pulled, one sample every 10 seconds for 10 minutes
+    write_samples(gateload_file, [
+        (secs, "lg1:9876", {"gateload": {
+            "total_doc_pushed": secs * 100,
+            "total_doc_pulled": secs * 50,
+            "ops": {"PushToSubscriberInteractive": {"p50": 1e8, "p95": 2e8, "p99": 5e8}}
+        }})
+        for secs in range(0, 601, 10)
+    ])
+
+    # Alloc grows 1MB per minute, 10ms GC pause per 10 seconds. sg2 samples are written out of order
+    write_samples(sync_gateway_file, [
+        (secs, sg, {"memstats": {"Alloc": secs / 60.0 * 1024 * 1024, "Sys": 1e9, "PauseTotalNs": secs * 1e6, "NumGC": secs / 10}})
+        for sg in ["sg1:4985", "sg2:4985"] for secs in (range(0, 601, 10) if sg == "sg1:4985" else range(600, -1, -10))
+    ])
+
+    machine_stats_folder = tmpdir.mkdir("perf_logs")
+    machine_stats_folder.mkdir("sg1").join("cpu_stats.json").write(json.dumps(dict(
+        (timestamp(secs), {"cpu_percent": 50.0 + secs % 20, "virtual_memory": {"used": 1e9}}) for secs in range(0, 601, 10)
+    )))
+
+    return gateload_file, sync_gateway_file, str(machine_stats_folder)
+
+
+def test_load_expvar_frames(run):
+    frames = load_expvar_frames(run[1], SYNC_GATEWAY_COLUMNS)
+    assert sorted(frames) == ["sg1:4985", "sg2:4985"]
+    assert len(frames["sg2:4985"]["time"]) == 61
+
+    # Sorted by time
+    assert frames["sg2:4985"]["time"][-1] - frames["sg2:4985"]["time"][0] == 600
+    assert frames["sg2:4985"]["alloc"][0] == 0
+
+
+def test_summarize_run(run):
+    summary = summarize_run(run[0], run[1], run[2], window_secs=300)
+
+    gateload = summary["gateload"]["lg1:9876"]
+    assert gateload["docs_pushed_per_sec"] == pytest.approx(100)
+    assert gateload["docs_pulled_per_sec"] == pytest.approx(50)
+    assert gateload["latency_p95_secs"] == pytest.approx(0.2)
+    assert gateload["latency_p99_secs"] == pytest.approx(0.5)
+    assert gateload["docs_failed_to_push"] == 0
+
+    # 0-299s, 300-599s and the last sample
+    assert [window["start_offset_secs"] for window in gateload["windows"]] == [0, 300, 600]
+    assert gateload["windows"][0]["docs_pushed_per_sec"] == pytest.approx(100)
+
+    sg = summary["sync_gateway"]["sg1:4985"]
+    assert sg["alloc_growth_bytes_per_hour"] == pytest.approx(60 * 1024 * 1024)
+    assert sg["gc_pause_secs"] == pytest.approx(0.6)
+    assert sg["gc_count"] == 60
+    assert sg["gc_pause_fraction"] == pytest.approx(0.001)
+
+    cpu = summary["machine_stats"]["sg1"]
+    assert cpu["cpu_percent_max"] == 60
+    assert 50 < cpu["cpu_percent_mean"] < 60
+
+    # Machine readable
+    json.dumps(summary)
+
+
+def test_compare_to_baseline(run, tmpdir):
+    baseline = summarize_run(run[0], run[1], run[2])
+    assert compare_to_baseline(baseline, baseline) == []
+
+    # 20% slower push throughput
+    summary = json.loads(json.dumps(baseline))
+    summary["gateload"]["lg1:9876"]["docs_pushed_per_sec"] = 80.0
+    regressions = compare_to_baseline(summary, baseline)
+    assert [(regression["node"], regression["metric"]) for regression in regressions] == [("lg1:9876", "docs_pushed_per_sec")]
+    assert regressions[0]["change"] == pytest.approx(0.2)
+
+    # A run on another cluster is compared by role and index
+    other_cluster = json.loads(json.dumps(summary))
+    for section in ["gateload", "sync_gateway", "machine_stats"]:
+        other_cluster[section] = dict(("10.0.0.{}".format(i), other_cluster[section][node]) for i, node in enumerate(sorted(other_cluster[section])))
+    regressions = compare_to_baseline(other_cluster, baseline)
+    assert [(regression["node"], regression["baseline_node"]) for regression in regressions] == [("10.0.0.0", "lg1:9876")]
+
+    # Nothing to compare must not pass silently
+    with pytest.raises(ValueError):
+        compare_to_baseline({"gateload": summary["gateload"]}, {"sync_gateway": baseline["sync_gateway"]})
+
+    # Within a custom threshold
+    thresholds = {"docs_pushed_per_sec": {"higher_is_better": True, "max_regression": 0.25}}
+    assert compare_to_baseline(summary, baseline, thresholds) == []
+
+    report_file = str(tmpdir.join("perf_summary.json"))
+    write_report(report_file, summary, regressions)
+    with open(report_file) as f:
+        report = json.load(f)
+    assert report["passed"] is False
+    assert report["regressions"][0]["metric"] == "docs_pushed_per_sec"
@@ -0,0 +1,228 @@
+import os
+import threading
+import time
+
+import pytest
+
+import keywords.remoteexecutor
+from keywords.exceptions import RemoteCommandError
+from keywords.remoteexecutor import RemoteExecutor
+from keywords.remoteexecutor import SSHConnectionPool
+from keywords.remoteexecutor import execute_on_hosts
+
+
+class MockChannel:
+    """ Channel that returns 'stdout_chunks' / 'stderr_chunks' and then exits with 'status' """
+
+    def __init__(self, stdout_chunks, stderr_chunks, status):
+        self.stdout_chunks = list(stdout_chunks)
+        self.stderr_chunks = list(stderr_chunks)
+        self.status = status
+        self.closed = False
+        # Always readable, only used by select()
+        self._read_fd, self._write_fd = os.pipe()
+        os.write(self._write_fd, b"x")
+
+    def fileno(self):
+        return self._read_fd
+
+    def recv_ready(self):
+        return len(self.stdout_chunks) > 0
+
+    def recv(self, size):
+        return self.stdout_chunks.pop(0)
+
+    def recv_stderr_ready(self):
+        return len(self.stderr_chunks) > 0
+
+    def recv_stderr(self, size):
+        return self.stderr_chunks.pop(0)
+
+    def exit_status_ready(self):
+        return not self.stdout_chunks and not self.stderr_chunks
+
+    def recv_exit_status(self):
+        return self.status
+
+    def close(self):
+        self.closed = True
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+
+
+class MockStream:
+
+    def __init__(self, channel=None):
+        self.channel = channel
+
+    def close(self):
+        pass
+
+
+class MockTransport:
+
+    def __init__(self):
+        self.active = True
+        self.keepalive = None
+
+    def is_active(self):
+        return self.active
+
+    def set_keepalive(self, interval):
+        self.keepalive = interval
+
+
+class MockSSHClient:
+    """ Answers every command with the output registered in 'outputs' """
+
+    connects = []
+    outputs = {}
+    # The first 'stale_connects' connections fail to start commands
+    stale_connects = 0
+
+    def __init__(self):
+        self.transport = MockTransport()
+        self.commands = []
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, host, **kwargs):
+        time.sleep(0.05)
+        MockSSHClient.connects.append(host)
+
+    def get_transport(self):
+        return self.transport
+
+    def exec_command(self, command, **kwargs):
+        if MockSSHClient.stale_connects > 0 and len(MockSSHClient.connects) <= MockSSHClient.stale_connects:
+            raise EOFError("Stale connection")
+        self.commands.append(command)
+        stdout_chunks, stderr_chunks, status = MockSSHClient.outputs.get(command, ([], [], 0))
+        channel = MockChannel(stdout_chunks, stderr_chunks, status)
+        return MockStream(), MockStream(channel), MockStream(channel)
+
+    def close(self):
+        self.transport.active = False
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    MockSSHClient.connects = []
+    MockSSHClient.outputs = {}
+    MockSSHClient.stale_connects = 0
+    monkeypatch.setattr(keywords.remoteexecutor.paramiko, "SSHClient", MockSSHClient)
+
+    pool = SSHConnectionPool(keepalive=10, idle_timeout=60)
+    monkeypatch.setattr(keywords.remoteexecutor, "ssh_connection_pool", pool)
+    yield pool
+    pool.close_all()
+
+
+def test_execute_reuses_connection(pool):
+    MockSSHClient.outputs["ls"] = ([b"a.log\r\nb.l", b"og\r\n", b"c.log"], [], 0)
+
+    for _ in range(5):
+        status, stdout, stderr = RemoteExecutor("sg1", username="user").execute("ls")
+        assert status == 0
+        assert stdout == ["a.log\r\n", "b.log\r\n", "c.log"]
+        assert stderr == []
+
+    assert MockSSHClient.connects == ["sg1"]
+    assert pool._connections[("sg1", "user")].client.transport.keepalive == 10
+
+
+def test_execute_streams_output(pool):
+    MockSSHClient.outputs["build"] = ([b"line 1\n", b"line 2\n"], [b"warning\n"], 2)
+    lines = []
+
+    status, stdout, stderr = RemoteExecutor("sg1", username="user").execute("build", on_line=lambda stream, line: lines.append((stream, line)))
+    assert status == 2
+    assert sorted(lines) == [("stderr", "warning\n"), ("stdout", "line 1\n"), ("stdout", "line 2\n")]
+
+    with pytest.raises(RemoteCommandError):
+        RemoteExecutor("sg1", username="user").must_execute("build")
+
+
+def test_execute_output_is_bounded(pool):
+    MockSSHClient.outputs["cat big.log"] = (["line {}\n".format(i).encode("utf-8") for i in range(100)], [], 0)
+
+    _, stdout, _ = RemoteExecutor("sg1", username="user").execute("cat big.log", max_output_lines=10)
+    assert stdout == ["line {}\n".format(i) for i in range(90, 100)]
+
+
+def test_reconnects_lost_connection(pool):
+    RemoteExecutor("sg1", username="user").execute("ls")
+    pool._connections[("sg1", "user")].client.transport.active = False
+    RemoteExecutor("sg1", username="user").execute("ls")
+    assert MockSSHClient.connects == ["sg1", "sg1"]
+
+
+def test_retries_stale_connection(pool):
+    MockSSHClient.stale_connects = 1
+    status, _, _ = RemoteExecutor("sg1", username="user").execute("ls")
+    assert status == 0
+    assert MockSSHClient.connects == ["sg1", "sg1"]
+
+    # Only retried once
+    MockSSHClient.stale_connects = 4
+    with pytest.raises(EOFError):
+        RemoteExecutor("sg2", username="user").execute("ls")
+    assert pool._connections.get(("sg2", "user")) is None
+
+
+def test_connection_is_closed_once_unused(pool):
+    MockSSHClient.outputs["tail"] = ([b"line 1\n", b"line 2\n"], [], 0)
+    running = iter(RemoteExecutor("sg1", username="user").start("tail"))
+    next(running)
+    connection = pool._connections[("sg1", "user")]
+
+    # The host was restarted, other commands get a new connection
+    pool.discard(connection)
+    RemoteExecutor("sg1", username="user").execute("ls")
+    replacement = pool._connections[("sg1", "user")]
+    assert replacement is not connection
+    assert connection.client.transport.active
+
+    # The running command only gives back its own connection
+    assert list(running) == [("stdout", "line 2\n")]
+    assert not connection.client.transport.active
+    assert replacement.in_use == 0
+    assert replacement.client.transport.active
+
+    replacement.last_used -= 120
+    pool.evict_idle()
+    assert not replacement.client.transport.active
+
+
+def test_evict_idle(pool):
+    RemoteExecutor("sg1", username="user").execute("ls")
+    RemoteExecutor("sg2", username="user").execute("ls")
+
+    pool._connections[("sg1", "user")].last_used -= 120
+    pool.evict_idle()
+    assert list(pool._connections) == [("sg2", "user")]
+
+
+def test_concurrent_commands_share_connection(pool):
+    threads = [threading.Thread(target=RemoteExecutor("sg1", username="user").execute, args=("ls",)) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert MockSSHClient.connects == ["sg1"]
+    assert len(pool._connections[("sg1", "user")].client.commands) == 10
+    assert pool._connections[("sg1", "user")].in_use == 0
+
+
+def test_execute_on_hosts(pool):
+    hosts = ["sg{}".format(i) for i in range(10)]
+
+    start = time.time()
+    results = execute_on_hosts(hosts, "ls", username="user")
+
+    # Connections are established in parallel
+    assert time.time() - start < 0.4
+    assert sorted(results) == hosts
+    assert all(status == 0 for status, _, _ in results.values())
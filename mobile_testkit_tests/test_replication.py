@@ -0,0 +1,158 @@
+import threading
+import time
+
+import pytest
+
+from CBLClient.Replication import Replication
+from keywords.exceptions import TimeoutError
+
+
+class MockReplicatorClient:
+    """
+    Test server client with one replicator. Status changes are scheduled with set_status_after().
+    'notifications' is False for test servers without replicator_statusSnapshot / replicator_waitForStatusChange
+    """
+
+    def __init__(self, activity_level="busy", completed=0, total=10, notifications=True):
+        self.notifications = notifications
+        self.status = {"activityLevel": activity_level, "completed": completed, "total": total, "version": 0}
+        self.condition = threading.Condition()
+        self.calls = []
+        self.unsupported_methods = set()
+
+    def set_status_after(self, delay, **status):
+        def set_status():
+            time.sleep(delay)
+            with self.condition:
+                self.status.update(status)
+                self.status["version"] += 1
+                self.condition.notify_all()
+
+        t = threading.Thread(target=set_status)
+        t.daemon = True
+        t.start()
+
+    def invokeMethod(self, method, args=None):
+        self.calls.append(method)
+        args = dict(args._args)
+        with self.condition:
+            if method in ("replicator_statusSnapshot", "replicator_waitForStatusChange") and not self.notifications:
+                raise Exception("404 Client Error: Not Found")
+            elif method == "replicator_statusSnapshot":
+                return dict(self.status)
+            elif method == "replicator_waitForStatusChange":
+                deadline = time.time() + args["timeout"] / 1000.0
+                while self.status["version"] <= args["version"] and time.time() < deadline:
+                    self.condition.wait(deadline - time.time())
+                return dict(self.status)
+            elif method == "replicator_getActivityLevel":
+                return self.status["activityLevel"]
+            elif method == "replicator_getCompleted":
+                return self.status["completed"]
+            elif method == "replicator_getTotal":
+                return self.status["total"]
+            elif method == "replicator_getError":
+                return self.status.get("error")
+        raise Exception("Unexpected method: {}".format(method))
+
+
+def make_replication(client):
+    replication = Replication("http://localhost:8080")
+    replication._client = client
+    return replication
+
+
+def test_wait_returns_when_idle():
+    client = MockReplicatorClient()
+    client.set_status_after(0.2, activityLevel="idle", completed=10)
+    replication = make_replication(client)
+
+    start = time.time()
+    status = replication.wait_for_replicator_idle("@1", timeout=10, sleep_time=2)
+
+    # Notified of the change rather than waiting for the next poll
+    assert time.time() - start < 1
+    assert status["activityLevel"] == "idle"
+    assert client.calls == ["replicator_statusSnapshot", "replicator_waitForStatusChange"]
+
+
+def test_wait_for_all_changes_to_complete():
+    client = MockReplicatorClient()
+    client.set_status_after(0.1, activityLevel="idle", completed=5)
+    client.set_status_after(0.3, completed=10)
+    replication = make_replication(client)
+
+    status = replication.wait_for_replicator_idle("@1", timeout=10)
+    assert status["completed"] == 10
+
+
+def test_wait_stopped():
+    client = MockReplicatorClient(activity_level="stopped", completed=10)
+    assert make_replication(client).wait_for_replicator_idle("@1", timeout=10, sleep_time=0.2)["activityLevel"] == "stopped"
+
+    client = MockReplicatorClient(activity_level="stopped", completed=5)
+    with pytest.raises(Exception) as e:
+        make_replication(client).wait_for_replicator_idle("@1", timeout=10)
+    assert "not completed" in str(e.value)
+
+
+def test_wait_error():
+    client = MockReplicatorClient()
+    client.set_status_after(0.1, error="CouchbaseLiteException{domain='CouchbaseLite', code=10401}")
+    with pytest.raises(Exception) as e:
+        make_replication(client).wait_for_replicator_idle("@1", timeout=10)
+    assert "Error while replicating" in str(e.value)
+
+
+def test_wait_timeout():
+    client = MockReplicatorClient()
+    replication = make_replication(client)
+
+    with pytest.raises(TimeoutError):
+        replication.wait_for_replicator_idle("@1", timeout=0.3)
+
+    # wait_until_replicator_idle gives up quietly like it always did
+    assert replication.wait_until_replicator_idle("@1", max_times=3, sleep_time=0.1) is None
+
+
+def test_wait_polls_without_notifications():
+    client = MockReplicatorClient(notifications=False)
+    client.set_status_after(0.3, activityLevel="idle", completed=10)
+    replication = make_replication(client)
+
+    start = time.time()
+    status = replication.wait_for_replicator_idle("@1", timeout=10, sleep_time=2)
+
+    # The backoff starts small, so this does not take a full 'sleep_time'
+    assert time.time() - start < 1
+    assert status["activityLevel"] == "idle"
+    # The snapshot is only tried once, then the status is read with one call per field
+    assert client.calls.count("replicator_statusSnapshot") == 1
+    assert client.calls.count("replicator_getActivityLevel") > 1
+
+
+def test_wait_settles_when_already_idle():
+    client = MockReplicatorClient(activity_level="idle", completed=10)
+    replication = make_replication(client)
+
+    # Nothing happens, the replicator is trusted after 'sleep_time'
+    start = time.time()
+    replication.wait_for_replicator_idle("@1", timeout=10, sleep_time=0.3)
+    assert 0.3 <= time.time() - start < 1
+
+    # The replicator picks up new changes after the wait started
+    client.set_status_after(0.1, activityLevel="busy")
+    client.set_status_after(0.2, activityLevel="idle", total=20, completed=20)
+    status = replication.wait_for_replicator_idle("@1", timeout=10, sleep_time=2)
+    assert status["completed"] == 20
+
+
+def test_unsupported_snapshot_is_remembered():
+    client = MockReplicatorClient(notifications=False)
+    assert "version" not in make_replication(client)._get_status("@1")
+
+    # Other wrappers of the same client skip the snapshot
+    client.calls = []
+    client.notifications = True
+    assert "version" not in make_replication(client)._get_status("@1")
+    assert "replicator_statusSnapshot" not in client.calls
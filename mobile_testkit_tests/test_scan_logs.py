@@ -1,3 +1,5 @@
+import zipfile
+
 import pytest
 from keywords.exceptions import LogScanningError
 
@@ -103,3 +105,68 @@ def test_data_race_log():
 
     error_message = str(e.value)
     assert error_message.startswith("DATA RACE found!!")
+
+
+@pytest.fixture
+def log_dir(tmpdir):
+    tmpdir.join("sg_info.log").write("2018-01-01 Starting\n2018-01-01 PANIC: boom\n2018-01-01 data race\n")
+    tmpdir.join("sg_debug.log").write("2018-01-01 all good\n")
+    tmpdir.join("empty.log").write("")
+
+    with zipfile.ZipFile(str(tmpdir.join("sgcollect.zip")), "w") as zf:
+        zf.writestr("sgcollect/sync_gateway.log", "line 1\nWARNING: Data Race detected\n" * 3 + "no newline at the end: panic")
+        zf.writestr("sgcollect/config.json", "{\"panic\": true}")
+    return tmpdir
+
+
+def test_scan_logs_reads_zip_without_extracting(log_dir):
+    with pytest.raises(LogScanningError):
+        scan_logs.scan_logs(str(log_dir), processes=1)
+
+    # Nothing extracted
+    assert sorted(path.basename for path in log_dir.listdir()) == ["empty.log", "sg_debug.log", "sg_info.log", "sgcollect.zip"]
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_scan_sources(log_dir, processes):
+    scan = scan_logs.scan_sources(scan_logs.get_log_sources(str(log_dir)), ["panic", "data race"], processes=processes)
+
+    assert scan["counts"] == {"panic": 2, "data race": 4}
+    assert scan["files"][str(log_dir.join("sg_debug.log"))] == {"panic": 0, "data race": 0}
+
+    zip_matches = [match for match in scan["matches"] if match["file"].endswith("sync_gateway.log")]
+    assert [match["pattern"] for match in zip_matches] == ["data race"] * 3 + ["panic"]
+    assert zip_matches[0]["line"] == "WARNING: Data Race detected"
+    assert zip_matches[0]["offset"] == len("line 1\nWARNING: ")
+    assert zip_matches[-1]["line"] == "no newline at the end: panic"
+
+    info_matches = [match for match in scan["matches"] if match["file"].endswith("sg_info.log")]
+    assert [(match["pattern"], match["line"]) for match in info_matches] == [("panic", "2018-01-01 PANIC: boom"), ("data race", "2018-01-01 data race")]
+
+
+def test_scan_file_limits_matches(tmpdir, monkeypatch):
+    log_file = tmpdir.join("sg.log")
+    log_file.write("panic\n" * 100)
+
+    # Files are read in chunks cut at line boundaries
+    monkeypatch.setattr(scan_logs, "SCAN_CHUNK_SIZE", 4)
+    result = scan_logs.scan_file(str(log_file), ["panic"], max_matches=5)
+    assert result["counts"] == {"panic": 100}
+    assert [match["offset"] for match in result["matches"]] == [0, 6, 12, 18, 24]
+    assert all(match["line"] == "panic" for match in result["matches"])
+
+    zip_file = str(tmpdir.join("logs.zip"))
+    with zipfile.ZipFile(zip_file, "w") as zf:
+        zf.writestr("sg.log", "panic\n" * 100)
+
+    result = scan_logs.scan_file(zip_file, ["panic"], member="sg.log", max_matches=5)
+    assert result["counts"] == {"panic": 100}
+    assert [match["offset"] for match in result["matches"]] == [0, 6, 12, 18, 24]
+    assert all(match["line"] == "panic" for match in result["matches"])
+
+
+def test_scan_for_pattern():
+    scan_logs.scan_for_pattern("mobile_testkit_tests/test_data/mock_panic_log.txt", ["nothing", "panic"])
+
+    with pytest.raises(LogScanningError):
+        scan_logs.scan_for_pattern("mobile_testkit_tests/test_data/mock_clean_log.txt", ["panic"])
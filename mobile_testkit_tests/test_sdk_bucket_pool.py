@@ -0,0 +1,114 @@
+import threading
+
+import pytest
+from couchbase.exceptions import CouchbaseError
+
+import keywords.couchbaseserver
+from keywords.couchbaseserver import CouchbaseServer
+from keywords.couchbaseserver import SdkBucketPool
+from keywords.couchbaseserver import sdk_connection_string
+
+
+class MockBucketManager:
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def n1ql_index_create_primary(self, ignore_exists=False):
+        self.bucket.primary_indexes_created += 1
+
+
+class MockBucket:
+
+    connections = []
+
+    def __init__(self, connection_str, password, lockmode):
+        self.connection_str = connection_str
+        self.healthy = True
+        self.primary_indexes_created = 0
+        MockBucket.connections.append(connection_str)
+
+    def get(self, key, quiet=False):
+        if not self.healthy:
+            raise CouchbaseError("Connection lost")
+        return None
+
+    def bucket_manager(self):
+        return MockBucketManager(self)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(keywords.couchbaseserver, "Bucket", MockBucket)
+    MockBucket.connections = []
+    pool = SdkBucketPool(health_check_interval=0)
+    monkeypatch.setattr(keywords.couchbaseserver, "sdk_bucket_pool", pool)
+    return pool
+
+
+def test_sdk_connection_string():
+    assert sdk_connection_string("192.168.33.10", "data-bucket") == "couchbase://192.168.33.10/data-bucket"
+    assert sdk_connection_string("192.168.33.10", "data-bucket", ssl=True) == "couchbases://192.168.33.10/data-bucket?ssl=no_verify"
+    assert sdk_connection_string("fe80::1", "data-bucket", ipv6=True) == "couchbase://fe80::1/data-bucket?ipv6=allow"
+    assert sdk_connection_string("fe80::1", "data-bucket", ssl=True, ipv6=True) == "couchbases://fe80::1/data-bucket?ssl=no_verify&ipv6=allow"
+
+
+def test_buckets_are_shared(pool):
+    server = CouchbaseServer("http://192.168.33.10:8091")
+    bucket = server.get_sdk_bucket("travel-sample")
+    assert CouchbaseServer("http://192.168.33.10:8091").get_sdk_bucket("travel-sample") is bucket
+    assert server.get_sdk_bucket("data-bucket") is not bucket
+    assert CouchbaseServer("https://192.168.33.10:18091").get_sdk_bucket("travel-sample") is not bucket
+    assert MockBucket.connections == [
+        "couchbase://192.168.33.10/travel-sample",
+        "couchbase://192.168.33.10/data-bucket",
+        "couchbases://192.168.33.10/travel-sample?ssl=no_verify"
+    ]
+
+    threads = [threading.Thread(target=server.get_sdk_bucket, args=("travel-sample",)) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(MockBucket.connections) == 3
+
+
+def test_unhealthy_bucket_is_reopened(pool):
+    bucket = pool.get("192.168.33.10", "travel-sample")
+    assert pool.get("192.168.33.10", "travel-sample") is bucket
+
+    bucket.healthy = False
+    reopened = pool.get("192.168.33.10", "travel-sample")
+    assert reopened is not bucket
+    assert len(MockBucket.connections) == 2
+
+    # Not checked again until the interval elapsed
+    pool.health_check_interval = 60
+    reopened.healthy = False
+    assert pool.get("192.168.33.10", "travel-sample") is reopened
+
+
+def test_invalidate(pool):
+    pool.get("192.168.33.10", "data-bucket")
+    pool.get("192.168.33.10", "travel-sample")
+    pool.get("192.168.33.11", "data-bucket")
+
+    pool.invalidate(bucket_name="data-bucket")
+    assert len(pool) == 1
+    pool.invalidate(host="192.168.33.11")
+    assert len(pool) == 1
+    pool.invalidate()
+    assert len(pool) == 0
+
+
+def test_primary_index_is_created_once(pool):
+    server = CouchbaseServer("http://192.168.33.10:8091")
+    bucket = server.get_sdk_bucket("data-bucket", primary_index=True)
+    assert server.get_sdk_bucket("data-bucket", primary_index=True) is bucket
+    assert bucket.primary_indexes_created == 1
+
+    # Dropping the handle forgets the index, the bucket may have been recreated
+    pool.invalidate(bucket_name="data-bucket")
+    bucket = server.get_sdk_bucket("data-bucket", primary_index=True)
+    assert bucket.primary_indexes_created == 1
+    assert len(MockBucket.connections) == 2
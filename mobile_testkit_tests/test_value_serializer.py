@@ -0,0 +1,68 @@
+import pytest
+
+from CBLClient.MemoryPointer import MemoryPointer
+from CBLClient.ValueSerializer import ValueSerializer
+from CBLClient.ValueSerializer import VALUE_ENCODINGS, VALUE_ENCODING_LEGACY, VALUE_ENCODING_TREE
+
+
+DOC = {
+    "name": "doc_1",
+    "count": 3,
+    "score": 1.5,
+    "active": True,
+    "deleted": None,
+    "channels": ["ABC", "NBC", [1, 2]],
+    "address": {"city": "Mountain View", "geo": {"lat": 37.5, "lon": -122.5}}
+}
+
+
+@pytest.mark.parametrize("encoding", VALUE_ENCODINGS)
+def test_round_trip(encoding):
+    assert ValueSerializer.deserialize(ValueSerializer.serialize(DOC, encoding)) == DOC
+    assert ValueSerializer.deserialize(ValueSerializer.serialize([DOC, DOC], encoding)) == [DOC, DOC]
+    assert ValueSerializer.deserialize(ValueSerializer.serialize({}, encoding)) == {}
+
+
+@pytest.mark.parametrize("value, serialized", [
+    (None, "null"),
+    ("abc", "\"abc\""),
+    (True, "true"),
+    (False, "false"),
+    (5, "I5"),
+    (5000000000, "L5000000000"),
+    (1.5, "F1.5"),
+])
+def test_scalars(value, serialized):
+    # Scalars are encoded the same way in every encoding
+    for encoding in VALUE_ENCODINGS:
+        assert ValueSerializer.serialize(value, encoding) == serialized
+    assert ValueSerializer.deserialize(serialized) == value
+
+
+def test_legacy_nested_values_are_json_strings():
+    serialized = ValueSerializer.serialize({"a": {"b": 1}}, VALUE_ENCODING_LEGACY)
+    assert serialized == '{"a": "{\\"b\\": \\"I1\\"}"}'
+
+
+def test_tree_is_a_single_json_tree():
+    serialized = ValueSerializer.serialize({"a": {"b": [1, "x"]}}, VALUE_ENCODING_TREE)
+    assert serialized == '~{"a":{"b":["I1","\\"x\\""]}}'
+
+
+def test_tree_memory_pointers():
+    value = ValueSerializer.deserialize(ValueSerializer.serialize({"doc": MemoryPointer("@12")}, VALUE_ENCODING_TREE))
+    assert value["doc"].getAddress() == "@12"
+
+
+def test_tree_walk_deeply_nested():
+    # Deeper than the recursion limit
+    value = []
+    for _ in range(5000):
+        value = [value]
+
+    decoded = ValueSerializer._from_tree(ValueSerializer._to_tree(value))
+    depth = 0
+    while decoded:
+        decoded = decoded[0]
+        depth += 1
+    assert depth == 5000
@@ -0,0 +1,63 @@
+import pytest
+
+from libraries.testkit.verify import diff_changes
+from libraries.testkit.verify import verify_changes
+
+
+def change(doc_id, rev, seq, updates=1):
+    return {"id": doc_id, "seq": seq, "changes": [{"rev": rev}], "doc": {"_id": doc_id, "_rev": rev, "updates": updates}}
+
+
+class MockUser:
+
+    def __init__(self, name, results):
+        self.name = name
+        self.results = results
+
+    def get_changes(self, include_docs=None):
+        return {"results": self.results}
+
+
+def test_diff_changes():
+    expected_docs = {"doc_0": "2-a", "doc_1": "2-b", "doc_2": "2-c"}
+    results = [
+        {"id": "_user/foo", "seq": 1, "changes": []},
+        change("doc_0", "2-a", 2),
+        change("doc_1", "2-x", 3),
+        change("doc_3", "2-d", 4),
+        change("doc_0", "2-a", 4)
+    ]
+
+    diff = diff_changes(expected_docs, results, name="foo")
+
+    assert diff.num_changes == 4
+    assert diff.missing == ["doc_2"]
+    assert diff.unexpected == ["doc_3"]
+    assert diff.wrong_revision == {"doc_1": ("2-b", "2-x")}
+    assert diff.duplicate_doc_ids == {"doc_0": 2}
+    assert diff.duplicate_sequences == {"4": ["doc_3", "doc_0"]}
+    assert not diff.is_empty()
+
+
+def test_diff_changes_checks():
+    expected_docs = {"doc_0": "2-a", "doc_1": "2-b"}
+    results = [change("doc_0", "2-a", 1, updates=1), change("doc_1", "2-b", 2, updates=0)]
+
+    diff = diff_changes(expected_docs, results, checks={"updates": lambda result: result["doc"]["updates"] == 1})
+
+    assert diff.check_failures == {"updates": ["doc_1"]}
+
+
+def test_diff_changes_without_docs():
+    results = [{"id": "doc_0", "seq": 1, "changes": [{"rev": "1-a"}]}]
+    assert diff_changes({"doc_0": "1-a"}, results).is_empty()
+
+
+def test_verify_changes():
+    expected_docs = {"doc_0": "2-a", "doc_1": "2-b"}
+    users = [MockUser("user_{}".format(i), [change("doc_0", "2-a", 1), change("doc_1", "2-b", 2)]) for i in range(5)]
+    verify_changes(users, expected_num_docs=2, expected_num_revisions=1, expected_docs=expected_docs)
+
+    users.append(MockUser("bad_user", [change("doc_0", "2-a", 1)]))
+    with pytest.raises(AssertionError):
+        verify_changes(users, expected_num_docs=2, expected_num_revisions=1, expected_docs=expected_docs)
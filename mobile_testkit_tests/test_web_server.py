@@ -0,0 +1,78 @@
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+from keywords.exceptions import TimeoutError
+from libraries.testkit.web_server import WebServer
+from libraries.testkit.web_server import WebhookStore
+from libraries.testkit.web_server import latency_histogram
+
+
+@pytest.fixture
+def web_server():
+    ws = WebServer(port=0)
+    ws.port = ws.server.server_address[1]
+    ws.start()
+    yield ws
+    ws.stop()
+
+
+def post_webhooks(port, payloads, delay=0):
+    time.sleep(delay)
+    session = requests.Session()
+    for payload in payloads:
+        resp = session.post("http://127.0.0.1:{}".format(port), data=json.dumps(payload))
+        resp.raise_for_status()
+
+
+def test_concurrent_deliveries(web_server):
+    threads = []
+    for i in range(20):
+        payloads = [{"_id": "doc_{}".format(i), "_rev": "{}-abc".format(rev), "content": rev} for rev in range(1, 6)]
+        threads.append(threading.Thread(target=post_webhooks, args=(web_server.port, payloads)))
+    threads.append(threading.Thread(target=post_webhooks, args=(web_server.port, [{"state": "offline"}])))
+    for thread in threads:
+        thread.start()
+
+    data = web_server.wait_for_count(101, timeout=30)
+    for thread in threads:
+        thread.join()
+
+    assert len(data) == 101
+    assert {"state": "offline"} in data
+    assert [payload["_rev"] for payload in web_server.store.get_doc_payloads("doc_3")] == ["{}-abc".format(rev) for rev in range(1, 6)]
+    assert web_server.store.get_received_at("doc_3", "5-abc") >= web_server.store.get_received_at("doc_3", "1-abc")
+
+    web_server.clear_data()
+    assert web_server.get_data() == []
+
+
+def test_wait_for_doc_ids(web_server):
+    payloads = [{"_id": "doc_{}".format(i), "_rev": "1-abc"} for i in range(10)]
+    payloads += [{"_id": "doc_{}".format(i), "_rev": "2-def"} for i in range(5)]
+    thread = threading.Thread(target=post_webhooks, args=(web_server.port, payloads, 0.2))
+    thread.start()
+
+    docs = web_server.wait_for_doc_ids(["doc_0", "doc_4"], timeout=30, rev_prefix="2-")
+    thread.join()
+    assert docs["doc_0"]["_rev"] == "2-def"
+
+    with pytest.raises(TimeoutError) as e:
+        web_server.wait_for_doc_ids(["doc_5", "doc_6", "doc_10"], timeout=0.2, rev_prefix="2-")
+    assert "doc_10" in str(e.value)
+
+
+def test_delivery_latencies():
+    store = WebhookStore()
+    store.add({"_id": "doc_0", "_rev": "1-abc"})
+    received_at = store.get_received_at("doc_0", "1-abc")
+
+    write_times = {("doc_0", "1-abc"): received_at - 0.25, ("doc_1", "1-abc"): received_at}
+    latencies = store.delivery_latencies(write_times)
+    assert len(latencies) == 1
+    assert abs(latencies[0] - 0.25) < 0.001
+
+    assert latency_histogram([0.01, 0.05, 0.15, 1.2]) == {0: 2, 100: 1, 1200: 1}
@@ -3,10 +3,6 @@ import pytest
 from keywords.utils import log_info
 from CBLClient.Database import Database
 from CBLClient.Query import Query
-from keywords.utils import host_for_url
-from couchbase.bucket import Bucket
-from couchbase.n1ql import N1QLQuery
-import numpy as np
 
 
 def test_get_doc_ids(params_from_base_test_setup):
@@ -19,29 +15,22 @@ def test_get_doc_ids(params_from_base_test_setup):
 
     Verifies with n1ql - select meta().id from `bucket_name` where meta().id not like "_sync%"
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
     db = Database(base_url)
 
-    cbs_ip = host_for_url(cbs_url)
-
     log_info("Fetching doc ids from the server")
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select meta().id from `{}` where meta().id not like "_sync%" ORDER BY id'.format(bucket_name)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    doc_ids_from_n1ql = []
-    for row in sdk_client.n1ql_query(query):
-        doc_ids_from_n1ql.append(row["id"])
+    doc_ids_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query).column("id")
 
     log_info("Fetching doc ids from CBL")
     ids_from_cbl = db.getDocIds(source_db, limit=35000)
 
     assert len(ids_from_cbl) == len(doc_ids_from_n1ql)
-    assert np.array_equal(sorted(ids_from_cbl), sorted(doc_ids_from_n1ql))
+    assert doc_ids_from_n1ql.matches(ids_from_cbl), doc_ids_from_n1ql.describe_mismatch(ids_from_cbl)
     log_info("Doc contents match between CBL and n1ql")
 
 
@@ -60,13 +49,11 @@ def test_doc_get(params_from_base_test_setup, doc_id):
 
     Verifies with n1ql - select * from `bucket_name` where meta().id="doc_id"
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
     cbl_db = params_from_base_test_setup["suite_cbl_db"]
     enable_sample_bucket = params_from_base_test_setup["enable_sample_bucket"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     # Get doc from CBL through query
     log_info("Fetching doc {} from CBL through query".format(doc_id))
@@ -81,18 +68,13 @@ def test_doc_get(params_from_base_test_setup, doc_id):
     # Get doc from n1ql through query
     log_info("Fetching doc {} from server through n1ql".format(doc_id))
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select * from `{}` where meta().id="{}"'.format(bucket_name, doc_id)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row[enable_sample_bucket])
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query).column(enable_sample_bucket)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
     log_info("Found {} docs".format(len(docs_from_cbl)))
-    assert sorted(docs_from_cbl) == sorted(docs_from_n1ql)
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
     log_info("Doc contents match between CBL and n1ql")
 
 
@@ -146,11 +128,9 @@ def test_multiple_selects(params_from_base_test_setup, select_property1, select_
 
     Verifies with n1ql - select name, type, meta().id from `travel-sample` where country="France"
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     log_info("Fetching docs from CBL through query")
     qy = Query(base_url)
@@ -163,17 +143,12 @@ def test_multiple_selects(params_from_base_test_setup, select_property1, select_
     # Get doc from n1ql through query
     log_info("Fetching docs from server through n1ql")
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select {}, {}, meta().id from `{}` where {}="{}"'.format(select_property1, select_property2, bucket_name, whr_key, whr_val)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
-    assert sorted(docs_from_cbl) == sorted(docs_from_n1ql)
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
 
     log_info("Doc contents match")
 
@@ -195,11 +170,9 @@ def test_query_where_and_or(params_from_base_test_setup, whr_key1, whr_val1, whr
 
     Verifies with n1ql - select meta().id from `travel-sample` t where t.type="hotel" and (t.country="United States" or t.country="France") and t.vacancy=true
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     log_info("Fetching docs from CBL through query")
     qy = Query(base_url)
@@ -212,18 +185,13 @@ def test_query_where_and_or(params_from_base_test_setup, whr_key1, whr_val1, whr
     # Get doc from n1ql through query
     log_info("Fetching docs from server through n1ql")
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select meta().id from `{}` t where t.{}="{}" and (t.{}="{}" or t.{}="{}") and t.{}={}'.format(bucket_name, whr_key1, whr_val1, whr_key2, whr_val2, whr_key3, whr_val3, whr_key4, whr_val4)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
     log_info("Found {} docs".format(len(docs_from_cbl)))
-    assert sorted(docs_from_cbl) == sorted(docs_from_n1ql)
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
     log_info("Doc contents match")
 
 
@@ -249,11 +217,9 @@ def test_query_pattern_like(params_from_base_test_setup, whr_key, whr_val, selec
 
     Verifies with n1ql - select meta().id, country, name from `travel-sample` t where t.type="landmark"  and t.name like "Royal Engineers Museum"
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     log_info("Fetching docs from CBL through query")
     qy = Query(base_url)
@@ -267,18 +233,13 @@ def test_query_pattern_like(params_from_base_test_setup, whr_key, whr_val, selec
     # Get doc from n1ql through query
     log_info("Fetching docs from server through n1ql")
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select meta().id, {}, {} from `{}` t where t.{}="{}"  and t.{} like "{}"'.format(select_property1, select_property2, bucket_name, whr_key, whr_val, like_key, like_val)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
     log_info("Found {} docs".format(len(docs_from_cbl)))
-    assert sorted(docs_from_cbl) == sorted(docs_from_n1ql)
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
     log_info("Doc contents match")
 
 
@@ -300,11 +261,9 @@ def test_query_pattern_regex(params_from_base_test_setup, whr_key, whr_val, sele
 
     Verifies with n1ql - select meta().id, country, name from `travel-sample` t where t.type="landmark" and REGEXP_CONTAINS(t.name, "\\bEng.*e\\b")
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     log_info("Fetching docs from CBL through query")
     qy = Query(base_url)
@@ -319,21 +278,16 @@ def test_query_pattern_regex(params_from_base_test_setup, whr_key, whr_val, sele
     # Get doc from n1ql through query
     log_info("Fetching docs from server through n1ql")
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
 
     # \ has to be escaped for n1ql
     regex_val_n1ql = regex_val.replace('\\b', '\\\\b')
     n1ql_query = 'select meta().id, {}, {} from `{}` t where t.{}="{}" and REGEXP_CONTAINS(t.{}, \'{}\')'.format(select_property1, select_property2, bucket_name, whr_key, whr_val, regex_key, regex_val_n1ql)
     log_info("n1ql_query: {}".format(n1ql_query))
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
     log_info("Found {} docs".format(len(docs_from_cbl)))
-    assert sorted(docs_from_cbl) == sorted(docs_from_n1ql)
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
     log_info("Doc contents match")
 
 
@@ -352,11 +306,9 @@ def test_query_isNullOrMissing(params_from_base_test_setup, select_property1, li
 
     Verifies with n1ql - select meta().id from `travel-sample` t where meta().id not like "_sync%" and (t.name IS NULL or t.name IS MISSING)
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     log_info("Fetching docs from CBL through query")
     qy = Query(base_url)
@@ -370,17 +322,12 @@ def test_query_isNullOrMissing(params_from_base_test_setup, select_property1, li
     # Get doc from n1ql through query
     log_info("Fetching docs from server through n1ql")
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select meta().id, {} from `{}` t where meta().id not like "_sync%" and (t.{} IS NULL or t.{} IS MISSING) order by "{}" asc limit {}'.format(select_property1, bucket_name, select_property1, select_property1, select_property1, limit)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
-    assert sorted(docs_from_cbl) == sorted(docs_from_n1ql)
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
     log_info("Doc contents match")
 
 
@@ -401,11 +348,9 @@ def test_query_ordering(params_from_base_test_setup, select_property1, whr_key,
 
     Verifies with n1ql - select meta().id, title from `travel-sample` t where t.type = "hotel" order by "title" asc
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     log_info("Fetching docs from CBL through query")
     qy = Query(base_url)
@@ -419,18 +364,13 @@ def test_query_ordering(params_from_base_test_setup, select_property1, whr_key,
     # Get doc from n1ql through query
     log_info("Fetching docs from server through n1ql")
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select meta().id, {} from `{}` t where t.{} = "{}" order by "{}" asc'.format(select_property1, bucket_name, whr_key, whr_val, select_property1)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
     log_info("Found {} docs".format(len(docs_from_cbl)))
-    assert sorted(docs_from_cbl) == sorted(docs_from_n1ql)
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
     log_info("Doc contents match")
 
 
@@ -451,11 +391,9 @@ def test_query_substring(params_from_base_test_setup, select_property1, select_p
 
     Verifies with n1ql - select meta().id, email, UPPER(name) from `travel-sample` t where CONTAINS(t.email, "gmail.com")
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     log_info("Fetching docs from CBL through query")
     qy = Query(base_url)
@@ -471,14 +409,9 @@ def test_query_substring(params_from_base_test_setup, select_property1, select_p
     # Get doc from n1ql through query
     log_info("Fetching docs from server through n1ql")
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select meta().id, {}, UPPER({}) from `{}` t where CONTAINS(t.{}, "{}")'.format(select_property1, select_property2, bucket_name, select_property1, substring)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
     for doc in docs_from_cbl:
@@ -506,11 +439,9 @@ def test_query_collation(params_from_base_test_setup, select_property1, whr_key1
 
     Verifies with n1ql - select meta().id, name from `travel-sample` t where t.type="hotel" and t.country = "France" and lower(t.name) = lower("Le Clos Fleuri")
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     log_info("Fetching docs from CBL through query")
     qy = Query(base_url)
@@ -524,18 +455,13 @@ def test_query_collation(params_from_base_test_setup, select_property1, whr_key1
     # Get doc from n1ql through query
     log_info("Fetching docs from server through n1ql")
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select meta().id, {} from `{}` t where t.{}="{}" and t.{} = "{}" and lower(t.{}) = lower("{}")'.format(select_property1, bucket_name, whr_key1, whr_val1, whr_key2, whr_val2, select_property1, equal_to)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
     log_info("Found {} docs".format(len(docs_from_cbl)))
-    assert sorted(docs_from_cbl) == sorted(docs_from_n1ql)
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
     log_info("Doc contents match")
 
 
@@ -572,11 +498,9 @@ def test_query_join(params_from_base_test_setup, select_property1,
       AND route.sourceairport = "SFO"
     LIMIT 2;
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     log_info("Fetching docs from CBL through query")
     qy = Query(base_url)
@@ -594,7 +518,6 @@ def test_query_join(params_from_base_test_setup, select_property1,
     # Get doc from n1ql through query
     log_info("Fetching docs from server through n1ql")
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select distinct airline.{}, airline.{}, route.{}, '\
         'route.{}, route.{} from `{}` route join `{}` airline '\
         'on keys route.{} where route.{}="{}" and '\
@@ -605,15 +528,11 @@ def test_query_join(params_from_base_test_setup, select_property1,
             join_key, whr_key1, whr_val1, whr_key2, whr_val2,
             whr_key3, whr_val3)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
     log_info("Found {} docs".format(len(docs_from_cbl)))
-    assert sorted(docs_from_cbl) == sorted(docs_from_n1ql)
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
     log_info("Doc contents match")
 
 
@@ -851,11 +770,9 @@ def test_equal_to(params_from_base_test_setup, prop, val):
 
     Verifies with n1ql - select meta().id from `bucket_name` where country = "france"
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     # Get doc from CBL through query
     qy = Query(base_url)
@@ -868,18 +785,13 @@ def test_equal_to(params_from_base_test_setup, prop, val):
 
     # Get doc from n1ql through query
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select meta().id from `{}` where {} = "{}" order by meta().id asc'.format(bucket_name, prop, val)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
     log_info("Found {} docs".format(len(docs_from_cbl)))
-    assert np.array_equal(sorted(docs_from_cbl), sorted(docs_from_n1ql))
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
     log_info("Doc contents match between CBL and n1ql")
 
 
@@ -898,11 +810,9 @@ def test_not_equal_to(params_from_base_test_setup, prop, val):
 
     Verifies with n1ql - select meta().id from `bucket_name` where country != "France"
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     # Get doc from CBL through query
     qy = Query(base_url)
@@ -915,18 +825,13 @@ def test_not_equal_to(params_from_base_test_setup, prop, val):
 
     # Get doc from n1ql through query
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select meta().id from `{}` where {} != "{}" order by meta().id asc'.format(bucket_name, prop, val)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
     log_info("Found {} docs".format(len(docs_from_cbl)))
-    assert np.array_equal(sorted(docs_from_cbl), sorted(docs_from_n1ql))
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
     log_info("Doc contents match between CBL and n1ql")
 
 
@@ -944,11 +849,9 @@ def test_greater_than(params_from_base_test_setup, prop, val):
 
     Verifies with n1ql - select meta().id from `bucket_name` where id > 1000
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     # Get doc from CBL through query
     qy = Query(base_url)
@@ -961,18 +864,13 @@ def test_greater_than(params_from_base_test_setup, prop, val):
 
     # Get doc from n1ql through query
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select meta().id from `{}` where {} > {} order by meta().id asc'.format(bucket_name, prop, val)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
     log_info("Found {} docs".format(len(docs_from_cbl)))
-    assert np.array_equal(sorted(docs_from_cbl), sorted(docs_from_n1ql))
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
     log_info("Doc contents match between CBL and n1ql")
 
 
@@ -990,11 +888,9 @@ def test_greater_than_or_equal_to(params_from_base_test_setup, prop, val):
 
     Verifies with n1ql - select meta().id from `bucket_name` where id >= 1000
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     # Get doc from CBL through query
     qy = Query(base_url)
@@ -1007,18 +903,13 @@ def test_greater_than_or_equal_to(params_from_base_test_setup, prop, val):
 
     # Get doc from n1ql through query
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select meta().id from `{}` where {} >= {} order by meta().id asc'.format(bucket_name, prop, val)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
     log_info("Found {} docs".format(len(docs_from_cbl)))
-    assert np.array_equal(sorted(docs_from_cbl), sorted(docs_from_n1ql))
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
     log_info("Doc contents match between CBL and n1ql")
 
 
@@ -1036,11 +927,9 @@ def test_less_than(params_from_base_test_setup, prop, val):
 
     Verifies with n1ql - select meta().id from `bucket_name` where id < 1000
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     # Get doc from CBL through query
     qy = Query(base_url)
@@ -1053,18 +942,13 @@ def test_less_than(params_from_base_test_setup, prop, val):
 
     # Get doc from n1ql through query
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select meta().id from `{}` where {} < {} order by meta().id asc'.format(bucket_name, prop, val)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
     log_info("Found {} docs".format(len(docs_from_cbl)))
-    assert np.array_equal(sorted(docs_from_cbl), sorted(docs_from_n1ql))
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
     log_info("Doc contents match between CBL and n1ql")
 
 
@@ -1082,11 +966,9 @@ def test_less_than_or_equal_to(params_from_base_test_setup, prop, val):
 
     Verifies with n1ql - select meta().id from `bucket_name` where id <= 1000
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     # Get doc from CBL through query
     qy = Query(base_url)
@@ -1099,18 +981,13 @@ def test_less_than_or_equal_to(params_from_base_test_setup, prop, val):
 
     # Get doc from n1ql through query
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select meta().id from `{}` where {} <= {} order by meta().id asc'.format(bucket_name, prop, val)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
     log_info("Found {} docs".format(len(docs_from_cbl)))
-    assert np.array_equal(sorted(docs_from_cbl), sorted(docs_from_n1ql))
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
     log_info("Doc contents match between CBL and n1ql")
 
 
@@ -1128,11 +1005,9 @@ def test_in(params_from_base_test_setup, prop, val1, val2):
 
     Verifies with n1ql - select meta().id from `bucket_name` where country in ['France', 'United States']
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     # Get doc from CBL through query
     qy = Query(base_url)
@@ -1145,18 +1020,13 @@ def test_in(params_from_base_test_setup, prop, val1, val2):
 
     # Get doc from n1ql through query
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select meta().id from `{}` where {} in ["{}", "{}"] order by meta().id asc'.format(bucket_name, prop, val1, val2)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
     log_info("Found {} docs".format(len(docs_from_cbl)))
-    assert np.array_equal(sorted(docs_from_cbl), sorted(docs_from_n1ql))
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
     log_info("Doc contents match between CBL and n1ql")
 
 
@@ -1174,11 +1044,9 @@ def test_between(params_from_base_test_setup, prop, val1, val2):
 
     Verifies with n1ql - select meta().id from `bucket_name` where id between 1000 and 2000
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     # Get doc from CBL through query
     qy = Query(base_url)
@@ -1191,18 +1059,13 @@ def test_between(params_from_base_test_setup, prop, val1, val2):
 
     # Get doc from n1ql through query
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select meta().id from `{}` where {} between {} and {} order by meta().id asc'.format(bucket_name, prop, val1, val2)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
     log_info("Found {} docs".format(len(docs_from_cbl)))
-    assert np.array_equal(sorted(docs_from_cbl), sorted(docs_from_n1ql))
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
     log_info("Doc contents match between CBL and n1ql")
 
 
@@ -1221,11 +1084,9 @@ def test_is(params_from_base_test_setup, prop):
 
     Verifies with n1ql - select meta().id from `bucket_name` where iata is null
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     # Get doc from CBL through query
     qy = Query(base_url)
@@ -1238,18 +1099,13 @@ def test_is(params_from_base_test_setup, prop):
 
     # Get doc from n1ql through query
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select meta().id from `{}` where {} is null order by meta().id asc'.format(bucket_name, prop)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
     log_info("Found {} docs".format(len(docs_from_cbl)))
-    assert np.array_equal(sorted(docs_from_cbl), sorted(docs_from_n1ql))
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
     log_info("Doc contents match between CBL and n1ql")
 
 
@@ -1268,11 +1124,9 @@ def test_isnot(params_from_base_test_setup, prop):
 
     Verifies with n1ql - select meta().id from `bucket_name` where iata is not null
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     # Get doc from CBL through query
     qy = Query(base_url)
@@ -1285,19 +1139,14 @@ def test_isnot(params_from_base_test_setup, prop):
 
     # Get doc from n1ql through query
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select meta().id, {} from `{}` where {} is not null order by meta().id asc'.format(prop, bucket_name, prop)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
     log_info("Found {} docs".format(len(docs_from_cbl)))
-    assert sorted(docs_from_cbl) == sorted(docs_from_n1ql)
-    # assert np.array_equal(sorted(docs_from_cbl), sorted(docs_from_n1ql))
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
+    # assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
     log_info("Doc contents match between CBL and n1ql")
 
 
@@ -1315,11 +1164,9 @@ def test_not(params_from_base_test_setup, prop, val1, val2):
 
     Verifies with n1ql - select meta().id from `bucket_name` where id not between 1000 and 2000
     """
-    cluster_topology = params_from_base_test_setup["cluster_topology"]
     source_db = params_from_base_test_setup["suite_source_db"]
-    cbs_url = cluster_topology['couchbase_servers'][0]
     base_url = params_from_base_test_setup["base_url"]
-    cbs_ip = host_for_url(cbs_url)
+    n1ql_reference_cache = params_from_base_test_setup["n1ql_reference_cache"]
 
     # Get doc from CBL through query
     qy = Query(base_url)
@@ -1332,18 +1179,13 @@ def test_not(params_from_base_test_setup, prop, val1, val2):
 
     # Get doc from n1ql through query
     bucket_name = "travel-sample"
-    sdk_client = Bucket('couchbase://{}/{}'.format(cbs_ip, bucket_name), password='password')
     n1ql_query = 'select meta().id from `{}` where {} not between {} and {} order by meta().id asc'.format(bucket_name, prop, val1, val2)
     log_info(n1ql_query)
-    query = N1QLQuery(n1ql_query)
-    docs_from_n1ql = []
-
-    for row in sdk_client.n1ql_query(query):
-        docs_from_n1ql.append(row)
+    docs_from_n1ql = n1ql_reference_cache.get_reference_result(n1ql_query)
 
     assert len(docs_from_cbl) == len(docs_from_n1ql)
     log_info("Found {} docs".format(len(docs_from_cbl)))
-    assert np.array_equal(sorted(docs_from_cbl), sorted(docs_from_n1ql))
+    assert docs_from_n1ql.matches(docs_from_cbl), docs_from_n1ql.describe_mismatch(docs_from_cbl)
     log_info("Doc contents match between CBL and n1ql")
 
 
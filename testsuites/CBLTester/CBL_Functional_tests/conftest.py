@@ -8,6 +8,7 @@ from keywords.utils import log_info
 from keywords.utils import host_for_url, clear_resources_pngs
 from keywords.ClusterKeywords import ClusterKeywords
 from keywords.couchbaseserver import CouchbaseServer
+from keywords.n1qlcache import get_reference_cache
 from keywords.constants import CLUSTER_CONFIGS_DIR
 from keywords.MobileRestClient import MobileRestClient
 from keywords.TestServerFactory import TestServerFactory
@@ -106,6 +107,14 @@ def pytest_addoption(parser):
                      action="store_true",
                      help="If set, will flush server memory per test")
 
+    parser.addoption("--release-pointers-per-test",
+                     action="store_true",
+                     help="If set, will release the memory pointers returned by the test server during a test at its teardown")
+
+    parser.addoption("--clear-n1ql-reference-cache",
+                     action="store_true",
+                     help="If set, will delete the cached results of the reference N1QL queries before running them again")
+
     parser.addoption("--sg-lb",
                      action="store_true",
                      help="If set, will enable load balancer for Sync Gateway")
@@ -167,6 +176,7 @@ def params_from_base_suite_setup(request):
     community_enabled = request.config.getoption("--community")
     sg_ssl = request.config.getoption("--sg-ssl")
     flush_memory_per_test = request.config.getoption("--flush-memory-per-test")
+    release_pointers_per_test = request.config.getoption("--release-pointers-per-test")
     sg_lb = request.config.getoption("--sg-lb")
     ci = request.config.getoption("--ci")
     debug_mode = request.config.getoption("--debug-mode")
@@ -177,6 +187,7 @@ def params_from_base_suite_setup(request):
     enable_file_logging = request.config.getoption("--enable-file-logging")
     cbl_log_decoder_platform = request.config.getoption("--cbl-log-decoder-platform")
     cbl_log_decoder_build = request.config.getoption("--cbl-log-decoder-build")
+    clear_n1ql_reference_cache = request.config.getoption("--clear-n1ql-reference-cache")
 
     test_name = request.node.name
 
@@ -432,6 +443,14 @@ def params_from_base_suite_setup(request):
         log_info("Stopping replication")
         repl_obj.stop(repl)
 
+    n1ql_reference_cache = None
+    if enable_sample_bucket:
+        # Expected results of the query tests, reused while the content of the sample bucket does not change
+        n1ql_reference_cache = get_reference_cache(cbs_url, enable_sample_bucket)
+        if clear_n1ql_reference_cache:
+            n1ql_reference_cache.clear()
+        n1ql_reference_cache.warm()
+
     yield {
         "cluster_config": cluster_config,
         "mode": mode,
@@ -456,13 +475,18 @@ def params_from_base_suite_setup(request):
         "testserver": testserver,
         "device_enabled": device_enabled,
         "flush_memory_per_test": flush_memory_per_test,
+        "release_pointers_per_test": release_pointers_per_test,
         "delta_sync_enabled": delta_sync_enabled,
         "enable_file_logging": enable_file_logging,
         "cbl_log_decoder_platform": cbl_log_decoder_platform,
         "cbl_log_decoder_build": cbl_log_decoder_build,
-        "suite_db_log_files": suite_db_log_files
+        "suite_db_log_files": suite_db_log_files,
+        "n1ql_reference_cache": n1ql_reference_cache
     }
 
+    if n1ql_reference_cache is not None:
+        log_info("N1QL reference cache: {} hits, {} misses".format(n1ql_reference_cache.num_hits, n1ql_reference_cache.num_misses))
+
     if create_db_per_suite:
         # Delete CBL database
         log_info("Deleting the database {} at the suite teardown".format(create_db_per_suite))
@@ -510,6 +534,8 @@ def params_from_base_test_setup(request, params_from_base_suite_setup):
     enable_file_logging = params_from_base_suite_setup["enable_file_logging"]
     cbl_log_decoder_platform = params_from_base_suite_setup["cbl_log_decoder_platform"]
     cbl_log_decoder_build = params_from_base_suite_setup["cbl_log_decoder_build"]
+    release_pointers_per_test = params_from_base_suite_setup["release_pointers_per_test"]
+    n1ql_reference_cache = params_from_base_suite_setup["n1ql_reference_cache"]
 
     source_db = None
     test_name_cp = test_name.replace("/", "-")
@@ -563,6 +589,11 @@ def params_from_base_test_setup(request, params_from_base_suite_setup):
         else:
             path = '/'.join(path.split('/')[:-1])
 
+    pointer_scope = None
+    if release_pointers_per_test:
+        utils_obj = Utils(base_url)
+        pointer_scope = utils_obj.begin_pointer_scope()
+
     # This dictionary is passed to each test
     yield {
         "cluster_config": cluster_config,
@@ -596,10 +627,16 @@ def params_from_base_test_setup(request, params_from_base_suite_setup):
         "liteserv_version": liteserv_version,
         "delta_sync_enabled": delta_sync_enabled,
         "cbl_log_decoder_platform": cbl_log_decoder_platform,
-        "cbl_log_decoder_build": cbl_log_decoder_build
+        "cbl_log_decoder_build": cbl_log_decoder_build,
+        "n1ql_reference_cache": n1ql_reference_cache
     }
 
     log_info("Tearing down test")
+    if pointer_scope is not None:
+        log_info("Releasing the memory pointers of the test")
+        utils_obj.end_pointer_scope(pointer_scope)
+        log_info("Test server stats: {}".format(utils_obj.get_stats()))
+
     if create_db_per_test:
         # Delete CBL database
         log_info("Deleting the database {} at test teardown".format(create_db_per_test))
@@ -1,18 +1,21 @@
 import pytest
 import time
 import random
-from sys import maxint
-from threading import Thread
 
 from keywords.MobileRestClient import MobileRestClient
 from CBLClient.Replication import Replication
 from CBLClient.Authenticator import Authenticator
+from CBLClient.DeviceFleet import Device, DeviceFleet
+from CBLClient.Utils import Utils
 from keywords.utils import log_info
 from libraries.testkit.cluster import Cluster
 from libraries.data.doc_generators import simple, four_k, simple_user,\
     complex_doc
 from datetime import datetime, timedelta
 
+# Shared deadline (seconds) for the replicators of all devices to be idle after a step
+REPLICATION_IDLE_TIMEOUT = 60 * 60
+
 
 @pytest.mark.sanity
 @pytest.mark.listener
@@ -116,12 +119,10 @@ def test_system(params_from_base_suite_setup, num_of_docs, num_of_updates, num_o
     time.sleep(5)
     _check_doc_count(db_obj_list, cbl_db_list)
     # Configure replication with push_pull for all db
-    replicator_obj_list = []
-    replicator_list = []
+    devices = []
     try:
-        for base_url, cbl_db, query in zip(base_url_list, cbl_db_list, query_obj_list):
+        for base_url, db_obj, cbl_db, db_name, query in zip(base_url_list, db_obj_list, cbl_db_list, db_name_list, query_obj_list):
             repl_obj = Replication(base_url)
-            replicator_obj_list.append(repl_obj)
             authenticator = Authenticator(base_url)
             cookie, session_id = sg_client.create_session(sg_admin_url, sg_db, username)
             replicator_authenticator = authenticator.authentication(session_id, cookie, authentication_type="session")
@@ -131,16 +132,23 @@ def test_system(params_from_base_suite_setup, num_of_docs, num_of_updates, num_o
                                              replicator_authenticator=replicator_authenticator)
             repl = repl_obj.create(repl_config)
             repl_obj.start(repl)
-            repl_obj.wait_until_replicator_idle(repl, max_times=maxint, sleep_time=repl_status_check_sleep_time)
-            replicator_list.append(repl)
-            query.query_get_docs_limit_offset(cbl_db, limit=query_limit, offset=query_offset)
+            devices.append(Device(db_name, db_obj, cbl_db, repl_obj=repl_obj, repl=repl, query=query))
+
+        # All devices replicate at the same time
+        fleet = DeviceFleet(devices)
+        fleet.wait_until_replicators_idle(timeout=REPLICATION_IDLE_TIMEOUT, sleep_time=repl_status_check_sleep_time)
+        fleet.query_docs(query_limit, query_offset)
 
         current_time = datetime.now()
         running_time = current_time + timedelta(minutes=up_time)
 
         _check_doc_count(db_obj_list, cbl_db_list)
+        utils_list = [Utils(base_url) for base_url in base_url_list]
         x = 1
         while running_time - current_time > timedelta(0):
+            # Memory pointers returned during an iteration (docs, query results, ...) are released at its end,
+            # so the memory of the test servers stays flat however long the test runs
+            pointer_scopes = [utils.begin_pointer_scope() for utils in utils_list]
 
             log_info('*' * 20)
             log_info("Starting iteration no. {} of system testing".format(x))
@@ -161,36 +169,27 @@ def test_system(params_from_base_suite_setup, num_of_docs, num_of_updates, num_o
                                   number_updates=num_of_updates, auth=session, channels=channels_sg)
 
             # Waiting until replicator finishes on all dbs
-            for repl_obj, repl, cbl_db, query in zip(replicator_obj_list,
-                                                     replicator_list,
-                                                     cbl_db_list,
-                                                     query_obj_list):
-                t = Thread(target=_replicaton_status_check, args=(repl_obj, repl, repl_status_check_sleep_time))
-                t.start()
-                t.join()
-                query.query_get_docs_limit_offset(cbl_db, limit=query_limit, offset=query_offset)
+            fleet.wait_until_replicators_idle(timeout=REPLICATION_IDLE_TIMEOUT, sleep_time=repl_status_check_sleep_time)
+            fleet.query_docs(query_limit, query_offset)
 
             #######################################
             # Checking for doc update on CBL side #
             #######################################
             docs_to_update = random.sample(doc_ids, num_of_docs_to_update)
-            i = 0
-            for db_obj, cbl_db, repl_obj, repl, query in zip(db_obj_list,
-                                                             cbl_db_list,
-                                                             replicator_obj_list,
-                                                             replicator_list,
-                                                             query_obj_list):
-                updates_per_db = len(docs_to_update) / len(db_obj_list)
+            updates_per_db = len(docs_to_update) / len(devices)
+            docs_to_update_per_device = _split_per_device(devices, docs_to_update, updates_per_db)
+
+            def update_docs(device):
+                device_docs_to_update = docs_to_update_per_device[device.name]
                 log_info("Updating {} docs on {} db - {}".format(updates_per_db,
-                                                                 db_obj.getName(cbl_db),
-                                                                 list(docs_to_update)[i: i + updates_per_db]))
-                db_obj.update_bulk_docs(cbl_db, num_of_updates, list(docs_to_update)[i: i + updates_per_db])
-                i += updates_per_db
-                # updating docs will affect all dbs as they are synced with SG.
-                t = Thread(target=_replicaton_status_check, args=(repl_obj, repl, repl_status_check_sleep_time))
-                t.start()
-                t.join()
-                query.query_get_docs_limit_offset(cbl_db, limit=query_limit, offset=query_offset)
+                                                                 device.name,
+                                                                 device_docs_to_update))
+                device.db_obj.update_bulk_docs(device.cbl_db, num_of_updates, device_docs_to_update)
+
+            fleet.run(update_docs, "Updating docs")
+            # updating docs will affect all dbs as they are synced with SG.
+            fleet.wait_until_replicators_idle(timeout=REPLICATION_IDLE_TIMEOUT, sleep_time=repl_status_check_sleep_time)
+            fleet.query_docs(query_limit, query_offset)
 
             ###########################
             # Deleting docs on SG side #
@@ -201,15 +200,9 @@ def test_system(params_from_base_suite_setup, num_of_docs, num_of_updates, num_o
                                                           docs_to_delete))
             sg_client.delete_bulk_docs(url=sg_url, db=sg_db,
                                        docs=sg_docs, auth=session)
-            for repl_obj, repl, cbl_db, query in zip(replicator_obj_list,
-                                                     replicator_list,
-                                                     cbl_db_list,
-                                                     query_obj_list):
-                t = Thread(target=_replicaton_status_check, args=(repl_obj, repl, repl_status_check_sleep_time))
-                t.start()
-                t.join()
-                query.query_get_docs_limit_offset(cbl_db, limit=query_limit, offset=query_offset)
-                time.sleep(5)
+            fleet.wait_until_replicators_idle(timeout=REPLICATION_IDLE_TIMEOUT, sleep_time=repl_status_check_sleep_time)
+            fleet.query_docs(query_limit, query_offset)
+            time.sleep(5)
             _check_doc_count(db_obj_list, cbl_db_list)
             # removing ids of deleted doc from the list
             doc_ids = doc_ids - docs_to_delete
@@ -221,32 +214,23 @@ def test_system(params_from_base_suite_setup, num_of_docs, num_of_updates, num_o
             # Deleting docs on CBL side #
             ############################
             docs_to_delete = set(random.sample(doc_ids, num_of_doc_to_delete))
-            docs_to_delete_per_db = len(docs_to_delete) / len(db_obj_list)
-            i = 0
-            for db_obj, cbl_db, repl_obj, repl, query in zip(db_obj_list,
-                                                             cbl_db_list,
-                                                             replicator_obj_list,
-                                                             replicator_list,
-                                                             query_obj_list):
+            docs_to_delete_per_db = len(docs_to_delete) / len(devices)
+            docs_to_delete_per_device = _split_per_device(devices, docs_to_delete, docs_to_delete_per_db)
+
+            def delete_docs(device):
+                device_docs_to_delete = docs_to_delete_per_device[device.name]
                 log_info("deleting {} docs from {} db - {}".format(docs_to_delete_per_db,
-                                                                   db_obj.getName(cbl_db),
-                                                                   list(docs_to_delete)[i: i + docs_to_delete_per_db]))
-                db_obj.delete_bulk_docs(cbl_db, list(docs_to_delete)[i: i + docs_to_delete_per_db])
-                i += docs_to_delete_per_db
-                time.sleep(5)
-                query.query_get_docs_limit_offset(cbl_db, limit=query_limit,
-                                                  offset=query_offset)
-
-                # Deleting docs will affect all dbs as they are synced with SG.
-                for repl_obj, repl, cbl_db, query in zip(replicator_obj_list,
-                                                         replicator_list,
-                                                         cbl_db_list,
-                                                         query_obj_list):
-                    t = Thread(target=_replicaton_status_check, args=(repl_obj, repl, repl_status_check_sleep_time))
-                    t.start()
-                    t.join()
-                    query.query_get_docs_limit_offset(cbl_db, limit=query_limit,
-                                                      offset=query_offset)
+                                                                   device.name,
+                                                                   device_docs_to_delete))
+                device.db_obj.delete_bulk_docs(device.cbl_db, device_docs_to_delete)
+
+            fleet.run(delete_docs, "Deleting docs")
+            time.sleep(5)
+            fleet.query_docs(query_limit, query_offset)
+
+            # Deleting docs will affect all dbs as they are synced with SG.
+            fleet.wait_until_replicators_idle(timeout=REPLICATION_IDLE_TIMEOUT, sleep_time=repl_status_check_sleep_time)
+            fleet.query_docs(query_limit, query_offset)
             _check_doc_count(db_obj_list, cbl_db_list)
             # removing ids of deleted doc from the list
             doc_ids = doc_ids - docs_to_delete
@@ -260,12 +244,8 @@ def test_system(params_from_base_suite_setup, num_of_docs, num_of_updates, num_o
             #############################
             # Creating docs on CBL side #
             #############################
-            for db_obj, cbl_db, repl_obj, repl, query in zip(db_obj_list,
-                                                             cbl_db_list,
-                                                             replicator_obj_list,
-                                                             replicator_list,
-                                                             query_obj_list):
-                name = db_obj.getName(cbl_db)
+            def create_docs(device):
+                name = device.db_obj.getName(device.cbl_db)
                 docs_to_create = ["cbl_{}_{}".format(name, doc_id) for doc_id in range(doc_id_for_new_docs, doc_id_for_new_docs + num_of_docs_to_add)]
                 added_docs = {}
                 new_doc_ids = []
@@ -282,40 +262,43 @@ def test_system(params_from_base_suite_setup, num_of_docs, num_of_updates, num_o
                     data["_id"] = doc_id
                     added_docs[doc_id] = data
                     new_doc_ids.append(doc_id)
-                doc_ids.update(new_doc_ids)
                 log_info("creating {} docs on {} - {}".format(len(docs_to_create),
-                                                              db_obj.getName(cbl_db),
+                                                              name,
                                                               new_doc_ids))
-                db_obj.saveDocuments(cbl_db, added_docs)
-                time.sleep(5)
-
-                # Adding docs will affect all dbs as they are synced with SG.
-                t = Thread(target=_replicaton_status_check, args=(repl_obj, repl, repl_status_check_sleep_time))
-                t.start()
-                t.join()
-                query.query_get_docs_limit_offset(cbl_db, limit=query_limit,
-                                                  offset=query_offset)
-                time.sleep(5)
+                device.db_obj.saveDocuments(device.cbl_db, added_docs)
+                return new_doc_ids
+
+            for new_doc_ids in fleet.run(create_docs, "Creating docs"):
+                doc_ids.update(new_doc_ids)
+            time.sleep(5)
+
+            # Adding docs will affect all dbs as they are synced with SG.
+            fleet.wait_until_replicators_idle(timeout=REPLICATION_IDLE_TIMEOUT, sleep_time=repl_status_check_sleep_time)
+            fleet.query_docs(query_limit, query_offset)
+            time.sleep(5)
             doc_id_for_new_docs += num_of_docs_to_add
             _check_doc_count(db_obj_list, cbl_db_list)
 
+            for utils, pointer_scope in zip(utils_list, pointer_scopes):
+                utils.end_pointer_scope(pointer_scope)
+                log_info("Test server stats: {}".format(utils.get_stats()))
             current_time = datetime.now()
         # stopping replication
         log_info("Test completed. Stopping Replicators")
     except Exception, err:
         raise Exception(err)
     finally:
-        for repl_obj, repl in zip(replicator_obj_list, replicator_list):
-            repl_obj.stop(repl)
+        for device in devices:
+            device.repl_obj.stop(device.repl)
             time.sleep(5)
         _check_doc_count(db_obj_list, cbl_db_list)
 
 
-def _replicaton_status_check(repl_obj, replicator, repl_status_check_sleep_time=2):
-    repl_obj.wait_until_replicator_idle(replicator, max_times=maxint, sleep_time=repl_status_check_sleep_time)
-    total = repl_obj.getTotal(replicator)
-    completed = repl_obj.getCompleted(replicator)
-    assert total == completed, "total is not equal to completed"
+def _split_per_device(devices, doc_ids, docs_per_device):
+    """ Returns a device name -> 'docs_per_device' doc ids map, each device gets a different slice of 'doc_ids' """
+
+    doc_ids = list(doc_ids)
+    return dict((device.name, doc_ids[i * docs_per_device: (i + 1) * docs_per_device]) for i, device in enumerate(devices))
 
 
 def _check_doc_count(db_obj_list, cbl_db_list):
@@ -1,5 +1,4 @@
 import pytest
-import concurrent.futures
 
 from keywords.utils import log_info
 from libraries.testkit.cluster import Cluster
@@ -78,24 +77,19 @@ def test_rollback_server_reset(params_from_base_test_setup, sg_conf_name):
         password=seth_user_info.password
     )
 
-    # create a doc that will hash to each vbucket in parallel except for vbucket 66
-    doc_id_for_every_vbucket_except_66 = []
-    with concurrent.futures.ProcessPoolExecutor() as pex:
-        futures = [pex.submit(document.generate_doc_id_for_vbucket, i) for i in range(num_vbuckets) if i != 66]
-        for future in concurrent.futures.as_completed(futures):
-            doc_id = future.result()
-            doc = document.create_doc(
-                doc_id=doc_id,
-                channels=seth_user_info.channels
-            )
-            doc_id_for_every_vbucket_except_66.append(doc)
-
-    vbucket_66_docs = []
-    for _ in range(5):
-        vbucket_66_docs.append(document.create_doc(
-            doc_id=document.generate_doc_id_for_vbucket(66),
-            channels=seth_user_info.channels
-        ))
+    # create a doc that will hash to each vbucket except for vbucket 66
+    doc_id_generator = document.VBucketDocIdGenerator(prefix="rollback")
+    vbuckets_except_66 = [i for i in range(num_vbuckets) if i != 66]
+    doc_ids = doc_id_generator.doc_ids_for_vbuckets(vbuckets_except_66, 1)
+    doc_id_for_every_vbucket_except_66 = [
+        document.create_doc(doc_id=doc_ids[i][0], channels=seth_user_info.channels)
+        for i in vbuckets_except_66
+    ]
+
+    vbucket_66_docs = [
+        document.create_doc(doc_id=doc_id, channels=seth_user_info.channels)
+        for doc_id in doc_id_generator.doc_ids_for_vbucket(66, 5)
+    ]
 
     seth_docs = client.add_bulk_docs(url=sg_url, db=sg_db, docs=doc_id_for_every_vbucket_except_66, auth=seth_session)
     seth_66_docs = client.add_bulk_docs(url=sg_url, db=sg_db, docs=vbucket_66_docs, auth=seth_session)
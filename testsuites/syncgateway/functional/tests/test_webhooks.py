@@ -76,9 +76,13 @@ def test_webhooks(params_from_base_test_setup, sg_conf_name, num_users, num_chan
     # Update docs
     log_info("Update docs")
     in_parallel(user_objects, 'update_docs', num_revisions)
-    time.sleep(30)
     expected_events = (num_users * num_docs * num_revisions) + (num_users * num_docs)
-    received_events = ws.get_data()
+    try:
+        received_events = ws.wait_for_count(expected_events, timeout=CLIENT_REQUEST_TIMEOUT)
+    except TimeoutError:
+        # Stop ws so successive tests can start it
+        ws.stop()
+        raise
     received_doc_events = []
     for ev in received_events:
         if "_id" in ev:
@@ -406,64 +410,30 @@ def delete_docs(sg_client, sg_url, sg_db, sg_doc_ids, sg_auth, sdk_client, sdk_d
 
 def poll_for_webhook_data(webhook_server, expected_doc_ids, expected_num_revs, expected_content, deleted=False):
 
-    start = time.time()
-    while True:
-
-        if time.time() - start > CLIENT_REQUEST_TIMEOUT:
-            webhook_server.stop()
-            raise TimeoutError('Timed out waiting for webhook events!!')
-
-        # Get web hook sent data and build a dictionary
-        expected_docs_scratch_pad = list(expected_doc_ids)
-
-        log_info('Getting posted webhook data ...')
-
-        data = webhook_server.get_data()
-        # Remove unwanted data from the response
-        for item in data:
-            if "_id" not in item:
-                data.remove(item)
-
-        posted_webhook_events = {item['_id']: item for item in data}
-        posted_webhook_events_ids = [item['_id'] for item in data]
-        posted_webhook_events_len = len(posted_webhook_events)
-
-        # If more webhook data is sent then we are expecting, blow up
-        assert posted_webhook_events_len <= len(expected_doc_ids)
-
-        all_docs_revs_found = True
-
-        if posted_webhook_events_len < len(expected_doc_ids):
-            # We have not seen the expected number of docs yet.
-            # Wait a sec and try again
-            delta = set(expected_doc_ids) - set(posted_webhook_events_ids)
-            log_info('Still waiting for webhook events. Expecting: {}, We have only seen: {}.  Missing: {}'.format(
-                len(expected_doc_ids),
-                posted_webhook_events_len,
-                delta,
-            ))
-            all_docs_revs_found = False
+    rev_prefix = "{}-".format(expected_num_revs)
 
+    log_info('Waiting for webhook events ...')
+    try:
+        posted_webhook_events = webhook_server.wait_for_doc_ids(
+            expected_doc_ids,
+            timeout=CLIENT_REQUEST_TIMEOUT,
+            rev_prefix=rev_prefix
+        )
+    except TimeoutError:
+        webhook_server.stop()
+        raise
+
+    # If more webhook data is sent then we are expecting, blow up
+    unexpected_doc_ids = set(posted_webhook_events) - set(expected_doc_ids)
+    assert len(unexpected_doc_ids) == 0, 'Unexpected posted webhook notifications: {}'.format(unexpected_doc_ids)
+
+    for doc_id in expected_doc_ids:
+        # Deliveries are handled concurrently, so the expected rev may not be the last one received
+        doc = [payload for payload in webhook_server.store.get_doc_payloads(doc_id) if payload['_rev'].startswith(rev_prefix)][-1]
+        if deleted:
+            assert doc['_deleted']
+            assert 'content' not in doc
         else:
-            for doc_id, doc in posted_webhook_events.items():
-
-                if deleted:
-                    assert doc['_deleted']
-                    assert 'content' not in doc
-                else:
-                    assert doc['content'] == expected_content
-
-                if doc_id in expected_docs_scratch_pad and doc['_rev'].startswith("{}-".format(expected_num_revs)):
-                    expected_docs_scratch_pad.remove(doc_id)
-                else:
-                    log_info('Unexpected posted webhook notification: {}'.format(doc))
-
-            if len(expected_docs_scratch_pad) != 0:
-                log_info('Missing expected revisions. Retrying ...')
-                all_docs_revs_found = False
-
-        if all_docs_revs_found:
-            log_info('Found all webhook events')
-            break
+            assert doc['content'] == expected_content
 
-        time.sleep(5)
+    log_info('Found all webhook events')
@@ -1,4 +1,3 @@
-import json
 import random
 import time
 
@@ -9,6 +8,7 @@ from requests.exceptions import HTTPError
 
 from keywords import couchbaseserver, document
 from keywords.ClusterKeywords import ClusterKeywords
+from keywords.ChangesLoad import ChangesLoadEngine, changes_feed_spec, summarize_changes_load
 from keywords.MobileRestClient import MobileRestClient
 from keywords.SyncGateway import sync_gateway_config_path_for_mode, SyncGateway
 from keywords.utils import log_info, host_for_url
@@ -182,61 +182,64 @@ def test_system_test(params_from_base_test_setup):
     log_info('END concurrent user / doc creation')
     log_info('------------------------------------------')
 
-    # Start changes processing
-    with ProcessPoolExecutor(max_workers=((len(users) * 3) + update_batch_size + 3)) as pex:
-
-        # Start changes feeds in background process
-        changes_workers_task = pex.submit(
-            start_changes_processing,
-            lb_url,
-            sg_db,
-            users,
-            changes_delay,
-            changes_limit,
-            changes_terminator_doc_id
-        )
+    # Start the changes feeds of every user, multiplexed over the changes load engine's worker processes
+    changes_engine = ChangesLoadEngine(
+        sg_url=lb_url,
+        sg_db=sg_db,
+        terminator_doc_id=changes_terminator_doc_id,
+        changes_delay=changes_delay,
+        changes_limit=changes_limit
+    )
+    changes_engine.start(create_changes_feed_specs(users))
 
-        log_info('------------------------------------------')
-        log_info('START concurrent updates')
-        log_info('------------------------------------------')
-        # Start concurrent updates of update
-        # Update batch size is the number of users that will concurrently update all of their docs
-        users = update_docs(
-            sg_url=lb_url,
-            sg_db=sg_db,
-            users=users,
-            update_runtime_sec=update_runtime_sec,
-            batch_size=update_batch_size,
-            docs_per_user_per_update=docs_per_user_per_update,
-            update_delay=update_delay
-        )
+    log_info('------------------------------------------')
+    log_info('START concurrent updates')
+    log_info('------------------------------------------')
+    # Start concurrent updates of update
+    # Update batch size is the number of users that will concurrently update all of their docs
+    users, writes = update_docs(
+        sg_url=lb_url,
+        sg_db=sg_db,
+        users=users,
+        update_runtime_sec=update_runtime_sec,
+        batch_size=update_batch_size,
+        docs_per_user_per_update=docs_per_user_per_update,
+        update_delay=update_delay
+    )
 
-        all_user_channels = []
-        for k, v in users.items():
-            log_info('User ({}) updated docs {} times!'.format(k, v['updates']))
-            all_user_channels.append(k)
+    all_user_channels = []
+    for k, v in users.items():
+        log_info('User ({}) updated docs {} times!'.format(k, v['updates']))
+        all_user_channels.append(k)
+
+    log_info('------------------------------------------')
+    log_info('END concurrent updates')
+    log_info('------------------------------------------')
 
-        log_info('------------------------------------------')
-        log_info('END concurrent updates')
-        log_info('------------------------------------------')
+    # Broadcast termination doc to all users
+    terminator_channel = 'terminator'
+    send_changes_termination_doc(lb_url, sg_db, users, changes_terminator_doc_id, terminator_channel)
 
-        # Broadcast termination doc to all users
-        terminator_channel = 'terminator'
-        send_changes_termination_doc(lb_url, sg_db, users, changes_terminator_doc_id, terminator_channel)
+    # Overwrite each users channels with 'terminator' so their changes feed will backfill with the termination doc
+    grant_users_access(users, [terminator_channel], sg_admin_url, sg_db)
 
-        # Overwrite each users channels with 'terminator' so their changes feed will backfill with the termination doc
-        grant_users_access(users, [terminator_channel], sg_admin_url, sg_db)
+    # Block on changes completion
+    changes_results = changes_engine.results()
+    for result in changes_results:
+        users[result['user']][result['feed']] = result['latest_changes']
 
-        # Block on changes completion
-        users = changes_workers_task.result()
+    # Print the summary of the system test
+    print_summary(users, summarize_changes_load(changes_results, writes))
 
-        # Print the summary of the system test
-        print_summary(users)
+    # A feed that gave up after too many errors did not see the termination doc
+    failed_feeds = ["{} ({}): {}".format(result['user'], result['feed'], result['error'])
+                    for result in changes_results if not result['terminated'] or result['error'] is not None]
+    assert not failed_feeds, "Changes feeds did not terminate: {}".format(failed_feeds)
 
-        # TODO: Validated expected changes
+    # TODO: Validated expected changes
 
 
-def print_summary(users):
+def print_summary(users, changes_summary):
     """ Pretty print user results for simulation """
     log_info('------------------------------------------')
     log_info('Summary')
@@ -257,6 +260,17 @@ def print_summary(users):
                 len(value['normal'])
             ))
 
+        for feed, feed_summary in sorted(changes_summary[user_name].items()):
+            log_info('  - {}: {} changes/s, {} requests, {} errors, latency to visibility p50: {}s p95: {}s max: {}s'.format(
+                feed,
+                feed_summary['changes_per_sec'],
+                feed_summary['requests'],
+                feed_summary['errors'],
+                feed_summary['latency_p50_secs'],
+                feed_summary['latency_p95_secs'],
+                feed_summary['latency_max_secs']
+            ))
+
 
 def grant_users_access(users, channels, sg_admin_url, sg_db):
     sg_client = MobileRestClient()
@@ -274,196 +288,31 @@ def send_changes_termination_doc(sg_url, sg_db, users, terminator_doc_id, termin
     sg_client.add_doc(url=sg_url, db=sg_db, doc=doc, auth=random_user['auth'])
 
 
-def start_polling_changes_worker(sg_url, sg_db, user_name, user_auth, changes_delay, changes_limit, terminator_doc_id, feed, channels_filtered, doc_ids_filtered):
-    sg_client = MobileRestClient()
-    since = 0
-    latest_changes = {}
-    found_terminator = False
-
-    # Pass a channel filter to changes request if filtered is true
-    filter_type = None
-    filter_channels = None
-    filter_doc_ids = None
-
-    if channels_filtered:
-        filter_type = 'sync_gateway/bychannel'
-        filter_channels = ['even', 'terminator']
-
-    elif doc_ids_filtered:
-        filter_type = '_doc_ids'
-        filter_doc_ids = ['terminator']
-
-    while True:
-
-        # If terminator doc is found, terminate the polling loop
-        if found_terminator:
-            log_info('Found terminator ({}, {})'.format(user_name, feed))
-            return user_name, latest_changes
-
-        log_info('_changes ({}) for ({}) since: {}'.format(feed, user_name, since))
-        changes = sg_client.get_changes(
-            url=sg_url,
-            db=sg_db,
-            since=since,
-            auth=user_auth,
-            feed=feed,
-            limit=changes_limit,
-            filter_type=filter_type,
-            filter_channels=filter_channels,
-            filter_doc_ids=filter_doc_ids
-        )
-
-        # A termination doc was processed, exit on the next loop
-        for change in changes['results']:
-            if change['id'] == terminator_doc_id:
-                found_terminator = True
-            else:
-                # Add latest rev to to latest_changes map
-                if len(change['changes']) >= 1:
-                    latest_changes[change['id']] = change['changes'][0]['rev']
-                else:
-                    latest_changes[change['id']] = ''
-
-        since = changes['last_seq']
-        time.sleep(changes_delay)
-
-
-def start_continuous_changes_worker(sg_url, sg_db, user_name, user_auth, terminator_doc_id, channels_filtered):
-
-    sg_client = MobileRestClient()
-
-    latest_changes = {}
-
-    # Pass a channel filter to changes request if filtered is true
-    filter_type = None
-    filter_channels = None
-
-    if channels_filtered:
-        filter_type = 'sync_gateway/bychannel'
-        filter_channels = ['even', 'terminator']
-
-    log_info('_changes (continuous) for ({}) since: 0'.format(user_name))
-    stream = sg_client.stream_continuous_changes(
-        sg_url,
-        sg_db,
-        since=0,
-        auth=user_auth,
-        filter_type=filter_type,
-        filter_channels=filter_channels
-    )
-
-    for line in stream.iter_lines():
-
-        # filter out keep-alive new lines
-        if line:
-            decoded_line = line.decode('utf-8')
-            change = json.loads(decoded_line)
-
-            if change['id'] == terminator_doc_id:
-                log_info('Found terminator ({}, continuous)'.format(user_name))
-                return user_name, latest_changes
-
-            else:
-                if len(change['changes']) >= 1:
-                    latest_changes[change['id']] = change['changes'][0]['rev']
-                else:
-                    latest_changes[change['id']] = ''
-
-
-def start_changes_processing(sg_url, sg_db, users, changes_delay, changes_limit, terminator_doc_id):
-
-    # Make sure there are enough workers for 3 changes feed types for each user
-    workers = len(users) * 3
-
-    with ProcessPoolExecutor(max_workers=workers) as changes_pex:
-
-        # Start 3 changes feed types for each user:
-        #  - looping normal
-        #  - looping longpoll
-        #  - continuous
-        # For 'filtered_channel_user' users:
-        #  - Apply a syncgateway/bychannel filter to the changes feed
-        # For 'filtered_doc_ids_user' users:
-        #  - Apply a _doc_ids filter to the normal changes feed (limitation of the filter type)
-
-        normal_changes_tasks = []
-        longpoll_changes_tasks = []
-        continuous_changes_tasks = []
-
-        for user_key, user_val in users.items():
-
-            channels_filtered = False
-            doc_ids_filtered = False
-            if user_key.startswith('filtered_channel'):
-                channels_filtered = True
-            elif user_key.startswith('filtered_doc_ids'):
-                doc_ids_filtered = True
-
-            # Start a looping normal changes feed for user
-            normal_changes_tasks.append(
-                changes_pex.submit(
-                    start_polling_changes_worker,
-                    sg_url,
-                    sg_db,
-                    user_key,
-                    user_val['auth'],
-                    changes_delay,
-                    changes_limit,
-                    terminator_doc_id,
-                    "normal",
-                    channels_filtered,
-                    doc_ids_filtered
-                )
-            )
-
-            # Start a looping longpoll changes feed for user
-            if not doc_ids_filtered:
-                longpoll_changes_tasks.append(
-                    changes_pex.submit(
-                        start_polling_changes_worker,
-                        sg_url,
-                        sg_db,
-                        user_key,
-                        user_val['auth'],
-                        changes_delay,
-                        changes_limit,
-                        terminator_doc_id,
-                        "longpoll",
-                        channels_filtered,
-                        False
-                    )
-                )
-
-            # Start continuous changes feed for each user
-            if not doc_ids_filtered:
-                continuous_changes_tasks.append(
-                    changes_pex.submit(
-                        start_continuous_changes_worker,
-                        sg_url,
-                        sg_db,
-                        user_key,
-                        user_val['auth'],
-                        terminator_doc_id,
-                        channels_filtered
-                    )
-                )
-
-        # Block on termination of "normal" changes feeds
-        for changes_task in as_completed(normal_changes_tasks):
-            user_name, latest_change = changes_task.result()
-            users[user_name]['normal'] = latest_change
-
-        # Block on termination of "longpoll" changes feeds
-        for changes_task in as_completed(longpoll_changes_tasks):
-            user_name, latest_change = changes_task.result()
-            users[user_name]['longpoll'] = latest_change
-
-        # Block on termination of "continuous" changes feeds
-        for changes_task in as_completed(continuous_changes_tasks):
-            user_name, latest_change = changes_task.result()
-            users[user_name]['continuous'] = latest_change
+def create_changes_feed_specs(users):
+    """
+    Returns the changes feeds to simulate for each user:
+     - looping normal
+     - looping longpoll
+     - continuous
+    For 'filtered_channel_user' users:
+     - Apply a syncgateway/bychannel filter to the changes feed
+    For 'filtered_doc_ids_user' users:
+     - Apply a _doc_ids filter to the normal changes feed (limitation of the filter type)
+    """
 
-    return users
+    specs = []
+    for user_name, user_val in users.items():
+        if user_name.startswith('filtered_channel'):
+            for feed in ['normal', 'longpoll', 'continuous']:
+                specs.append(changes_feed_spec(user_name, user_val['auth'], feed,
+                                               filter_type='sync_gateway/bychannel', filter_channels=['even', 'terminator']))
+        elif user_name.startswith('filtered_doc_ids'):
+            specs.append(changes_feed_spec(user_name, user_val['auth'], 'normal',
+                                           filter_type='_doc_ids', filter_doc_ids=['terminator']))
+        else:
+            for feed in ['normal', 'longpoll', 'continuous']:
+                specs.append(changes_feed_spec(user_name, user_val['auth'], feed))
+    return specs
 
 
 def create_user_names(num_users):
@@ -663,20 +512,26 @@ def update_docs_task(users, user_type, user_index, sg_url, sg_db, docs_per_user_
             doc['updates'] += 1
 
         # Add the docs via build_docs
-        sg_client.add_bulk_docs(url=sg_url, db=sg_db, docs=user_docs, auth=current_user_auth)
+        updated_docs = sg_client.add_bulk_docs(url=sg_url, db=sg_db, docs=user_docs, auth=current_user_auth)
+        written_at = time.time()
+        writes = dict((doc['id'], (doc['rev'], written_at)) for doc in updated_docs)
 
     else:
 
         # Do a single GET / PUT for each of the user docs
+        writes = {}
         for doc_id in user_docs_subset_to_update:
             doc = sg_client.get_doc(url=sg_url, db=sg_db, doc_id=doc_id, auth=current_user_auth)
             doc['updates'] += 1
-            sg_client.put_doc(url=sg_url, db=sg_db, doc_id=doc_id, doc_body=doc, rev=doc['_rev'], auth=current_user_auth)
+            updated_doc = sg_client.put_doc(url=sg_url, db=sg_db, doc_id=doc_id, doc_body=doc, rev=doc['_rev'], auth=current_user_auth)
+            writes[doc_id] = (updated_doc['rev'], time.time())
 
-    return user_name
+    # { doc_id: (rev, time written) }, used to measure the latency to visibility on the changes feeds
+    return user_name, writes
 
 
 def update_docs(sg_url, sg_db, users, update_runtime_sec, batch_size, docs_per_user_per_update, update_delay):
+    """ Returns the users and the latest write of each updated doc: { doc_id: (rev, time written) } """
 
     log_info('Updating {} doc/user per update'.format(docs_per_user_per_update))
     log_info('Starting updates with batch size (concurrent users updating): {} and delay: {}s'.format(
@@ -688,6 +543,7 @@ def update_docs(sg_url, sg_db, users, update_runtime_sec, batch_size, docs_per_u
     num_users_per_type = len(users) / len(USER_TYPES)
     start = time.time()
     current_user_index = 0
+    writes = {}
 
     while True:
 
@@ -695,7 +551,7 @@ def update_docs(sg_url, sg_db, users, update_runtime_sec, batch_size, docs_per_u
         log_info('Updated for: {}s'.format(elapsed_sec))
         if elapsed_sec > update_runtime_sec:
             log_info('Runtime limit reached. Exiting ...')
-            return users
+            return users, writes
 
         with ProcessPoolExecutor(max_workers=batch_size) as pe:
 
@@ -718,8 +574,9 @@ def update_docs(sg_url, sg_db, users, update_runtime_sec, batch_size, docs_per_u
             # exception in future.result()
             for future in as_completed(update_futures):
                 # Increment updates
-                user = future.result()
+                user, user_writes = future.result()
                 users[user]['updates'] += 1
+                writes.update(user_writes)
                 log_info('Completed updates ({})'.format(user))
 
         current_user_index = (current_user_index + batch_size) % num_users_per_type
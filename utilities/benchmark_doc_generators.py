@@ -0,0 +1,45 @@
+import argparse
+import time
+
+from libraries.data import doc_generators
+from keywords.utils import log_info
+
+
+def benchmark_generator(name, num_docs, serialized):
+    """ Returns docs/sec for generating 'num_docs' docs (and serializing them if 'serialized') """
+
+    if serialized:
+        docs = doc_generators.generate_serialized_docs(name, num_docs, seed_value=0)
+    else:
+        docs = doc_generators.generate_docs(name, num_docs, seed_value=0)
+
+    start = time.time()
+    for _ in docs:
+        pass
+    return num_docs / max(time.time() - start, 1e-9)
+
+
+def benchmark(names, num_docs, num_20mb_docs):
+    results = []
+    for name in names:
+        count = num_20mb_docs if name == "20mb" else num_docs
+        for serialized in [False, True]:
+            docs_per_sec = benchmark_generator(name, count, serialized)
+            results.append({
+                "generator": name,
+                "num_docs": count,
+                "serialized": serialized,
+                "docs_per_sec": docs_per_sec
+            })
+            log_info("{:>12} {:>10}: {:>10.0f} docs/s".format(name, "json" if serialized else "dict", docs_per_sec))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the docs/sec of the doc generators")
+    parser.add_argument("--generators", help="Comma separated generator names", default=",".join(sorted(doc_generators.GENERATORS)))
+    parser.add_argument("--num-docs", help="Docs generated per generator", type=int, default=100000)
+    parser.add_argument("--num-20mb-docs", help="Docs generated for the 20mb generator", type=int, default=10)
+    args = parser.parse_args()
+
+    benchmark(args.generators.split(","), args.num_docs, args.num_20mb_docs)
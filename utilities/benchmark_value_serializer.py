@@ -0,0 +1,83 @@
+import argparse
+import time
+
+from CBLClient.ValueSerializer import ValueSerializer
+from CBLClient.ValueSerializer import VALUE_ENCODING_LEGACY, VALUE_ENCODING_TREE
+from keywords.utils import log_info
+
+
+def generate_doc_map(num_docs):
+    """ Returns a doc id -> doc body map shaped like the results of Database.getDocuments """
+
+    docs = {}
+    for i in xrange(num_docs):
+        doc_id = "doc_{}".format(i)
+        docs[doc_id] = {
+            "doc_id": doc_id,
+            "type": "benchmark",
+            "updates": i,
+            "score": i / 3.0,
+            "active": i % 2 == 0,
+            "channels": ["ABC", "NBC"],
+            "address": {
+                "street": "{} Main St".format(i),
+                "city": "Mountain View",
+                "geo": {"lat": 37.3861, "lon": -122.0839}
+            }
+        }
+    return docs
+
+
+def benchmark_encoding(doc_map, encoding, iterations):
+    """ Returns (encode seconds, decode seconds, payload bytes) for the best of 'iterations' runs """
+
+    best_encode = None
+    best_decode = None
+    for _ in xrange(iterations):
+        start = time.time()
+        encoded = ValueSerializer.serialize(doc_map, encoding)
+        encode_time = time.time() - start
+
+        start = time.time()
+        decoded = ValueSerializer.deserialize(encoded)
+        decode_time = time.time() - start
+
+        assert len(decoded) == len(doc_map)
+        if best_encode is None or encode_time < best_encode:
+            best_encode = encode_time
+        if best_decode is None or decode_time < best_decode:
+            best_decode = decode_time
+
+    return best_encode, best_decode, len(encoded)
+
+
+def benchmark(doc_counts, iterations):
+    results = []
+    for num_docs in doc_counts:
+        doc_map = generate_doc_map(num_docs)
+        for encoding in [VALUE_ENCODING_LEGACY, VALUE_ENCODING_TREE]:
+            encode_time, decode_time, num_bytes = benchmark_encoding(doc_map, encoding, iterations)
+            results.append({
+                "num_docs": num_docs,
+                "encoding": encoding,
+                "encode_docs_per_sec": num_docs / max(encode_time, 1e-9),
+                "decode_docs_per_sec": num_docs / max(decode_time, 1e-9),
+                "bytes": num_bytes
+            })
+            log_info("{:>7} docs {:>8}: encode {:>10.0f} docs/s, decode {:>10.0f} docs/s, {:>11} bytes".format(
+                num_docs,
+                encoding,
+                results[-1]["encode_docs_per_sec"],
+                results[-1]["decode_docs_per_sec"],
+                num_bytes
+            ))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares the ValueSerializer encodings on large doc maps")
+    parser.add_argument("--doc-counts", help="Comma separated sizes of the doc maps", default="1000,10000,100000")
+    parser.add_argument("--iterations", help="Runs per encoding, the best run is reported", type=int, default=3)
+    args = parser.parse_args()
+
+    benchmark([int(count) for count in args.doc_counts.split(",")], args.iterations)
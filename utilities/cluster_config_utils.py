@@ -1,13 +1,127 @@
 import ConfigParser
+import copy
 import json
 import os
 import re
+import threading
 from keywords.exceptions import ProvisioningError
 from shutil import copyfile, rmtree, make_archive
 from subprocess import Popen, PIPE
 from distutils.dir_util import copy_tree
 
 
+class ClusterConfig:
+    """
+    Parsed cluster config (<cluster_config> ansible inventory and <cluster_config>.json).
+
+    Each file is parsed once and served from memory until its mtime or size changes,
+    or until persist_cluster_config_environment_prop() writes the cluster config.
+    Use get_cluster_config() to get the shared instance of a cluster config.
+    """
+
+    def __init__(self, cluster_config):
+        if cluster_config.endswith(".json"):
+            cluster_config = cluster_config[:-len(".json")]
+
+        self.inventory_path = cluster_config
+        self.json_path = "{}.json".format(cluster_config)
+
+        self._lock = threading.RLock()
+        self._json = None
+        self._json_stamp = None
+        self._hosts_by_tag = None
+        self._inventory_stamp = None
+        self._memo = {}
+
+    @staticmethod
+    def _stamp(path):
+        stat = os.stat(path)
+        return stat.st_mtime, stat.st_size
+
+    def invalidate(self):
+        with self._lock:
+            self._json = None
+            self._json_stamp = None
+            self._hosts_by_tag = None
+            self._inventory_stamp = None
+            self._memo = {}
+
+    def json(self):
+        """ Parsed <cluster_config>.json, shared by all callers so it must not be modified """
+
+        with self._lock:
+            stamp = self._stamp(self.json_path)
+            if stamp != self._json_stamp:
+                with open(self.json_path) as f:
+                    self._json = json.loads(f.read())
+                self._json_stamp = stamp
+                self._memo = {}
+            return self._json
+
+    def environment(self):
+        """ The 'environment' flags of the cluster config, must not be modified """
+        return self.json()["environment"]
+
+    def hosts_for_tag(self, tag):
+        """ Returns the host vars of the hosts in the inventory group 'tag' """
+
+        with self._lock:
+            stamp = self._stamp(self.inventory_path)
+            if stamp != self._inventory_stamp:
+                # Ansible is only needed (and imported) when an inventory is used
+                from libraries.utilities.provisioning_config_parser import load_inventory_hosts
+                self._hosts_by_tag = load_inventory_hosts(self.inventory_path)
+                self._inventory_stamp = stamp
+            return [dict(host_vars) for host_vars in self._hosts_by_tag.get(tag, [])]
+
+    def memoize(self, key, compute):
+        """
+        Returns compute() computed once per version of <cluster_config>.json.
+        A deep copy is returned so callers can modify it.
+        """
+
+        with self._lock:
+            self.json()
+            if key not in self._memo:
+                self._memo[key] = compute()
+            return copy.deepcopy(self._memo[key])
+
+
+_cluster_configs = {}
+_cluster_configs_lock = threading.Lock()
+
+
+def get_cluster_config(cluster_config):
+    """ Returns the shared ClusterConfig of 'cluster_config' (with or without the .json extension) """
+
+    if cluster_config.endswith(".json"):
+        cluster_config = cluster_config[:-len(".json")]
+    key = os.path.abspath(cluster_config)
+
+    with _cluster_configs_lock:
+        config = _cluster_configs.get(key)
+        if config is None:
+            config = ClusterConfig(cluster_config)
+            _cluster_configs[key] = config
+        return config
+
+
+def invalidate_cluster_config(cluster_config=None):
+    """ Drops the parsed 'cluster_config', or all cluster configs if None """
+
+    with _cluster_configs_lock:
+        if cluster_config is None:
+            configs = _cluster_configs.values()
+        else:
+            if cluster_config.endswith(".json"):
+                cluster_config = cluster_config[:-len(".json")]
+            configs = [_cluster_configs.get(os.path.abspath(cluster_config))]
+
+    for config in configs:
+        if config is not None:
+            config.invalidate()
+
+
 class CustomConfigParser(ConfigParser.RawConfigParser):
     """Virtually identical to the original method, but delimit keys and values with '=' instead of ' = '
        Python 3 has a space_around_delimiters=False option for write, it does not work for python 2.x
@@ -68,10 +182,12 @@ def persist_cluster_config_environment_prop(cluster_config, property_name, value
     with open(cluster_config, 'w') as f:
         config.write(f)
 
+    invalidate_cluster_config(cluster_config)
+
 
 def generate_x509_certs(cluster_config, bucket_name):
     ''' Generate and insert x509 certs for CBS and SG TLS Handshake'''
-    cluster = load_cluster_config_json(cluster_config)
+    cluster = get_cluster_config(cluster_config).json()
     for line in open("ansible.cfg"):
         match = re.match('remote_user\s*=\s*(\w*)$', line)
         if match:
@@ -112,33 +228,27 @@ def generate_x509_certs(cluster_config, bucket_name):
 
 
 def load_cluster_config_json(cluster_config):
-    """ Load json version of cluster config """
-
-    if ".json" not in cluster_config:
-        cluster_config = "{}.json".format(cluster_config)
-
-    with open(cluster_config) as f:
-        cluster = json.loads(f.read())
+    """ Load json version of cluster config. Returns a copy that can be modified """
 
-    return cluster
+    return copy.deepcopy(get_cluster_config(cluster_config).json())
 
 
 def is_cbs_ssl_enabled(cluster_config):
     """ Loads cluster config to see if cbs ssl is enabled """
 
-    cluster = load_cluster_config_json(cluster_config)
+    cluster = get_cluster_config(cluster_config).json()
     return cluster["environment"]["cbs_ssl_enabled"]
 
 
 def is_x509_auth(cluster_config):
     ''' Load cluster config to see if auth should be done using x509 certs '''
-    cluster = load_cluster_config_json(cluster_config)
+    cluster = get_cluster_config(cluster_config).json()
     return cluster["environment"]["x509_certs"]
 
 
 def get_cbs_servers(cluster_config):
     """ Loads cluster config to see if cbs ssl is enabled """
-    cluster = load_cluster_config_json(cluster_config)
+    cluster = get_cluster_config(cluster_config).json()
     cbs_ips = [cb["ip"] for cb in cluster["couchbase_servers"]]
     return cbs_ips
 
@@ -146,19 +256,19 @@ def get_cbs_servers(cluster_config):
 def is_xattrs_enabled(cluster_config):
     """ Loads cluster config to see if cbs ssl is enabled """
 
-    cluster = load_cluster_config_json(cluster_config)
+    cluster = get_cluster_config(cluster_config).json()
     return cluster["environment"]["xattrs_enabled"]
 
 
 def is_load_balancer_enabled(cluster_config):
     """ Loads cluster config to see if load balancer is enabled """
-    cluster = load_cluster_config_json(cluster_config)
+    cluster = get_cluster_config(cluster_config).json()
     return cluster["environment"]["sg_lb_enabled"]
 
 
 def get_load_balancer_ip(cluster_config):
     """ Loads cluster config to fetch load balancer ip """
-    cluster = load_cluster_config_json(cluster_config)
+    cluster = get_cluster_config(cluster_config).json()
 
     num_lbs = len(cluster["load_balancers"])
     if num_lbs != 1:
@@ -170,37 +280,37 @@ def get_load_balancer_ip(cluster_config):
 
 def get_sg_replicas(cluster_config):
     """ Loads cluster config to get sync gateway version"""
-    cluster = load_cluster_config_json(cluster_config)
+    cluster = get_cluster_config(cluster_config).json()
     return cluster["environment"]["number_replicas"]
 
 
 def get_sg_use_views(cluster_config):
     """ Loads cluster config to get sync gateway views/GSI"""
-    cluster = load_cluster_config_json(cluster_config)
+    cluster = get_cluster_config(cluster_config).json()
     return cluster["environment"]["sg_use_views"]
 
 
 def is_ipv6(cluster_config):
     """ Loads cluster config to get IPv6 status"""
-    cluster = load_cluster_config_json(cluster_config)
+    cluster = get_cluster_config(cluster_config).json()
     return cluster["environment"]["ipv6_enabled"]
 
 
 def get_sg_version(cluster_config):
     """ Loads cluster config to get sync gateway version"""
-    cluster = load_cluster_config_json(cluster_config)
+    cluster = get_cluster_config(cluster_config).json()
     return cluster["environment"]["sync_gateway_version"]
 
 
 def get_cbs_version(cluster_config):
     """ Loads cluster config to get the couchbase server version"""
-    cluster = load_cluster_config_json(cluster_config)
+    cluster = get_cluster_config(cluster_config).json()
     return cluster["environment"]["server_version"]
 
 
 def no_conflicts_enabled(cluster_config):
     "Get no conflicts value from cluster config"
-    cluster = load_cluster_config_json(cluster_config)
+    cluster = get_cluster_config(cluster_config).json()
     try:
         return cluster["environment"]["no_conflicts_enabled"]
     except KeyError:
@@ -209,7 +319,7 @@ def no_conflicts_enabled(cluster_config):
 
 def sg_ssl_enabled(cluster_config):
     "Get SG SSL value from cluster config"
-    cluster = load_cluster_config_json(cluster_config)
+    cluster = get_cluster_config(cluster_config).json()
     try:
         return cluster["environment"]["sync_gateway_ssl"]
     except KeyError:
@@ -218,19 +328,19 @@ def sg_ssl_enabled(cluster_config):
 
 def get_revs_limit(cluster_config):
     "Get revs limit"
-    cluster = load_cluster_config_json(cluster_config)
+    cluster = get_cluster_config(cluster_config).json()
     return cluster["environment"]["revs_limit"]
 
 
 def get_redact_level(cluster_config):
-    cluster = load_cluster_config_json(cluster_config)
+    cluster = get_cluster_config(cluster_config).json()
     return cluster["environment"]["redactlevel"]
 
 
 def is_delta_sync_enabled(cluster_config):
     """ Loads cluster config to see if delta sync is enabled """
 
-    cluster = load_cluster_config_json(cluster_config)
+    cluster = get_cluster_config(cluster_config).json()
     try:
         return cluster["environment"]["delta_sync_enabled"]
     except KeyError:
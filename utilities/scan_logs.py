@@ -1,7 +1,11 @@
 import argparse
+import mmap
+import multiprocessing
 import os
 import zipfile
 
+from concurrent.futures import ProcessPoolExecutor
+
 from keywords.utils import log_info
 from keywords.exceptions import LogScanningError
 
@@ -29,32 +33,205 @@ def unzip_log_files(directory):
             zf.extractall(zip_file_extract_dir)
 
 
-def scan_logs(directory):
-    """ Unzips .zip files and scans directory recursively for .log files and scan them for error key words.
+# Files are read in chunks of that size when they can not be memory mapped (ex. zip members)
+SCAN_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Matches (with context) kept per file, every match is still counted
+MAX_MATCHES_PER_FILE = 1000
+
+DEFAULT_ERROR_PATTERNS = ['panic', 'data race']
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return value.encode('utf-8')
+
+
+class _ScanResult:
+
+    def __init__(self, source, patterns, max_matches):
+        self.source = source
+        self.patterns = patterns
+        self.max_matches = max_matches
+        self.matches = []
+        self.counts = dict((pattern, 0) for pattern in patterns)
+        # The chunks are lowercased once, so all the patterns are matched regardless of case
+        self._needles = [(pattern, _to_bytes(pattern).lower()) for pattern in patterns]
+
+    def scan(self, data, base_offset):
+        """ Records the matches in 'data', a chunk made of whole lines starting at 'base_offset' in the file """
+
+        lowered = data.lower()
+        found = []
+        for pattern, needle in self._needles:
+            index = lowered.find(needle)
+            while index != -1:
+                self.counts[pattern] += 1
+                found.append((index, pattern))
+                index = lowered.find(needle, index + len(needle))
+
+        for index, pattern in sorted(found):
+            if self.max_matches is not None and len(self.matches) >= self.max_matches:
+                break
+
+            line_start = data.rfind(b'\n', 0, index) + 1
+            line_end = data.find(b'\n', index)
+            if line_end == -1:
+                line_end = len(data)
+
+            self.matches.append({
+                'file': self.source,
+                'offset': base_offset + index,
+                'pattern': pattern,
+                'line': data[line_start:line_end].rstrip(b'\r').decode('utf-8', 'replace')
+            })
+
+    def to_dict(self):
+        return {'file': self.source, 'matches': self.matches, 'counts': self.counts}
+
+
+def _scan_stream(stream, result):
+    """ Scans a file like object chunk by chunk, cutting the chunks at line boundaries """
+
+    offset = 0
+    leftover = b''
+    while True:
+        chunk = stream.read(SCAN_CHUNK_SIZE)
+        if not chunk:
+            break
+        data = leftover + chunk
+        last_newline = data.rfind(b'\n')
+        if last_newline == -1:
+            leftover = data
+            continue
+        result.scan(data[:last_newline + 1], offset)
+        offset += last_newline + 1
+        leftover = data[last_newline + 1:]
+
+    if leftover:
+        result.scan(leftover, offset)
+
+
+def _scan_mapped(mapped, result):
+    """ Scans a memory mapped file chunk by chunk, cutting the chunks at line boundaries """
+
+    size = len(mapped)
+    offset = 0
+    while offset < size:
+        end = min(offset + SCAN_CHUNK_SIZE, size)
+        if end < size:
+            last_newline = mapped.rfind(b'\n', offset, end)
+            if last_newline != -1:
+                end = last_newline + 1
+            else:
+                # Line longer than a chunk, extend the chunk to the end of the line
+                next_newline = mapped.find(b'\n', end)
+                end = size if next_newline == -1 else next_newline + 1
+        result.scan(mapped[offset:end], offset)
+        offset = end
+
+
+def scan_file(file_path, patterns, member=None, max_matches=MAX_MATCHES_PER_FILE):
+    """
+    Scans a log file, or the 'member' of a zip archive without extracting it, for the words in 'patterns'.
+    Words are matched regardless of case.
+    Returns {'file': ..., 'matches': [{'file', 'offset', 'pattern', 'line'}, ...], 'counts': {pattern: count}}
+    Matches are in file order and limited to 'max_matches', the counts include all the matches.
+    """
+
+    if member is not None:
+        result = _ScanResult('{}/{}'.format(file_path, member), patterns, max_matches)
+        with zipfile.ZipFile(file_path) as zf:
+            with zf.open(member) as stream:
+                _scan_stream(stream, result)
+        return result.to_dict()
+
+    result = _ScanResult(file_path, patterns, max_matches)
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # Empty files can not be memory mapped
+            return result.to_dict()
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            _scan_mapped(mapped, result)
+        finally:
+            mapped.close()
+    return result.to_dict()
+
+
+def _scan_file_args(args):
+    file_path, member, patterns, max_matches = args
+    return scan_file(file_path, patterns, member=member, max_matches=max_matches)
+
+
+def get_log_sources(directory, extension='.log'):
+    """ Returns the (file path, zip member or None) of the log files in 'directory', including the ones in .zip archives """
+
+    sources = [(file_path, None) for file_path in get_file_paths_with_extension(directory, extension)]
+    for zip_file in get_file_paths_with_extension(directory, '.zip'):
+        with zipfile.ZipFile(zip_file) as zf:
+            sources.extend((zip_file, name) for name in zf.namelist() if name.endswith(extension))
+    return sources
+
+
+def scan_sources(sources, patterns, processes=None, max_matches=MAX_MATCHES_PER_FILE):
+    """
+    Scans the (file path, zip member or None) 'sources' for 'patterns', spreading the files over a process pool.
+    Returns {'matches': [...], 'counts': {pattern: count}, 'files': {file: {pattern: count}}}
+    """
+
+    work = [(file_path, member, patterns, max_matches) for file_path, member in sources]
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    if processes <= 1 or len(work) <= 1:
+        results = [_scan_file_args(args) for args in work]
+    else:
+        with ProcessPoolExecutor(max_workers=min(processes, len(work))) as executor:
+            results = list(executor.map(_scan_file_args, work))
+
+    scan = {'matches': [], 'counts': dict((pattern, 0) for pattern in patterns), 'files': {}}
+    for result in results:
+        scan['matches'].extend(result['matches'])
+        scan['files'][result['file']] = result['counts']
+        for pattern, count in result['counts'].items():
+            scan['counts'][pattern] += count
+    return scan
+
+
+def scan_logs(directory, patterns=None, processes=None):
+    """ Scans directory recursively for .log files, and the .log files in .zip archives, for error key words.
     Raise an exception if any of the error keywords are found.
+    Returns the scan results (see scan_sources) if nothing was found.
     """
-    # Unzip logs
-    unzip_log_files(directory)
 
-    log_file_paths = get_file_paths_with_extension(directory, '.log')
+    if patterns is None:
+        patterns = DEFAULT_ERROR_PATTERNS
+
+    scan = scan_sources(get_log_sources(directory), patterns, processes=processes)
 
     found_errors = False
-    for logfile_path in log_file_paths:
-        try:
-            scan_for_errors(logfile_path, ['panic', 'data race'])
-        except LogScanningError:
-            log_info('Error found for: {}'.format(logfile_path))
+    for file_path, counts in sorted(scan['files'].items()):
+        if any(counts.values()):
+            log_info('Error found for: {} {}'.format(file_path, counts))
             found_errors = True
 
+    for match in scan['matches']:
+        log_info('{}:{}: {}'.format(match['file'], match['offset'], match['line']))
+
     if found_errors:
         raise LogScanningError('Found errors in the sync gateway / sg accel logs!!')
 
+    return scan
+
 
 def scan_for_errors(log_file_path, error_strings):
     """
-    Scans a log file line by line for a provided array of words.
+    Scans a log file for a provided array of words.
     We use this to look for errors, so we expect that no words will be found
     If any of the words are found, we raise an exception.
+    The words are matched regardless of case, 'warning' will catch 'WARNING' and 'Warning', etc
 
     'error_strings' should be a list. Example ['panic', 'error', 'data race']
     """
@@ -62,41 +239,33 @@ def scan_for_errors(log_file_path, error_strings):
     if type(error_strings) != list:
         raise ValueError('error_strings must be a list')
 
-    # Scan each line in the log file for the words to search for
-    with open(log_file_path) as f:
-        for line in f:
-            for word in error_strings:
-                # convert the word to lowercase and the line to all lower case
-                # which handles the case where 'warning' will catch 'WARNING' and 'Warning', etc
-                if word.lower() in line.lower():
-                    raise LogScanningError('{} found!! Please review: {} '.format(word, log_file_path))
+    result = scan_file(log_file_path, error_strings, max_matches=1)
+    if result['matches']:
+        raise LogScanningError('{} found!! Please review: {} '.format(result['matches'][0]['pattern'], log_file_path))
 
 
 def scan_for_pattern(logfile_path, pattern_list):
     """
-    Scans a log file line by line for a provided array of words.
+    Scans a log file for a provided array of words.
+    Raises an exception if none of the words are found.
 
     'pattern_list' should be a list. Example ['panic', 'error', 'data race']
     """
     if type(pattern_list) != list:
         raise ValueError('error_strings must be a list')
 
-    # Scan each line in the log file for the words to search for
-    flag = False
-    for line in open(logfile_path):
-        for word in pattern_list:
-            # convert the word to lowercase and the line to all lower case
-            if word.lower() in line.lower():
-                flag = True
-    if flag is False:
-            raise LogScanningError('{} Did not find the words !! Please review: {} '.format(pattern_list, logfile_path))
+    result = scan_file(logfile_path, pattern_list, max_matches=0)
+    if not any(result['counts'].values()):
+        raise LogScanningError('{} Did not find the words !! Please review: {} '.format(pattern_list, logfile_path))
 
 
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
     parser.add_argument('--path-to-log-dir', help='Directory containing the log files', required=True)
+    parser.add_argument('--patterns', help='Comma separated words to scan for', default=','.join(DEFAULT_ERROR_PATTERNS))
+    parser.add_argument('--processes', help='Number of scanning processes, defaults to the number of cpus', type=int)
     args = parser.parse_args()
 
     # Scan all log files in the directory for 'panic' and 'data races'
-    scan_logs(args.path_to_log_dir)
+    scan_logs(args.path_to_log_dir, args.patterns.split(','), args.processes)